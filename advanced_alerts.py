@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from app import app, db
 from models import Alert, TradingConfig, Trade
 from advanced_strategies import AdvancedTradingStrategies
+from market_data_hub import market_data_hub
 
 logger = logging.getLogger(__name__)
 
@@ -186,16 +187,16 @@ class AdvancedAlertSystem:
         volume_threshold = self.get_alert_threshold('volume', 150.0)  # 150% por defecto
         
         try:
-            for symbol in ['BTC/USDT', 'ETH/USDT', 'ADA/USDT']:
-                volumes = []
-                
-                for exchange in ['gateio', 'mexc', 'okx', 'bitget']:
-                    try:
-                        ticker = self.strategies.ccxt.get_ticker(exchange, symbol)
-                        if ticker and 'baseVolume' in ticker:
-                            volumes.append(float(ticker['baseVolume']))
-                    except Exception:
-                        continue
+            symbols = ['BTC/USDT', 'ETH/USDT', 'ADA/USDT']
+            # Mismas cotizaciones que usan las estrategias, sin volver a pedirlas
+            snapshot = market_data_hub.get_snapshot(['gateio', 'mexc', 'okx', 'bitget'], symbols)
+            
+            for symbol in symbols:
+                volumes = [
+                    float(quote['volume'])
+                    for quote in snapshot.by_symbol(symbol).values()
+                    if quote['volume']
+                ]
                 
                 if len(volumes) >= 2:
                     avg_volume = sum(volumes) / len(volumes)
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from app import app, db
 from models import Trade, Alert, TradingConfig
 from ccxt_integration import CCXTIntegration
+from market_data_hub import market_data_hub
 import logging
 
 logger = logging.getLogger(__name__)
@@ -166,19 +167,17 @@ class AdvancedTradingStrategies:
         try:
             alerts = []
             
+            # Recopilar datos de múltiples exchanges para todos los símbolos a la vez
+            snapshot = market_data_hub.get_snapshot(self.exchanges, self.symbols)
+            
             for symbol in self.symbols:
                 price_data = []
                 volume_data = []
                 
-                # Recopilar datos de múltiples exchanges
-                for exchange in self.exchanges:
-                    try:
-                        ticker = self.ccxt.get_ticker(exchange, symbol)
-                        if ticker:
-                            price_data.append(float(ticker['last']))
-                            volume_data.append(float(ticker.get('baseVolume', 0)))
-                    except Exception:
-                        continue
+                for quote in snapshot.by_symbol(symbol).values():
+                    if quote['last']:
+                        price_data.append(float(quote['last']))
+                        volume_data.append(float(quote['volume']))
                 
                 if len(price_data) < 2:
                     continue
@@ -0,0 +1,166 @@
+"""
+Matriz de arbitraje entre exchanges
+Bid, ask, volumen y coste por pata de todos los símbolos a la vez en arrays
+(símbolos x exchanges). Todos los spreads comprar-aquí/vender-allí salen de
+una sola operación con broadcasting y el top-K se elige con argpartition,
+en lugar de los bucles anidados exchange x exchange de cada motor. Con un
+nominal se descartan además las patas que el exchange rechazaría por step o
+mínimos (symbol_metadata.tradable_mask, una llamada por exchange).
+"""
+import numpy as np
+from cost_model import EXCHANGE_ALIASES, cost_model
+from symbol_metadata import symbol_metadata
+
+
+class ArbitrageMatrix:
+    """Precios de un escaneo; ejes: [símbolo, exchange de compra, exchange de venta]"""
+
+    __slots__ = ('symbols', 'exchanges', 'bid', 'ask', 'volume', 'fee', 'transfer', 'tradable', 'timestamp')
+
+    def __init__(self, symbols, exchanges, bid, ask, volume=None, fee=None, transfer=None, timestamp=None,
+                 tradable=None):
+        self.symbols = list(symbols)
+        self.exchanges = list(exchanges)
+        shape = (len(self.symbols), len(self.exchanges))
+        self.bid = np.asarray(bid, dtype=np.float64).reshape(shape)
+        self.ask = np.asarray(ask, dtype=np.float64).reshape(shape)
+        self.volume = np.zeros(shape) if volume is None else np.asarray(volume, dtype=np.float64).reshape(shape)
+        self.fee = np.zeros(shape) if fee is None else np.broadcast_to(np.asarray(fee, dtype=np.float64), shape)
+        # Reequilibrio entre exchanges por símbolo (fracción del nominal)
+        self.transfer = np.zeros(len(self.symbols)) if transfer is None else \
+            np.broadcast_to(np.asarray(transfer, dtype=np.float64), (len(self.symbols),))
+        # Patas operables con el nominal del escaneo (step y mínimos del exchange)
+        self.tradable = np.ones(shape, dtype=bool) if tradable is None else np.asarray(tradable, dtype=bool)
+        self.timestamp = timestamp
+
+    @staticmethod
+    def _fees(exchanges, symbols, fees):
+        """fees: None = coste por pata del cost_model (comisión + selección adversa), número o array = fijo"""
+        if fees is not None:
+            return fees
+        return np.array([[cost_model.leg_cost(exchange, symbol) for exchange in exchanges] for symbol in symbols])
+
+    @staticmethod
+    def _transfers(exchanges, symbols, ask, fees):
+        """Reequilibrio del cost_model al precio medio de compra; cero si las comisiones son fijas"""
+        if fees is not None:
+            return None
+        with np.errstate(invalid='ignore'):
+            prices = [np.nanmean(row) if np.isfinite(row).any() else 0.0 for row in ask]
+        return [cost_model.rebalance_cost(symbol, price, exchanges[0] if exchanges else None)
+                for symbol, price in zip(symbols, prices)]
+
+    @staticmethod
+    def _tradable(exchanges, symbols, ask, notional):
+        """Máscara (símbolos x exchanges) de compras de notional en quote que cumplen las reglas"""
+        if not notional:
+            return None
+        ask = np.asarray(ask, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            quantities = notional / ask
+        columns = [symbol_metadata.tradable_mask(EXCHANGE_ALIASES.get(exchange, exchange), symbols,
+                                                 quantities[:, j], ask[:, j])
+                   for j, exchange in enumerate(exchanges)]
+        return np.column_stack(columns) if columns else None
+
+    @classmethod
+    def from_snapshot(cls, snapshot, symbols, exchanges, fees=None, notional=None):
+        """Desde un QuoteSnapshot; las cotizaciones ausentes o vacías quedan en NaN"""
+        shape = (len(symbols), len(exchanges))
+        bid = np.full(shape, np.nan)
+        ask = np.full(shape, np.nan)
+        volume = np.zeros(shape)
+        for i, symbol in enumerate(symbols):
+            for j, exchange in enumerate(exchanges):
+                quote = snapshot.get(exchange, symbol)
+                if quote and quote['bid'] and quote['ask']:
+                    bid[i, j] = quote['bid']
+                    ask[i, j] = quote['ask']
+                    volume[i, j] = quote.get('volume') or 0.0
+        return cls(symbols, exchanges, bid, ask, volume, cls._fees(exchanges, symbols, fees),
+                   cls._transfers(exchanges, symbols, ask, fees), snapshot.started_at,
+                   cls._tradable(exchanges, symbols, ask, notional))
+
+    @classmethod
+    def from_prices(cls, symbol, prices, fees=None, notional=None):
+        """Desde {exchange: {'bid', 'ask'[, 'volume']}} de un solo símbolo"""
+        exchanges = [exchange for exchange, data in prices.items() if data.get('bid') and data.get('ask')]
+        bid = [[float(prices[exchange]['bid']) for exchange in exchanges]]
+        ask = [[float(prices[exchange]['ask']) for exchange in exchanges]]
+        volume = [[float(prices[exchange].get('volume') or 0.0) for exchange in exchanges]]
+        return cls([symbol], exchanges, bid, ask, volume, cls._fees(exchanges, [symbol], fees),
+                   cls._transfers(exchanges, [symbol], np.asarray(ask, dtype=np.float64), fees),
+                   tradable=cls._tradable(exchanges, [symbol], ask, notional))
+
+    # Spreads (símbolos x compra x venta)
+
+    def gross_spreads(self):
+        """(bid de venta - ask de compra) / ask de compra"""
+        return (self.bid[:, None, :] - self.ask[:, :, None]) / self.ask[:, :, None]
+
+    def net_spreads(self):
+        """Ventaja neta esperada: costes de ambas patas y reequilibrio, por unidad de quote invertida"""
+        received = self.bid[:, None, :] * (1 - self.fee[:, None, :])
+        paid = self.ask[:, :, None] * (1 + self.fee[:, :, None])
+        return (received - paid) / paid - self.transfer[:, None, None]
+
+    def _scores(self, min_spread, min_volume, net):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = self.net_spreads() if net else self.gross_spreads()
+        valid = np.isfinite(scores) & (scores > min_spread)
+        valid &= ~np.eye(len(self.exchanges), dtype=bool)  # mismo exchange en las dos patas
+        valid &= self.tradable[:, :, None] & self.tradable[:, None, :]
+        if min_volume:
+            liquid = self.volume > min_volume
+            valid &= liquid[:, :, None] & liquid[:, None, :]
+        return np.where(valid, scores, -np.inf)
+
+    def _opportunity(self, flat_index, gross, net):
+        s, b, v = np.unravel_index(flat_index, gross.shape)
+        return {
+            'symbol': self.symbols[s],
+            'buy_exchange': self.exchanges[b],
+            'sell_exchange': self.exchanges[v],
+            'buy_price': float(self.ask[s, b]),
+            'sell_price': float(self.bid[s, v]),
+            'spread_percentage': float(gross[s, b, v]) * 100,
+            'net_spread_percentage': float(net[s, b, v]) * 100,
+            'buy_fee': float(self.fee[s, b]),
+            'sell_fee': float(self.fee[s, v]),
+            'buy_volume': float(self.volume[s, b]),
+            'sell_volume': float(self.volume[s, v]),
+        }
+
+    def top(self, k=5, min_spread=0.0, min_volume=0.0, net=True):
+        """Las k mejores oportunidades de toda la matriz, ordenadas de mayor a menor"""
+        scores = self._scores(min_spread, min_volume, net).ravel()
+        count = int(np.count_nonzero(scores > -np.inf))
+        k = min(k, count)
+        if k <= 0:
+            return []
+
+        # argpartition deja las k mayores al principio sin ordenar todo el array
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            gross, net_values = self.gross_spreads(), self.net_spreads()
+        return [self._opportunity(index, gross, net_values) for index in candidates]
+
+    def best_per_symbol(self, min_spread=0.0, min_volume=0.0, net=True):
+        """{símbolo: mejor oportunidad}; los símbolos sin ninguna válida no aparecen"""
+        scores = self._scores(min_spread, min_volume, net).reshape(len(self.symbols), -1)
+        if not scores.size:
+            return {}
+        best = np.argmax(scores, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            gross, net_values = self.gross_spreads(), self.net_spreads()
+        pair_count = scores.shape[1]
+        return {
+            self.symbols[s]: self._opportunity(s * pair_count + best[s], gross, net_values)
+            for s in np.flatnonzero(scores[np.arange(len(self.symbols)), best] > -np.inf)
+        }
+
+    def best(self, min_spread=0.0, min_volume=0.0, net=True):
+        """Mejor oportunidad de la matriz o None"""
+        top = self.top(1, min_spread, min_volume, net)
+        return top[0] if top else None
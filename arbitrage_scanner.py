@@ -2,13 +2,28 @@ import logging
 from binance.exceptions import BinanceAPIException
 import time
 from collections import defaultdict
+from ticker_snapshot import TickerSnapshotCache
+from cost_model import cost_model
+from depth_book import DepthBook
+from symbol_metadata import symbol_metadata
+from triangular_arbitrage import TriangularArbitrage
 
 class ArbitrageScanner:
-    def __init__(self, client):
+    def __init__(self, client, ticker_snapshots=None, scan_all_symbols=False, book_stream=None):
         self.client = client
+        self.book_stream = book_stream  # Local WebSocket books, read without I/O
         self.price_cache = {}
         self.cache_duration = 2  # Cache prices for 2 seconds
         
+        # Bulk bookTicker snapshot shared with the engine for the whole cycle
+        self.ticker_snapshots = ticker_snapshots or TickerSnapshotCache(client, max_age=self.cache_duration)
+        self.scan_all_symbols = scan_all_symbols
+        self.quote_asset = 'USDT'
+        self.depth_bps = 10  # Volume counted as depth within 10 bps of the best price
+        self.book_limit = 20
+        self.triangular = None  # Currency graph, built on first triangular scan
+        self.triangular_min_profit = 0.001
+        
         # Focus on altcoins with typically higher spreads
         self.target_symbols = [
             'ADAUSDT', 'DOTUSDT', 'LINKUSDT', 'LTCUSDT', 'XLMUSDT',
@@ -21,6 +36,11 @@ class ArbitrageScanner:
 
     def get_order_book(self, symbol):
         """Get order book for a symbol with caching"""
+        if self.book_stream is not None:
+            local_book = self.book_stream.get_order_book(symbol, limit=5)
+            if local_book:
+                return local_book
+        
         cache_key = f"{symbol}_orderbook"
         current_time = time.time()
         
@@ -32,7 +52,7 @@ class ArbitrageScanner:
         
         try:
             # Get order book depth
-            orderbook = self.client.get_order_book(symbol=symbol, limit=5)
+            orderbook = self.client.get_order_book(symbol=symbol, limit=self.book_limit)
             
             # Cache the result
             self.price_cache[cache_key] = (orderbook, current_time)
@@ -43,23 +63,58 @@ class ArbitrageScanner:
             logging.error(f"Error getting order book for {symbol}: {e}")
             return None
 
-    def calculate_spread(self, symbol):
+    def get_ticker_snapshot(self):
+        """Get the shared bulk ticker snapshot, or None if the client can't provide it"""
+        if not self.ticker_snapshots.supported():
+            return None
+        return self.ticker_snapshots.get()
+
+    def get_scan_symbols(self, snapshot=None):
+        """Symbols to scan: whole quote-asset universe from the snapshot, or the target list"""
+        if self.scan_all_symbols and snapshot is not None:
+            return snapshot.symbols(self.quote_asset)
+        return self.target_symbols
+
+    def get_depth_book(self, symbol):
+        """DepthBook from the streamed local book, else from (cached) REST depth"""
+        if self.book_stream is not None:
+            depth = self.book_stream.get_depth_book(symbol, self.book_limit)
+            if depth is not None:
+                return depth
+        
+        orderbook = self.get_order_book(symbol)
+        if not orderbook or not orderbook.get('bids') or not orderbook.get('asks'):
+            return None
+        return DepthBook.from_order_book(orderbook, symbol)
+
+    def calculate_spread(self, symbol, snapshot=None):
         """Calculate bid-ask spread for a symbol"""
         try:
-            orderbook = self.get_order_book(symbol)
-            if not orderbook:
-                return None
+            # Prefer the streamed local book, then the cycle snapshot, then REST depth
+            depth = None
+            if self.book_stream is not None:
+                depth = self.book_stream.get_depth_book(symbol, self.book_limit)
             
-            best_bid = float(orderbook['bids'][0][0])  # Highest buy price
-            best_ask = float(orderbook['asks'][0][0])  # Lowest sell price
+            book = snapshot.book(symbol) if depth is None and snapshot is not None else None
+            
+            if book:
+                # The bulk snapshot only carries the top level
+                best_bid, bid_volume, best_ask, ask_volume = book
+            else:
+                depth = depth or self.get_depth_book(symbol)
+                if depth is None:
+                    return None
+                
+                best_bid = depth.best_bid  # Highest buy price
+                best_ask = depth.best_ask  # Lowest sell price
+                
+                # Volume available across levels near the top, not just level 0
+                bid_volume = depth.depth_within(self.depth_bps, 'SELL')[0]
+                ask_volume = depth.depth_within(self.depth_bps, 'BUY')[0]
             
             # Calculate spread percentage
             spread_pct = (best_ask - best_bid) / best_bid
             
-            # Get volumes
-            bid_volume = float(orderbook['bids'][0][1])
-            ask_volume = float(orderbook['asks'][0][1])
-            
             return {
                 'symbol': symbol,
                 'bid_price': best_bid,
@@ -78,14 +133,24 @@ class ArbitrageScanner:
         """Scan all target pairs for arbitrage opportunities"""
         opportunities = []
         
-        for symbol in self.target_symbols:
+        # One bulk request per cycle instead of one depth request per symbol
+        snapshot = self.get_ticker_snapshot()
+        
+        for symbol in self.get_scan_symbols(snapshot):
             try:
-                spread_data = self.calculate_spread(symbol)
+                spread_data = self.calculate_spread(symbol, snapshot)
                 
                 if spread_data and spread_data['spread_percentage'] > 0.005:  # > 0.5%
+                    # Expected edge after both legs' fees and adverse selection
+                    expected_edge = cost_model.net_edge(
+                        spread_data['spread_percentage'], symbol, 'binance', 'binance', spread_data['ask_price']
+                    )
+                    if expected_edge <= 0:
+                        continue
+                    
                     # Calculate potential profit for a $10 trade
                     trade_amount = 10.0
-                    potential_profit = trade_amount * spread_data['spread_percentage']
+                    potential_profit = trade_amount * expected_edge
                     
                     # Only consider if minimum volume is sufficient
                     if spread_data['min_volume'] * spread_data['bid_price'] >= trade_amount:
@@ -94,6 +159,7 @@ class ArbitrageScanner:
                             'buy_price': spread_data['bid_price'],
                             'sell_price': spread_data['ask_price'],
                             'spread_percentage': spread_data['spread_percentage'],
+                            'expected_edge': expected_edge,
                             'volume': spread_data['min_volume'],
                             'potential_profit': potential_profit,
                             'trade_amount': trade_amount
@@ -105,11 +171,87 @@ class ArbitrageScanner:
                 logging.error(f"Error scanning {symbol}: {e}")
                 continue
         
-        # Sort by spread percentage (highest first)
-        opportunities.sort(key=lambda x: x['spread_percentage'], reverse=True)
+        # Sort by expected edge (highest first)
+        opportunities.sort(key=lambda x: x['expected_edge'], reverse=True)
         
         return opportunities[:5]  # Return top 5 opportunities
 
+    def get_triangular_graph(self):
+        """Currency graph over every pair the exchange lists, built once from symbol metadata"""
+        if self.triangular is None:
+            rules = symbol_metadata.load('binance')
+            if not rules:
+                return None
+            self.triangular = TriangularArbitrage(min_profit=self.triangular_min_profit)
+            self.triangular.add_pairs_from_rules(rules)
+            logging.info(f"Triangular graph: {len(self.triangular.assets)} assets, "
+                         f"{len(self.triangular.pair_edges)} pairs")
+        return self.triangular
+
+    def scan_triangular(self, limit=5):
+        """Profitable conversion cycles on this exchange, updating only the quotes that moved"""
+        snapshot = self.get_ticker_snapshot()
+        graph = self.get_triangular_graph()
+        if snapshot is None or graph is None:
+            return []
+        
+        graph.update_from_snapshot(snapshot)
+        return graph.opportunities(limit)
+
+    def calculate_cross_spread(self, symbol, other_stream, other_symbol, other_name='KuCoin', trade_amount=10.0):
+        """Spread between the local Binance book and another exchange's local book,
+        priced at the VWAP of actually trading trade_amount on both books"""
+        if self.book_stream is None:
+            return None
+        
+        binance_book = self.book_stream.get_depth_book(symbol, self.book_limit)
+        other_book = other_stream.get_depth_book(other_symbol, self.book_limit)
+        if binance_book is None or other_book is None:
+            return None
+        if None in (binance_book.best_bid, binance_book.best_ask, other_book.best_bid, other_book.best_ask):
+            return None
+        
+        # Buy where the ask is lower, sell where the bid is higher
+        if other_book.best_bid > binance_book.best_ask:
+            buy, sell = ('Binance', binance_book), (other_name, other_book)
+        elif binance_book.best_bid > other_book.best_ask:
+            buy, sell = (other_name, other_book), ('Binance', binance_book)
+        else:
+            return None
+        
+        quantity, buy_vwap = buy[1].cost_to_buy_quote(trade_amount)
+        proceeds, sell_vwap = sell[1].vwap_to_sell(quantity)
+        if proceeds != proceeds:  # NaN: not enough depth on one side
+            return None
+        
+        return {
+            'symbol': symbol,
+            'buy_exchange': buy[0],
+            'sell_exchange': sell[0],
+            'buy_price': float(buy_vwap),
+            'sell_price': float(sell_vwap),
+            'spread_percentage': float((sell_vwap - buy_vwap) / buy_vwap),
+            'top_spread_percentage': (sell[1].best_bid - buy[1].best_ask) / buy[1].best_ask,
+            'expected_edge': cost_model.net_edge(
+                float((sell_vwap - buy_vwap) / buy_vwap), symbol,
+                buy[0].lower(), sell[0].lower(), float(buy_vwap)
+            ),
+            'volume': float(quantity),
+            'trade_amount': trade_amount
+        }
+
+    def scan_cross_exchange(self, other_stream, symbol_map, other_name='KuCoin', trade_amount=10.0):
+        """Scan cross-exchange spreads using two streamed books (no REST polling)"""
+        opportunities = []
+        
+        for symbol, other_symbol in symbol_map.items():
+            spread_data = self.calculate_cross_spread(symbol, other_stream, other_symbol, other_name, trade_amount)
+            if spread_data and spread_data['spread_percentage'] > 0.005 and spread_data['expected_edge'] > 0:
+                opportunities.append(spread_data)
+        
+        opportunities.sort(key=lambda x: x['expected_edge'], reverse=True)
+        return opportunities[:5]
+
     def scan_micro_movements(self):
         """Scan for micro price movements suitable for scalping"""
         opportunities = []
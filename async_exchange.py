@@ -0,0 +1,215 @@
+"""
+Capa de exchanges asíncrona en proceso (ccxt.async_support)
+Una instancia compartida por exchange (y credenciales), mercados cargados una
+sola vez, todas las peticiones sobre el event loop de async_runtime.
+Cada llamada pasa por el limitador de peso del exchange (rate_limiter), que
+es común a todas las instancias y da prioridad a las órdenes.
+"""
+import asyncio
+import logging
+from async_runtime import run_sync
+from rate_limiter import PRIORITY_MARKET_DATA, PRIORITY_ORDER, PRIORITY_POSITION, get_rate_limiter
+
+try:
+    import ccxt.async_support as ccxt_async
+except ImportError:  # ccxt no instalado: los motores usan el pool Node
+    ccxt_async = None
+
+
+class AsyncExchangeManager:
+    """Gestor de instancias ccxt.async_support compartidas por todos los motores"""
+
+    COMMANDS = {
+        'fetch_ticker': 'fetch_ticker',
+        'fetch_tickers': 'fetch_tickers',
+        'fetch_order_book': 'fetch_order_book',
+        'fetch_markets': 'load_markets',
+        'load_markets': 'load_markets',
+        'precision_mode': 'precision_mode',
+        'fetch_balance': 'fetch_balance',
+        'fetch_ohlcv': 'fetch_ohlcv',
+        'create_market_buy_order': 'create_market_buy_order',
+        'create_market_sell_order': 'create_market_sell_order',
+        'fetch_open_orders': 'fetch_open_orders',
+        'test_connection': 'test_connection',
+    }
+
+    # Prioridad y peso aproximado de cada llamada ante el limitador
+    LIMITS = {
+        'fetch_ticker': (PRIORITY_MARKET_DATA, 1),
+        'fetch_tickers': (PRIORITY_MARKET_DATA, 4),
+        'fetch_order_book': (PRIORITY_MARKET_DATA, 5),
+        'fetch_ohlcv': (PRIORITY_MARKET_DATA, 2),
+        'fetch_balance': (PRIORITY_POSITION, 10),
+        'fetch_open_orders': (PRIORITY_POSITION, 6),
+        'create_market_buy_order': (PRIORITY_ORDER, 1),
+        'create_market_sell_order': (PRIORITY_ORDER, 1),
+    }
+
+    def __init__(self, limiter_timeout=10.0):
+        self.limiter_timeout = limiter_timeout
+        self.exchanges = {}
+        self.markets_ready = {}
+
+    def is_available(self):
+        """ccxt (Python) está instalado"""
+        return ccxt_async is not None
+
+    @staticmethod
+    def _key(exchange_id, credentials):
+        credentials = credentials or {}
+        return (exchange_id, credentials.get('apiKey') or '', bool(credentials.get('sandbox')))
+
+    async def get_exchange(self, exchange_id, credentials=None):
+        """Obtener la instancia compartida con los mercados ya cargados"""
+        key = self._key(exchange_id, credentials)
+
+        if key not in self.exchanges:
+            credentials = credentials or {}
+            exchange_class = getattr(ccxt_async, exchange_id, None)
+            if exchange_class is None:
+                raise ValueError(f"Unknown exchange: {exchange_id}")
+
+            config = {'enableRateLimit': True}
+            for field in ('apiKey', 'secret', 'password'):
+                if credentials.get(field):
+                    config[field] = credentials[field]
+
+            exchange = exchange_class(config)
+            if credentials.get('sandbox'):
+                try:
+                    exchange.set_sandbox_mode(True)
+                except Exception as e:
+                    logging.warning(f"{exchange_id} sin sandbox, usando API pública: {e}")
+            self.exchanges[key] = exchange
+
+        # Cargar mercados una sola vez, compartiendo la tarea entre llamadas concurrentes
+        ready = self.markets_ready.get(key)
+        if ready is None or (ready.done() and ready.exception() is not None):
+            ready = asyncio.ensure_future(self.exchanges[key].load_markets())
+            self.markets_ready[key] = ready
+        await asyncio.shield(ready)
+
+        return self.exchanges[key]
+
+    async def _call(self, exchange_id, name, call, *args):
+        """Ejecutar una llamada ccxt respetando el limitador del exchange"""
+        priority, weight = self.LIMITS.get(name, (PRIORITY_MARKET_DATA, 1))
+        limiter = get_rate_limiter(exchange_id)
+        if not await limiter.acquire_async(weight, priority, self.limiter_timeout):
+            raise RuntimeError(f"{exchange_id}: sin presupuesto de peso o exchange pausado ({name})")
+
+        try:
+            return await call(*args)
+        except (ccxt_async.DDoSProtection, ccxt_async.RateLimitExceeded) as e:
+            # ccxt no expone Retry-After: pausa por defecto del limitador
+            limiter.on_rate_limited(418 if 'banned' in str(e).lower() else 429)
+            raise
+
+    async def fetch_ticker(self, exchange_id, symbol, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return await self._call(exchange_id, 'fetch_ticker', exchange.fetch_ticker, symbol)
+
+    async def fetch_tickers(self, exchange_id, symbols=None, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return await self._call(exchange_id, 'fetch_tickers', exchange.fetch_tickers, symbols)
+
+    async def fetch_order_book(self, exchange_id, symbol, limit=None, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return await self._call(exchange_id, 'fetch_order_book', exchange.fetch_order_book, symbol, limit)
+
+    async def fetch_balance(self, exchange_id, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return await self._call(exchange_id, 'fetch_balance', exchange.fetch_balance)
+
+    async def fetch_ohlcv(self, exchange_id, symbol, timeframe='1m', limit=10, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return await self._call(exchange_id, 'fetch_ohlcv', exchange.fetch_ohlcv, symbol, timeframe, None, limit)
+
+    async def create_market_buy_order(self, exchange_id, symbol, cost=None, amount=None, credentials=None):
+        """Compra a mercado por coste en quote (cost) o por cantidad base (amount)"""
+        exchange = await self.get_exchange(exchange_id, credentials)
+        if cost is not None:
+            return await self._call(exchange_id, 'create_market_buy_order',
+                                    exchange.create_market_buy_order_with_cost, symbol, cost)
+        return await self._call(exchange_id, 'create_market_buy_order',
+                                exchange.create_market_buy_order, symbol, amount)
+
+    async def create_market_sell_order(self, exchange_id, symbol, amount, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return await self._call(exchange_id, 'create_market_sell_order',
+                                exchange.create_market_sell_order, symbol, amount)
+
+    async def fetch_open_orders(self, exchange_id, symbol=None, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return await self._call(exchange_id, 'fetch_open_orders', exchange.fetch_open_orders, symbol)
+
+    async def load_markets(self, exchange_id, credentials=None):
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return exchange.markets
+
+    async def precision_mode(self, exchange_id, credentials=None):
+        """Cómo interpreta el exchange market['precision'] (DECIMAL_PLACES, TICK_SIZE...)"""
+        exchange = await self.get_exchange(exchange_id, credentials)
+        return exchange.precisionMode
+
+    async def test_connection(self, exchange_id, credentials=None):
+        ticker = await self.fetch_ticker(exchange_id, 'BTC/USDT', credentials)
+        return {'success': True, 'price': ticker['last']}
+
+    async def execute_async(self, command, exchange_id, symbol=None, params=None, credentials=None):
+        """Ejecutar un comando con la misma convención que el pool Node"""
+        params = params or {}
+        method = self.COMMANDS.get(command)
+        if method is None:
+            raise ValueError(f"Unknown command: {command}")
+
+        if method in ('fetch_ticker', 'fetch_order_book', 'fetch_ohlcv',
+                      'create_market_buy_order', 'create_market_sell_order'):
+            params = dict(params, symbol=symbol or 'BTC/USDT')
+        elif method == 'fetch_open_orders':
+            params = dict(params, symbol=symbol)  # sin símbolo = toda la cuenta
+
+        return await getattr(self, method)(exchange_id, credentials=credentials, **params)
+
+    def execute(self, command, exchange_id, symbol=None, params=None, credentials=None, timeout=10):
+        """Versión síncrona de execute_async; devuelve None si falla"""
+        try:
+            return run_sync(
+                self.execute_async(command, exchange_id, symbol, params, credentials),
+                timeout
+            )
+        except Exception as e:
+            logging.error(f"CCXT error ({command} {exchange_id} {symbol or ''}): {e}")
+            return None
+
+    def get_ticker(self, exchange_id, symbol, credentials=None, timeout=10):
+        """Obtener ticker de forma síncrona"""
+        return self.execute('fetch_ticker', exchange_id, symbol, credentials=credentials, timeout=timeout)
+
+    async def close_async(self):
+        for exchange in self.exchanges.values():
+            try:
+                await exchange.close()
+            except Exception as e:
+                logging.warning(f"Error cerrando {exchange.id}: {e}")
+        self.exchanges.clear()
+        self.markets_ready.clear()
+
+    def close(self):
+        """Cerrar todas las conexiones"""
+        if self.exchanges:
+            run_sync(self.close_async(), timeout=10)
+
+
+# Instancia global compartida por todos los motores
+async_exchange_manager = AsyncExchangeManager()
+
+
+def run_exchange_command(command, exchange_id, symbol=None, params=None, credentials=None, timeout=10):
+    """Ejecutar comando CCXT en proceso si ccxt está instalado, si no vía pool Node"""
+    if async_exchange_manager.is_available():
+        return async_exchange_manager.execute(command, exchange_id, symbol, params, credentials, timeout)
+
+    from ccxt_worker_pool import ccxt_worker_pool
+    return ccxt_worker_pool.call(command, exchange_id, symbol, params, credentials, timeout)
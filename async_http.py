@@ -0,0 +1,220 @@
+"""
+Cliente HTTP asíncrono con pool de conexiones
+Sesión aiohttp con conexiones keep-alive limitadas por host, timeout por
+llamada y reintentos con backoff y jitter sólo para GET (idempotentes).
+Vive en el loop compartido de async_runtime; request_sync() es el envoltorio
+síncrono para los motores. Sin aiohttp se usa requests con un pool del mismo
+tamaño y la misma política de timeouts y reintentos. Con rate_limiter, cada
+intento espera turno y peso, y las cabeceras y los 429/418 lo actualizan.
+"""
+import asyncio
+import logging
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from async_runtime import in_loop_thread, run_sync, spawn
+from rate_limiter import PRIORITY_MARKET_DATA
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Estados con los que merece la pena repetir un GET
+RETRY_STATUSES = {500, 502, 503, 504}
+# Límite superado / IP baneada: no reintentar, pausar el exchange
+RATE_LIMIT_STATUSES = {418, 429}
+
+
+class HttpRequestError(Exception):
+    """Fallo definitivo de una petición HTTP (tras agotar reintentos)"""
+
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class AsyncHttpClient:
+    """Pool de conexiones keep-alive hacia una API REST"""
+
+    def __init__(self, base_url, name='http', pool_size=10, timeout=10.0,
+                 retries=2, backoff=0.25, keepalive=30.0, rate_limiter=None):
+        self.base_url = base_url
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.keepalive = keepalive
+        self.rate_limiter = rate_limiter
+        self.session = None
+        self.sync_session = None
+
+    def is_async(self):
+        return aiohttp is not None
+
+    def _retry_delay(self, attempt):
+        """Backoff exponencial con jitter para no sincronizar reintentos"""
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _can_retry(self, method, attempt):
+        return method == 'GET' and attempt < self.retries
+
+    def _on_response(self, status, headers):
+        if self.rate_limiter is None:
+            return
+        self.rate_limiter.update_from_headers(headers)
+        if status in RATE_LIMIT_STATUSES:
+            self.rate_limiter.on_rate_limited(status, headers.get('Retry-After'))
+
+    def _rate_limited(self, endpoint):
+        return HttpRequestError(f"{self.name} {endpoint}: sin presupuesto de peso o exchange pausado", 429)
+
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=self.keepalive,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def request(self, method, endpoint, params=None, headers=None, json_body=None, timeout=None,
+                      weight=1, priority=PRIORITY_MARKET_DATA):
+        """Petición asíncrona; devuelve el JSON o lanza HttpRequestError"""
+        method = method.upper()
+        session = await self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        url = self.base_url + endpoint
+        attempt = 0
+
+        while True:
+            if self.rate_limiter is not None and not await self.rate_limiter.acquire_async(
+                    weight, priority, timeout or self.timeout):
+                raise self._rate_limited(endpoint)
+            try:
+                async with session.request(method, url, params=params, headers=headers,
+                                           json=json_body, timeout=client_timeout) as response:
+                    self._on_response(response.status, response.headers)
+                    if response.status >= 400:
+                        body = await response.text()
+                        if response.status in RETRY_STATUSES and self._can_retry(method, attempt):
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        raise HttpRequestError(
+                            f"{response.status} {response.reason} for {url}", response.status, body
+                        )
+                    try:
+                        return await response.json(content_type=None)
+                    except ValueError as e:
+                        # Cuerpo no JSON (página de error HTML de un proxy...): mismo error que los demás
+                        raise HttpRequestError(f"Respuesta no JSON de {url}: {e}", response.status,
+                                               await response.text()) from e
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not self._can_retry(method, attempt):
+                    raise HttpRequestError(f"{type(e).__name__} for {url}: {e}") from e
+                delay = self._retry_delay(attempt)
+                logging.warning(f"{self.name} GET {endpoint} falló ({e!r}), reintento en {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _get_sync_session(self):
+        if self.sync_session is None:
+            self.sync_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            self.sync_session.mount('https://', adapter)
+            self.sync_session.mount('http://', adapter)
+        return self.sync_session
+
+    def _request_blocking(self, method, endpoint, params=None, headers=None, json_body=None, timeout=None,
+                          weight=1, priority=PRIORITY_MARKET_DATA):
+        """Misma política que request() sobre requests (sin aiohttp o dentro del loop)"""
+        method = method.upper()
+        session = self._get_sync_session()
+        url = self.base_url + endpoint
+        attempt = 0
+
+        while True:
+            if self.rate_limiter is not None and not self.rate_limiter.acquire(
+                    weight, priority, timeout or self.timeout):
+                raise self._rate_limited(endpoint)
+            try:
+                response = session.request(method, url, params=params, headers=headers,
+                                           json=json_body, timeout=timeout or self.timeout)
+                self._on_response(response.status_code, response.headers)
+                if response.status_code in RETRY_STATUSES and self._can_retry(method, attempt):
+                    raise requests.exceptions.HTTPError(f"{response.status_code} for {url}")
+                if response.status_code >= 400:
+                    raise HttpRequestError(
+                        f"{response.status_code} {response.reason} for {url}",
+                        response.status_code, response.text
+                    )
+                try:
+                    return response.json()
+                except ValueError as e:
+                    # Cuerpo no JSON (página de error HTML de un proxy...): mismo error que los demás
+                    raise HttpRequestError(f"Respuesta no JSON de {url}: {e}", response.status_code,
+                                           response.text) from e
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                if not self._can_retry(method, attempt):
+                    raise HttpRequestError(f"{type(e).__name__} for {url}: {e}") from e
+                delay = self._retry_delay(attempt)
+                logging.warning(f"{self.name} GET {endpoint} falló ({e!r}), reintento en {delay:.2f}s")
+                attempt += 1
+                time.sleep(delay)
+
+    def request_sync(self, method, endpoint, params=None, headers=None, json_body=None, timeout=None,
+                     weight=1, priority=PRIORITY_MARKET_DATA):
+        """Envoltorio síncrono para los motores existentes"""
+        if not self.is_async() or in_loop_thread():
+            return self._request_blocking(method, endpoint, params, headers, json_body, timeout,
+                                          weight, priority)
+
+        # Tope del envoltorio: todos los intentos (cola del limitador incluida) más sus esperas
+        budget = 2 * (timeout or self.timeout) * (self.retries + 1) + self.backoff * (2 ** (self.retries + 1)) + 1
+        return run_sync(self.request(method, endpoint, params, headers, json_body, timeout, weight, priority),
+                        budget)
+
+    async def prewarm_async(self, endpoint, connections=None):
+        """Abrir conexiones (TLS incluido) antes de que las necesite el primer ciclo"""
+        connections = connections or min(self.pool_size, 4)
+        results = await asyncio.gather(
+            *(self.request('GET', endpoint) for _ in range(connections)),
+            return_exceptions=True
+        )
+        opened = sum(1 for result in results if not isinstance(result, Exception))
+        logging.info(f"{self.name}: {opened}/{connections} conexiones precalentadas")
+        return opened
+
+    def prewarm(self, endpoint, connections=None):
+        """Precalentar el pool sin bloquear al llamador"""
+        if self.is_async():
+            return spawn(self.prewarm_async(endpoint, connections))
+
+        try:
+            self._request_blocking('GET', endpoint)
+        except HttpRequestError as e:
+            logging.warning(f"{self.name}: precalentamiento falló: {e}")
+        return None
+
+    async def close_async(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def close(self):
+        if self.session is not None:
+            try:
+                run_sync(self.close_async(), 5)
+            except Exception as e:
+                logging.debug(f"Error cerrando sesión {self.name}: {e}")
+        if self.sync_session is not None:
+            self.sync_session.close()
+            self.sync_session = None
@@ -0,0 +1,51 @@
+"""
+Event loop asyncio compartido
+Un único loop en un hilo daemon donde viven las conexiones asíncronas
+(exchanges CCXT, websockets, sesiones HTTP). El código síncrono de los
+motores lo usa mediante run_sync().
+"""
+import asyncio
+import logging
+import threading
+
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """Obtener el loop compartido, arrancándolo la primera vez"""
+    global _loop, _thread
+
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name='async-runtime', daemon=True)
+            _thread.start()
+            logging.info("Async runtime iniciado")
+
+    return _loop
+
+
+def in_loop_thread():
+    """Indica si el código actual se ejecuta dentro del loop compartido"""
+    return _thread is not None and threading.current_thread() is _thread
+
+
+def spawn(coro):
+    """Programar una corrutina en el loop compartido y devolver su Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_sync(coro, timeout=None):
+    """Ejecutar una corrutina desde código síncrono y esperar el resultado"""
+    if in_loop_thread():
+        coro.close()
+        raise RuntimeError("run_sync() no puede llamarse desde el loop compartido")
+
+    future = spawn(coro)
+    try:
+        return future.result(timeout)
+    except Exception:
+        future.cancel()
+        raise
@@ -0,0 +1,288 @@
+"""
+Libro de balances en memoria
+Los motores ya no borran la tabla de balances y la vuelven a llenar en cada
+ciclo (con el dashboard leyendo una tabla medio vacía y una ráfaga de
+escrituras por segundo): el libro guarda el balance de cada (exchange, activo)
+en memoria, lo actualiza con los fills de cada orden y con las fotos periódicas
+de la cuenta, y vuelca a la base de datos en bloque solo las filas que
+cambiaron. Los lectores (rutas, websocket, estadísticas) reciben una foto
+coherente sin tocar la base de datos.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from cost_model import cost_model
+from usd_valuation import STABLE_ASSETS, usd_valuation
+
+USD_TOLERANCE = 0.001  # un cambio de valoración menor (0.1%) no se escribe en la base de datos
+RELOAD_INTERVAL = 5.0  # sin motores en este proceso: releer la tabla como mucho cada 5 s
+
+
+class LedgerEntry:
+    """Balance de un activo en un exchange; inmutable: cada cambio crea uno nuevo
+
+    Mismos nombres de atributos que el modelo Balance para que los lectores no
+    cambien.
+    """
+
+    __slots__ = ('exchange', 'asset', 'free_balance', 'locked_balance', 'usd_value', 'updated_at')
+
+    def __init__(self, exchange, asset, free_balance=0.0, locked_balance=0.0, usd_value=0.0, updated_at=None):
+        self.exchange = exchange
+        self.asset = asset
+        self.free_balance = free_balance
+        self.locked_balance = locked_balance
+        self.usd_value = usd_value
+        self.updated_at = updated_at or datetime.utcnow()
+
+    @property
+    def total_balance(self):
+        return self.free_balance + self.locked_balance
+
+    @property
+    def price(self):
+        """Valor en USD por unidad según la última valoración"""
+        if self.total_balance > 0:
+            return self.usd_value / self.total_balance
+        return 1.0 if self.asset in STABLE_ASSETS else 0.0
+
+    def to_mapping(self):
+        return {
+            'exchange': self.exchange,
+            'asset': self.asset,
+            'free_balance': self.free_balance,
+            'locked_balance': self.locked_balance,
+            'total_balance': self.total_balance,
+            'usd_value': self.usd_value,
+            'updated_at': self.updated_at
+        }
+
+
+class BalanceLedger:
+    def __init__(self, persist_interval=2.0):
+        self.persist_interval = persist_interval
+        self.entries = {}      # (EXCHANGE, activo) -> LedgerEntry
+        self.ids = {}          # (EXCHANGE, activo) -> Balance.id de su fila
+        self.persisted = {}    # (EXCHANGE, activo) -> (libre, bloqueado, usd) escritos en la base de datos
+        self.dirty = set()     # claves con cambios sin volcar (las borradas ya no están en entries)
+        self.stale_ids = []    # filas duplicadas de la tabla antigua pendientes de borrar
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.live = False      # algún motor de este proceso alimenta el libro
+        self.is_running = False
+        self.thread = None
+
+    @staticmethod
+    def _key(exchange, asset):
+        return (exchange or 'BINANCE').upper(), asset
+
+    # Carga
+
+    def load(self):
+        """Cargar la tabla de balances (al arrancar o, sin motores, para refrescar)"""
+        from app import app
+        from models import Balance
+        try:
+            with app.app_context():
+                rows = Balance.query.order_by(Balance.updated_at.desc()).all()
+        except Exception as e:
+            logging.error(f"Error cargando balances: {e}")
+            return
+        entries, ids, persisted, stale = {}, {}, {}, []
+        for row in rows:
+            key = self._key(row.exchange, row.asset)
+            if key in entries:
+                stale.append(row.id)  # duplicado del borrado y reinsertado antiguo: queda el más reciente
+                continue
+            entries[key] = LedgerEntry(key[0], row.asset, row.free_balance or 0.0, row.locked_balance or 0.0,
+                                       row.usd_value or 0.0, row.updated_at)
+            ids[key] = row.id
+            persisted[key] = (entries[key].free_balance, entries[key].locked_balance, entries[key].usd_value)
+        with self.lock:
+            if self.live:
+                # Un motor ya escribe en el libro: manda la memoria, de la tabla solo sus filas
+                for key, entry in entries.items():
+                    self.ids.setdefault(key, ids[key])
+                    self.persisted.setdefault(key, persisted[key])
+                    if key not in self.entries:
+                        self.entries[key] = entry
+                    elif self._changed(key, self.entries[key]):
+                        self.dirty.add(key)
+            else:
+                self.entries, self.ids, self.persisted = entries, ids, persisted
+            self.stale_ids = stale
+            self.loaded_at = time.time()
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or (not self.live and time.time() - self.loaded_at > RELOAD_INTERVAL):
+            self.load()
+
+    # Escritura
+
+    def apply_snapshot(self, exchange, balances, pricing=None):
+        """Foto de la cuenta de un exchange: {activo: AssetBalance}
+
+        Todos los activos se valoran de una vez con los precios de pricing (por
+        defecto los del propio exchange, ver usd_valuation). Los activos que ya
+        no aparecen (o a cero) se eliminan. Devuelve el valor total en USD.
+        """
+        self._start()
+        balances = {asset: balance for asset, balance in balances.items() if balance.total > 0}
+        values = usd_valuation.value_all({asset: balance.total for asset, balance in balances.items()},
+                                         pricing or exchange)
+        exchange = self._key(exchange, None)[0]
+        now = datetime.utcnow()
+        updated = {}
+        for asset, balance in balances.items():
+            updated[(exchange, asset)] = LedgerEntry(exchange, asset, balance.free, balance.locked, values[asset], now)
+
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == exchange and key not in updated]:
+                del self.entries[key]
+                self.dirty.add(key)
+            for key, entry in updated.items():
+                self.entries[key] = entry
+                if self._changed(key, entry):
+                    self.dirty.add(key)
+        return sum(entry.usd_value for entry in updated.values())
+
+    def apply_fill(self, result, base=None, quote=None):
+        """Aplicar una orden ejecutada (OrderResult) a los balances de su exchange"""
+        if result is None or not result.success or not result.filled_qty:
+            return
+        if base is None or quote is None:
+            base, quote = cost_model.assets(result.exchange, result.symbol)
+        if quote is None:
+            return
+        sign = 1 if result.side == 'BUY' else -1
+        deltas = {base: sign * result.filled_qty, quote: -sign * result.cost}
+        fees = [(fill.fee, fill.fee_asset) for fill in result.fills if fill.fee and fill.fee_asset]
+        if fees:
+            for fee, asset in fees:
+                deltas[asset] = deltas.get(asset, 0.0) - fee
+        elif result.fee:
+            deltas[quote] -= result.fee
+        self.adjust(result.exchange, deltas)
+
+    def adjust(self, exchange, deltas):
+        """Sumar {activo: cantidad} al saldo libre; el valor USD sigue el último precio"""
+        self._start()
+        exchange = self._key(exchange, None)[0]
+        now = datetime.utcnow()
+        with self.lock:
+            for asset, delta in deltas.items():
+                key = (exchange, asset)
+                previous = self.entries.get(key) or LedgerEntry(exchange, asset)
+                free = max(0.0, previous.free_balance + delta)
+                total = free + previous.locked_balance
+                if total <= 0:
+                    if self.entries.pop(key, None) is not None:
+                        self.dirty.add(key)
+                    continue
+                entry = LedgerEntry(exchange, asset, free, previous.locked_balance, total * previous.price, now)
+                self.entries[key] = entry
+                if self._changed(key, entry):
+                    self.dirty.add(key)
+
+    def _changed(self, key, entry):
+        persisted = self.persisted.get(key)
+        if persisted is None:
+            return True
+        free, locked, usd_value = persisted
+        return free != entry.free_balance or locked != entry.locked_balance or \
+            abs(entry.usd_value - usd_value) > USD_TOLERANCE * max(abs(usd_value), 1.0)
+
+    # Lectura
+
+    def snapshot(self, exchange=None):
+        """Balances con saldo de todos los exchanges (o de uno), coherentes entre sí"""
+        self._ensure_loaded()
+        with self.lock:
+            entries = list(self.entries.values())
+        if exchange is not None:
+            exchange = self._key(exchange, None)[0]
+            entries = [entry for entry in entries if entry.exchange == exchange]
+        return sorted(entries, key=lambda entry: (entry.exchange, entry.asset))
+
+    def free(self, exchange, asset):
+        self._ensure_loaded()
+        entry = self.entries.get(self._key(exchange, asset))
+        return entry.free_balance if entry else 0.0
+
+    def total_usd(self, exchange=None):
+        return sum(entry.usd_value for entry in self.snapshot(exchange))
+
+    # Volcado
+
+    def _start(self):
+        """Primer motor que escribe: el libro pasa a ser la fuente de verdad"""
+        if self.is_running:
+            return
+        self._ensure_loaded()
+        with self.lock:
+            if self.is_running:
+                return
+            self.is_running = self.live = True
+        self.thread = threading.Thread(target=self._persist_loop, name='balance-ledger', daemon=True)
+        self.thread.start()
+        atexit.register(self.persist)
+
+    def _persist_loop(self):
+        while self.is_running:
+            time.sleep(self.persist_interval)
+            self.persist()
+
+    def persist(self):
+        """Actualizar, insertar y borrar en bloque solo las filas que cambiaron"""
+        with self.lock:
+            if not self.dirty and not self.stale_ids:
+                return 0
+            keys, self.dirty = self.dirty, set()
+            changes = {key: self.entries.get(key) for key in keys}
+            stale_ids, self.stale_ids = self.stale_ids, []
+
+        updates, inserts, deletes = [], [], list(stale_ids)
+        for key, entry in changes.items():
+            row_id = self.ids.get(key)
+            if entry is None:
+                if row_id is not None:
+                    deletes.append(row_id)
+            elif row_id is not None:
+                updates.append(dict(entry.to_mapping(), id=row_id))
+            else:
+                inserts.append(entry.to_mapping())
+
+        try:
+            from app import app, db
+            from models import Balance
+            with app.app_context():
+                if updates:
+                    db.session.bulk_update_mappings(Balance, updates)
+                if inserts:
+                    db.session.bulk_insert_mappings(Balance, inserts, return_defaults=True)
+                if deletes:
+                    Balance.query.filter(Balance.id.in_(deletes)).delete(synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            logging.error(f"Error volcando balances a la base de datos: {e}")
+            with self.lock:
+                self.dirty |= keys  # se reintenta en el siguiente volcado
+                self.stale_ids = stale_ids + self.stale_ids
+            return 0
+
+        with self.lock:
+            for key, entry in changes.items():
+                if entry is None:
+                    self.ids.pop(key, None)
+                    self.persisted.pop(key, None)
+                    continue
+                self.persisted[key] = (entry.free_balance, entry.locked_balance, entry.usd_value)
+            for mapping in inserts:
+                self.ids[(mapping['exchange'], mapping['asset'])] = mapping['id']
+        return len(updates) + len(inserts) + len(deletes)
+
+
+# Instancia global compartida por todos los motores
+balance_ledger = BalanceLedger()
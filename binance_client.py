@@ -1,13 +1,31 @@
 import time
 import hashlib
 import hmac
-import requests
 import json
 import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from urllib.parse import urlencode
+from async_http import AsyncHttpClient, HttpRequestError
+from rate_limiter import PRIORITY_MARKET_DATA, PRIORITY_ORDER, PRIORITY_POSITION, get_rate_limiter
+
+# Request weight per endpoint (without symbol for the bulk ticker endpoints)
+ENDPOINT_WEIGHTS = {
+    '/api/v3/account': 20,
+    '/api/v3/exchangeInfo': 20,
+    '/api/v3/ticker/price': 4,
+    '/api/v3/ticker/bookTicker': 4,
+    '/api/v3/ticker/24hr': 80,
+    '/api/v3/klines': 2,
+}
+
+def _decimal(value):
+    """Order amount as plain decimal text: str(0.00005) is '5e-05', which Binance rejects"""
+    if isinstance(value, str):
+        return value
+    return f"{float(value):.8f}".rstrip('0').rstrip('.') or '0'
 
 class BinanceClient:
-    def __init__(self, api_key, api_secret, testnet=False):
+    def __init__(self, api_key, api_secret, testnet=False, timeout=10.0, pool_size=10, retries=2):
         self.api_key = api_key
         self.api_secret = api_secret
         
@@ -16,7 +34,10 @@ class BinanceClient:
         else:
             self.base_url = 'https://api.binance.com'
         
-        self.session = requests.Session()
+        # Keep-alive pool with per-call timeout; GETs are retried with jittered backoff
+        self.http = AsyncHttpClient(self.base_url, 'Binance', pool_size=pool_size,
+                                    timeout=timeout, retries=retries,
+                                    rate_limiter=get_rate_limiter('binance'))
         logging.info("Binance client initialized")
 
     def _generate_signature(self, query_string):
@@ -27,12 +48,9 @@ class BinanceClient:
             hashlib.sha256
         ).hexdigest()
 
-    def _make_request(self, endpoint, method='GET', params=None, signed=False):
-        """Make request to Binance API"""
-        url = self.base_url + endpoint
-        
-        if params is None:
-            params = {}
+    def _prepare_request(self, params, signed):
+        """Build headers and (optionally) signed params for a request"""
+        params = dict(params) if params else {}
         
         headers = {
             'X-MBX-APIKEY': self.api_key,
@@ -44,21 +62,73 @@ class BinanceClient:
             query_string = urlencode(params)
             params['signature'] = self._generate_signature(query_string)
         
+        return params, headers
+
+    @staticmethod
+    def _request_weight(endpoint, params):
+        """Weight charged by Binance for a request"""
+        if endpoint == '/api/v3/depth':
+            limit = int(params.get('limit', 100))
+            return 5 if limit <= 100 else 25 if limit <= 500 else 50 if limit <= 1000 else 250
+        if params.get('symbol') and endpoint in ('/api/v3/ticker/price', '/api/v3/ticker/bookTicker'):
+            return 2
+        if params.get('symbol') and endpoint == '/api/v3/ticker/24hr':
+            return 2
+        if endpoint == '/api/v3/openOrders':
+            return 6 if params.get('symbol') else 80
+        return ENDPOINT_WEIGHTS.get(endpoint, 1)
+
+    @staticmethod
+    def _request_priority(method, signed):
+        """Orders first, then account/position reads, then market data"""
+        if method != 'GET':
+            return PRIORITY_ORDER
+        return PRIORITY_POSITION if signed else PRIORITY_MARKET_DATA
+
+    def _make_request(self, endpoint, method='GET', params=None, signed=False, timeout=None, priority=None):
+        """Make request to Binance API (sync wrapper over the async pool)"""
+        if method not in ('GET', 'POST', 'DELETE'):
+            raise ValueError(f"Unsupported method: {method}")
+        
+        params, headers = self._prepare_request(params, signed)
+        weight = self._request_weight(endpoint, params)
+        if priority is None:
+            priority = self._request_priority(method, signed)
+        try:
+            return self.http.request_sync(method, endpoint, params=params, headers=headers, timeout=timeout,
+                                          weight=weight, priority=priority)
+        except HttpRequestError as e:
+            logging.error(f"Binance API request failed: {e}")
+            return None
+        except FutureTimeoutError:
+            # The sync wrapper gave up waiting on the shared loop; the request is cancelled there
+            logging.error(f"Binance API request timed out: {method} {endpoint}")
+            return None
+
+    async def _make_request_async(self, endpoint, method='GET', params=None, signed=False, timeout=None,
+                                  priority=None):
+        """Async variant of _make_request for code running on the shared loop"""
+        if method not in ('GET', 'POST', 'DELETE'):
+            raise ValueError(f"Unsupported method: {method}")
+        
+        params, headers = self._prepare_request(params, signed)
+        weight = self._request_weight(endpoint, params)
+        if priority is None:
+            priority = self._request_priority(method, signed)
         try:
-            if method == 'GET':
-                response = self.session.get(url, headers=headers, params=params)
-            elif method == 'POST':
-                response = self.session.post(url, headers=headers, params=params)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
+            return await self.http.request(method, endpoint, params=params, headers=headers, timeout=timeout,
+                                           weight=weight, priority=priority)
+        except HttpRequestError as e:
             logging.error(f"Binance API request failed: {e}")
             return None
 
+    def prewarm(self, connections=None):
+        """Open pooled connections ahead of the first trading cycle"""
+        return self.http.prewarm('/api/v3/ping', connections)
+
+    def close(self):
+        self.http.close()
+
     def get_account(self):
         """Get account information"""
         return self._make_request('/api/v3/account', signed=True)
@@ -68,6 +138,18 @@ class BinanceClient:
         params = {'symbol': symbol}
         return self._make_request('/api/v3/ticker/price', params=params)
 
+    def get_all_prices(self):
+        """Get latest price for every symbol in one request"""
+        return self._make_request('/api/v3/ticker/price')
+
+    def get_book_ticker(self, symbol):
+        """Get best bid/ask price and quantity for one symbol"""
+        return self._make_request('/api/v3/ticker/bookTicker', params={'symbol': symbol})
+
+    def get_book_tickers(self):
+        """Get best bid/ask price and quantity for every symbol in one request"""
+        return self._make_request('/api/v3/ticker/bookTicker')
+
     def get_order_book(self, symbol, limit=100):
         """Get order book for a symbol"""
         params = {'symbol': symbol, 'limit': limit}
@@ -96,7 +178,7 @@ class BinanceClient:
             'symbol': symbol,
             'side': 'BUY',
             'type': 'MARKET',
-            'quoteOrderQty': quoteOrderQty
+            'quoteOrderQty': _decimal(quoteOrderQty)
         }
         return self._make_request('/api/v3/order', method='POST', params=params, signed=True)
 
@@ -106,10 +188,15 @@ class BinanceClient:
             'symbol': symbol,
             'side': 'SELL',
             'type': 'MARKET',
-            'quantity': quantity
+            'quantity': _decimal(quantity)
         }
         return self._make_request('/api/v3/order', method='POST', params=params, signed=True)
 
+    def get_open_orders(self, symbol=None):
+        """Get open orders for one symbol or the whole account"""
+        params = {'symbol': symbol} if symbol else {}
+        return self._make_request('/api/v3/openOrders', params=params, signed=True)
+
     def test_connection(self):
         """Test API connection"""
         try:
@@ -119,6 +206,10 @@ class BinanceClient:
             logging.error(f"Binance connection test failed: {e}")
             return False
 
+    def get_trade_fees(self):
+        """Get maker/taker commission for every symbol on this account"""
+        return self._make_request('/sapi/v1/asset/tradeFee', signed=True)
+
     def get_exchange_info(self):
         """Get exchange information"""
         return self._make_request('/api/v3/exchangeInfo')
\ No newline at end of file
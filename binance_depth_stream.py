@@ -0,0 +1,131 @@
+"""
+Libros de órdenes de Binance mantenidos localmente
+Sigue el procedimiento oficial: stream <symbol>@depth@100ms + snapshot REST,
+descartando eventos anteriores al snapshot y resincronizando ante huecos de
+secuencia (U != u_anterior + 1).
+"""
+import asyncio
+import json
+import logging
+from order_book_stream import OrderBookStream
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+
+class BinanceDepthStream(OrderBookStream):
+    """Gestor de libros locales de Binance a partir de diffs de profundidad"""
+
+    name = 'binance-depth'
+
+    def __init__(self, client, symbols, snapshot_limit=1000, testnet=False, max_age=5.0):
+        super().__init__(symbols, max_age=max_age)
+        self.client = client
+        self.snapshot_limit = snapshot_limit
+        self.base_url = 'wss://testnet.binance.vision' if testnet else 'wss://stream.binance.com:9443'
+        self.buffers = {symbol: [] for symbol in symbols}
+        self.snapshot_tasks = {}
+
+    def _stream_url(self):
+        streams = '/'.join(f"{symbol.lower()}@depth@100ms" for symbol in self.books)
+        return f"{self.base_url}/stream?streams={streams}"
+
+    async def _stream(self):
+        if websockets is None:
+            self.is_running = False
+            raise RuntimeError("websockets no está instalado")
+
+        async with websockets.connect(self._stream_url(), ping_interval=20, max_size=None) as ws:
+            logging.info(f"Conectado a {self.name}")
+            for symbol in self.books:
+                self._request_snapshot(symbol)
+
+            async for message in ws:
+                payload = json.loads(message)
+                event = payload.get('data', payload)
+                symbol = event.get('s')
+                if symbol in self.books:
+                    self._on_event(symbol, event)
+
+    def _request_snapshot(self, symbol, delay=0):
+        """Pedir snapshot REST (una sola tarea en vuelo por símbolo)"""
+        task = self.snapshot_tasks.get(symbol)
+        if task is None or task.done():
+            self.snapshot_tasks[symbol] = asyncio.ensure_future(self._load_snapshot(symbol, delay))
+
+    async def _load_snapshot(self, symbol, delay=0):
+        if delay:
+            await asyncio.sleep(delay)
+
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(
+            None, lambda: self.client.get_order_book(symbol=symbol, limit=self.snapshot_limit)
+        )
+        # Liberar la tarea antes de reproducir, por si hay que pedir otro snapshot
+        self.snapshot_tasks.pop(symbol, None)
+
+        if not snapshot or 'lastUpdateId' not in snapshot:
+            logging.warning(f"Snapshot de {symbol} no disponible, reintentando")
+            self._request_snapshot(symbol, delay=1)
+            return
+
+        book = self.books[symbol]
+        book.load_snapshot(snapshot['bids'], snapshot['asks'], snapshot['lastUpdateId'])
+
+        # Reproducir los eventos recibidos mientras llegaba el snapshot
+        buffered, self.buffers[symbol] = self.buffers[symbol], []
+        for index, event in enumerate(buffered):
+            if event['u'] <= book.last_update_id:
+                continue
+
+            if not book.synced and event['U'] > book.last_update_id + 1:
+                # Snapshot más antiguo que los eventos: conservar el buffer y pedir otro
+                book.reset()
+                self.buffers[symbol] = buffered[index:]
+                self._request_snapshot(symbol, delay=0.5)
+                return
+
+            if not self._apply_event(book, event):
+                # Hueco a mitad de la reproducción: libro descartado y snapshot nuevo pedido;
+                # se conserva el resto del buffer para reproducirlo sobre ese snapshot
+                self.buffers[symbol] = buffered[index:]
+                return
+
+    def _on_event(self, symbol, event):
+        book = self.books[symbol]
+        if book.last_update_id is None:
+            self.buffers[symbol].append(event)
+            self._request_snapshot(symbol)
+            return
+        self._apply_event(book, event)
+
+    def _apply_event(self, book, event):
+        """Aplicar un diff respetando la secuencia; devuelve False si hubo que resincronizar"""
+        first_id, last_id = event['U'], event['u']
+
+        # Evento ya incluido en el snapshot
+        if last_id <= book.last_update_id:
+            return True
+
+        if book.synced:
+            in_sequence = first_id == book.last_update_id + 1
+        else:
+            # Primer evento tras el snapshot: debe cubrir lastUpdateId + 1
+            in_sequence = first_id <= book.last_update_id + 1 <= last_id
+
+        if not in_sequence:
+            logging.warning(f"Hueco de secuencia en {book.symbol}, resincronizando")
+            self._resync(book.symbol, event)
+            return False
+
+        book.apply(event['b'], event['a'], last_id)
+        book.synced = True
+        return True
+
+    def _resync(self, symbol, event=None):
+        """Descartar el libro y reconstruirlo desde un snapshot nuevo"""
+        self.books[symbol].reset()
+        self.buffers[symbol] = [event] if event else []
+        self._request_snapshot(symbol, delay=0.5)
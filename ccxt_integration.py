@@ -1,8 +1,9 @@
-import subprocess
-import json
 import logging
 import time
 from datetime import datetime
+from async_exchange import run_exchange_command
+from market_data_hub import market_data_hub
+from arbitrage_matrix import ArbitrageMatrix
 
 class CCXTIntegration:
     """Integración CCXT para múltiples exchanges"""
@@ -12,74 +13,19 @@ class CCXTIntegration:
         logging.info("CCXT Integration initialized")
     
     def run_ccxt_command(self, command, exchange, symbol=None, params=None):
-        """Ejecutar comando CCXT usando Node.js"""
-        try:
-            # Crear script temporal de Node.js
-            script = f"""
-const ccxt = require('ccxt');
-
-async function execute() {{
-    try {{
-        const exchange = new ccxt.{exchange}({{
-            sandbox: true,
-            enableRateLimit: true,
-        }});
-        
-        let result;
-        switch ('{command}') {{
-            case 'fetch_ticker':
-                result = await exchange.fetchTicker('{symbol or "BTC/USDT"}');
-                break;
-            case 'fetch_order_book':
-                result = await exchange.fetchOrderBook('{symbol or "BTC/USDT"}');
-                break;
-            case 'fetch_markets':
-                result = await exchange.fetchMarkets();
-                break;
-            case 'fetch_balance':
-                result = await exchange.fetchBalance();
-                break;
-            case 'fetch_ohlcv':
-                result = await exchange.fetchOHLCV('{symbol or "BTC/USDT"}', '1m', undefined, 10);
-                break;
-            default:
-                throw new Error('Unknown command');
-        }}
-        
-        console.log(JSON.stringify(result));
-    }} catch (error) {{
-        console.error(JSON.stringify({{error: error.message}}));
-    }}
-}}
-
-execute();
-"""
-            
-            # Escribir script temporal
-            with open('/tmp/ccxt_script.js', 'w') as f:
-                f.write(script)
-            
-            # Ejecutar con Node.js
-            result = subprocess.run(
-                ['node', '/tmp/ccxt_script.js'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                return json.loads(result.stdout)
-            else:
-                logging.error(f"CCXT error: {result.stderr}")
-                return None
-                
-        except Exception as e:
-            logging.error(f"Error running CCXT command: {e}")
-            return None
+        """Ejecutar comando CCXT (en proceso, o en el pool Node si ccxt no está instalado)"""
+        return run_exchange_command(
+            command,
+            exchange,
+            symbol or 'BTC/USDT',
+            params=params,
+            credentials={'sandbox': True},
+            timeout=10
+        )
     
     def get_ticker(self, exchange, symbol):
-        """Obtener precio actual de un símbolo"""
-        return self.run_ccxt_command('fetch_ticker', exchange, symbol)
+        """Obtener precio actual de un símbolo (compartido vía market data hub)"""
+        return market_data_hub.get_ticker(exchange, symbol)
     
     def get_order_book(self, exchange, symbol):
         """Obtener libro de órdenes"""
@@ -91,56 +37,31 @@ execute();
     
     def scan_arbitrage_opportunities(self, symbol='BTC/USDT'):
         """Escanear oportunidades de arbitraje entre exchanges"""
-        opportunities = []
-        prices = {}
-        
         # Obtener precios de todos los exchanges
-        for exchange in self.exchanges:
-            ticker = self.get_ticker(exchange, symbol)
-            if ticker and 'bid' in ticker and 'ask' in ticker:
-                prices[exchange] = {
-                    'bid': ticker['bid'],
-                    'ask': ticker['ask'],
-                    'last': ticker['last']
-                }
-        
-        # Buscar oportunidades de arbitraje
-        for buy_exchange, buy_data in prices.items():
-            for sell_exchange, sell_data in prices.items():
-                if buy_exchange != sell_exchange:
-                    # Calcular spread
-                    spread = (sell_data['bid'] - buy_data['ask']) / buy_data['ask']
-                    
-                    if spread > 0.003:  # Mínimo 0.3% de spread
-                        opportunities.append({
-                            'symbol': symbol,
-                            'buy_exchange': buy_exchange,
-                            'sell_exchange': sell_exchange,
-                            'buy_price': buy_data['ask'],
-                            'sell_price': sell_data['bid'],
-                            'spread_percentage': spread * 100,
-                            'potential_profit': 1000 * spread  # Ganancia en $1000
-                        })
+        snapshot = market_data_hub.get_snapshot(self.exchanges, [symbol])
+        matrix = ArbitrageMatrix.from_snapshot(snapshot, [symbol], self.exchanges)
         
-        # Ordenar por mayor spread
-        opportunities.sort(key=lambda x: x['spread_percentage'], reverse=True)
-        return opportunities[:5]  # Top 5 oportunidades
+        # Top 5 oportunidades por spread neto, mínimo 0.3%
+        opportunities = matrix.top(5, min_spread=0.003)
+        for opportunity in opportunities:
+            opportunity['potential_profit'] = 1000 * opportunity['net_spread_percentage'] / 100  # Ganancia en $1000
+        return opportunities
     
     def get_multi_exchange_prices(self, symbols=['BTC/USDT', 'ETH/USDT', 'ADA/USDT']):
         """Obtener precios de múltiples exchanges para comparación"""
         results = {}
+        snapshot = market_data_hub.get_snapshot(self.exchanges, symbols)
         
         for symbol in symbols:
             results[symbol] = {}
-            for exchange in self.exchanges:
-                ticker = self.get_ticker(exchange, symbol)
-                if ticker:
-                    results[symbol][exchange] = {
-                        'price': ticker.get('last', 0),
-                        'bid': ticker.get('bid', 0),
-                        'ask': ticker.get('ask', 0),
-                        'volume': ticker.get('baseVolume', 0)
-                    }
+            for exchange, quote in snapshot.by_symbol(symbol).items():
+                results[symbol][exchange] = {
+                    'price': quote['last'] or 0,
+                    'bid': quote['bid'] or 0,
+                    'ask': quote['ask'] or 0,
+                    'volume': quote['volume'],
+                    'timestamp': quote['timestamp']
+                }
         
         return results
     
@@ -149,9 +70,10 @@ execute();
         best_buy = {'exchange': None, 'price': float('inf')}
         best_sell = {'exchange': None, 'price': 0}
         
-        for exchange in self.exchanges:
-            ticker = self.get_ticker(exchange, symbol)
-            if ticker and 'ask' in ticker and 'bid' in ticker:
+        snapshot = market_data_hub.get_snapshot(self.exchanges, [symbol])
+        for ticker in snapshot.by_symbol(symbol).values():
+            exchange = ticker['exchange']
+            if ticker['ask'] and ticker['bid']:
                 # Mejor precio de compra (ask más bajo)
                 if ticker['ask'] < best_buy['price']:
                     best_buy = {
@@ -0,0 +1,113 @@
+// Worker CCXT persistente
+// Protocolo: una petición JSON por línea en stdin, una respuesta JSON por línea en stdout.
+// Petición:  {"id": 1, "method": "fetch_ticker", "exchange": "binance", "symbol": "BTC/USDT", "params": {}, "credentials": {}}
+// Respuesta: {"id": 1, "result": {...}} o {"id": 1, "error": "mensaje"}
+// Las peticiones se atienden concurrentemente, así que el cliente puede encadenar varias sin esperar.
+const ccxt = require('ccxt');
+const readline = require('readline');
+
+const exchanges = new Map();
+const marketsLoading = new Map();
+
+function getExchange(exchangeId, credentials) {
+    const creds = credentials || {};
+    const key = `${exchangeId}:${creds.apiKey || ''}:${creds.sandbox ? 1 : 0}`;
+
+    if (!exchanges.has(key)) {
+        if (!ccxt[exchangeId]) {
+            throw new Error(`Unknown exchange: ${exchangeId}`);
+        }
+        const exchange = new ccxt[exchangeId]({
+            apiKey: creds.apiKey || undefined,
+            secret: creds.secret || undefined,
+            password: creds.password || undefined,
+            sandbox: Boolean(creds.sandbox),
+            enableRateLimit: true,
+        });
+        exchanges.set(key, exchange);
+    }
+
+    return [key, exchanges.get(key)];
+}
+
+async function ensureMarkets(key, exchange) {
+    // Mercados cargados una sola vez por instancia, compartidos entre peticiones concurrentes
+    if (!marketsLoading.has(key)) {
+        marketsLoading.set(key, exchange.loadMarkets().catch((error) => {
+            marketsLoading.delete(key);
+            throw error;
+        }));
+    }
+    return marketsLoading.get(key);
+}
+
+async function execute(request) {
+    if (request.method === 'ping') {
+        return { success: true };
+    }
+
+    const [key, exchange] = getExchange(request.exchange, request.credentials);
+    const symbol = request.symbol || 'BTC/USDT';
+    const params = request.params || {};
+
+    await ensureMarkets(key, exchange);
+
+    switch (request.method) {
+        case 'fetch_ticker':
+            return await exchange.fetchTicker(symbol);
+        case 'fetch_tickers':
+            return await exchange.fetchTickers(params.symbols);
+        case 'fetch_order_book':
+            return await exchange.fetchOrderBook(symbol, params.limit);
+        case 'fetch_markets':
+        case 'load_markets':
+            return exchange.markets;
+        case 'precision_mode':
+            return exchange.precisionMode;
+        case 'fetch_balance':
+            return await exchange.fetchBalance();
+        case 'fetch_ohlcv':
+            return await exchange.fetchOHLCV(symbol, params.timeframe || '1m', undefined, params.limit || 10);
+        case 'create_market_buy_order':
+            if (params.cost !== undefined) {
+                return await exchange.createMarketBuyOrderWithCost(symbol, params.cost);
+            }
+            return await exchange.createMarketBuyOrder(symbol, params.amount);
+        case 'create_market_sell_order':
+            return await exchange.createMarketSellOrder(symbol, params.amount);
+        case 'fetch_open_orders':
+            return await exchange.fetchOpenOrders(request.symbol || undefined);
+        case 'test_connection': {
+            const ticker = await exchange.fetchTicker('BTC/USDT');
+            return { success: true, price: ticker.last };
+        }
+        default:
+            throw new Error(`Unknown command: ${request.method}`);
+    }
+}
+
+function reply(message) {
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+const input = readline.createInterface({ input: process.stdin, terminal: false });
+
+input.on('line', (line) => {
+    if (!line.trim()) {
+        return;
+    }
+
+    let request;
+    try {
+        request = JSON.parse(line);
+    } catch (error) {
+        reply({ id: null, error: `Invalid request: ${error.message}` });
+        return;
+    }
+
+    execute(request)
+        .then((result) => reply({ id: request.id, result: result }))
+        .catch((error) => reply({ id: request.id, error: error.message }));
+});
+
+input.on('close', () => process.exit(0));
@@ -0,0 +1,158 @@
+"""
+Pool de workers CCXT persistentes (Node.js)
+Mantiene procesos `node ccxt_worker.js` vivos con exchanges y mercados ya cargados,
+y les envía peticiones JSON-RPC por stdin/stdout con IDs para poder encadenarlas.
+"""
+import itertools
+import json
+import logging
+import os
+import subprocess
+import threading
+import zlib
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ccxt_worker.js')
+
+
+class CCXTWorkerError(Exception):
+    """Error devuelto por el worker CCXT"""
+
+
+class CCXTWorker:
+    """Proceso Node.js de larga duración que atiende peticiones CCXT"""
+
+    def __init__(self, name='ccxt-worker'):
+        self.name = name
+        self.process = None
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Arrancar el proceso Node y el hilo lector"""
+        self.process = subprocess.Popen(
+            ['node', WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1
+        )
+        reader = threading.Thread(target=self._read_loop, args=(self.process,), name=self.name, daemon=True)
+        reader.start()
+        logging.info(f"{self.name} iniciado (pid {self.process.pid})")
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def submit(self, method, exchange, symbol=None, params=None, credentials=None):
+        """Enviar una petición sin esperar la respuesta"""
+        future = Future()
+
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+
+            request_id = next(self.ids)
+            request = {
+                'id': request_id,
+                'method': method,
+                'exchange': exchange,
+                'symbol': symbol,
+                'params': params or {},
+                'credentials': credentials or {}
+            }
+            self.pending[request_id] = future
+
+            try:
+                self.process.stdin.write(json.dumps(request) + '\n')
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self.pending.pop(request_id, None)
+                future.set_exception(CCXTWorkerError(f"{self.name} no disponible: {e}"))
+
+        return future
+
+    def _read_loop(self, process):
+        """Leer respuestas línea a línea y resolver las peticiones pendientes"""
+        for line in process.stdout:
+            if not line.strip():
+                continue
+
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logging.warning(f"{self.name}: respuesta no válida")
+                continue
+
+            with self.lock:
+                future = self.pending.pop(message.get('id'), None)
+
+            if future is None:
+                continue
+
+            if 'error' in message:
+                future.set_exception(CCXTWorkerError(message['error']))
+            else:
+                future.set_result(message.get('result'))
+
+        # El proceso terminó: fallar todo lo que quedaba pendiente
+        with self.lock:
+            if self.process is process:
+                pending, self.pending = self.pending, {}
+            else:
+                pending = {}
+
+        for future in pending.values():
+            future.set_exception(CCXTWorkerError(f"{self.name} terminó inesperadamente"))
+
+    def stop(self):
+        """Detener el proceso"""
+        with self.lock:
+            if self.is_alive():
+                self.process.stdin.close()
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+            self.process = None
+
+
+class CCXTWorkerPool:
+    """Pool de workers CCXT; cada exchange se enruta siempre al mismo worker"""
+
+    def __init__(self, size=None):
+        self.size = size or int(os.environ.get('CCXT_WORKERS', 2))
+        self.workers = [CCXTWorker(f"ccxt-worker-{i}") for i in range(self.size)]
+
+    def _worker_for(self, exchange):
+        # Enrutado estable para que los mercados de un exchange se carguen en un solo proceso
+        return self.workers[zlib.crc32(exchange.encode('utf-8')) % self.size]
+
+    def submit(self, method, exchange, symbol=None, params=None, credentials=None):
+        """Enviar petición y devolver un Future (permite encadenar peticiones)"""
+        return self._worker_for(exchange).submit(method, exchange, symbol, params, credentials)
+
+    def call(self, method, exchange, symbol=None, params=None, credentials=None, timeout=10):
+        """Ejecutar petición y esperar el resultado; devuelve None si falla"""
+        try:
+            # Dentro del try: sin node (FileNotFoundError al arrancar el worker) también devuelve None
+            future = self.submit(method, exchange, symbol, params, credentials)
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logging.error(f"CCXT timeout: {method} {exchange} {symbol or ''}")
+        except CCXTWorkerError as e:
+            logging.error(f"CCXT error: {e}")
+        except Exception as e:
+            logging.error(f"Error running CCXT command: {e}")
+        return None
+
+    def stop(self):
+        """Detener todos los workers"""
+        for worker in self.workers:
+            worker.stop()
+
+
+# Instancia global del pool
+ccxt_worker_pool = CCXTWorkerPool()
@@ -0,0 +1,233 @@
+"""
+Modelo de costes de una oportunidad
+Convierte un spread bruto en ventaja neta esperada restando, por pata, la
+comisión del exchange (maker/taker desde symbol_metadata) y la selección
+adversa estimada como volatilidad reciente x raíz de la latencia medida de
+las órdenes; y, entre exchanges, el coste de retiro para reequilibrar
+inventario amortizado sobre el volumen de cada reequilibrio.
+El coste por (exchange, símbolo) se cachea y se recalcula en segundo plano.
+"""
+import logging
+import math
+import threading
+import time
+from market_data_hub import market_data_hub
+from symbol_metadata import DEFAULT_FEE, symbol_metadata
+
+# Comisión de retiro por activo (unidades del activo, red barata habitual)
+WITHDRAWAL_FEES = {
+    'USDT': 1.0,
+    'USDC': 1.0,
+    'BTC': 0.0002,
+    'ETH': 0.002,
+    'BNB': 0.0005,
+    'ADA': 1.0,
+    'XRP': 0.25,
+    'DOT': 0.1,
+    'SOL': 0.01,
+    'LTC': 0.001,
+    'TRX': 1.0,
+}
+
+# Nombres del hub que son el mismo exchange para comisiones y latencia
+EXCHANGE_ALIASES = {'binance_spot': 'binance'}
+
+QUOTE_ASSETS = ('USDT', 'USDC', 'BUSD', 'BTC', 'ETH', 'BNB')
+
+
+class LegCost:
+    """Coste de una pata como fracción del nominal"""
+
+    __slots__ = ('taker_fee', 'maker_fee', 'adverse', 'updated_at')
+
+    def __init__(self, taker_fee, maker_fee, adverse, updated_at):
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.adverse = adverse
+        self.updated_at = updated_at
+
+    def total(self, maker=False):
+        return (self.maker_fee if maker else self.taker_fee) + self.adverse
+
+
+class CostModel:
+    """Ventaja neta esperada de cada spread, con costes cacheados por (exchange, símbolo)"""
+
+    def __init__(self, hub=None, refresh_interval=5.0, rebalance_notional=1000.0, default_latency=0.5,
+                 latency_alpha=0.2, volatility_halflife=60.0, risk_multiplier=1.0):
+        self.hub = hub or market_data_hub
+        self.refresh_interval = refresh_interval
+        self.rebalance_notional = rebalance_notional  # USD movidos en cada reequilibrio
+        self.default_latency = default_latency        # segundos, hasta tener medidas
+        self.latency_alpha = latency_alpha
+        self.volatility_halflife = volatility_halflife
+        self.risk_multiplier = risk_multiplier        # desviaciones típicas cubiertas
+
+        self.latencies = {}       # exchange -> EWMA de latencia de orden (s)
+        self.variances = {}       # (exchange, símbolo) -> [último mid, instante, varianza por segundo]
+        self.withdrawal_fees = dict(WITHDRAWAL_FEES)
+        self.costs = {}           # (exchange, símbolo) -> LegCost
+        self.lock = threading.Lock()
+        self.token = None
+        self.is_running = False
+        self.thread = None
+
+    @staticmethod
+    def _canonical(exchange):
+        return EXCHANGE_ALIASES.get(exchange, exchange)
+
+    # Medidas
+
+    def record_latency(self, exchange, seconds):
+        """Latencia de ida y vuelta de una orden (envío -> fills conocidos)"""
+        exchange = self._canonical(exchange)
+        with self.lock:
+            previous = self.latencies.get(exchange)
+            self.latencies[exchange] = seconds if previous is None else \
+                previous + self.latency_alpha * (seconds - previous)
+
+    def latency(self, exchange):
+        return self.latencies.get(self._canonical(exchange), self.default_latency)
+
+    def on_quote(self, quote):
+        """Callback del hub: varianza EWMA de los retornos del mid, normalizada por segundo"""
+        bid, ask = quote['bid'], quote['ask']
+        if not bid or not ask:
+            return
+        mid = (bid + ask) / 2
+        now = quote['received_at']
+        key = (self._canonical(quote['exchange']), quote['symbol'])
+
+        with self.lock:
+            state = self.variances.get(key)
+            if state is None:
+                self.variances[key] = [mid, now, 0.0]
+                return
+            last_mid, last_time, variance = state
+            elapsed = now - last_time
+            if elapsed <= 0:
+                return
+            rate = math.log(mid / last_mid) ** 2 / elapsed
+            weight = 1 - 0.5 ** (elapsed / self.volatility_halflife)
+            state[:] = [mid, now, variance + weight * (rate - variance)]
+
+    def volatility(self, exchange, symbol):
+        """Desviación típica del retorno por raíz de segundo"""
+        state = self.variances.get((self._canonical(exchange), symbol))
+        return math.sqrt(state[2]) if state else 0.0
+
+    def set_withdrawal_fee(self, asset, amount):
+        self.withdrawal_fees[asset] = amount
+
+    # Costes
+
+    def _compute(self, exchange, symbol, previous=None):
+        # symbol_metadata no reintenta una descarga fallida hasta que pasa su espera
+        rules = symbol_metadata.get(exchange, symbol)
+        if rules is not None:
+            taker, maker = rules.taker_fee, rules.maker_fee
+        elif previous is not None:
+            # Sin metadatos: se mantienen las comisiones ya conocidas
+            taker, maker = previous.taker_fee, previous.maker_fee
+        else:
+            taker, maker = DEFAULT_FEE, DEFAULT_FEE
+        # El precio puede moverse en contra durante lo que tarda la orden en ejecutarse
+        adverse = self.risk_multiplier * self.volatility(exchange, symbol) * math.sqrt(self.latency(exchange))
+        return LegCost(taker, maker, adverse, time.time())
+
+    def leg_cost(self, exchange, symbol, maker=False):
+        """Comisión + selección adversa de una pata, desde la caché"""
+        key = (self._canonical(exchange), symbol)
+        cost = self.costs.get(key)
+        if cost is None:
+            try:
+                cost = self._compute(key[0], symbol)
+            except Exception as e:
+                logging.debug(f"Coste de {exchange} {symbol} no disponible: {e}")
+                cost = LegCost(DEFAULT_FEE, DEFAULT_FEE, 0.0, time.time())
+            self.costs[key] = cost
+        return cost.total(maker)
+
+    def assets(self, exchange, symbol):
+        """(base, quote) de un símbolo unificado o nativo"""
+        if '/' in symbol:
+            base, quote = symbol.split('/', 1)
+            return base, quote.split(':')[0]
+        rules = symbol_metadata.rules.get(self._canonical(exchange), {}).get(symbol)
+        if rules and rules.base and rules.quote:
+            return rules.base, rules.quote
+        for quote in QUOTE_ASSETS:
+            if symbol.endswith(quote) and len(symbol) > len(quote):
+                return symbol[:-len(quote)].rstrip('-_'), quote
+        return symbol, None
+
+    def rebalance_cost(self, symbol, price, exchange=None):
+        """Retiros para devolver base y quote a su sitio, repartidos en rebalance_notional"""
+        if not price:
+            return 0.0
+        base, quote = self.assets(exchange or '', symbol)
+        base_fee = self.withdrawal_fees.get(base, 0.0) * price
+        quote_fee = self.withdrawal_fees.get(quote, 0.0) if quote else 0.0
+        return (base_fee + quote_fee) / self.rebalance_notional
+
+    def transfer_cost(self, symbol, buy_exchange, sell_exchange, price):
+        """Coste de reequilibrio por operación; cero dentro de un mismo exchange"""
+        if self._canonical(buy_exchange) == self._canonical(sell_exchange):
+            return 0.0
+        return self.rebalance_cost(symbol, price, buy_exchange)
+
+    def net_edge(self, spread, symbol, buy_exchange, sell_exchange, price=None, maker=False):
+        """Spread bruto -> ventaja neta esperada (fracción del nominal)"""
+        return spread - self.cost(symbol, buy_exchange, sell_exchange, price, maker)
+
+    def cost(self, symbol, buy_exchange, sell_exchange, price=None, maker=False):
+        """Coste total de comprar en buy_exchange y vender en sell_exchange"""
+        return (self.leg_cost(buy_exchange, symbol, maker) + self.leg_cost(sell_exchange, symbol, maker)
+                + self.transfer_cost(symbol, buy_exchange, sell_exchange, price))
+
+    def breakdown(self, symbol, buy_exchange, sell_exchange, price=None):
+        """Desglose para logs y panel"""
+        buy = self.costs.get((self._canonical(buy_exchange), symbol))
+        sell = self.costs.get((self._canonical(sell_exchange), symbol))
+        return {
+            'buy_fee': buy.taker_fee if buy else None,
+            'sell_fee': sell.taker_fee if sell else None,
+            'adverse_selection': (buy.adverse if buy else 0.0) + (sell.adverse if sell else 0.0),
+            'transfer': self.transfer_cost(symbol, buy_exchange, sell_exchange, price),
+            'buy_latency': self.latency(buy_exchange),
+            'sell_latency': self.latency(sell_exchange)
+        }
+
+    # Refresco en segundo plano
+
+    def refresh(self):
+        """Recalcular todas las entradas cacheadas con latencias y volatilidades actuales"""
+        for key, previous in list(self.costs.items()):
+            exchange, symbol = key
+            try:
+                self.costs[key] = self._compute(exchange, symbol, previous)
+            except Exception as e:
+                logging.debug(f"Error refrescando coste de {exchange} {symbol}: {e}")
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self.token = self.hub.subscribe(self.on_quote)
+        self.thread = threading.Thread(target=self._refresh_loop, name='cost-model', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+        if self.token is not None:
+            self.hub.unsubscribe(self.token)
+            self.token = None
+
+    def _refresh_loop(self):
+        while self.is_running:
+            time.sleep(self.refresh_interval)
+            self.refresh()
+
+
+# Instancia global compartida por todos los motores
+cost_model = CostModel()
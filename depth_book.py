@@ -0,0 +1,168 @@
+"""
+Libro de órdenes sobre arrays NumPy
+Precios y cantidades de cada lado en arrays contiguos con sumas acumuladas,
+para responder en microsegundos cuánto cuesta comprar N unidades de quote,
+a qué VWAP se venden Q unidades base y cuánta profundidad hay a X bps del
+mejor precio. Lo usan el escáner, el dimensionado de riesgo y el simulador.
+"""
+import numpy as np
+
+
+class DepthBook:
+    """Libro inmutable: asks ascendentes, bids descendentes"""
+
+    __slots__ = ('symbol', 'bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes',
+                 '_bid_cum_qty', '_bid_cum_quote', '_ask_cum_qty', '_ask_cum_quote', 'timestamp')
+
+    def __init__(self, bid_prices, bid_sizes, ask_prices, ask_sizes, symbol=None, timestamp=None):
+        self.symbol = symbol
+        self.timestamp = timestamp
+        self.bid_prices = np.asarray(bid_prices, dtype=np.float64)
+        self.bid_sizes = np.asarray(bid_sizes, dtype=np.float64)
+        self.ask_prices = np.asarray(ask_prices, dtype=np.float64)
+        self.ask_sizes = np.asarray(ask_sizes, dtype=np.float64)
+
+        # Sumas acumuladas: consultas con searchsorted en lugar de recorrer niveles
+        self._bid_cum_qty = np.cumsum(self.bid_sizes)
+        self._bid_cum_quote = np.cumsum(self.bid_prices * self.bid_sizes)
+        self._ask_cum_qty = np.cumsum(self.ask_sizes)
+        self._ask_cum_quote = np.cumsum(self.ask_prices * self.ask_sizes)
+
+    @classmethod
+    def from_levels(cls, bids, asks, symbol=None, timestamp=None):
+        """Desde [[precio, cantidad], ...] (strings, números o BookLevel)"""
+        bid_array = np.array([(float(p), float(q)) for p, q, *_ in bids or []], dtype=np.float64).reshape(-1, 2)
+        ask_array = np.array([(float(p), float(q)) for p, q, *_ in asks or []], dtype=np.float64).reshape(-1, 2)
+
+        # Garantizar el orden (bids desc, asks asc) aunque la fuente no lo haga
+        bid_array = bid_array[np.argsort(-bid_array[:, 0], kind='stable')]
+        ask_array = ask_array[np.argsort(ask_array[:, 0], kind='stable')]
+        return cls(bid_array[:, 0], bid_array[:, 1], ask_array[:, 0], ask_array[:, 1], symbol, timestamp)
+
+    @classmethod
+    def from_order_book(cls, book, symbol=None):
+        """Desde un dict de la API ({'bids', 'asks'}) o un market_types.OrderBook"""
+        if book is None:
+            return None
+        if isinstance(book, dict):
+            return cls.from_levels(book.get('bids'), book.get('asks'), symbol, book.get('timestamp'))
+        return cls.from_levels(book.bids, book.asks, symbol or book.symbol, book.timestamp)
+
+    # Mejor precio
+
+    @property
+    def best_bid(self):
+        return float(self.bid_prices[0]) if self.bid_prices.size else None
+
+    @property
+    def best_ask(self):
+        return float(self.ask_prices[0]) if self.ask_prices.size else None
+
+    @property
+    def mid(self):
+        if not self.bid_prices.size or not self.ask_prices.size:
+            return None
+        return (self.best_bid + self.best_ask) / 2
+
+    def _side(self, side):
+        if side.upper() == 'BUY':
+            return self.ask_prices, self._ask_cum_qty, self._ask_cum_quote
+        return self.bid_prices, self._bid_cum_qty, self._bid_cum_quote
+
+    # Consultas (escalares o arrays de objetivos)
+
+    def quote_for_base(self, base_qty, side='BUY'):
+        """Quote gastado (BUY) o recibido (SELL) por base_qty; NaN si no hay profundidad"""
+        prices, cum_qty, cum_quote = self._side(side)
+        target = np.asarray(base_qty, dtype=np.float64)
+        if not prices.size:
+            return np.full(target.shape, np.nan)[()]
+
+        index = np.searchsorted(cum_qty, target, side='left')
+        safe = np.minimum(index, prices.size - 1)
+        prev_qty = np.where(safe > 0, cum_qty[safe - 1], 0.0)
+        prev_quote = np.where(safe > 0, cum_quote[safe - 1], 0.0)
+        quote = prev_quote + (target - prev_qty) * prices[safe]
+        return np.where(index < prices.size, quote, np.nan)[()]
+
+    def base_for_quote(self, quote_amount, side='BUY'):
+        """Base obtenido (BUY) o a entregar (SELL) por quote_amount; NaN si no hay profundidad"""
+        prices, cum_qty, cum_quote = self._side(side)
+        target = np.asarray(quote_amount, dtype=np.float64)
+        if not prices.size:
+            return np.full(target.shape, np.nan)[()]
+
+        index = np.searchsorted(cum_quote, target, side='left')
+        safe = np.minimum(index, prices.size - 1)
+        prev_qty = np.where(safe > 0, cum_qty[safe - 1], 0.0)
+        prev_quote = np.where(safe > 0, cum_quote[safe - 1], 0.0)
+        base = prev_qty + (target - prev_quote) / prices[safe]
+        return np.where(index < prices.size, base, np.nan)[()]
+
+    def cost_to_buy_quote(self, quote_amount):
+        """Comprar gastando quote_amount: (cantidad base, VWAP); NaN si no alcanza el libro"""
+        base = self.base_for_quote(quote_amount, 'BUY')
+        return base, np.asarray(quote_amount, dtype=np.float64)[()] / base
+
+    def cost_to_buy(self, base_qty):
+        """Coste en quote y VWAP de comprar base_qty"""
+        quote = self.quote_for_base(base_qty, 'BUY')
+        return quote, quote / np.asarray(base_qty, dtype=np.float64)[()]
+
+    def vwap_to_sell(self, base_qty):
+        """Quote recibido y VWAP de vender base_qty"""
+        quote = self.quote_for_base(base_qty, 'SELL')
+        return quote, quote / np.asarray(base_qty, dtype=np.float64)[()]
+
+    def depth_within(self, bps, side='BUY'):
+        """(base, quote) disponibles a menos de bps puntos básicos del mejor precio"""
+        prices, cum_qty, cum_quote = self._side(side)
+        if not prices.size:
+            return 0.0, 0.0
+
+        best = prices[0]
+        if side.upper() == 'BUY':
+            count = np.searchsorted(prices, best * (1 + bps / 10000.0), side='right')
+        else:
+            count = np.searchsorted(-prices, -best * (1 - bps / 10000.0), side='right')
+        if count == 0:
+            return 0.0, 0.0
+        return float(cum_qty[count - 1]), float(cum_quote[count - 1])
+
+    def max_quote_within_slippage(self, bps, side='BUY'):
+        """Mayor importe en quote cuyo VWAP no se aleja más de bps del mejor precio"""
+        prices, cum_qty, cum_quote = self._side(side)
+        if not prices.size:
+            return 0.0
+
+        best = prices[0]
+        limit = best * (1 + bps / 10000.0) if side.upper() == 'BUY' else best * (1 - bps / 10000.0)
+        # VWAP tras consumir entero cada nivel (monótono en el número de niveles)
+        vwaps = cum_quote / cum_qty
+        if side.upper() == 'BUY':
+            within = np.flatnonzero(vwaps <= limit)
+        else:
+            within = np.flatnonzero(vwaps >= limit)
+        if not within.size:
+            return 0.0
+
+        last = within[-1]
+        full_qty, full_quote = cum_qty[last], cum_quote[last]
+        if last + 1 >= prices.size:
+            return float(full_quote)
+
+        # Parte del siguiente nivel hasta que el VWAP toque el límite
+        next_price = prices[last + 1]
+        denominator = next_price - limit
+        extra_qty = (limit * full_qty - full_quote) / denominator if denominator else 0.0
+        extra_qty = min(max(extra_qty, 0.0), cum_qty[last + 1] - full_qty)
+        return float(full_quote + extra_qty * next_price)
+
+    def slippage_bps(self, quote_amount, side='BUY'):
+        """Desviación del VWAP frente al mejor precio al mover quote_amount"""
+        prices = self._side(side)[0]
+        if not prices.size:
+            return float('nan')
+        base = self.base_for_quote(quote_amount, side)
+        vwap = quote_amount / base
+        return float(abs(vwap - prices[0]) / prices[0] * 10000.0)
@@ -0,0 +1,395 @@
+"""
+Núcleo único de los motores de trading
+Los motores dejan de tener cada uno su bucle, su libro de posiciones, sus
+hilos y sus escrituras a la base de datos: son estrategias (Strategy) que se
+registran en un EngineCore compartido. El núcleo pone un solo EngineLoop, un
+solo libro de posiciones y una sola suscripción por estrategia al market data
+hub, de modo que tres motores a la vez comparten cotizaciones, hilo y volcado
+a SQL. Lo que bloquea (órdenes, balances por REST, estadísticas en SQL) no
+corre en ese hilo: va a un pool de E/S del núcleo (submit) y su resultado
+vuelve al bucle. Lo que cambia entre motores va en plugins:
+
+- Strategy: qué mercados mira, cuándo escanea y qué hace al salir una posición
+- Venue: por dónde salen las órdenes (adaptadores, diario, ejecución en dos patas)
+  y su efecto en el libro de balances
+- Persistence: posiciones, trades, alertas y estadísticas diarias
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from market_data_hub import market_data_hub
+from order_journal import order_journal
+from leg_executor import leg_executor
+from balance_ledger import balance_ledger
+from position_book import PositionBook
+from engine_loop import EngineLoop, PRIORITY_EXIT, PRIORITY_MARKET, PRIORITY_HOUSEKEEPING
+
+
+class Strategy:
+    """Plugin de estrategia: un motor registrado en el núcleo"""
+
+    name = 'strategy'
+    scan_interval = None  # escaneo de respaldo por si dejan de llegar cotizaciones
+    per_pair = False      # on_quote una vez por par (True) o una sola por todos los pares pendientes
+    core = None           # EngineCore en el que está registrada
+
+    def markets(self):
+        """Pares que vigila la estrategia -> {exchange: [símbolos]}"""
+        return {}
+
+    def wants(self, quote):
+        """Filtro en el hilo del hub: solo se encolan las cotizaciones de sus mercados"""
+        return quote['symbol'] in self.markets().get(quote['exchange'], ())
+
+    def setup(self, core):
+        """Al registrarse: temporizadores propios (core.every) y posiciones recuperadas"""
+
+    def on_quote(self, quote):
+        """Cotización nueva de sus mercados (fundidas mientras espera en la cola)"""
+        self.scan()
+
+    def scan(self):
+        """Buscar y ejecutar oportunidades"""
+
+    def on_exit(self, position_id, position, reason, price):
+        """Stop, objetivo o tiempo máximo de una posición vigilada por el núcleo"""
+
+    def on_error(self, error):
+        logging.error(f"Error en la estrategia {self.name}: {error}")
+
+    def teardown(self):
+        """Al quitarse del núcleo"""
+
+
+class Venue:
+    """Plugin de ejecución: adaptadores por exchange con cada orden pasando por el diario"""
+
+    def __init__(self, engine_name, adapters=None, adapter_factory=None):
+        self.engine_name = engine_name
+        self.adapters = adapters if adapters is not None else {}
+        self.adapter_factory = adapter_factory  # adapter_factory(exchange) para los que falten
+        self.lock = threading.Lock()
+
+    def adapter(self, exchange):
+        with self.lock:
+            if exchange not in self.adapters and self.adapter_factory is not None:
+                self.adapters[exchange] = self.adapter_factory(exchange)
+            return self.adapters[exchange]
+
+    def buy(self, exchange, symbol, quote_amount):
+        """Compra a mercado por importe en la moneda de cotización"""
+        result = order_journal.submit(self.engine_name, self.adapter(exchange), 'BUY', symbol, quote_amount)
+        balance_ledger.apply_fill(result)
+        return result
+
+    def sell(self, exchange, symbol, quantity):
+        """Venta a mercado de una cantidad del activo base"""
+        result = order_journal.submit(self.engine_name, self.adapter(exchange), 'SELL', symbol, quantity)
+        balance_ledger.apply_fill(result)
+        return result
+
+    def execute_pair(self, buy_exchange, sell_exchange, symbol, quantity, price, on_late=None):
+        """Compra y venta simultáneas en dos exchanges (ver leg_executor)
+
+        Los fills de una pata que respondió tarde, y sus coberturas, se aplican
+        al libro de balances y llegan a on_late(execution, órdenes) desde el
+        hilo del executor.
+        """
+        base, quote = symbol.split('/')
+
+        def late(execution, orders):
+            for order in orders:
+                balance_ledger.apply_fill(order, base, quote)
+            if on_late is not None:
+                on_late(execution, orders)
+
+        execution = leg_executor.execute(
+            self.adapter(buy_exchange), self.adapter(sell_exchange), symbol, quantity, price, base, quote,
+            on_late=late
+        )
+        for order in execution.orders:
+            balance_ledger.apply_fill(order, base, quote)
+        return execution
+
+    def reconcile(self, *engines):
+        """Órdenes sin resultado antes del reinicio que ya no están abiertas en el exchange"""
+        resolved = []
+        for engine in engines or (self.engine_name,):
+            resolved += order_journal.reconcile(self.adapters, engine)
+        return resolved
+
+
+class Persistence:
+    """Plugin de persistencia: todo pasa por el diario y se vuelca a SQL por lotes"""
+
+    def __init__(self, engine_name):
+        self.engine_name = engine_name
+
+    def recover(self):
+        """Posiciones abiertas de este motor antes del reinicio"""
+        return order_journal.recover(self.engine_name)
+
+    def open_position(self, key, position):
+        order_journal.open_position(self.engine_name, key, position)
+
+    def close_position(self, key, reason=None, profit=None):
+        order_journal.close_position(self.engine_name, key, reason, profit)
+
+    def record_trade(self, **fields):
+        order_journal.record_trade(**fields)
+
+    def record_row(self, model, **fields):
+        order_journal.record_row(model, **fields)
+
+    def alert(self, title, message, alert_type):
+        order_journal.record_alert(title=title, message=message, alert_type=alert_type)
+        logging.info(f"Alert: {title} - {message}")
+
+    def update_daily_stats(self, starting_balance=30.0, from_balances=True):
+        """Estadísticas del día a partir de los trades de hoy
+
+        Con from_balances el día arranca con el saldo final de ayer y termina con
+        el valor del libro de balances; si no, con starting_balance más el
+        resultado de los trades.
+        """
+        from app import db
+        from models import DailyStats, Trade
+        try:
+            today = datetime.now().date()
+            today_trades = Trade.query.filter(
+                Trade.executed_at >= datetime.combine(today, datetime.min.time())
+            ).all()
+            if not today_trades and not from_balances:
+                return
+
+            stats = DailyStats.query.filter_by(date=today).first()
+            if not stats:
+                if from_balances:
+                    yesterday_stats = DailyStats.query.filter_by(date=today - timedelta(days=1)).first()
+                    if yesterday_stats:
+                        starting_balance = yesterday_stats.ending_balance
+                stats = DailyStats()
+                stats.date = today
+                stats.starting_balance = starting_balance
+                stats.ending_balance = starting_balance
+                db.session.add(stats)
+
+            total_profit = sum(t.profit_loss for t in today_trades if t.profit_loss)
+            stats.total_trades = len(today_trades)
+            stats.successful_trades = len([t for t in today_trades if t.profit_loss and t.profit_loss > 0])
+            stats.total_profit = total_profit
+            stats.total_fees = sum(t.fee for t in today_trades if t.fee)
+            if from_balances:
+                stats.ending_balance = balance_ledger.total_usd()
+            else:
+                stats.ending_balance = stats.starting_balance + total_profit
+
+            if stats.starting_balance > 0:
+                stats.roi_percentage = (stats.ending_balance - stats.starting_balance) / stats.starting_balance * 100
+
+            db.session.commit()
+
+        except Exception as e:
+            logging.error(f"Error actualizando estadísticas diarias: {e}")
+
+
+class EngineCore:
+    """Un bucle, un libro de posiciones y una suscripción al hub para todas las estrategias"""
+
+    def __init__(self, hub=None, io_workers=8):
+        self.hub = hub or market_data_hub
+        self.loop = EngineLoop('engine_core', self.hub)
+        self.io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='engine-io')
+        self.busy = set()       # (estrategia, clave) de trabajos en el pool aún sin terminar
+        self.books = {}         # campo de precio ('bid', 'last') -> PositionBook
+        self.strategies = {}    # nombre -> estrategia
+        self.tokens = {}        # nombre -> temporizadores y suscripciones de la estrategia
+        self.lock = threading.Lock()
+        self.is_running = False
+        self.thread = None
+
+    # Estrategias
+
+    def register(self, strategy):
+        """Añadir una estrategia y arrancar el núcleo si hace falta"""
+        with self.lock:
+            if strategy.name in self.strategies:
+                return
+            self.strategies[strategy.name] = strategy
+            self.tokens[strategy.name] = []
+        strategy.core = self
+        self.start()
+
+        for exchange, symbols in strategy.markets().items():
+            self.hub.watch(exchange, symbols)
+        self.tokens[strategy.name].append(self.loop.subscribe_quotes(
+            self._guard(strategy, strategy.on_quote), per_pair=strategy.per_pair, accept=strategy.wants
+        ))
+        if strategy.scan_interval:
+            self.every(strategy, strategy.scan_interval, strategy.scan, PRIORITY_MARKET)
+        self._guard(strategy, strategy.setup)(self)
+        logging.info(f"Estrategia {strategy.name} registrada en el núcleo ({len(self.strategies)} activas)")
+
+    def unregister(self, strategy):
+        """Quitar una estrategia con sus temporizadores y sus posiciones vigiladas"""
+        with self.lock:
+            if self.strategies.pop(strategy.name, None) is None:
+                return
+            tokens = self.tokens.pop(strategy.name, [])
+        for token in tokens:
+            self.loop.cancel(token)
+        for book in self.books.values():
+            for key in [key for key in list(book.entries) if key[0] == strategy.name]:
+                book.remove(key)
+        self._guard(strategy, strategy.teardown)()
+        logging.info(f"Estrategia {strategy.name} retirada del núcleo")
+
+    def every(self, strategy, interval, function, priority=PRIORITY_HOUSEKEEPING, blocking=False):
+        """Tarea periódica de una estrategia; se cancela con unregister
+
+        Con blocking (REST, SQL) corre en el pool de E/S, sin solaparse con la
+        pasada anterior si aún no terminó.
+        """
+        if blocking:
+            task = function
+            function = lambda: self.submit(strategy, task, key=('every', task))
+        token = self.loop.every(interval, self._guard(strategy, function), priority)
+        self.tokens.setdefault(strategy.name, []).append(token)
+        return token
+
+    def submit(self, strategy, function, *args, then=None, key=None, priority=PRIORITY_EXIT, **kwargs):
+        """function(*args, **kwargs) en el pool de E/S; then(resultado) vuelve al bucle con priority
+
+        Si function lanza, el error va a on_error de la estrategia y then
+        recibe None. Con key no se lanza un segundo trabajo con la misma clave
+        mientras el primero siga en curso (devuelve False).
+        """
+        busy_key = None if key is None else (strategy.name, key)
+        with self.lock:
+            if busy_key is not None:
+                if busy_key in self.busy:
+                    return False
+                self.busy.add(busy_key)
+
+        def work():
+            result = None
+            try:
+                from app import app
+                with app.app_context():
+                    result = function(*args, **kwargs)
+            except Exception as e:
+                logging.error(f"Error en {strategy.name}.{getattr(function, '__name__', 'trabajo')}: {e}")
+                self.call_soon(strategy, strategy.on_error, e, priority=priority)
+            finally:
+                with self.lock:
+                    self.busy.discard(busy_key)
+            if then is not None:
+                self.call_soon(strategy, then, result, priority=priority)
+
+        self.io.submit(work)
+        return True
+
+    def call_soon(self, strategy, function, *args, priority=PRIORITY_EXIT):
+        """Encolar function(*args) en el bucle desde cualquier hilo (fills tardíos, callbacks)"""
+        self.loop.call_soon(self._guard(strategy, function), *args, priority=priority)
+
+    def post_once(self, strategy, key, function, priority=PRIORITY_MARKET):
+        """Encolar function() detrás de los eventos ya pendientes, una sola vez por clave"""
+        self.loop.post_once((strategy.name, key), self._guard(strategy, function), priority)
+
+    def _guard(self, strategy, function):
+        """Los errores de una estrategia van a su on_error sin tumbar a las demás"""
+        def guarded(*args):
+            try:
+                return function(*args)
+            except Exception as e:
+                logging.error(f"Error en {strategy.name}.{getattr(function, '__name__', 'handler')}: {e}")
+                try:
+                    strategy.on_error(e)
+                except Exception as error:
+                    logging.error(f"Error en {strategy.name}.on_error: {error}")
+        return guarded
+
+    # Posiciones
+
+    def track(self, strategy, position_id, exchange, symbol, stop_price=None, target_price=None,
+              deadline=None, position=None, price_field='bid'):
+        """Vigilar stop, objetivo y tiempo máximo de una posición; sale por strategy.on_exit"""
+        self._book(price_field).add(
+            (strategy.name, position_id), exchange, symbol, stop_price, target_price, deadline, position
+        )
+
+    def untrack(self, strategy, position_id):
+        for book in self.books.values():
+            book.remove((strategy.name, position_id))
+
+    def _book(self, price_field):
+        with self.lock:
+            book = self.books.get(price_field)
+            if book is None:
+                book = PositionBook(self._on_exit, hub=self.hub, price_field=price_field,
+                                    executor=self.loop.executor(PRIORITY_EXIT))
+                self.books[price_field] = book
+                if self.is_running:
+                    book.start()
+            return book
+
+    def _expire(self):
+        now = time.time()
+        for book in list(self.books.values()):
+            book.expire(now)
+
+    def _on_exit(self, key, position, reason, price):
+        name, position_id = key
+        strategy = self.strategies.get(name)
+        if strategy is None:
+            return  # estrategia retirada mientras la salida esperaba en la cola
+        self._guard(strategy, strategy.on_exit)(position_id, position, reason, price)
+
+    # Ciclo de vida
+
+    def start(self):
+        with self.lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            books = list(self.books.values())
+        for book in books:
+            book.start()
+        self.hub.start()
+        self.loop.every(1.0, self._expire, PRIORITY_EXIT)
+        self.loop.is_running = True
+        self.thread = threading.Thread(target=self._run, name='engine-core', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        # Las estrategias leen y escriben modelos: todo el bucle dentro del contexto de la app
+        from app import app
+        with app.app_context():
+            self.loop.run()
+
+    def stop(self):
+        """Parar el núcleo (al apagar la aplicación)"""
+        with self.lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+        for strategy in list(self.strategies.values()):
+            self.unregister(strategy)
+        for book in self.books.values():
+            book.stop()
+        self.loop.stop()
+
+    def get_status(self):
+        return {
+            'running': self.is_running,
+            'strategies': list(self.strategies),
+            'tracked_positions': sum(len(book) for book in self.books.values()),
+            'events_handled': self.loop.handled
+        }
+
+
+# Instancia global compartida por todos los motores
+engine_core = EngineCore()
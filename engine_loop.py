@@ -0,0 +1,194 @@
+"""
+Bucle de eventos de los motores de trading
+Sustituye el ciclo fijo "balances -> escaneo -> posiciones -> sleep" por una
+cola de eventos con prioridad atendida por un solo hilo: comandos de control,
+salidas de posiciones y fills, cotizaciones del market data hub y tareas
+periódicas (temporizadores). Una salida encolada se atiende antes que
+cualquier escaneo pendiente y una cotización nueva dispara el escaneo al
+instante, así que la reacción cuesta lo que tarda el manejador y no hasta un
+intervalo de sleep más un ciclo completo.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from market_data_hub import market_data_hub
+
+# Prioridades: menor número = antes
+PRIORITY_CONTROL = 0    # parar, pausar, recargar configuración
+PRIORITY_EXIT = 1       # salidas de posiciones y fills
+PRIORITY_MARKET = 2     # cotizaciones y escaneos
+PRIORITY_HOUSEKEEPING = 3  # balances, estadísticas
+
+# Tipos de evento
+CALL = 'call'
+STOP = 'stop'
+
+
+class EngineLoop:
+    """Cola de eventos con prioridad, temporizadores y suscripción al hub"""
+
+    def __init__(self, name, hub=None):
+        self.name = name
+        self.hub = hub or market_data_hub
+        self.events = []            # heap [(prioridad, seq, tipo, datos)]
+        self.timers = []            # heap [(vencimiento, seq, intervalo, prioridad, función)]
+        self.handlers = {}          # tipo -> [manejador(datos)]
+        self.pending = set()        # claves de eventos coalescidos aún en la cola
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.tokens = []
+        self.on_error = None        # on_error(evento, excepción)
+        self.is_running = False
+        self.thread = None
+        self.handled = 0
+
+    # Registro
+
+    def on(self, event_type, handler):
+        """Atender eventos de un tipo con handler(datos)"""
+        self.handlers.setdefault(event_type, []).append(handler)
+
+    def every(self, interval, function, priority=PRIORITY_HOUSEKEEPING, delay=0.0):
+        """Ejecutar function() cada interval segundos (la primera vez tras delay); devuelve un token"""
+        with self.lock:
+            token = next(self.sequence)
+            heapq.heappush(self.timers, (time.time() + delay, token, interval, priority, function))
+            self.wakeup.notify()
+        return token
+
+    def subscribe_quotes(self, handler, symbol=None, exchange=None, priority=PRIORITY_MARKET, per_pair=True,
+                         accept=None):
+        """Cotizaciones del hub como eventos handler(quote); devuelve un token
+
+        Las cotizaciones sin atender se funden en la última: por par, o en una
+        sola llamada para todos los pares con per_pair=False (escaneos globales).
+        accept(quote) descarta las que no interesan antes de encolarlas.
+        """
+        latest = {}
+
+        def on_quote(quote):
+            if accept is not None and not accept(quote):
+                return
+            key = (id(handler), quote['exchange'], quote['symbol']) if per_pair else id(handler)
+            latest[key] = quote
+            self.post_once(key, lambda: handler(latest[key]), priority)
+
+        token = self.hub.subscribe(on_quote, symbol, exchange)
+        self.tokens.append(token)
+        return token
+
+    def cancel(self, token):
+        """Quitar un temporizador de every() o una suscripción de subscribe_quotes()"""
+        if isinstance(token, int):
+            with self.lock:
+                self.timers = [timer for timer in self.timers if timer[1] != token]
+                heapq.heapify(self.timers)
+        elif token in self.tokens:
+            self.tokens.remove(token)
+            self.hub.unsubscribe(token)
+
+    # Publicación (desde cualquier hilo)
+
+    def post(self, event_type, data=None, priority=PRIORITY_MARKET):
+        with self.lock:
+            heapq.heappush(self.events, (priority, next(self.sequence), event_type, data))
+            self.wakeup.notify()
+
+    def call_soon(self, function, *args, priority=PRIORITY_MARKET):
+        self.post(CALL, (function, args, None), priority)
+
+    def post_once(self, key, function, priority=PRIORITY_MARKET):
+        """call_soon salvo que ya haya un evento con esa clave esperando"""
+        with self.lock:
+            self._push_once(key, function, priority)
+            self.wakeup.notify()
+
+    def _push_once(self, key, function, priority):
+        if key in self.pending:
+            return
+        self.pending.add(key)
+        heapq.heappush(self.events, (priority, next(self.sequence), CALL, (function, (), key)))
+
+    def executor(self, priority=PRIORITY_EXIT):
+        """Objeto con submit(fn, *args) que encola en este bucle (para PositionBook)"""
+        loop = self
+
+        class _Submitter:
+            @staticmethod
+            def submit(function, *args):
+                loop.call_soon(function, *args, priority=priority)
+
+        return _Submitter()
+
+    # Ejecución
+
+    def _next(self):
+        """Siguiente evento o temporizador vencido; bloquea hasta que haya uno"""
+        with self.lock:
+            while True:
+                now = time.time()
+                while self.timers and self.timers[0][0] <= now:
+                    due, seq, interval, priority, function = heapq.heappop(self.timers)
+                    # Siguiente vencimiento sin acumular retraso; una tarea lenta no se encola dos veces
+                    heapq.heappush(self.timers, (max(due + interval, now), seq, interval, priority, function))
+                    self._push_once(('timer', seq), function, priority)
+                if self.events:
+                    event = heapq.heappop(self.events)
+                    if event[2] == CALL and event[3][2] is not None:
+                        self.pending.discard(event[3][2])
+                    return event
+                if not self.is_running:
+                    return None
+                timeout = self.timers[0][0] - now if self.timers else None
+                self.wakeup.wait(timeout)
+
+    def _dispatch(self, event):
+        _, _, event_type, data = event
+        if event_type == CALL:
+            function, args, _ = data
+            function(*args)
+        for handler in self.handlers.get(event_type, []):
+            handler(data)
+
+    def run(self):
+        """Atender eventos en este hilo hasta stop()"""
+        self.is_running = True
+        logging.info(f"Bucle de eventos {self.name} iniciado")
+        while True:
+            event = self._next()
+            if event is None or event[2] == STOP:
+                break
+            try:
+                self._dispatch(event)
+                self.handled += 1
+            except Exception as e:
+                logging.error(f"Error en evento {event[2]} de {self.name}: {e}")
+                if self.on_error:
+                    self.on_error(event, e)
+        with self.lock:
+            # Un nuevo run() empieza de cero salvo las salidas que quedaron encoladas
+            self.events = [event for event in self.events if event[0] <= PRIORITY_EXIT and event[2] != STOP]
+            heapq.heapify(self.events)
+            self.pending = {event[3][2] for event in self.events if event[2] == CALL and event[3][2] is not None}
+            self.is_running = False
+        logging.info(f"Bucle de eventos {self.name} detenido")
+
+    def start(self):
+        """run() en un hilo propio"""
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, name=f"{self.name}-loop", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        for token in self.tokens:
+            self.hub.unsubscribe(token)
+        self.tokens = []
+        with self.lock:
+            self.timers = []
+            self.is_running = False
+            # Detrás de las salidas ya encoladas y delante de escaneos y tareas periódicas
+            heapq.heappush(self.events, (PRIORITY_EXIT, next(self.sequence), STOP, None))
+            self.wakeup.notify()
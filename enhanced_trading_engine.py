@@ -1,24 +1,39 @@
-import subprocess
-import json
 import logging
-import time
 import threading
+import time
 from datetime import datetime, timedelta
-from app import db
-from models import Trade, Balance, DailyStats, TradingConfig, Alert
+from models import DailyStats, TradingConfig
+from async_exchange import run_exchange_command
+from symbol_metadata import symbol_metadata
+from opportunity_tracker import opportunity_tracker
+from exchange_adapters import CCXTAdapter
+from leg_executor import EXPOSED, FILLED, HEDGED, REJECTED
+from engine_core import Strategy, Venue, Persistence, engine_core
+from balance_ledger import balance_ledger
+from usd_valuation import usd_valuation
+from market_types import AssetBalance, to_float
+from market_data_hub import market_data_hub
 
-class EnhancedTradingEngine:
+class EnhancedTradingEngine(Strategy):
     """Motor de trading mejorado con CCXT y APIs reales"""
     
+    name = 'enhanced_trading_engine'
+    scan_interval = 10.0
+    
     def __init__(self, telegram_bot=None):
         self.telegram_bot = telegram_bot
         self.is_running = False
         self.positions = {}
+        self.executed = {}  # (símbolo, compra, venta) -> opened_at de la oportunidad ya ejecutada
+        self.venue = Venue(self.name, adapter_factory=self.build_adapter)
+        self.persistence = Persistence(self.name)
         
         # Configuración de trading
         self.min_trade_amount = 5.0
         self.target_spread = 0.003  # 0.3% mínimo
         self.stop_loss_percentage = 0.02  # 2% stop loss
+        self.exit_retry = 5.0  # segundos hasta reintentar una venta fallida; se dobla en cada intento
+        self.max_exit_attempts = 5
         
         # Exchanges disponibles (sin sandbox para usar APIs reales)
         self.exchanges = ['binance', 'okx']
@@ -28,73 +43,20 @@ class EnhancedTradingEngine:
     
     def run_ccxt_command(self, command, exchange, symbol=None, params=None):
         """Ejecutar comando CCXT"""
-        try:
-            # Obtener credenciales desde configuración
-            api_key = self.get_config(f'{exchange}_api_key')
-            api_secret = self.get_config(f'{exchange}_api_secret')
-            
-            script = f"""
-const ccxt = require('ccxt');
-
-async function execute() {{
-    try {{
-        const exchange = new ccxt.{exchange}({{
-            apiKey: '{api_key or ""}',
-            secret: '{api_secret or ""}',
-            sandbox: false,
-            enableRateLimit: true,
-        }});
-        
-        let result;
-        switch ('{command}') {{
-            case 'fetch_ticker':
-                result = await exchange.fetchTicker('{symbol or "BTC/USDT"}');
-                break;
-            case 'fetch_order_book':
-                result = await exchange.fetchOrderBook('{symbol or "BTC/USDT"}');
-                break;
-            case 'fetch_balance':
-                result = await exchange.fetchBalance();
-                break;
-            case 'create_market_buy_order':
-                result = await exchange.createMarketBuyOrder('{symbol}', null, null, {params or '{}'});
-                break;
-            case 'create_market_sell_order':
-                result = await exchange.createMarketSellOrder('{symbol}', {params or 0}, null, {{}});
-                break;
-            default:
-                throw new Error('Unknown command: {command}');
-        }}
+        # Obtener credenciales desde configuración
+        credentials = {
+            'apiKey': self.get_config(f'{exchange}_api_key'),
+            'secret': self.get_config(f'{exchange}_api_secret')
+        }
         
-        console.log(JSON.stringify(result));
-    }} catch (error) {{
-        console.error(JSON.stringify({{error: error.message}}));
-    }}
-}}
-
-execute();
-"""
-            
-            # Escribir y ejecutar script
-            with open('/tmp/ccxt_script.js', 'w') as f:
-                f.write(script)
-            
-            result = subprocess.run(
-                ['node', '/tmp/ccxt_script.js'],
-                capture_output=True,
-                text=True,
-                timeout=15
-            )
-            
-            if result.returncode == 0:
-                return json.loads(result.stdout)
-            else:
-                logging.error(f"CCXT error: {result.stderr}")
-                return None
-                
-        except Exception as e:
-            logging.error(f"Error running CCXT command: {e}")
-            return None
+        return run_exchange_command(
+            command,
+            exchange,
+            symbol or 'BTC/USDT',
+            params=params,
+            credentials=credentials,
+            timeout=15
+        )
     
     def get_config(self, key):
         """Obtener configuración desde base de datos"""
@@ -109,266 +71,293 @@ execute();
         self.is_running = True
         logging.info("Starting Enhanced Trading Engine...")
         
-        while self.is_running:
-            try:
-                self.update_balances()
-                self.scan_arbitrage_opportunities()
-                self.manage_positions()
-                
-                time.sleep(10)  # Check cada 10 segundos
-                
-            except Exception as e:
-                logging.error(f"Error in trading loop: {e}")
-                time.sleep(30)
+        # En el núcleo compartido: escaneo con cada cotización de nuestros exchanges
+        engine_core.register(self)
+    
+    def markets(self):
+        return {exchange: self.target_symbols for exchange in self.exchanges}
+    
+    def setup(self, core):
+        # Exposiciones abiertas antes del reinicio
+        for pos_id, position in self.persistence.recover().items():
+            self.positions[pos_id] = position
+            self.track_position(pos_id, position)
+        core.every(self, 10.0, self.update_balances, blocking=True)  # REST: en el pool de E/S del núcleo
+    
+    def scan(self):
+        self.scan_arbitrage_opportunities()
     
     def update_balances(self):
         """Actualizar balances desde exchanges reales"""
         try:
             total_usd_value = 0
             
-            with db.session.begin():
-                # Limpiar balances existentes
-                Balance.query.delete()
-                
-                for exchange in self.exchanges:
-                    balance_data = self.run_ccxt_command('fetch_balance', exchange)
-                    
-                    if balance_data and 'total' in balance_data:
-                        for asset, amounts in balance_data['total'].items():
-                            if amounts > 0:
-                                # Obtener valor en USD
-                                usd_value = self.get_usd_value(asset, amounts, exchange)
-                                total_usd_value += usd_value
-                                
-                                # Guardar en base de datos
-                                balance_record = Balance()
-                                balance_record.asset = asset
-                                balance_record.free_balance = balance_data['free'].get(asset, 0)
-                                balance_record.locked_balance = balance_data['used'].get(asset, 0)
-                                balance_record.total_balance = amounts
-                                balance_record.usd_value = usd_value
-                                balance_record.exchange = exchange.upper()
-                                db.session.add(balance_record)
+            for exchange in self.exchanges:
+                balance_data = self.run_ccxt_command('fetch_balance', exchange)
                 
-                db.session.commit()
-                logging.info(f"Balances updated: ${total_usd_value:.2f} total")
+                if balance_data and 'total' in balance_data:
+                    balances = {
+                        asset: AssetBalance(asset, to_float(balance_data['free'].get(asset)),
+                                            to_float(balance_data['used'].get(asset)))
+                        for asset, amounts in balance_data['total'].items() if amounts and amounts > 0
+                    }
+                    # Libro en memoria valorado con una foto de precios; solo se escriben las filas que cambian
+                    total_usd_value += balance_ledger.apply_snapshot(exchange, balances)
+            
+            logging.info(f"Balances updated: ${total_usd_value:.2f} total")
                 
         except Exception as e:
             logging.error(f"Error updating balances: {e}")
     
     def get_usd_value(self, asset, amount, exchange):
         """Obtener valor USD de un asset"""
-        if asset in ['USDT', 'USD', 'USDC']:
-            return amount
-        
         try:
-            symbol = f'{asset}/USDT'
-            ticker = self.run_ccxt_command('fetch_ticker', exchange, symbol)
-            if ticker and 'last' in ticker:
-                return amount * ticker['last']
+            # Tipos cruzados sobre una sola foto de precios del exchange, no un ticker por activo
+            return usd_valuation.value(asset, amount, exchange)
         except:
-            pass
-        
-        return 0
+            return 0
     
     def scan_arbitrage_opportunities(self):
         """Escanear oportunidades de arbitraje entre exchanges"""
         try:
-            for symbol in self.target_symbols:
-                prices = {}
-                
-                # Obtener precios de todos los exchanges
-                for exchange in self.exchanges:
-                    ticker = self.run_ccxt_command('fetch_ticker', exchange, symbol)
-                    if ticker and 'bid' in ticker and 'ask' in ticker:
-                        prices[exchange] = {
-                            'bid': ticker['bid'],
-                            'ask': ticker['ask'],
-                            'last': ticker['last']
-                        }
-                
-                # Buscar oportunidades
-                if len(prices) >= 2:
-                    self.find_arbitrage_opportunity(symbol, prices)
+            # El tracker reevalúa cada cotización al llegar; aquí solo se leen las vivas
+            opportunity_tracker.track(self.exchanges, self.target_symbols)
+            best = opportunity_tracker.best_per_symbol(
+                self.target_spread, exchanges=self.exchanges, symbols=self.target_symbols
+            )
+            self.find_arbitrage_opportunity(best)
                     
         except Exception as e:
             logging.error(f"Error scanning opportunities: {e}")
     
-    def find_arbitrage_opportunity(self, symbol, prices):
-        """Buscar y ejecutar oportunidad de arbitraje"""
-        best_opportunity = None
-        max_spread = 0
-        
-        for buy_exchange, buy_data in prices.items():
-            for sell_exchange, sell_data in prices.items():
-                if buy_exchange != sell_exchange:
-                    spread = (sell_data['bid'] - buy_data['ask']) / buy_data['ask']
-                    
-                    if spread > self.target_spread and spread > max_spread:
-                        max_spread = spread
-                        best_opportunity = {
-                            'symbol': symbol,
-                            'buy_exchange': buy_exchange,
-                            'sell_exchange': sell_exchange,
-                            'buy_price': buy_data['ask'],
-                            'sell_price': sell_data['bid'],
-                            'spread_percentage': spread * 100,
-                            'potential_profit': self.min_trade_amount * spread
-                        }
-        
-        if best_opportunity:
+    def find_arbitrage_opportunity(self, candidates):
+        """Ejecutar la mejor oportunidad de arbitraje de cada símbolo"""
+        for symbol, best in candidates.items():
+            # El escaneo corre con cada cotización: una sola ejecución por oportunidad viva
+            key = (symbol, best['buy_exchange'], best['sell_exchange'])
+            if self.executed.get(key) == best['opened_at']:
+                continue
+            self.executed[key] = best['opened_at']
+            best_opportunity = dict(
+                best,
+                potential_profit=self.min_trade_amount * best['net_spread_percentage'] / 100
+            )
             logging.info(f"Opportunity found: {best_opportunity}")
             self.execute_arbitrage(best_opportunity)
     
+    def build_adapter(self, exchange):
+        """Adaptador CCXT del exchange con las credenciales de la configuración"""
+        return CCXTAdapter(exchange, {
+            'apiKey': self.get_config(f'{exchange}_api_key'),
+            'secret': self.get_config(f'{exchange}_api_secret')
+        }, timeout=15)
+    
+    def get_adapter(self, exchange):
+        return self.venue.adapter(exchange)
+    
     def execute_arbitrage(self, opportunity):
-        """Ejecutar operación de arbitraje"""
+        """Ejecutar operación de arbitraje: ambas patas a la vez con el inventario de cada exchange
+
+        Las patas corren en el pool de E/S del núcleo; el resultado vuelve al bucle en on_execution.
+        """
         try:
-            symbol = opportunity['symbol']
-            trade_amount = self.min_trade_amount
-            
-            # Verificar balance disponible
-            if not self.has_sufficient_balance('USDT', trade_amount, opportunity['buy_exchange']):
-                logging.warning(f"Insufficient USDT balance for {opportunity['buy_exchange']}")
-                return
-            
-            # Ejecutar compra
-            buy_order = self.run_ccxt_command(
-                'create_market_buy_order',
+            self.core.submit(
+                self, self.venue.execute_pair,
                 opportunity['buy_exchange'],
-                symbol,
-                f'"{trade_amount}"'
+                opportunity['sell_exchange'],
+                opportunity['symbol'],
+                self.min_trade_amount / opportunity['buy_price'],
+                opportunity['buy_price'],
+                on_late=lambda execution, orders: self.core.call_soon(self, self.on_late_fill, execution, orders),
+                key=(opportunity['symbol'], opportunity['buy_exchange'], opportunity['sell_exchange']),
+                then=lambda execution: self.on_execution(opportunity, execution)
             )
+        except Exception as e:
+            logging.error(f"Error executing arbitrage: {e}")
+    
+    def on_execution(self, opportunity, execution):
+        """Resultado del arbitraje, de vuelta en el bucle: registrar patas y estado"""
+        if execution is None:
+            return
+        try:
+            symbol = opportunity['symbol']
             
-            if buy_order and buy_order.get('status') == 'closed':
-                # Registrar trade de compra
-                self.record_trade(
-                    symbol=symbol,
-                    side='BUY',
-                    quantity=buy_order['filled'],
-                    price=buy_order['average'],
-                    total_value=trade_amount,
-                    exchange=opportunity['buy_exchange'],
-                    order_id=buy_order['id']
-                )
-                
-                # Guardar posición para venta posterior
-                position_id = f"{symbol}_{int(time.time())}"
-                self.positions[position_id] = {
-                    'symbol': symbol,
-                    'quantity': buy_order['filled'],
-                    'buy_price': buy_order['average'],
-                    'buy_exchange': opportunity['buy_exchange'],
-                    'sell_exchange': opportunity['sell_exchange'],
-                    'timestamp': time.time()
-                }
-                
-                logging.info(f"Arbitrage buy executed: {symbol} on {opportunity['buy_exchange']}")
+            # Registrar patas, coberturas y unwinds
+            self.record_orders(execution.orders)
+            self.open_exposure(execution)
+            
+            if execution.status in (FILLED, HEDGED):
+                logging.info(f"Arbitrage executed: {symbol} {opportunity['buy_exchange']} -> "
+                             f"{opportunity['sell_exchange']}, profit {execution.profit:.4f}")
+            elif execution.status != REJECTED:
+                logging.warning(f"Arbitrage {symbol} ended {execution.status}: {execution.error}")
                 
         except Exception as e:
-            logging.error(f"Error executing arbitrage: {e}")
+            logging.error(f"Error recording arbitrage: {e}")
+    
+    def record_orders(self, orders):
+        for order in orders:
+            self.record_trade(
+                symbol=order.symbol,
+                side=order.side,
+                quantity=order.filled_qty,
+                price=order.avg_price,
+                total_value=order.cost,
+                exchange=order.exchange,
+                order_id=order.order_id
+            )
+    
+    def on_late_fill(self, execution, orders):
+        """Una pata colgada respondió tras leg_timeout: registrar sus órdenes"""
+        self.record_orders(orders)
+        self.open_exposure(execution)
+        logging.warning(f"Late fill {execution.symbol} {execution.buy_exchange} -> {execution.sell_exchange}: "
+                        f"{execution.status}, residual {execution.residual}")
     
     def has_sufficient_balance(self, asset, amount, exchange):
         """Verificar si hay balance suficiente"""
         try:
-            balance = Balance.query.filter_by(
-                asset=asset, 
-                exchange=exchange.upper()
-            ).first()
-            return balance and balance.free_balance >= amount
+            return balance_ledger.free(exchange, asset) >= amount
         except:
             return False
     
     def record_trade(self, symbol, side, quantity, price, total_value, exchange, order_id):
-        """Registrar trade en base de datos"""
+        """Registrar trade en el diario; se inserta en la base de datos por lotes"""
         try:
-            trade = Trade()
-            trade.symbol = symbol
-            trade.side = side
-            trade.quantity = quantity
-            trade.price = price
-            trade.total_value = total_value
-            trade.strategy = 'arbitrage_ccxt'
-            trade.exchange = exchange.upper()
-            trade.order_id = order_id
-            
-            db.session.add(trade)
-            db.session.commit()
+            self.persistence.record_trade(
+                symbol=symbol,
+                side=side,
+                quantity=quantity,
+                price=price,
+                total_value=total_value,
+                strategy='arbitrage_ccxt',
+                exchange=exchange.upper(),
+                order_id=order_id
+            )
             
         except Exception as e:
             logging.error(f"Error recording trade: {e}")
     
-    def manage_positions(self):
-        """Gestionar posiciones abiertas"""
-        positions_to_close = []
-        current_time = time.time()
+    def open_exposure(self, execution):
+        """Base sobrante sin cubrir tras conciliar: abrirla como posición con stop y objetivo
+
+        Con órdenes aún sin respuesta (execution.late) se espera a on_late_fill.
+        """
+        if execution.status != EXPOSED or execution.late or not execution.residual:
+            return
+        if execution.residual < 0:
+            # Se vendió más de lo comprado: no se cierra vendiendo
+            self.create_alert(
+                'Uncovered Exposure',
+                f'{execution.symbol}: oversold {-execution.residual} on {execution.sell_exchange}, '
+                f'restore inventory manually',
+                'ERROR'
+            )
+            return
         
-        for pos_id, position in self.positions.items():
-            try:
-                # Obtener precio actual
-                ticker = self.run_ccxt_command(
-                    'fetch_ticker',
-                    position['sell_exchange'],
-                    position['symbol']
-                )
-                
-                if ticker and 'bid' in ticker:
-                    current_price = ticker['bid']
-                    profit_pct = (current_price - position['buy_price']) / position['buy_price']
-                    
-                    # Criterios para cerrar posición
-                    should_close = False
-                    reason = ""
-                    
-                    if profit_pct >= 0.008:  # 0.8% ganancia
-                        should_close = True
-                        reason = "PROFIT_TARGET"
-                    elif profit_pct <= -self.stop_loss_percentage:
-                        should_close = True
-                        reason = "STOP_LOSS"
-                    elif current_time - position['timestamp'] > 600:  # 10 minutos max
-                        should_close = True
-                        reason = "TIME_EXIT"
-                    
-                    if should_close:
-                        self.close_position(position, current_price, reason)
-                        positions_to_close.append(pos_id)
-                        
-            except Exception as e:
-                logging.error(f"Error managing position {pos_id}: {e}")
+        pos_id = f"{execution.symbol}:{execution.buy_exchange}:{execution.sell_exchange}:{execution.started_at:.3f}"
+        self.positions[pos_id] = {
+            'symbol': execution.symbol,
+            'quantity': execution.residual,
+            'buy_price': execution.buy.avg_price,
+            'sell_exchange': execution.sell_exchange,
+            'timestamp': time.time()
+        }
+        self.persistence.open_position(pos_id, self.positions[pos_id])
+        self.track_position(pos_id, self.positions[pos_id])
+        logging.warning(f"Exposure opened as position: {execution.symbol} {execution.residual} "
+                        f"@ {execution.buy.avg_price}")
+    
+    def track_position(self, pos_id, position):
+        """Registrar objetivo, stop loss y tiempo máximo en el núcleo"""
+        buy_price = position['buy_price']
+        self.core.track(
+            self, pos_id, position['sell_exchange'], position['symbol'],
+            stop_price=buy_price * (1 - self.stop_loss_percentage),
+            target_price=buy_price * 1.008,  # 0.8% ganancia
+            deadline=position['timestamp'] + 600,  # 10 minutos max
+            position=position
+        )
+    
+    def on_exit(self, pos_id, position, reason, price):
+        """Disparo del libro de posiciones: vender al bid del exchange de venta en el pool de E/S"""
+        if price is None:
+            quote = market_data_hub.get_quote(position['sell_exchange'], position['symbol'])
+            if not quote or not quote['bid']:
+                self.retry_exit(pos_id, position, 'no quote')
+                return
+            price = quote['bid']
         
-        # Remover posiciones cerradas
-        for pos_id in positions_to_close:
-            del self.positions[pos_id]
+        # Cantidad ajustada al step size: evita el rechazo y el reintento al cerrar
+        quantity = symbol_metadata.prepare_order(
+            position['sell_exchange'], position['symbol'], position['quantity'], price
+        )
+        if quantity is None:
+            self.drop_dust(pos_id, position)
+            return
+        # Con la venta anterior aún en curso no se envía otra: su resultado decide
+        self.core.submit(
+            self, self.venue.sell, position['sell_exchange'], position['symbol'], quantity,
+            key=('sell', pos_id),
+            then=lambda sell_order: self.close_position(pos_id, position, reason, sell_order)
+        )
+    
+    def retry_exit(self, pos_id, position, error):
+        """Venta fallida: reintentar con espera creciente; tras max_exit_attempts queda para revisión"""
+        attempts = position['exit_attempts'] = position.get('exit_attempts', 0) + 1
+        if attempts >= self.max_exit_attempts:
+            self.create_alert(
+                'Exit Abandoned',
+                f"{position['symbol']} on {position['sell_exchange']}: {attempts} failed sells ({error}); "
+                f"position left open for manual review",
+                'ERROR'
+            )
+            return
+        self.core.track(
+            self, pos_id, position['sell_exchange'], position['symbol'],
+            deadline=time.time() + self.exit_retry * 2 ** (attempts - 1),
+            position=position
+        )
     
-    def close_position(self, position, current_price, reason):
-        """Cerrar posición vendiendo"""
+    def drop_dust(self, pos_id, position):
+        """Resto por debajo de los mínimos del exchange: se cierra con alerta y queda como saldo"""
+        self.create_alert(
+            'Unsellable Position',
+            f"{position['symbol']}: {position['quantity']} below {position['sell_exchange']} minimums, kept as balance",
+            'WARNING'
+        )
+        self.positions.pop(pos_id, None)
+        self.persistence.close_position(pos_id, 'dust')
+    
+    def close_position(self, pos_id, position, reason, sell_order):
+        """Resultado de la venta, de vuelta en el bucle: registrar y cerrar la posición"""
         try:
-            sell_order = self.run_ccxt_command(
-                'create_market_sell_order',
-                position['sell_exchange'],
-                position['symbol'],
-                position['quantity']
+            if sell_order is None or not sell_order.success:
+                error = sell_order and sell_order.error or 'unknown error'
+                logging.error(f"Error closing position {position['symbol']}: {error}")
+                self.retry_exit(pos_id, position, error)
+                return
+            
+            quantity = sell_order.filled_qty
+            profit_loss = (sell_order.avg_price - position['buy_price']) * quantity
+            
+            # Registrar trade de venta
+            self.persistence.record_trade(
+                symbol=position['symbol'],
+                side='SELL',
+                quantity=quantity,
+                price=sell_order.avg_price,
+                total_value=sell_order.cost,
+                fee=sell_order.fee,
+                profit_loss=profit_loss,
+                strategy='arbitrage_ccxt',
+                exchange=position['sell_exchange'].upper(),
+                order_id=sell_order.order_id
             )
+            self.positions.pop(pos_id, None)
+            self.persistence.close_position(pos_id, reason, profit_loss)
             
-            if sell_order and sell_order.get('status') == 'closed':
-                profit_loss = (sell_order['average'] - position['buy_price']) * position['quantity']
-                
-                # Registrar trade de venta
-                trade = Trade()
-                trade.symbol = position['symbol']
-                trade.side = 'SELL'
-                trade.quantity = position['quantity']
-                trade.price = sell_order['average']
-                trade.total_value = sell_order['cost']
-                trade.profit_loss = profit_loss
-                trade.strategy = 'arbitrage_ccxt'
-                trade.exchange = position['sell_exchange'].upper()
-                trade.order_id = sell_order['id']
-                
-                db.session.add(trade)
-                db.session.commit()
-                
-                logging.info(f"Position closed: {position['symbol']} - P/L: ${profit_loss:.2f} - Reason: {reason}")
+            logging.info(f"Position closed: {position['symbol']} - P/L: ${profit_loss:.2f} - Reason: {reason}")
                 
         except Exception as e:
             logging.error(f"Error closing position: {e}")
@@ -376,15 +365,7 @@ execute();
     def create_alert(self, title, message, alert_type):
         """Crear alerta del sistema"""
         try:
-            alert = Alert()
-            alert.title = title
-            alert.message = message
-            alert.alert_type = alert_type
-            
-            db.session.add(alert)
-            db.session.commit()
-            
-            logging.info(f"Alert created: {title}")
+            self.persistence.alert(title, message, alert_type)
             
         except Exception as e:
             logging.error(f"Error creating alert: {e}")
@@ -392,4 +373,5 @@ execute();
     def stop(self):
         """Detener motor de trading"""
         self.is_running = False
+        engine_core.unregister(self)
         logging.info("Enhanced Trading Engine stopped")
\ No newline at end of file
@@ -0,0 +1,421 @@
+"""
+Adaptadores de exchange con una sola interfaz
+BinanceClient (y ExchangeSimulator, que imita su API), KuCoinClient y ccxt
+(en proceso o vía pool Node) devuelven formas distintas; cada adaptador las
+convierte una vez a los objetos de market_types. Todos aceptan símbolos
+unificados (BTC/USDT) o nativos del exchange.
+"""
+import functools
+import logging
+import time
+from cost_model import cost_model
+from market_types import AssetBalance, Fill, OrderBook, OrderResult, Ticker, to_float
+from symbol_metadata import symbol_metadata
+
+
+def timed_order(method):
+    """Medir la ida y vuelta de cada orden ejecutada para el modelo de costes"""
+    @functools.wraps(method)
+    def wrapper(self, symbol, amount):
+        started = time.time()
+        result = method(self, symbol, amount)
+        if result.success:
+            cost_model.record_latency(self.name, time.time() - started)
+        return result
+    return wrapper
+
+
+class ExchangeAdapter:
+    """Interfaz común que usan los motores"""
+
+    name = 'exchange'
+
+    def native_symbol(self, symbol):
+        return symbol
+
+    def get_ticker(self, symbol):
+        """Ticker o None"""
+        raise NotImplementedError
+
+    def get_tickers(self, symbols):
+        """{símbolo: Ticker}; por defecto un ticker por símbolo"""
+        tickers = {}
+        for symbol in symbols:
+            ticker = self.get_ticker(symbol)
+            if ticker is not None:
+                tickers[symbol] = ticker
+        return tickers
+
+    def get_order_book(self, symbol, limit=20):
+        """OrderBook o None"""
+        raise NotImplementedError
+
+    def get_balances(self):
+        """{activo: AssetBalance}; None si falla la consulta"""
+        raise NotImplementedError
+
+    def get_free_balance(self, asset):
+        balances = self.get_balances()
+        if not balances or asset not in balances:
+            return 0.0
+        return balances[asset].free
+
+    def market_buy(self, symbol, quote_amount):
+        """Compra a mercado por importe en moneda quote -> OrderResult"""
+        raise NotImplementedError
+
+    def market_sell(self, symbol, quantity):
+        """Venta a mercado de una cantidad base -> OrderResult"""
+        raise NotImplementedError
+
+    def get_open_orders(self, symbol=None):
+        """Ids de las órdenes abiertas en el exchange; None si no se pudo consultar"""
+        return None
+
+    def test_connection(self):
+        return self.get_ticker('BTC/USDT') is not None
+
+
+class BinanceAdapter(ExchangeAdapter):
+    """BinanceClient o cualquier cliente con su misma API (ExchangeSimulator)"""
+
+    def __init__(self, client, name='binance'):
+        self.client = client
+        self.name = name
+
+    def native_symbol(self, symbol):
+        return symbol.replace('/', '')
+
+    def get_ticker(self, symbol):
+        native = self.native_symbol(symbol)
+        if hasattr(self.client, 'get_book_ticker'):
+            data = self.client.get_book_ticker(native)
+            if data:
+                return Ticker(self.name, symbol, to_float(data.get('bidPrice')), to_float(data.get('askPrice')))
+
+        book = self.client.get_order_book(native, limit=5)
+        price = self.client.get_symbol_ticker(native)
+        if not book and not price:
+            return None
+        bid = to_float(book['bids'][0][0]) if book and book.get('bids') else 0.0
+        ask = to_float(book['asks'][0][0]) if book and book.get('asks') else 0.0
+        return Ticker(self.name, symbol, bid, ask, to_float(price.get('price')) if price else 0.0)
+
+    def get_tickers(self, symbols):
+        """Un solo bookTicker en bloque para todos los símbolos"""
+        if not hasattr(self.client, 'get_book_tickers'):
+            return super().get_tickers(symbols)
+
+        books = self.client.get_book_tickers() or []
+        wanted = {self.native_symbol(symbol): symbol for symbol in symbols}
+        tickers = {}
+        for book in books:
+            symbol = wanted.get(book.get('symbol'))
+            if symbol is not None:
+                tickers[symbol] = Ticker(self.name, symbol, to_float(book.get('bidPrice')),
+                                         to_float(book.get('askPrice')))
+        return tickers
+
+    def get_order_book(self, symbol, limit=20):
+        data = self.client.get_order_book(self.native_symbol(symbol), limit=limit)
+        if not data:
+            return None
+        return OrderBook.from_levels(self.name, symbol, data.get('bids'), data.get('asks'),
+                                     sequence=data.get('lastUpdateId'))
+
+    def get_balances(self):
+        account = self.client.get_account()
+        if not account or 'balances' not in account:
+            return None
+        return {
+            item['asset']: AssetBalance(item['asset'], to_float(item.get('free')), to_float(item.get('locked')))
+            for item in account['balances']
+        }
+
+    def _order_result(self, symbol, side, order):
+        if not order:
+            return OrderResult.failed(self.name, symbol, side, 'sin respuesta del exchange')
+
+        executed = to_float(order.get('executedQty'))
+        raw_fills = order.get('fills') or []
+        fills = [
+            Fill(
+                to_float(fill.get('price')),
+                # El simulador no informa qty por fill: un único fill con toda la cantidad
+                to_float(fill.get('qty'), executed if len(raw_fills) == 1 else 0.0),
+                to_float(fill.get('commission')),
+                fill.get('commissionAsset')
+            )
+            for fill in raw_fills
+        ]
+        result = OrderResult.from_fills(self.name, symbol, side, order.get('orderId'), order.get('status'), fills)
+
+        quote_qty = to_float(order.get('cummulativeQuoteQty'))
+        if not fills and executed and quote_qty:
+            result = OrderResult(self.name, symbol, side, True, order.get('orderId'), order.get('status'),
+                                 executed, quote_qty / executed, quote_qty)
+        elif quote_qty:
+            result.cost = quote_qty
+        return result
+
+    def _rules(self, native):
+        # Reglas ya cargadas (prepare_order las pidió antes de llegar aquí); sin descarga en la ruta de la orden
+        return symbol_metadata.rules.get(self.name, {}).get(native)
+
+    @timed_order
+    def market_buy(self, symbol, quote_amount):
+        native = self.native_symbol(symbol)
+        rules = self._rules(native)
+        if rules is not None:
+            quote_amount = rules.format_quote(quote_amount)  # texto con los decimales exactos, nunca 5e-05
+        order = self.client.order_market_buy(native, quote_amount)
+        return self._order_result(symbol, 'BUY', order)
+
+    @timed_order
+    def market_sell(self, symbol, quantity):
+        native = self.native_symbol(symbol)
+        rules = self._rules(native)
+        if rules is not None:
+            quantity = rules.format_quantity(quantity)
+        order = self.client.order_market_sell(native, quantity)
+        return self._order_result(symbol, 'SELL', order)
+
+    def get_open_orders(self, symbol=None):
+        orders = self.client.get_open_orders(self.native_symbol(symbol) if symbol else None)
+        if orders is None:
+            return None
+        return [str(order['orderId']) for order in orders]
+
+    def test_connection(self):
+        if hasattr(self.client, 'test_connection'):
+            return self.client.test_connection()
+        return super().test_connection()
+
+
+class KuCoinAdapter(ExchangeAdapter):
+    """KuCoinClient: desempaqueta {'code', 'data'} y completa las órdenes con su detalle"""
+
+    def __init__(self, client, name='kucoin', fill_timeout=2.0):
+        self.client = client
+        self.name = name
+        self.fill_timeout = fill_timeout
+
+    def native_symbol(self, symbol):
+        return symbol.replace('/', '-')
+
+    @staticmethod
+    def _data(response):
+        if not response or response.get('code') != '200000':
+            return None
+        return response.get('data')
+
+    def get_ticker(self, symbol):
+        data = self._data(self.client.get_symbol_ticker(self.native_symbol(symbol)))
+        if not data:
+            return None
+        return Ticker(self.name, symbol, to_float(data.get('bestBid')), to_float(data.get('bestAsk')),
+                      to_float(data.get('price')), to_float(data.get('size')),
+                      to_float(data.get('time')) / 1000 or None)
+
+    def get_tickers(self, symbols):
+        """Un solo allTickers para todos los símbolos"""
+        data = self._data(self.client.get_24hr_ticker())
+        if not data:
+            return {}
+        wanted = {self.native_symbol(symbol): symbol for symbol in symbols}
+        timestamp = to_float(data.get('time')) / 1000 or None
+        tickers = {}
+        for item in data.get('ticker', []):
+            symbol = wanted.get(item.get('symbol'))
+            if symbol is not None:
+                tickers[symbol] = Ticker(self.name, symbol, to_float(item.get('buy')), to_float(item.get('sell')),
+                                         to_float(item.get('last')), to_float(item.get('vol')), timestamp)
+        return tickers
+
+    def get_order_book(self, symbol, limit=20):
+        data = self._data(self.client.get_order_book(self.native_symbol(symbol), limit=20 if limit <= 20 else 100))
+        if not data:
+            return None
+        return OrderBook.from_levels(self.name, symbol, (data.get('bids') or [])[:limit],
+                                     (data.get('asks') or [])[:limit],
+                                     to_float(data.get('time')) / 1000 or None, to_float(data.get('sequence')))
+
+    def get_balances(self):
+        data = self._data(self.client.get_account_balance())
+        if data is None:
+            return None
+        balances = {}
+        for account in data:
+            if account.get('type') != 'trade':
+                continue
+            asset = account['currency']
+            balances[asset] = AssetBalance(asset, to_float(account.get('available')), to_float(account.get('holds')))
+        return balances
+
+    def _order_result(self, symbol, side, response):
+        data = self._data(response)
+        if not data:
+            error = response.get('msg') if response else 'sin respuesta del exchange'
+            return OrderResult.failed(self.name, symbol, side, error)
+
+        # La respuesta de creación sólo trae orderId: consultar el detalle hasta que se ejecute
+        order_id = data['orderId']
+        deadline = time.time() + self.fill_timeout
+        order = None
+        while time.time() < deadline:
+            order = self._data(self.client.get_order(order_id))
+            if order and not order.get('isActive'):
+                break
+            time.sleep(0.1)
+
+        if not order:
+            return OrderResult(self.name, symbol, side, False, order_id, 'unknown',
+                               error='detalle de la orden no disponible')
+
+        filled = to_float(order.get('dealSize'))
+        funds = to_float(order.get('dealFunds'))
+        fill = Fill(funds / filled if filled else 0.0, filled, to_float(order.get('fee')), order.get('feeCurrency'))
+        status = 'active' if order.get('isActive') else 'done'
+        return OrderResult.from_fills(self.name, symbol, side, order_id, status, [fill] if filled else [])
+
+    @timed_order
+    def market_buy(self, symbol, quote_amount):
+        return self._order_result(symbol, 'BUY',
+                                  self.client.place_market_buy_order(self.native_symbol(symbol), quote_amount))
+
+    @timed_order
+    def market_sell(self, symbol, quantity):
+        return self._order_result(symbol, 'SELL',
+                                  self.client.place_market_sell_order(self.native_symbol(symbol), quantity))
+
+    def get_open_orders(self, symbol=None):
+        data = self._data(self.client.get_open_orders(self.native_symbol(symbol) if symbol else None))
+        if data is None:
+            return None
+        return [str(order['id']) for order in data.get('items') or []]
+
+    def test_connection(self):
+        return self.client.test_connection()
+
+
+class CCXTAdapter(ExchangeAdapter):
+    """Cualquier exchange ccxt: en proceso (ccxt.async_support) o vía pool Node"""
+
+    def __init__(self, exchange_id, credentials=None, timeout=10):
+        from async_exchange import run_exchange_command
+        self.run = run_exchange_command
+        self.name = exchange_id
+        self.credentials = credentials
+        self.timeout = timeout
+
+    def native_symbol(self, symbol):
+        if '/' in symbol:
+            return symbol
+        # BTCUSDT / BTC-USDT -> BTC/USDT
+        if '-' in symbol:
+            return symbol.replace('-', '/')
+        for quote in ('USDT', 'USDC', 'BUSD', 'BTC', 'ETH', 'EUR', 'USD'):
+            if symbol.endswith(quote) and len(symbol) > len(quote):
+                return f"{symbol[:-len(quote)]}/{quote}"
+        return symbol
+
+    def _command(self, command, symbol=None, params=None):
+        return self.run(command, self.name, symbol, params, self.credentials, self.timeout)
+
+    def _ticker(self, symbol, data):
+        return Ticker(self.name, symbol, to_float(data.get('bid')), to_float(data.get('ask')),
+                      to_float(data.get('last')), to_float(data.get('baseVolume')),
+                      to_float(data.get('timestamp')) / 1000 or None)
+
+    def get_ticker(self, symbol):
+        data = self._command('fetch_ticker', self.native_symbol(symbol))
+        return self._ticker(symbol, data) if data else None
+
+    def get_tickers(self, symbols):
+        natives = {self.native_symbol(symbol): symbol for symbol in symbols}
+        data = self._command('fetch_tickers', params={'symbols': list(natives)})
+        if not data:
+            return super().get_tickers(symbols)
+        return {
+            natives[native]: self._ticker(natives[native], ticker)
+            for native, ticker in data.items() if native in natives
+        }
+
+    def get_order_book(self, symbol, limit=20):
+        data = self._command('fetch_order_book', self.native_symbol(symbol), {'limit': limit})
+        if not data:
+            return None
+        return OrderBook.from_levels(self.name, symbol, data.get('bids'), data.get('asks'),
+                                     to_float(data.get('timestamp')) / 1000 or None, data.get('nonce'))
+
+    def get_balances(self):
+        data = self._command('fetch_balance')
+        if not data:
+            return None
+        free, used = data.get('free') or {}, data.get('used') or {}
+        return {
+            asset: AssetBalance(asset, to_float(free.get(asset)), to_float(used.get(asset)))
+            for asset in set(free) | set(used)
+        }
+
+    def _order_result(self, symbol, side, order):
+        if not order:
+            return OrderResult.failed(self.name, symbol, side, 'orden rechazada o sin respuesta')
+
+        fee = order.get('fee') or {}
+        trades = order.get('trades') or []
+        if trades:
+            fills = [
+                Fill(to_float(trade.get('price')), to_float(trade.get('amount')),
+                     to_float((trade.get('fee') or {}).get('cost')), (trade.get('fee') or {}).get('currency'))
+                for trade in trades
+            ]
+            result = OrderResult.from_fills(self.name, symbol, side, order.get('id'), order.get('status'), fills)
+        else:
+            filled = to_float(order.get('filled'))
+            average = to_float(order.get('average')) or to_float(order.get('price'))
+            result = OrderResult(
+                self.name, symbol, side, filled > 0, order.get('id'), order.get('status'),
+                filled, average, to_float(order.get('cost')) or filled * average,
+                error=None if filled > 0 else f"orden {order.get('id')} sin ejecutar ({order.get('status')})"
+            )
+        if fee.get('cost') is not None and not result.fee:
+            result.fee = to_float(fee.get('cost'))
+        return result
+
+    @timed_order
+    def market_buy(self, symbol, quote_amount):
+        order = self._command('create_market_buy_order', self.native_symbol(symbol), {'cost': quote_amount})
+        return self._order_result(symbol, 'BUY', order)
+
+    @timed_order
+    def market_sell(self, symbol, quantity):
+        order = self._command('create_market_sell_order', self.native_symbol(symbol), {'amount': quantity})
+        return self._order_result(symbol, 'SELL', order)
+
+    def get_open_orders(self, symbol=None):
+        orders = self._command('fetch_open_orders', self.native_symbol(symbol) if symbol else None)
+        if orders is None:
+            return None
+        return [str(order['id']) for order in orders]
+
+    def test_connection(self):
+        result = self._command('test_connection')
+        return bool(result and result.get('success'))
+
+
+def create_adapter(client_or_id, credentials=None):
+    """Adaptador adecuado para un cliente REST, el simulador o un id de ccxt"""
+    if isinstance(client_or_id, str):
+        return CCXTAdapter(client_or_id, credentials)
+
+    class_name = type(client_or_id).__name__
+    if class_name == 'KuCoinClient':
+        return KuCoinAdapter(client_or_id)
+    if class_name == 'ExchangeSimulator':
+        return BinanceAdapter(client_or_id, name=client_or_id.name.lower())
+    if class_name == 'BinanceClient':
+        return BinanceAdapter(client_or_id)
+
+    logging.warning(f"Cliente {class_name} sin adaptador específico, asumiendo API estilo Binance")
+    return BinanceAdapter(client_or_id, name=class_name.lower())
@@ -1,6 +1,7 @@
 import random
 import time
 import logging
+from depth_book import DepthBook
 from datetime import datetime
 
 class ExchangeSimulator:
@@ -53,6 +54,30 @@ class ExchangeSimulator:
         
         return {'price': str(current_price)}
 
+    def get_all_prices(self):
+        """Simulate latest price for every symbol"""
+        return [
+            {'symbol': symbol, 'price': self.get_symbol_ticker(symbol)['price']}
+            for symbol in self.base_prices
+        ]
+
+    def get_book_ticker(self, symbol):
+        """Simulate best bid/ask for one symbol"""
+        book = self.get_order_book(symbol, limit=1)
+        if book is None:
+            return None
+        return {
+            'symbol': symbol,
+            'bidPrice': book['bids'][0][0],
+            'bidQty': book['bids'][0][1],
+            'askPrice': book['asks'][0][0],
+            'askQty': book['asks'][0][1]
+        }
+
+    def get_book_tickers(self):
+        """Simulate best bid/ask for every symbol"""
+        return [self.get_book_ticker(symbol) for symbol in self.base_prices]
+
     def get_order_book(self, symbol, limit=100):
         """Simulate order book with realistic bid/ask spreads"""
         if symbol not in self.base_prices:
@@ -74,9 +99,9 @@ class ExchangeSimulator:
             bid_level = bid_price - (i * spread * 0.1)
             ask_level = ask_price + (i * spread * 0.1)
             
-            # Random volumes between 0.1 and 10
-            bid_volume = random.uniform(0.1, 10.0)
-            ask_volume = random.uniform(0.1, 10.0)
+            # Random depth between $50 and $5000 per level
+            bid_volume = random.uniform(50.0, 5000.0) / bid_level
+            ask_volume = random.uniform(50.0, 5000.0) / ask_level
             
             bids.append([str(bid_level), str(bid_volume)])
             asks.append([str(ask_level), str(ask_volume)])
@@ -105,18 +130,15 @@ class ExchangeSimulator:
             if self.balances['USDT']['free'] < float(quoteOrderQty):
                 return None
             
-            # Get current price
-            ticker = self.get_symbol_ticker(symbol)
-            if not ticker:
+            # Walk the simulated book: slippage comes from the depth consumed
+            book = DepthBook.from_order_book(self.get_order_book(symbol))
+            if book is None:
                 return None
             
-            price = float(ticker['price'])
-            # Add some slippage (0.01% to 0.05%)
-            slippage = random.uniform(0.0001, 0.0005)
-            executed_price = price * (1 + slippage)
-            
-            # Calculate quantity bought
-            quantity = float(quoteOrderQty) / executed_price
+            quantity, executed_price = book.cost_to_buy_quote(float(quoteOrderQty))
+            if quantity != quantity:  # NaN: not enough depth
+                return None
+            quantity, executed_price = float(quantity), float(executed_price)
             fee = float(quoteOrderQty) * 0.001  # 0.1% fee
             
             # Update balances
@@ -153,18 +175,15 @@ class ExchangeSimulator:
             if base_asset not in self.balances or self.balances[base_asset]['free'] < float(quantity):
                 return None
             
-            # Get current price
-            ticker = self.get_symbol_ticker(symbol)
-            if not ticker:
+            # Walk the simulated bids for the whole quantity
+            book = DepthBook.from_order_book(self.get_order_book(symbol))
+            if book is None:
                 return None
             
-            price = float(ticker['price'])
-            # Add some slippage (negative for sells)
-            slippage = random.uniform(0.0001, 0.0005)
-            executed_price = price * (1 - slippage)
-            
-            # Calculate USDT received
-            usdt_received = float(quantity) * executed_price
+            usdt_received, executed_price = book.vwap_to_sell(float(quantity))
+            if usdt_received != usdt_received:  # NaN: not enough depth
+                return None
+            usdt_received, executed_price = float(usdt_received), float(executed_price)
             fee = usdt_received * 0.001  # 0.1% fee
             net_usdt = usdt_received - fee
             
@@ -257,6 +276,10 @@ class ExchangeSimulator:
         
         return klines
 
+    def get_open_orders(self, symbol=None):
+        """Market orders fill immediately: nothing is ever left open"""
+        return []
+
     def test_connection(self):
         """Simulate successful connection test"""
         return True
\ No newline at end of file
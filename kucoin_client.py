@@ -2,13 +2,25 @@ import time
 import hashlib
 import hmac
 import base64
-import requests
 import json
 import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
+from urllib.parse import urlencode
+from async_http import AsyncHttpClient, HttpRequestError
+from rate_limiter import PRIORITY_MARKET_DATA, PRIORITY_ORDER, PRIORITY_POSITION, get_rate_limiter
+
+# Public/private pool weights per endpoint (default 2)
+ENDPOINT_WEIGHTS = {
+    '/api/v1/accounts': 5,
+    '/api/v1/market/allTickers': 15,
+    '/api/v1/market/orderbook/level2_100': 4,
+    '/api/v1/symbols': 4,
+    '/api/v1/bullet-public': 10,
+}
 
 class KuCoinClient:
-    def __init__(self, api_key, api_secret, passphrase, sandbox=False):
+    def __init__(self, api_key, api_secret, passphrase, sandbox=False, timeout=10.0, pool_size=10, retries=2):
         self.api_key = api_key
         self.api_secret = api_secret
         self.passphrase = passphrase
@@ -18,7 +30,10 @@ class KuCoinClient:
         else:
             self.base_url = 'https://api.kucoin.com'
         
-        self.session = requests.Session()
+        # Keep-alive pool with per-call timeout; GETs are retried with jittered backoff
+        self.http = AsyncHttpClient(self.base_url, 'KuCoin', pool_size=pool_size,
+                                    timeout=timeout, retries=retries,
+                                    rate_limiter=get_rate_limiter('kucoin'))
         logging.info("KuCoin client initialized")
 
     def _generate_signature(self, timestamp, method, endpoint, body=''):
@@ -42,8 +57,8 @@ class KuCoinClient:
         
         return signature, passphrase_signature
 
-    def _make_request(self, method, endpoint, params=None, body=None):
-        """Make authenticated request to KuCoin API"""
+    def _prepare_headers(self, method, endpoint, params=None, body=None):
+        """Build signed headers for a request"""
         timestamp = int(time.time() * 1000)
         
         if body:
@@ -51,6 +66,10 @@ class KuCoinClient:
         else:
             body_str = ''
         
+        # GET params are part of the signed path
+        if params:
+            endpoint = endpoint + '?' + urlencode(params)
+        
         signature, passphrase_signature = self._generate_signature(
             timestamp, method.upper(), endpoint, body_str
         )
@@ -63,24 +82,60 @@ class KuCoinClient:
             'KC-API-KEY-VERSION': '2',
             'Content-Type': 'application/json'
         }
+        return headers
+
+    @staticmethod
+    def _request_priority(method, endpoint):
+        """Orders first, then account reads, then market data"""
+        if endpoint.startswith('/api/v1/orders') or endpoint.startswith('/api/v1/fills'):
+            return PRIORITY_ORDER
+        if endpoint.startswith('/api/v1/accounts'):
+            return PRIORITY_POSITION
+        return PRIORITY_MARKET_DATA
+
+    def _make_request(self, method, endpoint, params=None, body=None, timeout=None, priority=None):
+        """Make authenticated request to KuCoin API (sync wrapper over the async pool)"""
+        if method.upper() not in ('GET', 'POST', 'DELETE'):
+            raise ValueError(f"Unsupported HTTP method: {method}")
         
-        url = self.base_url + endpoint
+        headers = self._prepare_headers(method, endpoint, params, body)
+        if priority is None:
+            priority = self._request_priority(method, endpoint)
+        try:
+            return self.http.request_sync(method, endpoint, params=params, headers=headers,
+                                          json_body=body, timeout=timeout,
+                                          weight=ENDPOINT_WEIGHTS.get(endpoint, 2), priority=priority)
+        except HttpRequestError as e:
+            logging.error(f"KuCoin API request failed: {e}")
+            return None
+        except FutureTimeoutError:
+            # The sync wrapper gave up waiting on the shared loop; the request is cancelled there
+            logging.error(f"KuCoin API request timed out: {method} {endpoint}")
+            return None
+
+    async def _make_request_async(self, method, endpoint, params=None, body=None, timeout=None, priority=None):
+        """Async variant of _make_request for code running on the shared loop"""
+        if method.upper() not in ('GET', 'POST', 'DELETE'):
+            raise ValueError(f"Unsupported HTTP method: {method}")
         
+        headers = self._prepare_headers(method, endpoint, params, body)
+        if priority is None:
+            priority = self._request_priority(method, endpoint)
         try:
-            if method.upper() == 'GET':
-                response = self.session.get(url, headers=headers, params=params)
-            elif method.upper() == 'POST':
-                response = self.session.post(url, headers=headers, json=body)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
+            return await self.http.request(method, endpoint, params=params, headers=headers,
+                                           json_body=body, timeout=timeout,
+                                           weight=ENDPOINT_WEIGHTS.get(endpoint, 2), priority=priority)
+        except HttpRequestError as e:
             logging.error(f"KuCoin API request failed: {e}")
             return None
 
+    def prewarm(self, connections=None):
+        """Open pooled connections ahead of the first trading cycle"""
+        return self.http.prewarm('/api/v1/timestamp', connections)
+
+    def close(self):
+        self.http.close()
+
     def get_account_balance(self):
         """Get account balance"""
         endpoint = '/api/v1/accounts'
@@ -133,6 +188,24 @@ class KuCoinClient:
         }
         return self._make_request('POST', endpoint, body=body)
 
+    def get_order(self, order_id):
+        """Get a single order (dealSize, dealFunds, fee, isActive)"""
+        endpoint = f'/api/v1/orders/{order_id}'
+        return self._make_request('GET', endpoint)
+
+    def get_open_orders(self, symbol=None):
+        """Get active orders (first page), optionally for one symbol"""
+        endpoint = '/api/v1/orders'
+        params = {'status': 'active', 'pageSize': 500}
+        if symbol:
+            params['symbol'] = symbol
+        return self._make_request('GET', endpoint, params=params)
+
+    def get_public_ws_token(self):
+        """Get public WebSocket token and servers (bullet-public)"""
+        endpoint = '/api/v1/bullet-public'
+        return self._make_request('POST', endpoint)
+
     def get_symbols(self):
         """Get all available trading symbols"""
         endpoint = '/api/v1/symbols'
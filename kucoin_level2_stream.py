@@ -0,0 +1,169 @@
+"""
+Libros de órdenes de KuCoin mantenidos localmente
+Token público (bullet-public), ping periódico y topic /market/level2 con
+cambios ordenados por secuencia sobre un snapshot REST level2_100.
+Misma interfaz de lectura que BinanceDepthStream.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from order_book_stream import OrderBookStream
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+
+class KuCoinLevel2Stream(OrderBookStream):
+    """Gestor de libros locales de KuCoin a partir de incrementos level2"""
+
+    name = 'kucoin-level2'
+
+    def __init__(self, client, symbols, max_age=5.0):
+        super().__init__(symbols, max_age=max_age)
+        self.client = client
+        self.buffers = {symbol: [] for symbol in symbols}
+        self.snapshot_tasks = {}
+
+    async def _connect_info(self):
+        """Obtener token y servidor con el handshake bullet-public"""
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, self.client.get_public_ws_token)
+        if not response or response.get('code') != '200000':
+            raise RuntimeError(f"bullet-public falló: {response}")
+
+        data = response['data']
+        server = data['instanceServers'][0]
+        url = f"{server['endpoint']}?token={data['token']}&connectId={uuid.uuid4().hex}"
+        return url, server.get('pingInterval', 18000) / 1000.0
+
+    async def _stream(self):
+        if websockets is None:
+            self.is_running = False
+            raise RuntimeError("websockets no está instalado")
+
+        url, ping_interval = await self._connect_info()
+
+        # KuCoin usa su propio ping a nivel de mensaje
+        async with websockets.connect(url, ping_interval=None, max_size=None) as ws:
+            welcome = json.loads(await asyncio.wait_for(ws.recv(), timeout=10))
+            if welcome.get('type') != 'welcome':
+                raise RuntimeError(f"Respuesta inesperada: {welcome}")
+
+            await ws.send(json.dumps({
+                'id': str(int(time.time() * 1000)),
+                'type': 'subscribe',
+                'topic': '/market/level2:' + ','.join(self.books),
+                'privateChannel': False,
+                'response': True
+            }))
+            logging.info(f"Conectado a {self.name}")
+
+            for symbol in self.books:
+                self._request_snapshot(symbol)
+
+            keepalive = asyncio.ensure_future(self._keepalive(ws, ping_interval))
+            try:
+                async for message in ws:
+                    payload = json.loads(message)
+                    if payload.get('type') == 'message' and payload.get('subject') == 'trade.l2update':
+                        data = payload['data']
+                        if data.get('symbol') in self.books:
+                            self._on_update(data['symbol'], data)
+                    elif payload.get('type') == 'error':
+                        raise RuntimeError(payload.get('data'))
+            finally:
+                keepalive.cancel()
+
+    async def _keepalive(self, ws, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await ws.send(json.dumps({'id': str(int(time.time() * 1000)), 'type': 'ping'}))
+
+    def _request_snapshot(self, symbol, delay=0):
+        """Pedir snapshot REST (una sola tarea en vuelo por símbolo)"""
+        task = self.snapshot_tasks.get(symbol)
+        if task is None or task.done():
+            self.snapshot_tasks[symbol] = asyncio.ensure_future(self._load_snapshot(symbol, delay))
+
+    async def _load_snapshot(self, symbol, delay=0):
+        if delay:
+            await asyncio.sleep(delay)
+
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, lambda: self.client.get_order_book(symbol, limit=100))
+        self.snapshot_tasks.pop(symbol, None)
+
+        snapshot = response.get('data') if response else None
+        if not snapshot or 'sequence' not in snapshot:
+            logging.warning(f"Snapshot de {symbol} no disponible, reintentando")
+            self._request_snapshot(symbol, delay=1)
+            return
+
+        book = self.books[symbol]
+        book.load_snapshot(snapshot['bids'], snapshot['asks'], int(snapshot['sequence']))
+
+        # Reproducir los incrementos recibidos mientras llegaba el snapshot
+        buffered, self.buffers[symbol] = self.buffers[symbol], []
+        for index, update in enumerate(buffered):
+            if update['sequenceEnd'] <= book.last_update_id:
+                continue
+
+            if not book.synced and update['sequenceStart'] > book.last_update_id + 1:
+                # Snapshot más antiguo que los incrementos: conservar el buffer y pedir otro
+                book.reset()
+                self.buffers[symbol] = buffered[index:]
+                self._request_snapshot(symbol, delay=0.5)
+                return
+
+            if not self._apply_update(book, update):
+                # Hueco a mitad de la reproducción: libro descartado y snapshot nuevo pedido;
+                # se conserva el resto del buffer para reproducirlo sobre ese snapshot
+                self.buffers[symbol] = buffered[index:]
+                return
+
+    def _on_update(self, symbol, update):
+        book = self.books[symbol]
+        if book.last_update_id is None:
+            self.buffers[symbol].append(update)
+            self._request_snapshot(symbol)
+            return
+        self._apply_update(book, update)
+
+    def _apply_update(self, book, update):
+        """Aplicar cambios con secuencia > la del libro; resincronizar si hay hueco o retroceso"""
+        if update['sequenceEnd'] <= book.last_update_id:
+            if book.synced and update['sequenceEnd'] < book.last_update_id:
+                # Con el libro al día la secuencia solo avanza: KuCoin la reinició
+                logging.warning(f"Secuencia de {book.symbol} reiniciada, resincronizando")
+                self._resync(book.symbol, update)
+                return False
+            return True
+
+        if update['sequenceStart'] > book.last_update_id + 1:
+            logging.warning(f"Hueco de secuencia en {book.symbol}, resincronizando")
+            self._resync(book.symbol, update)
+            return False
+
+        # Cada cambio lleva su propia secuencia: descartar los ya incluidos
+        last_sequence = book.last_update_id
+        changes = {}
+        for side in ('bids', 'asks'):
+            changes[side] = [
+                (price, size)
+                for price, size, sequence in update['changes'].get(side, [])
+                if int(sequence) > last_sequence and float(price) > 0
+            ]
+
+        book.apply(changes['bids'], changes['asks'], update['sequenceEnd'])
+        book.synced = True
+        return True
+
+    def _resync(self, symbol, update=None):
+        """Descartar el libro y reconstruirlo desde un snapshot nuevo"""
+        self.books[symbol].reset()
+        self.buffers[symbol] = [update] if update else []
+        self._request_snapshot(symbol, delay=0.5)
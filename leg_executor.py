@@ -0,0 +1,301 @@
+"""
+Ejecución simultánea de las dos patas de un arbitraje entre exchanges
+Compra y venta salen a la vez contra inventario ya repartido en cada exchange
+(quote en el de compra, base en el de venta), cada una con su timeout. Al
+terminar se concilian las cantidades ejecutadas: si una pata quedó corta se
+completa en su exchange (cobertura) y, si tampoco es posible, se deshace lo
+ejecutado en la otra (unwind) para no quedar con exposición. Una pata que no
+responde en leg_timeout deja la ejecución EXPOSED sin bloquear al llamante; la
+conciliación se hace cuando por fin responde y sus órdenes se entregan a on_late.
+"""
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
+from market_types import OrderResult
+from order_journal import order_journal
+from symbol_metadata import symbol_metadata
+
+FILLED = 'FILLED'        # ambas patas completas
+HEDGED = 'HEDGED'        # una pata se completó con una orden adicional
+UNWOUND = 'UNWOUND'      # se deshizo la pata ejecutada
+FAILED = 'FAILED'        # ninguna pata ejecutó
+EXPOSED = 'EXPOSED'      # quedó exposición sin cubrir (requiere revisión)
+REJECTED = 'REJECTED'    # no se envió nada (inventario o mínimos)
+
+
+class ArbitrageExecution:
+    """Resultado de un arbitraje de dos patas"""
+
+    __slots__ = ('symbol', 'buy_exchange', 'sell_exchange', 'quantity', 'status', 'buy', 'sell',
+                 'adjustments', 'residual', 'started_at', 'finished_at', 'error', 'late')
+
+    def __init__(self, symbol, buy_exchange, sell_exchange, quantity):
+        self.symbol = symbol
+        self.buy_exchange = buy_exchange
+        self.sell_exchange = sell_exchange
+        self.quantity = quantity
+        self.status = None
+        self.buy = None
+        self.sell = None
+        self.adjustments = []   # OrderResult de coberturas y unwinds
+        self.residual = 0.0     # base comprada - base vendida tras conciliar
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self.late = False       # quedan órdenes sin respuesta: el estado final llega por on_late
+
+    @property
+    def orders(self):
+        return [order for order in [self.buy, self.sell] + self.adjustments if order is not None and order.success]
+
+    @property
+    def profit(self):
+        """Quote recibido - quote pagado - comisiones; aproximado si alguna comisión no se cobró en quote"""
+        received = sum(order.cost for order in self.orders if order.side == 'SELL')
+        paid = sum(order.cost for order in self.orders if order.side == 'BUY')
+        return received - paid - sum(order.fee for order in self.orders)
+
+    def to_dict(self):
+        return {
+            'symbol': self.symbol,
+            'buy_exchange': self.buy_exchange,
+            'sell_exchange': self.sell_exchange,
+            'quantity': self.quantity,
+            'status': self.status,
+            'bought': self.buy.filled_qty if self.buy else 0.0,
+            'sold': self.sell.filled_qty if self.sell else 0.0,
+            'adjustments': len(self.adjustments),
+            'residual': self.residual,
+            'profit': self.profit,
+            'duration': (self.finished_at or time.time()) - self.started_at,
+            'error': self.error,
+            'late': self.late
+        }
+
+
+class TwoLegExecutor:
+    """Lanza las dos patas en paralelo y concilia fills parciales o patas colgadas"""
+
+    def __init__(self, leg_timeout=2.0, price_buffer=0.002, max_workers=8):
+        self.leg_timeout = leg_timeout              # espera por pata antes de darla por colgada
+        self.price_buffer = price_buffer            # margen al comprar base por importe en quote
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='leg')
+        self.lock = threading.Lock()
+        self.pending = []   # ejecuciones con una pata colgada aún sin conciliar
+
+    @staticmethod
+    def _submit_safe(adapter, side, symbol, amount):
+        try:
+            return order_journal.submit('leg_executor', adapter, side, symbol, amount)
+        except Exception as e:
+            return OrderResult.failed(adapter.name, symbol, side, str(e))
+
+    def _leg(self, adapter, side, symbol, amount):
+        return self.pool.submit(self._submit_safe, adapter, side, symbol, amount)
+
+    def has_inventory(self, buy_adapter, sell_adapter, symbol, quantity, price, base, quote):
+        """Quote suficiente en el exchange de compra y base en el de venta (consultas en paralelo)"""
+        quote_free = self.pool.submit(buy_adapter.get_free_balance, quote)
+        base_free = self.pool.submit(sell_adapter.get_free_balance, base)
+        try:
+            return (quote_free.result(self.leg_timeout) >= quantity * price * (1 + self.price_buffer)
+                    and base_free.result(self.leg_timeout) >= quantity)
+        except Exception as e:
+            logging.warning(f"No se pudo verificar inventario para {symbol}: {e}")
+            return False
+
+    def execute(self, buy_adapter, sell_adapter, symbol, quantity, buy_price, base=None, quote=None,
+                on_late=None):
+        """Comprar quantity en buy_adapter y venderla en sell_adapter a la vez
+
+        Si una pata no responde en leg_timeout se devuelve EXPOSED al momento;
+        cuando responde se concilia y on_late(execution, órdenes nuevas) recibe
+        el fill tardío y las coberturas o unwinds que haya hecho falta.
+        """
+        execution = ArbitrageExecution(symbol, buy_adapter.name, sell_adapter.name, quantity)
+
+        # La misma cantidad tiene que ser válida en los dos exchanges: step de ambos y mínimos de ambos
+        quantity = symbol_metadata.quantize_quantity(sell_adapter.name, symbol, quantity)
+        quantity = symbol_metadata.quantize_quantity(buy_adapter.name, symbol, quantity)
+        legs = [buy_adapter.name, sell_adapter.name]
+        if not symbol_metadata.tradable_mask(legs, [symbol, symbol], [quantity, quantity],
+                                             [buy_price, buy_price]).all():
+            execution.status, execution.error = REJECTED, 'cantidad por debajo de los mínimos'
+            return self._finish(execution)
+        execution.quantity = quantity
+
+        if base and quote and not self.has_inventory(buy_adapter, sell_adapter, symbol, quantity,
+                                                     buy_price, base, quote):
+            execution.status, execution.error = REJECTED, 'inventario insuficiente en algún exchange'
+            return self._finish(execution)
+
+        quote_amount = symbol_metadata.quantize_quote(
+            buy_adapter.name, symbol, quantity * buy_price * (1 + self.price_buffer)
+        )
+        buy_future = self._leg(buy_adapter, 'BUY', symbol, quote_amount)
+        sell_future = self._leg(sell_adapter, 'SELL', symbol, quantity)
+
+        done, hanging = wait_futures([buy_future, sell_future], timeout=self.leg_timeout)
+        execution.buy = buy_future.result() if buy_future in done else None
+        execution.sell = sell_future.result() if sell_future in done else None
+
+        if hanging:
+            # Una orden a mercado enviada no se puede cancelar: conciliar cuando responda, sin esperarla aquí
+            legs = [name for name, future in (('compra', buy_future), ('venta', sell_future)) if future in hanging]
+            logging.warning(f"Pata colgada en {symbol}: {', '.join(legs)}")
+            bought = execution.buy.filled_qty if execution.buy and execution.buy.success else 0.0
+            sold = execution.sell.filled_qty if execution.sell and execution.sell.success else 0.0
+            execution.status, execution.residual = EXPOSED, bought - sold
+            execution.error = f"{', '.join(legs)} sin respuesta tras leg_timeout"
+            execution.late = True
+            with self.lock:
+                self.pending.append(execution)
+
+            remaining = set(hanging)
+
+            def on_done(future):
+                with self.lock:
+                    remaining.discard(future)
+                    if remaining:
+                        return
+                # Hilo propio: la conciliación espera a órdenes de este mismo pool
+                threading.Thread(target=self._late, name='leg-late', daemon=True, args=(
+                    execution, buy_future, sell_future, buy_adapter, sell_adapter, buy_price, on_late
+                )).start()
+
+            for future in hanging:
+                future.add_done_callback(on_done)
+            return self._finish(execution)
+
+        self._reconcile(execution, buy_adapter, sell_adapter, buy_price, on_late)
+        return self._finish(execution)
+
+    def _late(self, execution, buy_future, sell_future, buy_adapter, sell_adapter, buy_price, on_late):
+        """Las patas colgadas ya respondieron: conciliar y entregar las órdenes que no vio el llamante
+
+        La ejecución que recibió el llamante no se toca (puede estar leyéndola);
+        on_late recibe una copia con el estado final.
+        """
+        resolved = copy.copy(execution)
+        resolved.adjustments = list(execution.adjustments)
+        resolved.late = False
+        resolved.buy, resolved.sell = buy_future.result(), sell_future.result()
+        late = [order for order, seen in ((resolved.buy, execution.buy), (resolved.sell, execution.sell))
+                if seen is None]
+        try:
+            self._reconcile(resolved, buy_adapter, sell_adapter, buy_price, on_late)
+        except Exception as e:
+            resolved.status, resolved.error = EXPOSED, str(e)
+        finally:
+            with self.lock:
+                self.pending.remove(execution)
+        self._finish(resolved)
+        self._deliver(resolved, late + resolved.adjustments[len(execution.adjustments):], on_late)
+
+    def _late_adjustment(self, execution, result, exchange, status, remaining, long, buy_price, on_late):
+        """Respondió tarde una cobertura o un unwind: entregar el estado que deja, sin tocar execution"""
+        resolved = copy.copy(execution)
+        resolved.adjustments = list(execution.adjustments)
+        resolved.late = False
+        if result.success:
+            resolved.adjustments.append(result)
+            remaining -= result.filled_qty
+            resolved.residual = remaining if long else -remaining
+            if not self._material(exchange, execution.symbol, max(remaining, 0.0), buy_price):
+                resolved.status, resolved.error = status, None
+        self._deliver(resolved, [result], on_late)
+
+    @staticmethod
+    def _deliver(execution, orders, on_late):
+        orders = [order for order in orders if order is not None and order.success]
+        if on_late is None or not orders:
+            return
+        try:
+            on_late(execution, orders)
+        except Exception as e:
+            logging.error(f"Error entregando el fill tardío de {execution.symbol}: {e}")
+
+    def _reconcile(self, execution, buy_adapter, sell_adapter, buy_price, on_late=None):
+        """Igualar base comprada y vendida; completar la pata corta o deshacer la larga"""
+        bought = execution.buy.filled_qty if execution.buy and execution.buy.success else 0.0
+        sold = execution.sell.filled_qty if execution.sell and execution.sell.success else 0.0
+        symbol = execution.symbol
+
+        if not bought and not sold:
+            execution.status = FAILED
+            execution.error = (execution.buy and execution.buy.error) or (execution.sell and execution.sell.error)
+            return
+
+        excess = bought - sold
+        if not self._material(sell_adapter.name if excess > 0 else buy_adapter.name, symbol, abs(excess), buy_price):
+            execution.status = FILLED
+            execution.residual = excess
+            return
+
+        if excess > 0:
+            # Sobra base en el exchange de compra: vender lo que faltó en el de venta, o devolverlo
+            attempts = [(sell_adapter, 'SELL'), (buy_adapter, 'SELL')]
+        else:
+            # Se vendió más de lo comprado: recomprar en el de compra, o en el de venta
+            attempts = [(buy_adapter, 'BUY'), (sell_adapter, 'BUY')]
+
+        remaining = abs(excess)
+        for index, (adapter, side) in enumerate(attempts):
+            amount = symbol_metadata.prepare_order(adapter.name, symbol, remaining, buy_price)
+            if not amount:
+                break
+            if side == 'BUY':
+                amount = symbol_metadata.quantize_quote(adapter.name, symbol, amount * buy_price * (1 + self.price_buffer))
+            future = self._leg(adapter, side, symbol, amount)
+            try:
+                result = future.result(timeout=self.leg_timeout)
+            except FutureTimeoutError:
+                # La orden puede ejecutarse aún: no se espera ni se envía otra encima; su fill va a on_late
+                logging.warning(f"{'Cobertura' if index == 0 else 'Unwind'} de {symbol} en {adapter.name} sin respuesta")
+                execution.status = EXPOSED
+                execution.residual = remaining if excess > 0 else -remaining
+                execution.error = f"orden de {side} en {adapter.name} sin respuesta tras leg_timeout"
+                execution.late = True
+                future.add_done_callback(lambda done: self._late_adjustment(
+                    execution, done.result(), adapter.name, HEDGED if index == 0 else UNWOUND,
+                    remaining, excess > 0, buy_price, on_late
+                ))
+                return
+            if result.success:
+                execution.adjustments.append(result)
+                remaining -= result.filled_qty
+                if not self._material(adapter.name, symbol, max(remaining, 0.0), buy_price):
+                    execution.status = HEDGED if index == 0 else UNWOUND
+                    execution.residual = remaining if excess > 0 else -remaining
+                    return
+            logging.warning(f"{'Cobertura' if index == 0 else 'Unwind'} de {symbol} en {adapter.name} "
+                            f"incompleta: {result.error or remaining}")
+
+        execution.status = EXPOSED
+        execution.residual = remaining if excess > 0 else -remaining
+        execution.error = f"exposición de {remaining} {symbol} sin cubrir"
+
+    @staticmethod
+    def _material(exchange, symbol, quantity, price):
+        """La diferencia es operable (supera los mínimos del exchange)"""
+        if quantity <= 0:
+            return False
+        rules = symbol_metadata.get(exchange, symbol)
+        if rules is None:
+            return True
+        quantity = rules.quantize_quantity(quantity)
+        return quantity > 0 and rules.check_order(quantity, price)[0]
+
+    @staticmethod
+    def _finish(execution):
+        execution.finished_at = time.time()
+        level = logging.INFO if execution.status in (FILLED, HEDGED, REJECTED) else logging.WARNING
+        logging.log(level, f"Arbitraje {execution.symbol} {execution.buy_exchange}->{execution.sell_exchange}: "
+                           f"{execution.status} ({execution.to_dict()['profit']:.4f} quote)")
+        return execution
+
+
+# Instancia global compartida por todos los motores
+leg_executor = TwoLegExecutor()
@@ -1,7 +1,29 @@
+import os
 from app import app
 
+
+def start_tenant_engine():
+    """Motor multiusuario según TENANT_ENGINE: off (por defecto), inline (en el núcleo de este
+    proceso) o sharded (evaluación repartida en procesos worker, ver shard_supervisor)"""
+    mode = os.environ.get('TENANT_ENGINE', 'off').lower()
+    if mode == 'inline':
+        from tenant_engine import tenant_engine as engine
+    elif mode == 'sharded':
+        from shard_supervisor import shard_supervisor as engine
+    else:
+        return None
+    with app.app_context():
+        engine.start()
+    return engine
+
+
+# gunicorn importa main:app sin llamar a main(): el motor arranca al importar el módulo.
+# Los workers spawn de shard_supervisor reimportan el script principal como __mp_main__.
+tenant_engine = start_tenant_engine() if __name__ != '__mp_main__' else None
+
+
 def main():
-    # Optimized for fast navigation - no WebSockets, no background processes
+    # Optimized for fast navigation - no WebSockets; background engines only via TENANT_ENGINE
     app.run(host='0.0.0.0', port=5000, debug=False)
 
 if __name__ == '__main__':
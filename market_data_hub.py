@@ -0,0 +1,221 @@
+"""
+Hub de datos de mercado en proceso
+Guarda la última cotización por (exchange, símbolo) con número de secuencia,
+deduplica las peticiones de todos los motores y notifica a los suscriptores.
+Cada cotización se pide una vez por refresco aunque la usen varias estrategias.
+"""
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+from quote_fanout import QuoteSnapshot, make_quote, quote_fanout
+
+
+class MarketDataHub:
+    """Publicación/suscripción de cotizaciones compartida por todos los motores"""
+
+    def __init__(self, refresh_interval=1.0, max_age=2.0):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age  # segundos antes de volver a pedir una cotización
+        self.quotes = {}
+        self.sequence = itertools.count(1)
+        self.subscribers = defaultdict(list)
+        self.watched = defaultdict(set)
+        self.credentials = {}  # exchange -> credenciales con las que se refresca
+        self.sources = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.is_running = False
+        self.thread = None
+
+    def register_source(self, exchange, fetch_many):
+        """Registrar fuente propia: fetch_many(symbols) -> {symbol: ticker estilo ccxt}"""
+        self.sources[exchange] = fetch_many
+
+    def watch(self, exchange, symbols, credentials=None):
+        """Añadir símbolos al refresco periódico en segundo plano (con credenciales si las hay)"""
+        with self.lock:
+            self.watched[exchange].update(symbols)
+            if credentials:
+                self.credentials[exchange] = credentials
+
+    def subscribe(self, callback, symbol=None, exchange=None):
+        """Suscribirse a cotizaciones (symbol=None: todas); callback(quote) en el hilo que publica"""
+        with self.lock:
+            self.subscribers[symbol].append((exchange, callback))
+        return symbol, exchange, callback
+
+    def unsubscribe(self, token):
+        symbol, exchange, callback = token
+        with self.lock:
+            if (exchange, callback) in self.subscribers[symbol]:
+                self.subscribers[symbol].remove((exchange, callback))
+
+    def publish(self, exchange, symbol, ticker, received_at=None):
+        """Guardar una cotización nueva y notificar a los suscriptores"""
+        quote = make_quote(exchange, symbol, ticker, received_at or time.time())
+
+        with self.lock:
+            quote['sequence'] = next(self.sequence)
+            self.quotes[(exchange, symbol)] = quote
+            listeners = self.subscribers.get(symbol, []) + self.subscribers.get(None, [])
+
+        for listener_exchange, callback in listeners:
+            if listener_exchange is not None and listener_exchange != exchange:
+                continue
+            try:
+                callback(quote)
+            except Exception as e:
+                logging.error(f"Error en suscriptor de {exchange} {symbol}: {e}")
+
+        return quote
+
+    def _is_fresh(self, quote, max_age):
+        return quote is not None and time.time() - quote['received_at'] < max_age
+
+    def _fetch(self, requests, credentials=None, deadline=None):
+        """Pedir las cotizaciones indicadas ({exchange: symbols}) y publicarlas"""
+        ccxt_requests = {}
+        for exchange, symbols in requests.items():
+            if not symbols:
+                continue
+            if exchange in self.sources:
+                try:
+                    tickers = self.sources[exchange](list(symbols)) or {}
+                except Exception as e:
+                    logging.error(f"Error en fuente {exchange}: {e}")
+                    continue
+                for symbol, ticker in tickers.items():
+                    self.publish(exchange, symbol, ticker)
+            else:
+                ccxt_requests[exchange] = symbols
+
+        # Agrupar exchanges que piden los mismos símbolos en un solo fan-out
+        groups = defaultdict(list)
+        for exchange, symbols in ccxt_requests.items():
+            groups[frozenset(symbols)].append(exchange)
+
+        for symbols, exchanges in groups.items():
+            snapshot = quote_fanout.fetch(exchanges, list(symbols), credentials=credentials, deadline=deadline)
+            for (exchange, symbol), quote in snapshot.quotes.items():
+                self.publish(exchange, symbol, {
+                    'bid': quote['bid'],
+                    'ask': quote['ask'],
+                    'last': quote['last'],
+                    'baseVolume': quote['volume'],
+                    'timestamp': quote['timestamp']
+                }, quote['received_at'])
+
+    def _fetch_once(self, requests, credentials=None, deadline=None):
+        """Igual que _fetch pero sin duplicar peticiones ya en vuelo desde otro hilo"""
+        owned, waiting = defaultdict(set), []
+
+        with self.lock:
+            for exchange, symbols in requests.items():
+                for symbol in symbols:
+                    key = (exchange, symbol)
+                    if key in self.in_flight:
+                        waiting.append(self.in_flight[key])
+                    else:
+                        self.in_flight[key] = threading.Event()
+                        owned[exchange].add(symbol)
+
+        try:
+            if owned:
+                self._fetch(owned, credentials, deadline)
+        finally:
+            with self.lock:
+                for exchange, symbols in owned.items():
+                    for symbol in symbols:
+                        self.in_flight.pop((exchange, symbol)).set()
+
+        for event in waiting:
+            event.wait(deadline or quote_fanout.deadline)
+
+    def get_quote(self, exchange, symbol, max_age=None, credentials=None):
+        """Última cotización; se pide (una sola vez) si falta o está obsoleta"""
+        max_age = self.max_age if max_age is None else max_age
+        quote = self.quotes.get((exchange, symbol))
+
+        if not self._is_fresh(quote, max_age):
+            self._fetch_once({exchange: {symbol}}, {exchange: credentials} if credentials else None)
+            quote = self.quotes.get((exchange, symbol))
+
+        return quote
+
+    def get_ticker(self, exchange, symbol, max_age=None):
+        """Cotización con forma de ticker ccxt (bid, ask, last, baseVolume)"""
+        quote = self.get_quote(exchange, symbol, max_age)
+        if quote is None:
+            return None
+        return {
+            'symbol': symbol,
+            'bid': quote['bid'],
+            'ask': quote['ask'],
+            'last': quote['last'],
+            'baseVolume': quote['volume'],
+            'timestamp': quote['timestamp']
+        }
+
+    def get_snapshot(self, exchanges, symbols, max_age=None, credentials=None, deadline=None):
+        """QuoteSnapshot de exchanges x símbolos, pidiendo solo lo que falte o esté obsoleto"""
+        max_age = self.max_age if max_age is None else max_age
+        started_at = time.time()
+
+        stale = defaultdict(set)
+        for exchange in exchanges:
+            for symbol in symbols:
+                if not self._is_fresh(self.quotes.get((exchange, symbol)), max_age):
+                    stale[exchange].add(symbol)
+
+        if stale:
+            self._fetch_once(stale, credentials, deadline)
+
+        snapshot = QuoteSnapshot(started_at)
+        for exchange in exchanges:
+            for symbol in symbols:
+                quote = self.quotes.get((exchange, symbol))
+                if self._is_fresh(quote, max_age + (deadline or quote_fanout.deadline)):
+                    snapshot.quotes[(exchange, symbol)] = quote
+                else:
+                    snapshot.missing.append((exchange, symbol))
+        snapshot.completed_at = time.time()
+        return snapshot
+
+    def snapshot(self):
+        """Copia de todas las cotizaciones actuales"""
+        with self.lock:
+            return dict(self.quotes)
+
+    def refresh(self):
+        """Un ciclo de refresco de los símbolos vigilados"""
+        with self.lock:
+            requests = {exchange: set(symbols) for exchange, symbols in self.watched.items()}
+            credentials = dict(self.credentials)
+        self._fetch_once(requests, credentials or None)
+
+    def start(self):
+        """Arrancar el refresco periódico en segundo plano"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = threading.Thread(target=self._refresh_loop, name='market-data-hub', daemon=True)
+        self.thread.start()
+        logging.info("Market data hub iniciado")
+
+    def stop(self):
+        self.is_running = False
+
+    def _refresh_loop(self):
+        while self.is_running:
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error refrescando market data hub: {e}")
+            time.sleep(max(0.0, self.refresh_interval - (time.time() - started)))
+
+
+# Instancia global compartida por todos los motores
+market_data_hub = MarketDataHub()
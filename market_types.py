@@ -0,0 +1,164 @@
+"""
+Objetos de mercado normalizados
+Ticker, niveles y libros de órdenes, fills y resultados de órdenes con
+__slots__ y números ya convertidos a float en la frontera del adaptador, para
+que los motores no vuelvan a parsear strings en cada ciclo.
+"""
+import time
+
+
+def to_float(value, default=0.0):
+    """float() tolerante a None y strings vacíos"""
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class Ticker:
+    __slots__ = ('exchange', 'symbol', 'bid', 'ask', 'last', 'volume', 'timestamp')
+
+    def __init__(self, exchange, symbol, bid=0.0, ask=0.0, last=0.0, volume=0.0, timestamp=None):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.bid = bid
+        self.ask = ask
+        self.last = last or ((bid + ask) / 2 if bid and ask else 0.0)
+        self.volume = volume
+        self.timestamp = timestamp or time.time()
+
+    @property
+    def mid(self):
+        if self.bid and self.ask:
+            return (self.bid + self.ask) / 2
+        return self.last
+
+    @property
+    def spread(self):
+        """Spread relativo bid/ask (0.001 = 0.1%)"""
+        if self.bid and self.ask:
+            return (self.ask - self.bid) / self.ask
+        return None
+
+    def to_dict(self):
+        """Forma de ticker ccxt (bid/ask/last/baseVolume) para código existente"""
+        return {
+            'symbol': self.symbol,
+            'bid': self.bid,
+            'ask': self.ask,
+            'last': self.last,
+            'baseVolume': self.volume,
+            'timestamp': int(self.timestamp * 1000)
+        }
+
+
+class BookLevel:
+    __slots__ = ('price', 'quantity')
+
+    def __init__(self, price, quantity):
+        self.price = price
+        self.quantity = quantity
+
+    def __iter__(self):
+        # Permite "price, qty = level" como con las listas de la API
+        yield self.price
+        yield self.quantity
+
+
+class OrderBook:
+    __slots__ = ('exchange', 'symbol', 'bids', 'asks', 'timestamp', 'sequence')
+
+    def __init__(self, exchange, symbol, bids, asks, timestamp=None, sequence=None):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.bids = bids  # BookLevel, precio descendente
+        self.asks = asks  # BookLevel, precio ascendente
+        self.timestamp = timestamp or time.time()
+        self.sequence = sequence
+
+    @classmethod
+    def from_levels(cls, exchange, symbol, bids, asks, timestamp=None, sequence=None):
+        """Construir desde listas [[price, qty], ...] con strings o números"""
+        return cls(
+            exchange, symbol,
+            [BookLevel(float(level[0]), float(level[1])) for level in bids or []],
+            [BookLevel(float(level[0]), float(level[1])) for level in asks or []],
+            timestamp, sequence
+        )
+
+    @property
+    def best_bid(self):
+        return self.bids[0].price if self.bids else None
+
+    @property
+    def best_ask(self):
+        return self.asks[0].price if self.asks else None
+
+
+class Fill:
+    __slots__ = ('price', 'quantity', 'fee', 'fee_asset')
+
+    def __init__(self, price, quantity, fee=0.0, fee_asset=None):
+        self.price = price
+        self.quantity = quantity
+        self.fee = fee
+        self.fee_asset = fee_asset
+
+
+class AssetBalance:
+    __slots__ = ('asset', 'free', 'locked')
+
+    def __init__(self, asset, free=0.0, locked=0.0):
+        self.asset = asset
+        self.free = free
+        self.locked = locked
+
+    @property
+    def total(self):
+        return self.free + self.locked
+
+
+class OrderResult:
+    """Resultado de una orden; success=False lleva el motivo en error"""
+
+    __slots__ = ('exchange', 'symbol', 'side', 'success', 'order_id', 'status', 'filled_qty',
+                 'avg_price', 'cost', 'fee', 'fills', 'error', 'timestamp')
+
+    def __init__(self, exchange, symbol, side, success, order_id=None, status=None, filled_qty=0.0,
+                 avg_price=0.0, cost=0.0, fee=0.0, fills=None, error=None, timestamp=None):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.side = side
+        self.success = success
+        self.order_id = order_id
+        self.status = status
+        self.filled_qty = filled_qty
+        self.avg_price = avg_price
+        self.cost = cost
+        self.fee = fee
+        self.fills = fills or []
+        self.error = error
+        self.timestamp = timestamp or time.time()
+
+    @classmethod
+    def failed(cls, exchange, symbol, side, error):
+        return cls(exchange, symbol, side, False, error=error)
+
+    @classmethod
+    def from_fills(cls, exchange, symbol, side, order_id, status, fills):
+        """Agregar fills en cantidad, precio medio ponderado, coste y comisión"""
+        filled_qty = sum(fill.quantity for fill in fills)
+        cost = sum(fill.price * fill.quantity for fill in fills)
+        return cls(
+            exchange, symbol, side, filled_qty > 0,
+            order_id=order_id,
+            status=status,
+            filled_qty=filled_qty,
+            avg_price=cost / filled_qty if filled_qty else 0.0,
+            cost=cost,
+            fee=sum(fill.fee for fill in fills),
+            fills=fills,
+            error=None if filled_qty > 0 else f"orden {order_id} sin ejecutar ({status})"
+        )
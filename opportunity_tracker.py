@@ -0,0 +1,248 @@
+"""
+Seguimiento incremental de oportunidades de arbitraje
+Suscrito al market data hub: cada cotización nueva de (exchange, símbolo) solo
+reevalúa los spreads de ese símbolo contra los demás exchanges, y el conjunto
+de oportunidades vivas se mantiene ordenado en el sitio. El coste por tick
+depende del ritmo de actualizaciones, no del tamaño del universo, y cada
+oportunidad guarda cuándo apareció y cuándo desapareció.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+from cost_model import cost_model
+from market_data_hub import market_data_hub
+
+
+class Opportunity:
+    """Oportunidad comprar en buy_exchange / vender en sell_exchange, viva o cerrada"""
+
+    __slots__ = ('symbol', 'buy_exchange', 'sell_exchange', 'buy_price', 'sell_price', 'buy_fee',
+                 'sell_fee', 'buy_volume', 'sell_volume', 'spread', 'net_spread', 'peak_spread',
+                 'opened_at', 'updated_at', 'closed_at', 'updates', 'rank_key')
+
+    def __init__(self, symbol, buy_exchange, sell_exchange, opened_at):
+        self.symbol = symbol
+        self.buy_exchange = buy_exchange
+        self.sell_exchange = sell_exchange
+        self.buy_price = self.sell_price = 0.0
+        self.buy_fee = self.sell_fee = 0.0
+        self.buy_volume = self.sell_volume = 0.0
+        self.spread = self.net_spread = self.peak_spread = 0.0
+        self.opened_at = opened_at
+        self.updated_at = opened_at
+        self.closed_at = None
+        self.updates = 0
+        self.rank_key = None
+
+    @property
+    def key(self):
+        return self.symbol, self.buy_exchange, self.sell_exchange
+
+    @property
+    def lifetime(self):
+        """Segundos abierta (hasta ahora si sigue viva)"""
+        return (self.closed_at or time.time()) - self.opened_at
+
+    def to_dict(self):
+        """Mismos campos que ArbitrageMatrix más los tiempos de vida"""
+        return {
+            'symbol': self.symbol,
+            'buy_exchange': self.buy_exchange,
+            'sell_exchange': self.sell_exchange,
+            'buy_price': self.buy_price,
+            'sell_price': self.sell_price,
+            'spread_percentage': self.spread * 100,
+            'net_spread_percentage': self.net_spread * 100,
+            'buy_fee': self.buy_fee,
+            'sell_fee': self.sell_fee,
+            'buy_volume': self.buy_volume,
+            'sell_volume': self.sell_volume,
+            'peak_spread_percentage': self.peak_spread * 100,
+            'opened_at': self.opened_at,
+            'closed_at': self.closed_at,
+            'lifetime': self.lifetime,
+            'updates': self.updates
+        }
+
+
+class OpportunityTracker:
+    """Conjunto vivo y ordenado de oportunidades entre exchanges"""
+
+    def __init__(self, hub=None, min_spread=0.0, max_age=5.0, history_size=1000):
+        self.hub = hub or market_data_hub
+        self.min_spread = min_spread  # ventaja neta esperada mínima para considerarla viva
+        self.max_age = max_age        # cotizaciones más viejas no abren ni sostienen oportunidades
+        self.quotes = {}              # símbolo -> {exchange: (bid, ask, volume, coste de pata, received_at)}
+        self.live = {}                # (símbolo, compra, venta) -> Opportunity
+        self.ranked = []              # [(-spread neto, clave)] ascendente = mejor primero
+        self.history = deque(maxlen=history_size)
+        self.exchanges = set()
+        self.symbols = set()
+        self.token = None
+        self.lock = threading.Lock()
+
+    def track(self, exchanges, symbols, credentials=None):
+        """Seguir estos exchanges/símbolos: el hub los refresca y cada cotización llega aquí
+
+        credentials: {exchange: credenciales} para refrescar con la API autenticada.
+        """
+        credentials = credentials or {}
+        with self.lock:
+            self.exchanges.update(exchanges)
+            self.symbols.update(symbols)
+        for exchange in exchanges:
+            self.hub.watch(exchange, symbols, credentials.get(exchange))
+        if self.token is None:
+            self.token = self.hub.subscribe(self.on_quote)
+        cost_model.start()
+        self.hub.start()
+
+    def stop(self):
+        if self.token is not None:
+            self.hub.unsubscribe(self.token)
+            self.token = None
+
+    # Entrada de cotizaciones
+
+    def on_quote(self, quote):
+        """Callback del hub: reevaluar solo los pares que incluyen (exchange, símbolo)"""
+        exchange, symbol = quote['exchange'], quote['symbol']
+        if exchange not in self.exchanges or symbol not in self.symbols:
+            return
+        bid, ask = quote['bid'], quote['ask']
+        fee = cost_model.leg_cost(exchange, symbol)  # comisión + selección adversa
+
+        with self.lock:
+            books = self.quotes.setdefault(symbol, {})
+            previous = books.get(exchange)
+            if not bid or not ask:
+                books.pop(exchange, None)
+                self._close_exchange(symbol, exchange, quote['received_at'])
+                return
+
+            books[exchange] = (bid, ask, quote['volume'] or 0.0, fee, quote['received_at'])
+            if previous is not None and previous[0] == bid and previous[1] == ask:
+                return  # mismo precio: solo se renueva la frescura
+            self._evaluate(symbol, exchange, quote['received_at'])
+
+    def _evaluate(self, symbol, exchange, now):
+        books = self.quotes[symbol]
+        bid, ask, volume, fee, _ = books[exchange]
+        for other, (other_bid, other_ask, other_volume, other_fee, received_at) in books.items():
+            if other == exchange:
+                continue
+            if now - received_at > self.max_age:
+                self._close((symbol, exchange, other), now)
+                self._close((symbol, other, exchange), now)
+                continue
+            # Comprar aquí y vender allí, y al revés
+            self._apply(symbol, exchange, other, ask, fee, volume, other_bid, other_fee, other_volume, now)
+            self._apply(symbol, other, exchange, other_ask, other_fee, other_volume, bid, fee, volume, now)
+
+    def _apply(self, symbol, buy_exchange, sell_exchange, buy_price, buy_fee, buy_volume,
+               sell_price, sell_fee, sell_volume, now):
+        paid = buy_price * (1 + buy_fee)
+        net_spread = (sell_price * (1 - sell_fee) - paid) / paid
+        net_spread -= cost_model.transfer_cost(symbol, buy_exchange, sell_exchange, buy_price)
+        key = (symbol, buy_exchange, sell_exchange)
+
+        if net_spread <= self.min_spread:
+            self._close(key, now)
+            return
+
+        opportunity = self.live.get(key)
+        if opportunity is None:
+            opportunity = Opportunity(symbol, buy_exchange, sell_exchange, now)
+            self.live[key] = opportunity
+        else:
+            self._unrank(opportunity)
+
+        opportunity.buy_price, opportunity.sell_price = buy_price, sell_price
+        opportunity.buy_fee, opportunity.sell_fee = buy_fee, sell_fee
+        opportunity.buy_volume, opportunity.sell_volume = buy_volume, sell_volume
+        opportunity.spread = (sell_price - buy_price) / buy_price
+        opportunity.net_spread = net_spread
+        opportunity.peak_spread = max(opportunity.peak_spread, net_spread)
+        opportunity.updated_at = now
+        opportunity.updates += 1
+
+        opportunity.rank_key = (-net_spread, key)
+        bisect.insort(self.ranked, opportunity.rank_key)
+
+    def _unrank(self, opportunity):
+        index = bisect.bisect_left(self.ranked, opportunity.rank_key)
+        if index < len(self.ranked) and self.ranked[index] == opportunity.rank_key:
+            del self.ranked[index]
+
+    def _close(self, key, now):
+        opportunity = self.live.pop(key, None)
+        if opportunity is None:
+            return
+        self._unrank(opportunity)
+        opportunity.closed_at = now
+        self.history.append(opportunity)
+
+    def _close_exchange(self, symbol, exchange, now):
+        for key in [key for key in self.live if key[0] == symbol and exchange in key[1:]]:
+            self._close(key, now)
+
+    def expire(self, now=None):
+        """Cerrar las oportunidades con alguna pata sin cotización reciente"""
+        now = now or time.time()
+        with self.lock:
+            for key in list(self.live):
+                symbol, buy_exchange, sell_exchange = key
+                books = self.quotes.get(symbol, {})
+                for exchange in (buy_exchange, sell_exchange):
+                    book = books.get(exchange)
+                    if book is None or now - book[4] > self.max_age:
+                        self._close(key, now)
+                        break
+
+    # Lectura
+
+    def top(self, k=5, min_spread=0.0, exchanges=None, symbols=None, min_volume=0.0):
+        """Las k mejores oportunidades vivas (spread neto), con filtros opcionales"""
+        self.expire()
+        result = []
+        with self.lock:
+            for neg_spread, key in self.ranked:
+                if -neg_spread <= min_spread or len(result) >= k:
+                    break
+                symbol, buy_exchange, sell_exchange = key
+                if symbols is not None and symbol not in symbols:
+                    continue
+                if exchanges is not None and (buy_exchange not in exchanges or sell_exchange not in exchanges):
+                    continue
+                opportunity = self.live[key]
+                if min_volume and min(opportunity.buy_volume, opportunity.sell_volume) <= min_volume:
+                    continue
+                result.append(opportunity.to_dict())
+        return result
+
+    def best_per_symbol(self, min_spread=0.0, exchanges=None, symbols=None, min_volume=0.0):
+        """{símbolo: mejor oportunidad viva}"""
+        best = {}
+        for opportunity in self.top(len(self.live), min_spread, exchanges, symbols, min_volume):
+            best.setdefault(opportunity['symbol'], opportunity)
+        return best
+
+    def lifetime_stats(self):
+        """Duración de las oportunidades ya cerradas (segundos)"""
+        with self.lock:
+            lifetimes = sorted(opportunity.lifetime for opportunity in self.history)
+        if not lifetimes:
+            return {'closed': 0, 'live': len(self.live)}
+        return {
+            'closed': len(lifetimes),
+            'live': len(self.live),
+            'mean': sum(lifetimes) / len(lifetimes),
+            'median': lifetimes[len(lifetimes) // 2],
+            'p90': lifetimes[min(len(lifetimes) - 1, int(len(lifetimes) * 0.9))],
+            'max': lifetimes[-1]
+        }
+
+
+# Instancia global compartida por todos los motores
+opportunity_tracker = OpportunityTracker()
@@ -0,0 +1,153 @@
+"""
+Libros de órdenes locales alimentados por websocket
+Base común para los streams de cada exchange: el stream mantiene los libros
+en memoria sobre el loop de async_runtime y los escáneres los leen sin I/O.
+"""
+import asyncio
+import heapq
+import logging
+import random
+import threading
+import time
+from async_runtime import spawn
+from depth_book import DepthBook
+
+
+class LocalOrderBook:
+    """Libro de órdenes en memoria de un símbolo (precio -> cantidad)"""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = {}
+        self.asks = {}
+        self.last_update_id = None
+        self.synced = False
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            self.last_update_id = None
+            self.synced = False
+
+    def load_snapshot(self, bids, asks, last_update_id):
+        """Cargar snapshot completo (niveles [precio, cantidad])"""
+        with self.lock:
+            self.bids = {float(price): float(qty) for price, qty, *_ in bids if float(qty) > 0}
+            self.asks = {float(price): float(qty) for price, qty, *_ in asks if float(qty) > 0}
+            self.last_update_id = last_update_id
+            self.synced = False
+            self.updated_at = time.time()
+
+    def apply(self, bids, asks, last_update_id):
+        """Aplicar cambios incrementales; cantidad 0 elimina el nivel"""
+        with self.lock:
+            for side, levels in ((self.bids, bids), (self.asks, asks)):
+                for price, qty, *_ in levels:
+                    price, qty = float(price), float(qty)
+                    if qty == 0:
+                        side.pop(price, None)
+                    else:
+                        side[price] = qty
+            self.last_update_id = last_update_id
+            self.updated_at = time.time()
+
+    def top(self, limit=5):
+        """Mejores niveles en el mismo formato que la API REST de Binance"""
+        with self.lock:
+            bids = heapq.nlargest(limit, self.bids.items())
+            asks = heapq.nsmallest(limit, self.asks.items())
+        return {
+            'bids': [[price, qty] for price, qty in bids],
+            'asks': [[price, qty] for price, qty in asks],
+            'lastUpdateId': self.last_update_id,
+            'timestamp': self.updated_at
+        }
+
+    def best(self):
+        """(bid, bid_qty, ask, ask_qty) o None si algún lado está vacío"""
+        with self.lock:
+            if not self.bids or not self.asks:
+                return None
+            bid = max(self.bids)
+            ask = min(self.asks)
+            return bid, self.bids[bid], ask, self.asks[ask]
+
+
+class OrderBookStream:
+    """Base de los streams de profundidad: reconexión y lectura sin I/O"""
+
+    name = 'orderbook'
+
+    def __init__(self, symbols, max_age=5.0):
+        self.books = {symbol: LocalOrderBook(symbol) for symbol in symbols}
+        self.max_age = max_age  # segundos sin actualizar antes de considerar el libro obsoleto
+        self.is_running = False
+        self.future = None
+
+    def start(self):
+        """Arrancar el stream en el loop compartido"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.future = spawn(self._run())
+        logging.info(f"Stream {self.name} iniciado para {len(self.books)} símbolos")
+
+    def stop(self):
+        """Detener el stream"""
+        self.is_running = False
+        if self.future:
+            self.future.cancel()
+            self.future = None
+        for book in self.books.values():
+            book.reset()
+
+    async def _run(self):
+        """Conectar y reconectar con backoff mientras el stream esté activo"""
+        backoff = 1.0
+        while self.is_running:
+            try:
+                await self._stream()
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Stream {self.name} desconectado: {e}")
+
+            for book in self.books.values():
+                book.reset()
+
+            if self.is_running:
+                await asyncio.sleep(backoff + random.uniform(0, backoff / 2))
+                backoff = min(backoff * 2, 60.0)
+
+    async def _stream(self):
+        """Conexión concreta de cada exchange"""
+        raise NotImplementedError
+
+    # Interfaz de lectura (sin I/O)
+
+    def is_synced(self, symbol):
+        book = self.books.get(symbol)
+        return bool(book and book.synced and time.time() - book.updated_at < self.max_age)
+
+    def get_order_book(self, symbol, limit=5):
+        """Libro local del símbolo o None si no está sincronizado/fresco"""
+        if not self.is_synced(symbol):
+            return None
+        return self.books[symbol].top(limit)
+
+    def get_depth_book(self, symbol, limit=50):
+        """DepthBook (arrays NumPy) del libro local o None"""
+        book = self.get_order_book(symbol, limit)
+        if book is None:
+            return None
+        return DepthBook.from_levels(book['bids'], book['asks'], symbol, book['timestamp'])
+
+    def best_bid_ask(self, symbol):
+        """(bid, bid_qty, ask, ask_qty) del libro local o None"""
+        if not self.is_synced(symbol):
+            return None
+        return self.books[symbol].best()
@@ -0,0 +1,456 @@
+"""
+Diario de órdenes y posiciones (write-ahead log)
+Cada orden deja en disco su intención antes de salir al exchange y después su
+ack y su fill; cada posición su apertura y su cierre. Los registros se añaden
+a un fichero JSON por líneas y se sincronizan con fsync en lotes (group
+commit), de modo que muchos registros comparten un solo fsync. Al arrancar se
+reproduce el fichero para reconstruir las posiciones de cada motor y las
+órdenes sin resolver, que se cruzan con las órdenes abiertas del exchange.
+Los trades también pasan por el diario y se vuelcan a SQL en bloque desde un
+hilo aparte: el commit por trade sale del camino crítico sin perder ninguno.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+JOURNAL_PATH = os.environ.get(
+    'ORDER_JOURNAL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'order_journal.log')
+)
+
+# Tipos de registro
+INTENT = 'intent'          # orden decidida, aún no enviada
+ACK = 'ack'                # respuesta del exchange (aceptada o rechazada)
+FILL = 'fill'              # cantidad ejecutada de una orden aceptada
+OPEN = 'open'              # posición abierta por un motor
+CLOSE = 'close'            # posición cerrada
+TRADE = 'trade'            # fila (Trade, Alert, UserTrade) pendiente de SQL
+CHECKPOINT = 'checkpoint'  # trades volcados a SQL hasta este seq
+RECONCILE = 'reconcile'    # orden sin resolver aclarada contra el exchange
+ORDER = 'order'            # estado de una orden sin resolver (solo en compactación)
+SNAPSHOT = 'snapshot'      # cabecera de un fichero compactado
+
+# Modelos que se vuelcan por lotes -> columna de fecha que se rellena al registrar
+ROW_TIMESTAMPS = {'Trade': 'executed_at', 'Alert': 'created_at', 'UserTrade': 'executed_at'}
+
+
+class OrderJournal:
+    """Diario append-only con fsync por lotes y reconstrucción de estado al arrancar"""
+
+    def __init__(self, path=JOURNAL_PATH, sync_interval=0.005, db_interval=1.0,
+                 compact_bytes=8 * 1024 * 1024, retry_interval=0.5):
+        self.path = path
+        self.dead_letter_path = f"{path}.rejected"  # filas que la base de datos no acepta
+        self.sync_interval = sync_interval  # ventana para agrupar registros en un fsync
+        self.retry_interval = retry_interval  # espera antes de reintentar una escritura fallida
+        self.db_interval = db_interval      # cada cuánto se vuelcan los trades a SQL
+        self.compact_bytes = compact_bytes  # tamaño a partir del cual se reescribe el fichero
+
+        self.seq = 0
+        self.synced_seq = 0
+        self.write_error = None   # último error de escritura/fsync
+        self.write_failures = 0   # escrituras fallidas; quien espera falla si crece mientras espera
+        self.orders = {}          # client_id -> orden sin resolver
+        self.positions = {}       # motor -> {clave: posición}
+        self.trades = {}          # seq -> (modelo, campos) aún no volcados
+        self.recovered_seq = 0    # trades con seq <= este pueden estar ya en SQL
+        self.buffer = []          # líneas pendientes de escribir
+        self.file = None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.is_running = False
+        self.writer = None
+        self.db_writer = None
+
+    # Arranque
+
+    def open(self):
+        """Reproducir el fichero, compactarlo y arrancar los hilos de escritura"""
+        with self.lock:
+            if self.is_running:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            started = time.perf_counter()
+            count = self._replay()
+            self.recovered_seq = self.seq
+            self._compact()
+            self.synced_seq = self.seq
+            self.is_running = True
+        logging.info(f"Diario de órdenes: {count} registros reproducidos en "
+                     f"{(time.perf_counter() - started) * 1000:.1f} ms, {len(self.orders)} órdenes sin resolver, "
+                     f"{sum(len(p) for p in self.positions.values())} posiciones abiertas")
+
+        self.writer = threading.Thread(target=self._write_loop, name='order-journal', daemon=True)
+        self.writer.start()
+        self.db_writer = threading.Thread(target=self._db_loop, name='order-journal-db', daemon=True)
+        self.db_writer.start()
+        atexit.register(self.close)
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return 0
+        count = valid = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # escritura cortada por una caída: se descarta la cola
+                self._apply(record)
+                valid += len(line)
+                count += 1
+        if valid < os.path.getsize(self.path):
+            logging.warning(f"Diario de órdenes truncado en el byte {valid} (registro incompleto)")
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid)
+        return count
+
+    def _apply(self, record):
+        """Aplicar un registro al estado en memoria (al escribir y al reproducir)"""
+        kind = record['type']
+        self.seq = max(self.seq, record['seq'])
+
+        if kind == INTENT:
+            self.orders[record['client_id']] = {
+                'client_id': record['client_id'],
+                'engine': record['engine'],
+                'exchange': record['exchange'],
+                'symbol': record['symbol'],
+                'side': record['side'],
+                'amount': record['amount'],
+                'status': 'PENDING',
+                'order_id': None,
+                'created_at': record['ts']
+            }
+        elif kind == ACK:
+            order = self.orders.get(record['client_id'])
+            if order is not None:
+                if record['success']:
+                    order.update(status='ACKED', order_id=record['order_id'])
+                else:
+                    del self.orders[record['client_id']]
+        elif kind in (FILL, RECONCILE):
+            self.orders.pop(record['client_id'], None)
+        elif kind == ORDER:
+            self.orders[record['order']['client_id']] = record['order']
+        elif kind == OPEN:
+            self.positions.setdefault(record['engine'], {})[record['key']] = record['position']
+        elif kind == CLOSE:
+            self.positions.get(record['engine'], {}).pop(record['key'], None)
+        elif kind == TRADE:
+            self.trades[record['seq']] = (record.get('model', 'Trade'), record['trade'])
+        elif kind == CHECKPOINT:
+            for seq in [seq for seq in self.trades if seq <= record['upto']]:
+                del self.trades[seq]
+
+    def _snapshot(self):
+        """Registros mínimos que reproducen el estado actual"""
+        records = [{'type': SNAPSHOT, 'seq': self.seq, 'ts': time.time()}]
+        records += [{'type': ORDER, 'seq': self.seq, 'order': order} for order in self.orders.values()]
+        records += [
+            {'type': OPEN, 'seq': self.seq, 'engine': engine, 'key': key, 'position': position}
+            for engine, positions in self.positions.items() for key, position in positions.items()
+        ]
+        records += [{'type': TRADE, 'seq': seq, 'model': model, 'trade': fields}
+                    for seq, (model, fields) in self.trades.items()]
+        return records
+
+    def _compact(self):
+        """Reescribir el fichero con el estado actual (con el lock tomado)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for record in self._snapshot():
+                f.write(json.dumps(record, separators=(',', ':'), default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.path, 'a')
+        self.buffer = []  # su efecto ya está en la instantánea
+
+    # Escritura
+
+    def append(self, kind, durable=False, **fields):
+        """Añadir un registro; durable=True espera a que esté en disco"""
+        if not self.is_running:
+            self.open()
+        with self.lock:
+            self.seq += 1
+            record = dict(fields, type=kind, seq=self.seq, ts=time.time())
+            self._apply(record)
+            self.buffer.append(json.dumps(record, separators=(',', ':'), default=str))
+            self.changed.notify_all()
+            if durable:
+                failures = self.write_failures
+                while self.synced_seq < record['seq'] and self.is_running:
+                    if self.write_failures != failures:
+                        # Sin el registro en disco no se puede seguir (p. ej. enviar la orden)
+                        raise OSError(f"Diario de órdenes sin escribir en disco: {self.write_error}")
+                    self.changed.wait()
+        return record['seq']
+
+    def _write_loop(self):
+        while True:
+            with self.lock:
+                while not self.buffer and self.is_running:
+                    self.changed.wait()
+                if not self.buffer and not self.is_running:
+                    return
+                lines, self.buffer = self.buffer, []
+                last = self.seq
+            offset = None
+            try:
+                offset = self.file.tell()
+                self.file.write('\n'.join(lines) + '\n')
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except (OSError, ValueError) as e:
+                logging.error(f"Error escribiendo el diario de órdenes: {e}")
+                self._discard_partial(offset)
+                with self.lock:
+                    # Las líneas vuelven al principio del buffer y se reintentan; synced_seq no avanza
+                    self.buffer = lines + self.buffer
+                    self.write_error = e
+                    self.write_failures += 1
+                    self.changed.notify_all()
+                time.sleep(self.retry_interval)
+                continue
+            with self.lock:
+                self.synced_seq = max(self.synced_seq, last)
+                if self.file.tell() > self.compact_bytes:
+                    self._compact()
+                    self.synced_seq = self.seq
+                self.changed.notify_all()
+            time.sleep(self.sync_interval)  # los registros que llegan mientras tanto van en el siguiente fsync
+
+    def _discard_partial(self, offset):
+        """Quitar lo que dejó a medias una escritura fallida y reabrir el fichero
+
+        Una línea cortada en mitad del fichero haría que la reproducción se
+        detuviera en ella y perdiera todo lo posterior.
+        """
+        try:
+            self.file.close()
+        except (OSError, ValueError):
+            pass  # lo que quedara en el buffer de Python se descarta
+        try:
+            if offset is not None:
+                os.truncate(self.path, offset)
+            self.file = open(self.path, 'a')
+        except OSError as e:
+            logging.error(f"No se pudo reabrir el diario de órdenes: {e}")
+
+    def flush(self):
+        """Esperar a que todo lo escrito hasta ahora esté en disco; False si la escritura está fallando"""
+        with self.lock:
+            target, failures = self.seq, self.write_failures
+            while self.synced_seq < target and self.is_running:
+                if self.write_failures != failures:
+                    return False
+                self.changed.wait()
+        return True
+
+    def close(self):
+        if not self.is_running:
+            return
+        self.persist_trades()
+        self.flush()
+        with self.lock:
+            self.is_running = False
+            self.changed.notify_all()
+        self.writer.join(timeout=5)
+        self.file.close()
+
+    # Órdenes y posiciones
+
+    def intent(self, engine, exchange, symbol, side, amount):
+        """Registrar (en disco) una orden antes de enviarla; devuelve su client_id"""
+        client_id = uuid.uuid4().hex[:16]
+        self.append(INTENT, durable=True, client_id=client_id, engine=engine, exchange=exchange,
+                    symbol=symbol, side=side, amount=amount)
+        return client_id
+
+    def order_result(self, client_id, result):
+        """Ack y fill de un OrderResult"""
+        self.append(ACK, client_id=client_id, success=result.success, order_id=result.order_id,
+                    status=result.status, error=result.error)
+        if result.success:
+            self.append(FILL, client_id=client_id, filled_qty=result.filled_qty, avg_price=result.avg_price,
+                        cost=result.cost, fee=result.fee)
+
+    def submit(self, engine, adapter, side, symbol, amount):
+        """Orden a mercado por un adaptador con intención, ack y fill en el diario"""
+        client_id = self.intent(engine, adapter.name, symbol, side, amount)
+        result = adapter.market_buy(symbol, amount) if side == 'BUY' else adapter.market_sell(symbol, amount)
+        self.order_result(client_id, result)
+        return result
+
+    def open_position(self, engine, key, position):
+        self.append(OPEN, engine=engine, key=str(key), position=position)
+
+    def close_position(self, engine, key, reason=None, profit=None):
+        self.append(CLOSE, engine=engine, key=str(key), reason=reason, profit=profit)
+
+    def recover(self, engine):
+        """Posiciones abiertas de un motor según el diario"""
+        if not self.is_running:
+            self.open()
+        with self.lock:
+            return {key: dict(position) for key, position in self.positions.get(engine, {}).items()}
+
+    def pending_orders(self, engine=None):
+        """Órdenes con intención registrada y sin fill ni rechazo"""
+        with self.lock:
+            return [dict(order) for order in self.orders.values() if engine is None or order['engine'] == engine]
+
+    def reconcile(self, adapters, engine=None):
+        """Cruzar las órdenes sin resolver con las abiertas en cada exchange
+
+        Las que siguen abiertas se mantienen; las demás se dan por resueltas
+        (ejecutadas o rechazadas mientras el proceso estaba caído) y se
+        devuelven para revisar su efecto en los balances.
+        """
+        unresolved = {}
+        for order in self.pending_orders(engine):
+            unresolved.setdefault(order['exchange'], []).append(order)
+
+        resolved = []
+        for exchange, orders in unresolved.items():
+            adapter = adapters.get(exchange)
+            if adapter is None:
+                continue
+            try:
+                open_ids = adapter.get_open_orders()
+            except Exception as e:
+                logging.warning(f"No se pudieron consultar las órdenes abiertas de {exchange}: {e}")
+                continue
+            if open_ids is None:
+                continue
+            open_ids = set(open_ids)
+            for order in orders:
+                if order['order_id'] is not None and str(order['order_id']) in open_ids:
+                    logging.warning(f"Orden {order['order_id']} de {order['symbol']} sigue abierta en {exchange}")
+                    continue
+                self.append(RECONCILE, client_id=order['client_id'], outcome='not_open')
+                resolved.append(order)
+                logging.warning(f"Orden {order['side']} {order['symbol']} en {exchange} ({order['status']}) "
+                                f"sin resultado en el diario: revisar balances")
+        return resolved
+
+    # Trades hacia SQL
+
+    def record_row(self, model, **fields):
+        """Registrar una fila de un modelo de ROW_TIMESTAMPS; se inserta en el próximo volcado"""
+        fields.setdefault(ROW_TIMESTAMPS[model], time.time())
+        self.append(TRADE, model=model, trade=fields)
+
+    def record_trade(self, **fields):
+        """Registrar un trade; se inserta en SQL en el próximo volcado por lotes"""
+        self.record_row('Trade', **fields)
+
+    def record_alert(self, **fields):
+        """Registrar una alerta; mismo volcado por lotes que los trades"""
+        self.record_row('Alert', **fields)
+
+    def _db_loop(self):
+        while self.is_running:
+            time.sleep(self.db_interval)
+            self.persist_trades()
+
+    def persist_trades(self):
+        """Insertar en bloque los trades y alertas pendientes y marcar el checkpoint
+
+        Si la base de datos rechaza el lote se reintenta fila a fila: las filas
+        inválidas se apartan en dead_letter_path para que no bloqueen los
+        volcados siguientes.
+        """
+        with self.lock:
+            batch = list(self.trades.items())
+        if not batch:
+            return 0
+        try:
+            from app import app, db
+            from sqlalchemy.exc import OperationalError
+            with app.app_context():
+                try:
+                    rows = [self._row(seq, model, fields) for seq, (model, fields) in batch]
+                    db.session.add_all([row for row in rows if row is not None])
+                    db.session.commit()
+                    done = batch[-1][0]
+                except OperationalError:
+                    raise  # base de datos caída: todo el lote espera al siguiente volcado
+                except Exception as e:
+                    db.session.rollback()
+                    logging.warning(f"Lote de {len(batch)} trades rechazado ({e}), reintentando fila a fila")
+                    done = self._persist_rows(db, batch)
+        except Exception as e:
+            logging.error(f"Error volcando trades del diario a la base de datos: {e}")
+            return 0
+        if done is None:
+            return 0
+        self.append(CHECKPOINT, upto=done)
+        return sum(1 for seq, _ in batch if seq <= done)
+
+    def _row(self, seq, model, fields):
+        """Instancia del modelo para un registro TRADE, o None si ya está en SQL"""
+        import models
+        model_class = getattr(models, model)
+        # Tras una caída el lote pudo llegar a SQL sin su checkpoint
+        if seq <= self.recovered_seq and fields.get('order_id') and 'side' in fields:
+            identity = {name: fields[name] for name in ('order_id', 'side', 'user_id') if name in fields}
+            if model_class.query.filter_by(**identity).first():
+                return None
+        # Los modelos no aceptan todas las columnas en __init__: se asignan una a una
+        row = model_class()
+        for name, value in fields.items():
+            if name == ROW_TIMESTAMPS[model]:
+                # UTC sin zona, como los default=datetime.utcnow de los modelos
+                value = datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+            setattr(row, name, value)
+        return row
+
+    def _persist_rows(self, db, batch):
+        """Fila a fila; devuelve el último seq resuelto (insertado o apartado)"""
+        from sqlalchemy.exc import OperationalError
+        done = None
+        for seq, (model, fields) in batch:
+            try:
+                row = self._row(seq, model, fields)
+                if row is not None:
+                    db.session.add(row)
+                    db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                logging.error(f"Base de datos no disponible volcando trades: {e}")
+                break  # el resto se reintenta en el siguiente volcado
+            except Exception as e:
+                db.session.rollback()
+                try:
+                    self._dead_letter(seq, model, fields, e)
+                except OSError as write_error:
+                    logging.error(f"No se pudo apartar el trade {seq}: {write_error}")
+                    break
+            done = seq
+        return done
+
+    def _dead_letter(self, seq, model, fields, error):
+        """Apartar una fila rechazada por la base de datos (JSON por líneas, para revisarla a mano)"""
+        logging.error(f"{model} del diario (seq {seq}) rechazado por la base de datos: {error}; "
+                      f"apartado en {self.dead_letter_path}")
+        record = {'seq': seq, 'model': model, 'trade': fields, 'error': str(error), 'ts': time.time()}
+        with open(self.dead_letter_path, 'a') as f:
+            f.write(json.dumps(record, separators=(',', ':'), default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# Instancia global compartida por todos los motores
+order_journal = OrderJournal()
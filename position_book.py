@@ -0,0 +1,176 @@
+"""
+Libro de posiciones indexado por (exchange, símbolo)
+Cada posición larga deja su stop y su objetivo en dos escaleras ordenadas por
+precio y su vencimiento en un heap. Una cotización nueva solo toca los
+disparos que cruza (bisect sobre la escalera de su par) y los vencimientos se
+miran en la cima del heap, en lugar de recorrer todas las posiciones y pedir
+un ticker por REST para cada una. Las salidas se ejecutan en un hilo propio
+para no frenar al hub que publica las cotizaciones.
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from market_data_hub import market_data_hub
+
+STOP_LOSS = 'STOP_LOSS'
+PROFIT_TARGET = 'PROFIT_TARGET'
+TIME_EXIT = 'TIME_EXIT'
+
+
+class _Ladder:
+    """Precios de disparo ordenados con su posición"""
+
+    __slots__ = ('prices', 'ids')
+
+    def __init__(self):
+        self.prices = []
+        self.ids = []
+
+    def add(self, price, position_id):
+        index = bisect.bisect_right(self.prices, price)
+        self.prices.insert(index, price)
+        self.ids.insert(index, position_id)
+
+    def remove(self, price, position_id):
+        index = bisect.bisect_left(self.prices, price)
+        while index < len(self.prices) and self.prices[index] == price:
+            if self.ids[index] == position_id:
+                del self.prices[index]
+                del self.ids[index]
+                return
+            index += 1
+
+    def pop_at_or_above(self, price):
+        """Disparos con precio >= price (stops cruzados a la baja)"""
+        index = bisect.bisect_left(self.prices, price)
+        crossed = self.ids[index:]
+        del self.prices[index:], self.ids[index:]
+        return crossed
+
+    def pop_at_or_below(self, price):
+        """Disparos con precio <= price (objetivos cruzados al alza)"""
+        index = bisect.bisect_right(self.prices, price)
+        crossed = self.ids[:index]
+        del self.prices[:index], self.ids[:index]
+        return crossed
+
+
+class PositionBook:
+    """Posiciones abiertas con salidas disparadas por cotización o por tiempo"""
+
+    def __init__(self, on_trigger, hub=None, price_field='bid', executor=None):
+        self.on_trigger = on_trigger      # on_trigger(position_id, position, reason, price)
+        self.hub = hub or market_data_hub
+        self.price_field = price_field    # precio al que se cerraría (bid al vender, o last)
+        self.entries = {}                 # id -> (exchange, símbolo, stop, objetivo, vencimiento, posición)
+        self.stops = {}                   # (exchange, símbolo) -> _Ladder
+        self.targets = {}                 # (exchange, símbolo) -> _Ladder
+        self.deadlines = []               # heap [(vencimiento, id)], con borrado perezoso
+        self.last_prices = {}             # (exchange, símbolo) -> último precio visto
+        self.lock = threading.Lock()
+        # Dónde corren las salidas: hilo propio o la cola de un EngineLoop (loop.executor())
+        self.exits = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='position-exit')
+        self.token = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, position_id):
+        return position_id in self.entries
+
+    def add(self, position_id, exchange, symbol, stop_price=None, target_price=None, deadline=None,
+            position=None):
+        """Registrar una posición larga; el hub pasa a refrescar su par"""
+        with self.lock:
+            self._remove(position_id)
+            key = (exchange, symbol)
+            self.entries[position_id] = (exchange, symbol, stop_price, target_price, deadline, position)
+            if stop_price:
+                self.stops.setdefault(key, _Ladder()).add(stop_price, position_id)
+            if target_price:
+                self.targets.setdefault(key, _Ladder()).add(target_price, position_id)
+            if deadline:
+                heapq.heappush(self.deadlines, (deadline, position_id))
+        self.hub.watch(exchange, [symbol])
+
+    def remove(self, position_id):
+        """Quitar una posición cerrada por otra vía; devuelve la posición o None"""
+        with self.lock:
+            entry = self._remove(position_id)
+        return entry[5] if entry else None
+
+    def _remove(self, position_id):
+        entry = self.entries.pop(position_id, None)
+        if entry is None:
+            return None
+        exchange, symbol, stop_price, target_price, _, _ = entry
+        if stop_price:
+            self.stops[(exchange, symbol)].remove(stop_price, position_id)
+        if target_price:
+            self.targets[(exchange, symbol)].remove(target_price, position_id)
+        return entry  # el vencimiento se descarta al salir del heap
+
+    # Disparos
+
+    def check_price(self, exchange, symbol, price):
+        """Sacar del libro las posiciones cuyo stop u objetivo cruza price -> [(id, posición, motivo)]"""
+        key = (exchange, symbol)
+        triggered = []
+        with self.lock:
+            self.last_prices[key] = price
+            for ladder, pop, reason in ((self.stops.get(key), _Ladder.pop_at_or_above, STOP_LOSS),
+                                        (self.targets.get(key), _Ladder.pop_at_or_below, PROFIT_TARGET)):
+                if ladder is None:
+                    continue
+                for position_id in pop(ladder, price):
+                    entry = self._remove(position_id)
+                    if entry is not None:
+                        triggered.append((position_id, entry[5], reason))
+        return triggered
+
+    def check_deadlines(self, now=None):
+        """Sacar del libro las posiciones vencidas -> [(id, posición, precio conocido)]"""
+        now = now or time.time()
+        expired = []
+        with self.lock:
+            while self.deadlines and self.deadlines[0][0] <= now:
+                deadline, position_id = heapq.heappop(self.deadlines)
+                entry = self.entries.get(position_id)
+                if entry is None or entry[4] != deadline:
+                    continue  # cerrada o reprogramada
+                self._remove(position_id)
+                expired.append((position_id, entry[5], self.last_prices.get((entry[0], entry[1]))))
+        return expired
+
+    def on_quote(self, quote):
+        """Callback del hub: disparos del par de esta cotización"""
+        price = quote.get(self.price_field)
+        key = (quote['exchange'], quote['symbol'])
+        if not price or (key not in self.stops and key not in self.targets):
+            return
+        for position_id, position, reason in self.check_price(quote['exchange'], quote['symbol'], price):
+            self.exits.submit(self._fire, position_id, position, reason, price)
+
+    def expire(self, now=None):
+        """Lanzar las salidas por tiempo; llamar desde el bucle del motor"""
+        for position_id, position, price in self.check_deadlines(now):
+            self.exits.submit(self._fire, position_id, position, TIME_EXIT, price)
+
+    def _fire(self, position_id, position, reason, price):
+        try:
+            self.on_trigger(position_id, position, reason, price)
+        except Exception as e:
+            logging.error(f"Error cerrando posición {position_id} ({reason}): {e}")
+
+    def start(self):
+        if self.token is None:
+            self.token = self.hub.subscribe(self.on_quote)
+        self.hub.start()
+
+    def stop(self):
+        if self.token is not None:
+            self.hub.unsubscribe(self.token)
+            self.token = None
@@ -0,0 +1,165 @@
+"""
+Fan-out concurrente de tickers
+Lanza todas las peticiones de un escaneo (exchanges x símbolos) a la vez, con
+límite de concurrencia por exchange y un deadline global. Lo que no llega a
+tiempo se descarta, así el snapshot no mezcla precios de edades muy distintas.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import wait as wait_futures
+from async_exchange import async_exchange_manager
+from async_runtime import run_sync
+
+
+def make_quote(exchange, symbol, ticker, received_at):
+    """Cotización normalizada a partir de un ticker ccxt"""
+    return {
+        'exchange': exchange,
+        'symbol': symbol,
+        'bid': ticker.get('bid'),
+        'ask': ticker.get('ask'),
+        'last': ticker.get('last'),
+        'volume': ticker.get('baseVolume') or 0,
+        'timestamp': ticker.get('timestamp'),  # ms, reloj del exchange
+        'received_at': received_at
+    }
+
+
+class QuoteSnapshot:
+    """Foto consistente de precios de un escaneo"""
+
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.completed_at = None
+        self.quotes = {}
+        self.missing = []
+
+    def add(self, exchange, symbol, ticker, received_at):
+        self.quotes[(exchange, symbol)] = make_quote(exchange, symbol, ticker, received_at)
+
+    def get(self, exchange, symbol):
+        return self.quotes.get((exchange, symbol))
+
+    def by_symbol(self, symbol):
+        """Precios de un símbolo indexados por exchange"""
+        return {
+            exchange: quote
+            for (exchange, quote_symbol), quote in self.quotes.items()
+            if quote_symbol == symbol
+        }
+
+    def age(self):
+        """Segundos entre el inicio del escaneo y la última cotización recibida"""
+        if not self.quotes:
+            return 0.0
+        return max(q['received_at'] for q in self.quotes.values()) - self.started_at
+
+    def __len__(self):
+        return len(self.quotes)
+
+
+class QuoteFanout:
+    """Etapa de obtención de precios concurrente para todos los escáneres"""
+
+    def __init__(self, per_exchange_limit=4, deadline=3.0, max_age=None):
+        self.per_exchange_limit = per_exchange_limit
+        self.deadline = deadline
+        self.max_age = max_age  # segundos; descarta tickers con timestamp del exchange más antiguo
+
+    def _is_fresh(self, ticker, started_at):
+        if self.max_age is None or not ticker.get('timestamp'):
+            return True
+        return ticker['timestamp'] / 1000.0 >= started_at - self.max_age
+
+    async def fetch_async(self, exchanges, symbols, credentials=None, deadline=None):
+        """Obtener todos los tickers concurrentemente dentro del deadline"""
+        credentials = credentials or {}
+        deadline = deadline or self.deadline
+        snapshot = QuoteSnapshot(time.time())
+        semaphores = {exchange: asyncio.Semaphore(self.per_exchange_limit) for exchange in exchanges}
+
+        async def fetch_one(exchange, symbol):
+            async with semaphores[exchange]:
+                ticker = await async_exchange_manager.fetch_ticker(
+                    exchange, symbol, credentials.get(exchange)
+                )
+            return exchange, symbol, ticker, time.time()
+
+        tasks = {
+            asyncio.ensure_future(fetch_one(exchange, symbol)): (exchange, symbol)
+            for exchange in exchanges
+            for symbol in symbols
+        }
+        if not tasks:
+            snapshot.completed_at = time.time()
+            return snapshot
+
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+        for task in pending:
+            task.cancel()
+            snapshot.missing.append(tasks[task])
+
+        for task in done:
+            if task.exception() is not None:
+                snapshot.missing.append(tasks[task])
+                logging.debug(f"Ticker {tasks[task]} falló: {task.exception()}")
+                continue
+
+            exchange, symbol, ticker, received_at = task.result()
+            if ticker and self._is_fresh(ticker, snapshot.started_at):
+                snapshot.add(exchange, symbol, ticker, received_at)
+            else:
+                snapshot.missing.append((exchange, symbol))
+
+        snapshot.completed_at = time.time()
+        return snapshot
+
+    def _fetch_with_node(self, exchanges, symbols, credentials, deadline):
+        """Fallback sin ccxt en Python: peticiones encadenadas al pool Node"""
+        from ccxt_worker_pool import ccxt_worker_pool
+
+        snapshot = QuoteSnapshot(time.time())
+        futures = {}
+        for exchange in exchanges:
+            for symbol in symbols:
+                future = ccxt_worker_pool.submit('fetch_ticker', exchange, symbol,
+                                                 credentials=credentials.get(exchange))
+                future.add_done_callback(lambda f: setattr(f, 'received_at', time.time()))
+                futures[future] = (exchange, symbol)
+
+        done, pending = wait_futures(futures, timeout=deadline)
+        for future in pending:
+            snapshot.missing.append(futures[future])
+
+        for future in done:
+            exchange, symbol = futures[future]
+            ticker = future.result() if future.exception() is None else None
+            if ticker and self._is_fresh(ticker, snapshot.started_at):
+                snapshot.add(exchange, symbol, ticker, getattr(future, 'received_at', time.time()))
+            else:
+                snapshot.missing.append((exchange, symbol))
+
+        snapshot.completed_at = time.time()
+        return snapshot
+
+    def fetch(self, exchanges, symbols, credentials=None, deadline=None):
+        """Versión síncrona: devuelve siempre un QuoteSnapshot (vacío si todo falla)"""
+        deadline = deadline or self.deadline
+        credentials = credentials or {}
+
+        if not async_exchange_manager.is_available():
+            return self._fetch_with_node(exchanges, symbols, credentials, deadline)
+
+        try:
+            return run_sync(self.fetch_async(exchanges, symbols, credentials, deadline), deadline + 1)
+        except Exception as e:
+            logging.error(f"Error en fan-out de tickers: {e}")
+            snapshot = QuoteSnapshot(time.time())
+            snapshot.missing = [(exchange, symbol) for exchange in exchanges for symbol in symbols]
+            return snapshot
+
+
+# Instancia global compartida por los escáneres
+quote_fanout = QuoteFanout()
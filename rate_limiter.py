@@ -0,0 +1,209 @@
+"""
+Limitador de peso por exchange con prioridades
+Lleva el presupuesto de peso de cada exchange (ventana local + cabeceras del
+servidor como X-MBX-USED-WEIGHT-1M) y atiende las peticiones por prioridad:
+órdenes y cancelaciones, luego consultas de posiciones, luego datos de mercado.
+Los datos de mercado no pueden gastar la reserva de las órdenes, y un 429/418
+pausa sólo ese exchange durante el Retry-After en lugar de tumbar el motor.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+PRIORITY_ORDER = 0         # colocar / cancelar órdenes, salidas
+PRIORITY_POSITION = 1      # balances, estado de posiciones
+PRIORITY_MARKET_DATA = 2   # tickers, libros, escaneos
+
+
+class ExchangeRateLimiter:
+    """Presupuesto de peso de un exchange compartido por todos los motores"""
+
+    def __init__(self, name, weight_limit=1200, window=60.0, market_data_share=0.8,
+                 used_header=None, remaining_header=None, ban_backoff=60.0):
+        self.name = name
+        self.weight_limit = weight_limit
+        self.window = window
+        self.market_data_share = market_data_share  # el resto queda reservado a órdenes/posiciones
+        self.used_header = used_header
+        self.remaining_header = remaining_header
+        self.ban_backoff = ban_backoff
+
+        self.spent = deque()  # (timestamp, weight) dentro de la ventana
+        self.spent_weight = 0
+        self.server_used = 0
+        self.server_window = None
+        self.banned_until = 0.0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def _window_id(self, now):
+        return int(now // self.window)
+
+    def _expire(self, now):
+        while self.spent and self.spent[0][0] <= now - self.window:
+            self.spent_weight -= self.spent.popleft()[1]
+
+    def used_weight(self, now=None):
+        """Peso gastado: el mayor entre la cuenta local y la última cabecera del servidor"""
+        now = now or time.time()
+        self._expire(now)
+        server = self.server_used if self.server_window == self._window_id(now) else 0
+        return max(self.spent_weight, server)
+
+    def _cap(self, priority):
+        if priority == PRIORITY_MARKET_DATA:
+            return self.weight_limit * self.market_data_share
+        return self.weight_limit
+
+    def _wait_hint(self, now):
+        """Segundos hasta que pueda liberarse peso (o acabe el baneo)"""
+        if self.banned_until > now:
+            return self.banned_until - now
+        if self.spent:
+            return max(0.01, self.spent[0][0] + self.window - now)
+        return max(0.01, (self._window_id(now) + 1) * self.window - now)
+
+    def _try_take(self, ticket, weight, now):
+        """Consumir peso si el ticket es el primero de la cola y cabe en el presupuesto"""
+        if self.banned_until > now or self.waiters[0] is not ticket:
+            return False
+        if self.used_weight(now) + weight > self._cap(ticket[0]):
+            return False
+
+        heapq.heappop(self.waiters)
+        self.spent.append((now, weight))
+        self.spent_weight += weight
+        self.condition.notify_all()
+        return True
+
+    def _enqueue(self, priority):
+        ticket = [priority, next(self.sequence)]
+        heapq.heappush(self.waiters, ticket)
+        return ticket
+
+    def _abandon(self, ticket):
+        self.waiters.remove(ticket)
+        heapq.heapify(self.waiters)
+        self.condition.notify_all()
+
+    def _hopeless(self, priority, deadline, now):
+        """Baneado más allá del tiempo de espera: fallar ya (datos de mercado, siempre)"""
+        if self.banned_until <= now:
+            return False
+        return priority == PRIORITY_MARKET_DATA or self.banned_until > deadline
+
+    def acquire(self, weight=1, priority=PRIORITY_MARKET_DATA, timeout=10.0):
+        """Esperar turno y presupuesto; devuelve False si no llega a tiempo"""
+        deadline = time.time() + timeout
+        with self.condition:
+            if self._hopeless(priority, deadline, time.time()):
+                return False
+            ticket = self._enqueue(priority)
+            while True:
+                now = time.time()
+                if self._try_take(ticket, weight, now):
+                    return True
+                if now >= deadline or self._hopeless(priority, deadline, now):
+                    self._abandon(ticket)
+                    return False
+                self.condition.wait(min(deadline - now, self._wait_hint(now), 0.25))
+
+    async def acquire_async(self, weight=1, priority=PRIORITY_MARKET_DATA, timeout=10.0):
+        """Igual que acquire() sin bloquear el loop compartido"""
+        deadline = time.time() + timeout
+        with self.condition:
+            if self._hopeless(priority, deadline, time.time()):
+                return False
+            ticket = self._enqueue(priority)
+
+        try:
+            while True:
+                with self.condition:
+                    now = time.time()
+                    if self._try_take(ticket, weight, now):
+                        ticket = None
+                        return True
+                    if now >= deadline or self._hopeless(priority, deadline, now):
+                        return False
+                    delay = min(deadline - now, self._wait_hint(now), 0.05)
+                await asyncio.sleep(delay)
+        finally:
+            if ticket is not None:
+                with self.condition:
+                    self._abandon(ticket)
+
+    def update_from_headers(self, headers):
+        """Sincronizar el peso gastado con lo que informa el servidor"""
+        if not headers:
+            return
+        now = time.time()
+        with self.condition:
+            try:
+                if self.used_header and headers.get(self.used_header) is not None:
+                    self.server_used = int(headers[self.used_header])
+                elif self.remaining_header and headers.get(self.remaining_header) is not None:
+                    self.server_used = self.weight_limit - int(headers[self.remaining_header])
+                else:
+                    return
+            except (TypeError, ValueError):
+                return
+            self.server_window = self._window_id(now)
+
+    def on_rate_limited(self, status, retry_after=None):
+        """429 (límite superado) o 418 (IP baneada): pausar el exchange"""
+        try:
+            pause = float(retry_after) if retry_after is not None else self.ban_backoff
+        except (TypeError, ValueError):
+            pause = self.ban_backoff
+
+        with self.condition:
+            self.banned_until = max(self.banned_until, time.time() + pause)
+            self.server_used = self.weight_limit
+            self.server_window = self._window_id(time.time())
+            self.condition.notify_all()
+
+        level = logging.ERROR if status == 418 else logging.WARNING
+        logging.log(level, f"{self.name}: HTTP {status}, peticiones pausadas {pause:.0f}s")
+
+    def is_banned(self):
+        return self.banned_until > time.time()
+
+    def status(self):
+        with self.condition:
+            return {
+                'exchange': self.name,
+                'used_weight': self.used_weight(),
+                'weight_limit': self.weight_limit,
+                'queued': len(self.waiters),
+                'banned_for': max(0.0, self.banned_until - time.time())
+            }
+
+
+# Límites publicados por cada exchange (peso por ventana)
+LIMITER_CONFIG = {
+    'binance': {'weight_limit': 6000, 'window': 60.0, 'used_header': 'X-MBX-USED-WEIGHT-1M'},
+    'kucoin': {'weight_limit': 2000, 'window': 30.0, 'remaining_header': 'gw-ratelimit-remaining'},
+}
+DEFAULT_CONFIG = {'weight_limit': 600, 'window': 60.0}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(exchange):
+    """Limitador compartido por exchange (todas las instancias y motores del proceso)"""
+    with _limiters_lock:
+        if exchange not in _limiters:
+            _limiters[exchange] = ExchangeRateLimiter(exchange, **LIMITER_CONFIG.get(exchange, DEFAULT_CONFIG))
+        return _limiters[exchange]
+
+
+def rate_limit_status():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.status() for limiter in limiters]
@@ -4,25 +4,45 @@ Solo se activa cuando el usuario configura sus API keys
 """
 import json
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
-from models import Trade, Alert, Configuration, Balance
-from app import db
-import time
-import threading
+from models import Configuration
+from market_data_hub import market_data_hub
+from symbol_metadata import symbol_metadata
+from exchange_adapters import CCXTAdapter
+from arbitrage_matrix import ArbitrageMatrix
+from opportunity_tracker import opportunity_tracker
+from leg_executor import EXPOSED, FILLED, HEDGED, REJECTED
+from engine_core import Strategy, Venue, Persistence, engine_core
+from balance_ledger import balance_ledger
+from engine_loop import PRIORITY_CONTROL
 
-class RealTradingEngine:
+class RealTradingEngine(Strategy):
     """Motor de trading que opera con dinero real usando APIs configuradas"""
     
+    name = 'real_trading_engine'
+    scan_interval = 2.0  # por si no llegan cotizaciones
+    
     def __init__(self):
         self.is_running = False
         self.exchanges = {}
+        self.credentials = {}
         self.min_spread = 0.5  # Mínimo spread para arbitraje
         self.max_trade_amount = 15.0
         self.min_trade_amount = 5.0
         self.stop_loss_percentage = 2.0
         self.max_positions = 3
+        self.exit_retry = 5.0  # segundos hasta reintentar una venta fallida; se dobla en cada intento
+        self.max_exit_attempts = 5
         self.active_positions = []
+        self.executed = {}  # (símbolo, compra, venta) -> opened_at de la oportunidad ya ejecutada
+        self.executing = set()  # oportunidades con patas en curso; ocupan hueco de max_positions
+        self.executing_lock = threading.Lock()
+        self.symbols = ['BTC/USDT', 'ETH/USDT', 'BNB/USDT', 'ADA/USDT', 'XRP/USDT']
+        self.venue = Venue(self.name, self.exchanges)
+        self.persistence = Persistence(self.name)
         self.last_scan = None
         
     def load_configuration(self):
@@ -47,19 +67,16 @@ class RealTradingEngine:
     def load_exchange_clients(self):
         """Cargar y configurar clientes de exchanges desde base de datos"""
         try:
-            import ccxt
-            
             # Cargar configuración de Binance
             binance_config = Configuration.query.filter_by(key='binance_config').first()
             if binance_config:
                 config_data = json.loads(binance_config.value)
                 if config_data.get('enabled'):
-                    self.exchanges['binance'] = ccxt.binance({
+                    self.credentials['binance'] = {
                         'apiKey': config_data['api_key'],
                         'secret': config_data['api_secret'],
-                        'sandbox': False,
-                        'enableRateLimit': True,
-                    })
+                    }
+                    self.exchanges['binance'] = CCXTAdapter('binance', self.credentials['binance'])
                     logging.info("Cliente Binance configurado")
             
             # Cargar configuración de KuCoin
@@ -67,13 +84,12 @@ class RealTradingEngine:
             if kucoin_config:
                 config_data = json.loads(kucoin_config.value)
                 if config_data.get('enabled'):
-                    self.exchanges['kucoin'] = ccxt.kucoin({
+                    self.credentials['kucoin'] = {
                         'apiKey': config_data['api_key'],
                         'secret': config_data['api_secret'],
                         'password': config_data['passphrase'],
-                        'sandbox': False,
-                        'enableRateLimit': True,
-                    })
+                    }
+                    self.exchanges['kucoin'] = CCXTAdapter('kucoin', self.credentials['kucoin'])
                     logging.info("Cliente KuCoin configurado")
             
             if not self.exchanges:
@@ -108,9 +124,8 @@ class RealTradingEngine:
         self.load_configuration()
         self.is_running = True
         
-        # Iniciar en hilo separado
-        trading_thread = threading.Thread(target=self.trading_loop, daemon=True)
-        trading_thread.start()
+        # En el núcleo compartido: recupera el estado y arranca sus tareas al registrarse
+        engine_core.register(self)
         
         # Crear alerta de inicio
         self.create_alert(
@@ -122,9 +137,28 @@ class RealTradingEngine:
         logging.info(f"Motor de trading real iniciado con exchanges: {list(self.exchanges.keys())}")
         return {'success': True, 'message': 'Motor de trading real iniciado exitosamente'}
     
+    def recover_state(self):
+        """Reconstruir posiciones y órdenes en vuelo desde el diario tras un reinicio"""
+        positions = self.persistence.recover()
+        for key, position in positions.items():
+            position['id'] = key
+            position['opened_at'] = datetime.fromisoformat(position['opened_at'])
+        self.active_positions = list(positions.values())
+        for position in self.active_positions:
+            self.track_position(position)
+        
+        # Patas del executor y ventas de este motor que no dejaron resultado
+        for order in self.venue.reconcile('leg_executor', self.name):
+            self.create_alert(
+                'Orden sin Resultado',
+                f"{order['side']} {order['symbol']} en {order['exchange']} quedó sin resultado antes del reinicio",
+                'WARNING'
+            )
+    
     def stop(self):
         """Detener motor de trading"""
         self.is_running = False
+        engine_core.unregister(self)
         self.create_alert(
             'Trading Detenido',
             'Motor de trading real detenido por usuario',
@@ -132,65 +166,57 @@ class RealTradingEngine:
         )
         logging.info("Motor de trading real detenido")
     
-    def trading_loop(self):
-        """Loop principal de trading"""
-        while self.is_running:
-            try:
-                # Verificar que sigue en modo real
-                if not self.is_trading_mode_real():
-                    self.stop()
+    def markets(self):
+        return {exchange: self.symbols for exchange in self.exchanges}
+    
+    def setup(self, core):
+        """Tareas del motor en el núcleo: control primero, salidas y cotizaciones después"""
+        self.recover_state()
+        core.every(self, 2.0, self.check_trading_mode, PRIORITY_CONTROL)
+        core.every(self, 2.0, self.update_balances, blocking=True)  # REST: en el pool de E/S del núcleo
+    
+    def on_error(self, error):
+        logging.error(f"Error en trading loop: {error}")
+    
+    def check_trading_mode(self):
+        """Verificar que sigue en modo real"""
+        if not self.is_trading_mode_real():
+            self.stop()
+    
+    def scan(self):
+        self.scan_and_execute()
+    
+    def scan_and_execute(self):
+        """Buscar oportunidades y ejecutar las que superan el spread mínimo"""
+        for opportunity in self.scan_arbitrage_opportunities():
+            if opportunity['profit_percentage'] < self.min_spread:
+                continue
+            
+            # El escaneo corre con cada cotización: una sola ejecución por oportunidad viva
+            key = (opportunity['symbol'], opportunity['buy_exchange'], opportunity['sell_exchange'])
+            with self.executing_lock:
+                if len(self.active_positions) + len(self.executing) >= self.max_positions:
                     break
-                
-                # Actualizar balances
-                self.update_balances()
-                
-                # Buscar oportunidades de arbitraje
-                opportunities = self.scan_arbitrage_opportunities()
-                
-                # Ejecutar trades si hay oportunidades
-                for opportunity in opportunities:
-                    if len(self.active_positions) >= self.max_positions:
-                        break
-                    
-                    if opportunity['profit_percentage'] >= self.min_spread:
-                        self.execute_arbitrage_trade(opportunity)
-                
-                # Gestionar posiciones abiertas
-                self.manage_open_positions()
-                
-                # Esperar antes del siguiente ciclo
-                time.sleep(2)  # Escanear cada 2 segundos
-                
-            except Exception as e:
-                logging.error(f"Error en trading loop: {e}")
-                time.sleep(5)  # Esperar más tiempo si hay error
+                if key in self.executing or self.executed.get(key) == opportunity['opened_at']:
+                    continue
+                self.executed[key] = opportunity['opened_at']
+                self.executing.add(key)
+            
+            if not self.execute_arbitrage_trade(opportunity):
+                with self.executing_lock:
+                    self.executing.discard(key)
     
     def scan_arbitrage_opportunities(self):
         """Buscar oportunidades de arbitraje entre exchanges"""
         opportunities = []
-        symbols = ['BTC/USDT', 'ETH/USDT', 'BNB/USDT', 'ADA/USDT', 'XRP/USDT']
+        symbols = self.symbols
         
         try:
-            for symbol in symbols:
-                prices = {}
-                
-                # Obtener precios de todos los exchanges
-                for exchange_name, client in self.exchanges.items():
-                    try:
-                        ticker = client.get_symbol_ticker(symbol)
-                        if ticker.get('success'):
-                            prices[exchange_name] = {
-                                'bid': float(ticker['price']) * 0.999,  # Simular bid
-                                'ask': float(ticker['price']) * 1.001   # Simular ask
-                            }
-                    except Exception as e:
-                        logging.warning(f"Error obteniendo precio de {symbol} en {exchange_name}: {e}")
-                
-                # Encontrar oportunidades de arbitraje
-                if len(prices) >= 2:
-                    opportunity = self.find_best_arbitrage(symbol, prices)
-                    if opportunity:
-                        opportunities.append(opportunity)
+            # Cada cotización se evalúa al llegar al hub; el escaneo lee las oportunidades vivas
+            exchanges = list(self.exchanges)
+            opportunity_tracker.track(exchanges, symbols, credentials=self.credentials)
+            best = opportunity_tracker.best_per_symbol(self.min_spread / 100, exchanges=exchanges, symbols=symbols)
+            opportunities = [self._to_opportunity(best[symbol]) for symbol in symbols if symbol in best]
             
             self.last_scan = datetime.now()
             return opportunities
@@ -201,196 +227,259 @@ class RealTradingEngine:
     
     def find_best_arbitrage(self, symbol, prices):
         """Encontrar la mejor oportunidad de arbitraje para un símbolo"""
-        best_opportunity = None
-        max_profit = 0
-        
-        exchanges = list(prices.keys())
-        
-        for i in range(len(exchanges)):
-            for j in range(len(exchanges)):
-                if i != j:
-                    buy_exchange = exchanges[i]
-                    sell_exchange = exchanges[j]
-                    
-                    buy_price = prices[buy_exchange]['ask']
-                    sell_price = prices[sell_exchange]['bid']
-                    
-                    if sell_price > buy_price:
-                        profit_percentage = ((sell_price - buy_price) / buy_price) * 100
-                        
-                        if profit_percentage > max_profit and profit_percentage >= self.min_spread:
-                            max_profit = profit_percentage
-                            best_opportunity = {
-                                'symbol': symbol,
-                                'buy_exchange': buy_exchange,
-                                'sell_exchange': sell_exchange,
-                                'buy_price': buy_price,
-                                'sell_price': sell_price,
-                                'profit_percentage': profit_percentage,
-                                'estimated_profit': (sell_price - buy_price) * (self.min_trade_amount / buy_price)
-                            }
-        
-        return best_opportunity
+        best = ArbitrageMatrix.from_prices(symbol, prices, notional=self.min_trade_amount).best(
+            min_spread=self.min_spread / 100
+        )
+        return self._to_opportunity(best) if best else None
+    
+    def _to_opportunity(self, candidate):
+        """Oportunidad de la matriz con los campos que usa execute_arbitrage_trade"""
+        return dict(
+            candidate,
+            profit_percentage=candidate['net_spread_percentage'],
+            estimated_profit=self.min_trade_amount * candidate['net_spread_percentage'] / 100
+        )
     
     def execute_arbitrage_trade(self, opportunity):
-        """Ejecutar trade de arbitraje"""
+        """Ejecutar trade de arbitraje: compra y venta simultáneas contra el inventario de cada exchange
+
+        Las patas corren en el pool de E/S del núcleo y el resultado vuelve al
+        bucle en on_execution; devuelve si se lanzaron.
+        """
         try:
-            symbol = opportunity['symbol']
-            buy_exchange = opportunity['buy_exchange']
-            sell_exchange = opportunity['sell_exchange']
             trade_amount = min(self.max_trade_amount, max(self.min_trade_amount, 
                              opportunity['estimated_profit'] * 10))
             
-            # Verificar balances suficientes
-            if not self.has_sufficient_balance(buy_exchange, 'USDT', trade_amount):
-                logging.warning(f"Balance insuficiente en {buy_exchange} para trade de {trade_amount} USDT")
-                return False
-            
-            # Ejecutar compra
-            buy_client = self.exchanges[buy_exchange]
-            buy_result = buy_client.order_market_buy(symbol, trade_amount)
-            
-            if not buy_result.get('success'):
-                logging.error(f"Error en compra: {buy_result.get('error', 'Error desconocido')}")
-                return False
-            
-            quantity = buy_result['quantity']
-            
-            # Registrar trade de compra
-            buy_trade = Trade(
-                symbol=symbol,
-                side='BUY',
-                quantity=quantity,
-                price=opportunity['buy_price'],
-                total_value=trade_amount,
-                exchange=buy_exchange,
-                order_id=buy_result['order_id'],
-                status='COMPLETED'
+            # Las dos patas a la vez; el executor verifica inventario y concilia fills parciales
+            return self.core.submit(
+                self, self.venue.execute_pair,
+                opportunity['buy_exchange'], opportunity['sell_exchange'], opportunity['symbol'],
+                trade_amount / opportunity['buy_price'], opportunity['buy_price'],
+                on_late=lambda execution, orders: self.core.call_soon(self, self.on_late_fill, execution, orders),
+                then=lambda execution: self.on_execution(opportunity, execution)
             )
-            db.session.add(buy_trade)
             
-            # Agregar a posiciones activas
-            position = {
-                'symbol': symbol,
-                'quantity': quantity,
-                'buy_price': opportunity['buy_price'],
-                'sell_exchange': sell_exchange,
-                'target_price': opportunity['sell_price'],
-                'stop_loss': opportunity['buy_price'] * (1 - self.stop_loss_percentage / 100),
-                'buy_trade_id': buy_trade.id,
-                'opened_at': datetime.now()
-            }
-            self.active_positions.append(position)
+        except Exception as e:
+            logging.error(f"Error ejecutando trade: {e}")
+            return False
+    
+    def on_execution(self, opportunity, execution):
+        """Resultado del arbitraje, de vuelta en el bucle: liberar el hueco y registrar las órdenes"""
+        symbol = opportunity['symbol']
+        buy_exchange = opportunity['buy_exchange']
+        sell_exchange = opportunity['sell_exchange']
+        with self.executing_lock:
+            self.executing.discard((symbol, buy_exchange, sell_exchange))
+        if execution is None:
+            return False
+        
+        try:
+            if execution.status == REJECTED:
+                logging.warning(f"Arbitraje {symbol} descartado: {execution.error}")
+                return False
             
-            db.session.commit()
+            # Registrar cada orden ejecutada (patas, coberturas y unwinds)
+            self.record_orders(execution, execution.orders)
+            self.open_exposure(execution)
             
             # Crear alerta de trade ejecutado
+            alert_type = 'SUCCESS' if execution.status in (FILLED, HEDGED) else 'WARNING'
             self.create_alert(
-                'Trade Ejecutado',
-                f'Arbitraje {symbol}: Compra en {buy_exchange} a ${opportunity["buy_price"]:.4f}',
-                'SUCCESS'
+                f'Arbitraje {execution.status}',
+                f'{symbol}: {buy_exchange} -> {sell_exchange}, '
+                f'Profit ${execution.profit:.4f} en {execution.to_dict()["duration"]:.2f}s',
+                alert_type
             )
             
-            logging.info(f"Trade ejecutado: {symbol} comprado en {buy_exchange}")
-            return True
+            logging.info(f"Arbitraje ejecutado: {execution.to_dict()}")
+            return execution.status in (FILLED, HEDGED)
             
         except Exception as e:
-            logging.error(f"Error ejecutando trade: {e}")
-            db.session.rollback()
+            logging.error(f"Error registrando arbitraje: {e}")
             return False
     
-    def manage_open_positions(self):
-        """Gestionar posiciones abiertas"""
-        for position in self.active_positions[:]:  # Copiar lista para poder modificar
-            try:
-                symbol = position['symbol']
-                sell_exchange = position['sell_exchange']
-                
-                # Obtener precio actual
-                sell_client = self.exchanges[sell_exchange]
-                ticker = sell_client.get_symbol_ticker(symbol)
-                
-                if ticker.get('success'):
-                    current_price = float(ticker['price'])
-                    
-                    # Verificar stop loss
-                    if current_price <= position['stop_loss']:
-                        self.close_position(position, current_price, 'STOP_LOSS')
-                        continue
-                    
-                    # Verificar si es rentable vender
-                    if current_price >= position['target_price']:
-                        self.close_position(position, current_price, 'PROFIT')
-                        continue
-                    
-                    # Verificar timeout (cerrar después de 5 minutos)
-                    if datetime.now() - position['opened_at'] > timedelta(minutes=5):
-                        self.close_position(position, current_price, 'TIMEOUT')
-                        continue
-                        
-            except Exception as e:
-                logging.error(f"Error gestionando posición: {e}")
+    def record_orders(self, execution, orders):
+        """Trades de las órdenes de un arbitraje (la venta lleva el resultado de la operación)"""
+        for order in orders:
+            self.persistence.record_trade(
+                symbol=execution.symbol,
+                side=order.side,
+                quantity=order.filled_qty,
+                price=order.avg_price,
+                total_value=order.cost,
+                fee=order.fee,
+                profit_loss=execution.profit if order is execution.sell else 0.0,
+                exchange=order.exchange,
+                order_id=order.order_id,
+                strategy='arbitrage',
+                status='COMPLETED'
+            )
+    
+    def on_late_fill(self, execution, orders):
+        """Una pata colgada respondió tras leg_timeout: registrar sus órdenes y el estado final"""
+        self.record_orders(execution, orders)
+        self.open_exposure(execution)
+        self.create_alert(
+            f'Fill Tardío - {execution.status}',
+            f'{execution.symbol}: {execution.buy_exchange} -> {execution.sell_exchange}, '
+            f'{len(orders)} órdenes conciliadas tarde, residual {execution.residual}',
+            'SUCCESS' if execution.status in (FILLED, HEDGED) else 'WARNING'
+        )
+    
+    def open_exposure(self, execution):
+        """Base sobrante que no se pudo cubrir ni deshacer: abrirla como posición con stop y objetivo
+
+        Mientras quede una orden por responder (execution.late) el estado final
+        llega por on_late_fill y es entonces cuando se decide.
+        """
+        if execution.status != EXPOSED or execution.late or not execution.residual:
+            return
+        if execution.residual < 0:
+            # Se vendió más de lo comprado: no se cierra vendiendo, hay que reponer a mano
+            self.create_alert(
+                'Exposición sin Cubrir',
+                f'{execution.symbol}: {-execution.residual} vendidos de más en {execution.sell_exchange}, '
+                f'reponer inventario manualmente',
+                'ERROR'
+            )
+            return
+        
+        buy_price = execution.buy.avg_price
+        position = {
+            'id': f"{execution.symbol}:{execution.buy_exchange}:{execution.sell_exchange}:{execution.started_at:.3f}",
+            'symbol': execution.symbol,
+            'quantity': execution.residual,
+            'buy_price': buy_price,
+            'sell_exchange': execution.sell_exchange,
+            'target_price': buy_price * (1 + self.min_spread / 100),
+            'stop_loss': buy_price * (1 - self.stop_loss_percentage / 100),
+            'opened_at': datetime.now()
+        }
+        self.active_positions.append(position)
+        self.persistence.open_position(position['id'], dict(position, opened_at=position['opened_at'].isoformat()))
+        self.track_position(position)
+        self.create_alert(
+            'Exposición Abierta como Posición',
+            f"{execution.symbol}: {position['quantity']} a ${buy_price:.4f} en vigilancia "
+            f"(stop ${position['stop_loss']:.4f}, objetivo ${position['target_price']:.4f})",
+            'WARNING'
+        )
+    
+    def track_position(self, position):
+        """Registrar stop, objetivo y timeout de la posición en el núcleo"""
+        self.core.track(
+            self, position['id'], position['sell_exchange'], position['symbol'],
+            stop_price=position['stop_loss'],
+            target_price=position['target_price'],
+            deadline=(position['opened_at'] + timedelta(minutes=5)).timestamp(),  # cerrar después de 5 minutos
+            position=position
+        )
+    
+    def on_exit(self, position_id, position, reason, price):
+        """Disparo del libro de posiciones: vender al bid del exchange de venta en el pool de E/S"""
+        if price is None:
+            quote = market_data_hub.get_quote(position['sell_exchange'], position['symbol'])
+            price = float(quote['bid']) if quote and quote['bid'] else None
+        if price is None:
+            self.retry_exit(position, 'sin cotización')
+            return
+        quantity = symbol_metadata.prepare_order(position['sell_exchange'], position['symbol'], position['quantity'], price)
+        if quantity is None:
+            self.drop_dust(position)
+            return
+        # Con la venta anterior aún en curso no se envía otra: su resultado decide
+        self.core.submit(
+            self, self.venue.sell, position['sell_exchange'], position['symbol'], quantity,
+            key=('sell', position_id),
+            then=lambda sell_result: self.close_position(position, price, reason, sell_result)
+        )
+    
+    def retry_exit(self, position, error):
+        """Venta fallida: reintentar con espera creciente y, tras max_exit_attempts, dejarla para revisión
+
+        Mientras espera el reintento no se vigilan stop ni objetivo; solo el plazo.
+        """
+        attempts = position['exit_attempts'] = position.get('exit_attempts', 0) + 1
+        if attempts >= self.max_exit_attempts:
+            self.create_alert(
+                'Salida Abandonada',
+                f"{position['symbol']} en {position['sell_exchange']}: {attempts} ventas fallidas ({error}); "
+                f"la posición sigue abierta para revisión manual",
+                'ERROR'
+            )
+            return
+        self.core.track(
+            self, position['id'], position['sell_exchange'], position['symbol'],
+            deadline=time.time() + self.exit_retry * 2 ** (attempts - 1),
+            position=position
+        )
+    
+    def drop_dust(self, position):
+        """Resto por debajo de los mínimos del exchange: no se puede vender, se cierra con alerta"""
+        self.create_alert(
+            'Posición Invendible',
+            f"{position['symbol']}: {position['quantity']} por debajo de los mínimos de "
+            f"{position['sell_exchange']}, se deja como saldo",
+            'WARNING'
+        )
+        if position in self.active_positions:
+            self.active_positions.remove(position)
+        self.persistence.close_position(position['id'], 'dust')
     
-    def close_position(self, position, current_price, reason):
-        """Cerrar una posición vendiendo"""
+    def close_position(self, position, current_price, reason, sell_result):
+        """Resultado de la venta, de vuelta en el bucle: registrar y cerrar la posición"""
         try:
             symbol = position['symbol']
-            quantity = position['quantity']
             sell_exchange = position['sell_exchange']
             
-            sell_client = self.exchanges[sell_exchange]
-            sell_result = sell_client.order_market_sell(symbol, quantity)
+            if sell_result is None or not sell_result.success:
+                error = sell_result and sell_result.error or 'Error desconocido'
+                logging.error(f"Error en venta: {error}")
+                self.retry_exit(position, error)
+                return
+            
+            quantity = sell_result.filled_qty
+            total_received = sell_result.cost
+            original_cost = quantity * position['buy_price']
+            profit = total_received - original_cost
+            profit_percentage = (profit / original_cost) * 100
+            
+            # Registrar trade de venta
+            self.persistence.record_trade(
+                symbol=symbol,
+                side='SELL',
+                quantity=quantity,
+                price=sell_result.avg_price or current_price,
+                total_value=total_received,
+                fee=sell_result.fee,
+                profit_loss=profit,
+                exchange=sell_exchange,
+                order_id=sell_result.order_id,
+                strategy='arbitrage',
+                status='COMPLETED'
+            )
+            
+            # Remover de posiciones activas
+            self.active_positions.remove(position)
+            self.persistence.close_position(position['id'], reason, profit)
+            
+            # Crear alerta
+            alert_type = 'SUCCESS' if profit > 0 else 'WARNING'
+            self.create_alert(
+                f'Posición Cerrada - {reason}',
+                f'{symbol}: Profit ${profit:.2f} ({profit_percentage:.2f}%)',
+                alert_type
+            )
+            
+            logging.info(f"Posición cerrada: {symbol}, Profit: ${profit:.2f}")
             
-            if sell_result.get('success'):
-                total_received = sell_result['total_value']
-                original_cost = position['quantity'] * position['buy_price']
-                profit = total_received - original_cost
-                profit_percentage = (profit / original_cost) * 100
-                
-                # Registrar trade de venta
-                sell_trade = Trade(
-                    symbol=symbol,
-                    side='SELL',
-                    quantity=quantity,
-                    price=current_price,
-                    total_value=total_received,
-                    exchange=sell_exchange,
-                    order_id=sell_result['order_id'],
-                    status='COMPLETED'
-                )
-                db.session.add(sell_trade)
-                db.session.commit()
-                
-                # Remover de posiciones activas
-                self.active_positions.remove(position)
-                
-                # Crear alerta
-                alert_type = 'SUCCESS' if profit > 0 else 'WARNING'
-                self.create_alert(
-                    f'Posición Cerrada - {reason}',
-                    f'{symbol}: Profit ${profit:.2f} ({profit_percentage:.2f}%)',
-                    alert_type
-                )
-                
-                logging.info(f"Posición cerrada: {symbol}, Profit: ${profit:.2f}")
-                
         except Exception as e:
             logging.error(f"Error cerrando posición: {e}")
     
     def has_sufficient_balance(self, exchange, asset, amount):
         """Verificar si hay balance suficiente en un exchange"""
         try:
-            client = self.exchanges[exchange]
-            account = client.get_account()
-            
-            if account.get('success'):
-                balances = account.get('balances', [])
-                for balance in balances:
-                    if balance.get('asset') == asset:
-                        free_balance = float(balance.get('free', 0))
-                        return free_balance >= amount
-            
-            return False
+            return self.exchanges[exchange].get_free_balance(asset) >= amount
             
         except Exception as e:
             logging.error(f"Error verificando balance: {e}")
@@ -399,40 +488,11 @@ class RealTradingEngine:
     def update_balances(self):
         """Actualizar balances de todos los exchanges"""
         try:
-            for exchange_name, client in self.exchanges.items():
-                account = client.get_account()
-                if account.get('success'):
-                    balances = account.get('balances', [])
-                    
-                    for balance_data in balances:
-                        asset = balance_data.get('asset')
-                        free = float(balance_data.get('free', 0))
-                        locked = float(balance_data.get('locked', 0))
-                        
-                        if free > 0 or locked > 0:  # Solo guardar balances no cero
-                            balance = Balance.query.filter_by(
-                                exchange=exchange_name,
-                                asset=asset
-                            ).first()
-                            
-                            if balance:
-                                balance.free_balance = free
-                                balance.locked_balance = locked
-                                balance.total_balance = free + locked
-                                balance.usd_value = free + locked
-                                balance.updated_at = datetime.now()
-                            else:
-                                balance = Balance(
-                                    exchange=exchange_name,
-                                    asset=asset,
-                                    free_balance=free,
-                                    locked_balance=locked,
-                                    total_balance=free + locked,
-                                    usd_value=free + locked
-                                )
-                                db.session.add(balance)
-            
-            db.session.commit()
+            for exchange_name, adapter in self.exchanges.items():
+                balances = adapter.get_balances()
+                if balances:
+                    # Libro en memoria valorado con una foto de precios; solo se escriben las filas que cambian
+                    balance_ledger.apply_snapshot(exchange_name, balances)
             
         except Exception as e:
             logging.error(f"Error actualizando balances: {e}")
@@ -440,13 +500,7 @@ class RealTradingEngine:
     def create_alert(self, title, message, alert_type):
         """Crear alerta en base de datos"""
         try:
-            alert = Alert(
-                title=title,
-                message=message,
-                alert_type=alert_type
-            )
-            db.session.add(alert)
-            db.session.commit()
+            self.persistence.alert(title, message, alert_type)
         except Exception as e:
             logging.error(f"Error creando alerta: {e}")
     
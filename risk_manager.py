@@ -108,6 +108,16 @@ class RiskManager:
             logging.error(f"Error calculating position size: {e}")
             return 5.0  # Default minimum
 
+    def size_for_depth(self, amount, depth_book, side='BUY', max_slippage_bps=20):
+        """Cap a quote amount to what the book absorbs within max_slippage_bps"""
+        if depth_book is None:
+            return amount
+        
+        capacity = depth_book.max_quote_within_slippage(max_slippage_bps, side)
+        if capacity < amount:
+            logging.info(f"Trade size capped by book depth: ${amount:.2f} -> ${capacity:.2f}")
+        return min(amount, capacity)
+
     def check_stop_loss(self, entry_price, current_price, side):
         """Check if stop loss should be triggered"""
         try:
@@ -1,10 +1,11 @@
 from flask import render_template, request, jsonify, redirect, url_for, flash
 from app import app, db
-from models import Trade, Balance, DailyStats, ArbitrageOpportunity, Alert, TradingConfig, User, Subscription, ReferralCode, Configuration
+from models import Trade, DailyStats, ArbitrageOpportunity, Alert, TradingConfig, User, Subscription, ReferralCode, Configuration
 from datetime import datetime, timedelta
 from admin_manager import admin_manager, setup_initial_admin, is_user_admin
 from performance_optimizer import performance_optimizer, start_performance_optimization
 from notification_system import notification_system, send_notification
+from balance_ledger import balance_ledger
 # from advanced_monitoring import advanced_monitor, start_advanced_monitoring, get_system_health, get_live_metrics
 from flask_login import current_user
 import logging
@@ -15,7 +16,7 @@ def index():
     """Main dashboard page"""
     try:
         # Get current balance
-        balances = Balance.query.all()
+        balances = balance_ledger.snapshot()
         total_balance = sum(b.usd_value for b in balances)
         
         # Get today's stats
@@ -103,7 +104,7 @@ def dashboard():
         total_fees = sum(t.fee for t in all_trades)
         
         # Get balances
-        balances = Balance.query.all()
+        balances = balance_ledger.snapshot()
         total_balance = sum(b.usd_value for b in balances)
         
         # Convert DailyStats to serializable format
@@ -212,7 +213,7 @@ def update_settings():
 def api_balance():
     """API endpoint for current balance"""
     try:
-        balances = Balance.query.all()
+        balances = balance_ledger.snapshot()
         balance_data = []
         total_usd = 0
         
@@ -0,0 +1,303 @@
+"""
+Reparto de usuarios entre procesos
+El motor multiusuario evalúa todas las cotizaciones en el hilo del núcleo,
+dentro del proceso de Flask: el GIL limita la evaluación a un núcleo de CPU
+que además comparte con la web. El supervisor reparte los usuarios entre
+procesos worker (por hash estable del user_id) y a cada uno le reenvía por un
+socket local (multiprocessing.Pipe) las cotizaciones de sus símbolos en lotes.
+Cada worker tiene su propio tracker de oportunidades y evalúa solo a sus
+usuarios; devuelve las órdenes al supervisor, que es el único dueño de las
+cuentas de exchange, del diario y de la base de datos: junta las órdenes de
+todos los workers por cuenta, las ejecuta y devuelve a cada worker el saldo
+resultante de sus usuarios. También es el único que descarga los metadatos de
+símbolos (y escribe su caché): los workers los reciben ya cargados. Los
+workers informan además de su salud y se reinician si dejan de hacerlo.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from cost_model import EXCHANGE_ALIASES
+from symbol_metadata import symbol_metadata
+from tenant_engine import TenantEngine
+
+# Mensajes supervisor -> worker
+RULES = 'rules'      # metadatos de símbolos (symbol_metadata.export) de los exchanges del shard
+TENANTS = 'tenants'  # [Tenant.to_dict()] del shard
+QUOTES = 'quotes'    # [cotización]
+FILLS = 'fills'      # [(user_id, importe, saldo, trades de hoy)]
+STOP = 'stop'
+# Mensajes worker -> supervisor
+ORDERS = 'orders'    # [((símbolo, compra, venta), [(user_id, importe, oportunidad)])]
+HEALTH = 'health'    # {pid, usuarios, cotizaciones, evaluaciones, órdenes, lag}
+
+HEALTH_INTERVAL = 1.0
+HEALTH_TIMEOUT = 30.0  # sin latido durante este tiempo: reiniciar el worker
+
+
+def _worker_main(shard, connection):
+    """Bucle de un worker: cotizaciones -> tracker local -> órdenes de sus usuarios"""
+    from market_data_hub import MarketDataHub
+    from opportunity_tracker import OpportunityTracker
+    from cost_model import cost_model
+
+    class RelayHub(MarketDataHub):
+        """Hub alimentado por el supervisor: no pide nada a los exchanges"""
+
+        def start(self):
+            pass
+
+    hub = RelayHub()
+    cost_model.hub = hub  # volatilidades con las cotizaciones reenviadas
+    engine = TenantEngine(tracker=OpportunityTracker(hub=hub))
+    stats = {'pid': os.getpid(), 'quotes': 0, 'evaluations': 0, 'orders': 0, 'lag': 0.0}
+    last_health = 0.0
+
+    while True:
+        now = time.time()
+        if now - last_health >= HEALTH_INTERVAL:
+            connection.send((HEALTH, dict(stats, tenants=len(engine.tenants), symbols=len(engine.index))))
+            last_health = now
+        if not connection.poll(HEALTH_INTERVAL):
+            continue
+        try:
+            kind, payload = connection.recv()
+        except EOFError:
+            break  # el supervisor cerró el socket
+
+        if kind == QUOTES:
+            symbols = set()
+            for quote in payload:
+                hub.publish(quote['exchange'], quote['symbol'], {
+                    'bid': quote['bid'], 'ask': quote['ask'], 'last': quote['last'],
+                    'baseVolume': quote['volume'], 'timestamp': quote['timestamp']
+                }, quote['received_at'])
+                symbols.add(quote['symbol'])
+            for symbol in symbols:
+                engine.collect(symbol)
+            stats['quotes'] += len(payload)
+            stats['evaluations'] += len(symbols)
+            stats['lag'] = time.time() - min(quote['received_at'] for quote in payload)
+            if engine.pending:
+                batches, engine.pending = engine.pending, {}
+                orders = [(key, [(tenant.user_id, amount, opportunity) for tenant, amount, opportunity in entries])
+                          for key, entries in batches.items()]
+                stats['orders'] += sum(len(entries) for _, entries in orders)
+                connection.send((ORDERS, orders))
+        elif kind == FILLS:
+            for user_id, amount, balance, trades_today in payload:
+                engine.apply_fill(user_id, amount, balance, trades_today)
+        elif kind == RULES:
+            symbol_metadata.adopt(payload)
+        elif kind == TENANTS:
+            engine.set_tenants(payload)
+        elif kind == STOP:
+            break
+    connection.close()
+
+
+class ShardWorker:
+    """Proceso worker con su socket y su hilo lector en el supervisor"""
+
+    def __init__(self, shard, on_message):
+        self.shard = shard
+        self.on_message = on_message  # on_message(shard, tipo, datos) en el hilo lector
+        self.process = None
+        self.connection = None
+        self.symbols = set()          # símbolos de sus usuarios: solo se le reenvían estos
+        self.rules = {}               # exchange -> fetched_at de los metadatos ya enviados
+        self.health = {}
+        self.last_seen = 0.0
+        self.lock = threading.Lock()  # send() desde el núcleo y desde el monitor
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')  # sin heredar hilos ni sockets de Flask
+        parent, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(self.shard, child),
+                                       name=f"tenant-shard-{self.shard}", daemon=True)
+        self.process.start()
+        child.close()
+        self.connection = parent
+        self.rules = {}
+        self.last_seen = time.time()
+        threading.Thread(target=self._read_loop, args=(parent,), name=f"tenant-shard-{self.shard}-reader",
+                         daemon=True).start()
+        logging.info(f"Shard {self.shard} iniciado (pid {self.process.pid})")
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive() and \
+            time.time() - self.last_seen < HEALTH_TIMEOUT
+
+    def send(self, kind, payload):
+        if self.connection is None:
+            return False  # aún sin arrancar: recibirá sus usuarios en start()
+        with self.lock:
+            try:
+                self.connection.send((kind, payload))
+                return True
+            except (OSError, ValueError) as e:
+                logging.warning(f"Shard {self.shard} no disponible: {e}")
+                return False
+
+    def _read_loop(self, connection):
+        while True:
+            try:
+                kind, payload = connection.recv()
+            except (EOFError, OSError):
+                return
+            self.last_seen = time.time()
+            if kind == HEALTH:
+                self.health = payload
+            else:
+                self.on_message(self.shard, kind, payload)
+
+    def restart(self):
+        """Matar el proceso si sigue vivo (colgado) y arrancar uno nuevo"""
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.kill()
+            self.connection.close()
+        self.start()
+
+    def stop(self):
+        if self.process is None:
+            return
+        self.send(STOP, None)
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+        self.process = None
+
+
+class ShardSupervisor(TenantEngine):
+    """TenantEngine que evalúa en procesos worker y ejecuta y persiste en este"""
+
+    name = 'tenant_shards'
+
+    def __init__(self, workers=None, refresh_interval=60.0):
+        super().__init__(refresh_interval)
+        size = workers or int(os.environ.get('TENANT_SHARDS', max(1, (os.cpu_count() or 2) - 1)))
+        self.workers = [ShardWorker(shard, self.on_worker_message) for shard in range(size)]
+        self.outbox = [[] for _ in self.workers]   # cotizaciones pendientes de reenviar por shard
+        self.inbox = deque()                       # (shard, órdenes) recibidas de los workers
+
+    def shard_of(self, user_id):
+        return zlib.crc32(str(user_id).encode('utf-8')) % len(self.workers)
+
+    # Ciclo de vida
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        super().start()
+
+    def stop(self):
+        super().stop()
+        for worker in self.workers:
+            worker.stop()
+
+    def setup(self, core):
+        super().setup(core)
+        core.every(self, 2.0, self.check_workers)
+
+    def _install(self, tenants):
+        super()._install(tenants)
+        self.distribute()
+
+    def distribute(self, shard=None):
+        """Enviar a cada worker (o a uno) sus usuarios, precedidos de los metadatos que le falten"""
+        snapshots = [[] for _ in self.workers]
+        for tenant in self.tenants.values():
+            snapshots[self.shard_of(tenant.user_id)].append(tenant.to_dict())
+        for worker in self.workers:
+            if shard is not None and worker.shard != shard:
+                continue
+            exchanges = {EXCHANGE_ALIASES.get(exchange, exchange)
+                         for tenant in snapshots[worker.shard] for exchange in tenant['exchanges']}
+            for exchange in exchanges:
+                symbol_metadata.load(exchange)  # una sola descarga (y escritura de caché) para todos los shards
+            stale = {exchange for exchange in exchanges
+                     if worker.rules.get(exchange) != symbol_metadata.fetched_at.get(exchange)}
+            if stale:
+                rules = symbol_metadata.export(stale)
+                if rules and worker.send(RULES, rules):
+                    worker.rules.update((exchange, entry['fetched_at']) for exchange, entry in rules.items())
+            worker.symbols = {symbol for tenant in snapshots[worker.shard] for symbol in tenant['symbols']}
+            worker.send(TENANTS, snapshots[worker.shard])
+
+    def check_workers(self):
+        """Reiniciar los workers caídos o sin latido y devolverles sus usuarios"""
+        for worker in self.workers:
+            if worker.is_alive():
+                continue
+            logging.warning(f"Shard {worker.shard} sin respuesta: reiniciando")
+            worker.restart()
+            # Las órdenes que tuviera en vuelo no llegarán: sus reservas se liberan al reenviar el saldo
+            for tenant in self.tenants.values():
+                if self.shard_of(tenant.user_id) == worker.shard:
+                    tenant.reserved = 0.0
+            self.distribute(worker.shard)
+
+    # Cotizaciones hacia los workers
+
+    def on_quote(self, quote):
+        for worker in self.workers:
+            if quote['symbol'] in worker.symbols:
+                self.outbox[worker.shard].append(quote)
+        self.core.post_once(self, 'forward', self.forward)
+
+    def forward(self):
+        """Un mensaje por worker con todas las cotizaciones acumuladas"""
+        for worker in self.workers:
+            quotes, self.outbox[worker.shard] = self.outbox[worker.shard], []
+            if quotes:
+                worker.send(QUOTES, quotes)
+
+    # Órdenes desde los workers
+
+    def on_worker_message(self, shard, kind, payload):
+        if kind == ORDERS:
+            self.inbox.append((shard, payload))
+            self.core.post_once(self, 'orders', self.execute_orders)
+
+    def execute_orders(self):
+        """Juntar las órdenes de todos los workers por cuenta, ejecutar y devolver saldos"""
+        while self.inbox:
+            _, orders = self.inbox.popleft()
+            for key, entries in orders:
+                for user_id, amount, opportunity in entries:
+                    tenant = self.tenants.get(user_id)
+                    if tenant is None:
+                        continue  # dado de baja en el último refresco
+                    tenant.reserved += amount
+                    self.pending.setdefault(key, []).append((tenant, amount, opportunity))
+        self.flush()
+
+    def flush(self):
+        settled = super().flush()
+        self.on_settled(settled)
+        return settled
+
+    def on_settled(self, settled):
+        """Devolver a cada worker el saldo de sus usuarios tras liquidar sus lotes"""
+        fills = [[] for _ in self.workers]
+        for tenant, amount in settled:
+            fills[self.shard_of(tenant.user_id)].append((tenant.user_id, amount, tenant.balance, tenant.trades_today))
+        for worker in self.workers:
+            if fills[worker.shard]:
+                worker.send(FILLS, fills[worker.shard])
+
+    def get_status(self):
+        status = super().get_status()
+        status['shards'] = [
+            dict(worker.health, shard=worker.shard, alive=worker.is_alive()) for worker in self.workers
+        ]
+        return status
+
+
+# Instancia global del supervisor
+shard_supervisor = ShardSupervisor()
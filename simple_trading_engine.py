@@ -1,17 +1,33 @@
 import time
 import logging
-from datetime import datetime, timedelta
-from app import db
 from flask_socketio import emit
-from models import Trade, Balance, DailyStats, TradingConfig, Alert
+from models import TradingConfig
 from exchange_simulator import ExchangeSimulator
+from ticker_snapshot import TickerSnapshotCache
+from market_data_hub import market_data_hub
+from exchange_adapters import BinanceAdapter
+from engine_core import Strategy, Venue, Persistence, engine_core
+from balance_ledger import balance_ledger
+from usd_valuation import usd_valuation
 import threading
 
-class SimpleTradingEngine:
+class SimpleTradingEngine(Strategy):
+    name = 'simple_trading_engine'
+    scan_interval = 5.0
+
     def __init__(self, telegram_bot=None):
         # Use simulator for now to get the app running
         self.client = ExchangeSimulator("Binance")
         self.kucoin_client = ExchangeSimulator("KuCoin")
+        self.adapters = {
+            'Binance': BinanceAdapter(self.client, name='Binance'),
+            'KuCoin': BinanceAdapter(self.kucoin_client, name='KuCoin')
+        }
+        self.venue = Venue(self.name, self.adapters)
+        self.persistence = Persistence(self.name)
+        self.ticker_snapshots = TickerSnapshotCache(self.client, max_age=5.0)
+        market_data_hub.register_source('simulator', self.ticker_snapshots.fetch_tickers)
+        usd_valuation.register_snapshot('simulator', self.ticker_snapshots)
         self.telegram_bot = telegram_bot
         
         # Trading parameters
@@ -20,9 +36,12 @@ class SimpleTradingEngine:
         self.stop_loss_percentage = 0.02
         self.target_spread = 0.005
         self.reinvestment_rate = 0.8
+        self.exit_retry = 5.0  # Seconds before retrying a failed sell, doubled on every attempt
+        self.max_exit_attempts = 5
         
         self.is_running = False
-        self.positions = {}
+        # Open positions survive restarts through the order journal
+        self.positions = self.persistence.recover()
         
         # Target symbols for arbitrage
         self.target_symbols = [
@@ -37,51 +56,35 @@ class SimpleTradingEngine:
         self.is_running = True
         logging.info("Starting Simple Trading Engine...")
         
-        while self.is_running:
-            try:
-                self.update_balances()
-                self.scan_opportunities()
-                self.manage_positions()
-                self.update_daily_stats()
-                
-                time.sleep(5)  # Check every 5 seconds
-                
-            except Exception as e:
-                logging.error(f"Error in trading loop: {e}")
-                self.create_alert("Trading Error", f"Error in main loop: {str(e)}", "ERROR")
-                time.sleep(10)
+        # Runs on the shared engine core: a scan on every simulator quote, exits first
+        engine_core.register(self)
+
+    def markets(self):
+        return {'simulator': self.target_symbols}
+
+    def setup(self, core):
+        # Positions recovered from the journal are watched again
+        for pos_id, position in self.positions.items():
+            self.track_position(pos_id, position)
+        # Balances and SQL stats run on the core's I/O pool, never on the shared loop thread
+        core.every(self, 5.0, self.update_balances, blocking=True)
+        core.every(self, 60.0, self.persistence.update_daily_stats, blocking=True)
+
+    def scan(self):
+        self.scan_opportunities()
+
+    def on_error(self, error):
+        self.create_alert("Trading Error", f"Error in main loop: {str(error)}", "ERROR")
 
     def update_balances(self):
         """Update account balances from simulator"""
         try:
-            account_info = self.client.get_account()
-            if not account_info:
+            balances = self.adapters['Binance'].get_balances()
+            if not balances:
                 return
             
-            total_usd_value = 0
-            
-            with db.session.begin():
-                # Clear existing balances
-                Balance.query.delete()
-                
-                for balance in account_info['balances']:
-                    free = float(balance['free'])
-                    locked = float(balance['locked'])
-                    total = free + locked
-                    
-                    if total > 0:
-                        usd_value = self.get_usd_value(balance['asset'], total)
-                        total_usd_value += usd_value
-                        
-                        balance_record = Balance()
-                        balance_record.asset = balance['asset']
-                        balance_record.free_balance = free
-                        balance_record.locked_balance = locked
-                        balance_record.total_balance = total
-                        balance_record.usd_value = usd_value
-                        db.session.add(balance_record)
-                
-                db.session.commit()
+            # In-memory ledger valued at simulator prices; only changed rows hit the database
+            balance_ledger.apply_snapshot('Binance', balances, pricing='simulator')
             
             # No socket emission needed from here
             
@@ -90,35 +93,27 @@ class SimpleTradingEngine:
 
     def get_usd_value(self, asset, amount):
         """Get USD value of an asset"""
-        if asset == 'USDT':
-            return amount
-        
         try:
-            symbol = f'{asset}USDT'
-            ticker = self.client.get_symbol_ticker(symbol)
-            if ticker and 'price' in ticker:
-                return amount * float(ticker['price'])
+            return usd_valuation.value(asset, amount, 'simulator')
         except:
-            pass
-        
-        return 0
+            return 0
 
     def scan_opportunities(self):
         """Scan for arbitrage opportunities between exchanges"""
         try:
             for symbol in self.target_symbols:
                 # Get prices from both exchanges
-                binance_book = self.client.get_order_book(symbol)
-                kucoin_book = self.kucoin_client.get_order_book(symbol)
+                binance_book = self.adapters['Binance'].get_order_book(symbol)
+                kucoin_book = self.adapters['KuCoin'].get_order_book(symbol)
                 
                 if not binance_book or not kucoin_book:
                     continue
                 
                 # Calculate spread between exchanges
-                binance_ask = float(binance_book['asks'][0][0])
-                binance_bid = float(binance_book['bids'][0][0])
-                kucoin_ask = float(kucoin_book['asks'][0][0])
-                kucoin_bid = float(kucoin_book['bids'][0][0])
+                binance_ask = binance_book.best_ask
+                binance_bid = binance_book.best_bid
+                kucoin_ask = kucoin_book.best_ask
+                kucoin_bid = kucoin_book.best_bid
                 
                 # Find arbitrage opportunity
                 if binance_bid > kucoin_ask:
@@ -165,102 +160,115 @@ class SimpleTradingEngine:
             if usdt_balance < trade_amount:
                 return
             
-            # Execute buy order on cheaper exchange
-            buy_client = self.client if opportunity['buy_exchange'] == 'Binance' else self.kucoin_client
-            buy_order = buy_client.order_market_buy(symbol, trade_amount)
-            
-            if buy_order and buy_order.get('status') == 'FILLED':
-                # Record buy trade
-                trade = Trade()
-                trade.symbol = symbol
-                trade.side = 'BUY'
-                trade.quantity = float(buy_order['executedQty'])
-                trade.price = float(buy_order['fills'][0]['price'])
-                trade.total_value = trade_amount
-                trade.fee = float(buy_order['fills'][0]['commission'])
-                trade.strategy = 'arbitrage'
-                trade.exchange = opportunity['buy_exchange']
-                trade.order_id = buy_order['orderId']
+            # Execute buy order on cheaper exchange (core I/O pool); the fill comes back to the loop
+            self.core.submit(
+                self, self.venue.buy, opportunity['buy_exchange'], symbol, trade_amount,
+                key=('buy', symbol, opportunity['buy_exchange']),
+                then=lambda buy_order: self.on_buy(opportunity, trade_amount, buy_order)
+            )
                 
-                db.session.add(trade)
-                db.session.commit()
+        except Exception as e:
+            logging.error(f"Error executing arbitrage: {e}")
+
+    def on_buy(self, opportunity, trade_amount, buy_order):
+        """Buy result back on the engine loop: record it and track the new position"""
+        try:
+            symbol = opportunity['symbol']
+            if buy_order is not None and buy_order.success:
+                # Record buy trade
+                self.persistence.record_trade(
+                    symbol=symbol,
+                    side='BUY',
+                    quantity=buy_order.filled_qty,
+                    price=buy_order.avg_price,
+                    total_value=trade_amount,
+                    fee=buy_order.fee,
+                    strategy='arbitrage',
+                    exchange=opportunity['buy_exchange'],
+                    order_id=buy_order.order_id
+                )
                 
                 # Store position for selling
-                self.positions[f"{symbol}_{int(time.time())}"] = {
+                pos_id = f"{symbol}_{int(time.time())}"
+                self.positions[pos_id] = {
                     'symbol': symbol,
-                    'quantity': float(buy_order['executedQty']),
-                    'buy_price': float(buy_order['fills'][0]['price']),
+                    'quantity': buy_order.filled_qty,
+                    'buy_price': buy_order.avg_price,
                     'buy_exchange': opportunity['buy_exchange'],
                     'sell_exchange': opportunity['sell_exchange'],
                     'timestamp': time.time()
                 }
+                self.persistence.open_position(pos_id, self.positions[pos_id])
+                self.track_position(pos_id, self.positions[pos_id])
                 
                 logging.info(f"Arbitrage buy executed: {symbol} on {opportunity['buy_exchange']}")
                 
                 # Log trade notification
-                logging.info(f"Trade executed: {symbol} BUY ${trade_amount} at {trade.price}")
+                logging.info(f"Trade executed: {symbol} BUY ${trade_amount} at {buy_order.avg_price}")
                 
         except Exception as e:
-            logging.error(f"Error executing arbitrage: {e}")
+            logging.error(f"Error recording arbitrage buy: {e}")
 
-    def manage_positions(self):
-        """Manage open positions"""
-        positions_to_remove = []
-        current_time = time.time()
-        
-        for pos_id, position in self.positions.items():
-            try:
-                symbol = position['symbol']
-                
-                # Get current price
-                ticker = self.client.get_symbol_ticker(symbol)
-                if not ticker:
-                    continue
-                
-                current_price = float(ticker['price'])
-                buy_price = position['buy_price']
-                quantity = position['quantity']
-                
-                # Calculate profit percentage
-                profit_pct = (current_price - buy_price) / buy_price
-                
-                # Check if we should sell (profit target or time-based)
-                should_sell = False
-                reason = ""
-                
-                if profit_pct >= 0.008:  # 0.8% profit target
-                    should_sell = True
-                    reason = "PROFIT_TARGET"
-                elif profit_pct <= -self.stop_loss_percentage:  # Stop loss
-                    should_sell = True
-                    reason = "STOP_LOSS"
-                elif current_time - position['timestamp'] > 300:  # 5 minutes max hold
-                    should_sell = True
-                    reason = "TIME_EXIT"
-                
-                if should_sell:
-                    self.execute_sell_position(position, current_price, reason)
-                    positions_to_remove.append(pos_id)
-                    
-            except Exception as e:
-                logging.error(f"Error managing position {pos_id}: {e}")
+    def track_position(self, pos_id, position):
+        """Register profit target, stop loss and max hold of a position with the engine core"""
+        buy_price = position['buy_price']
+        self.core.track(
+            self, pos_id, 'simulator', position['symbol'],
+            stop_price=buy_price * (1 - self.stop_loss_percentage),
+            target_price=buy_price * 1.008,  # 0.8% profit target
+            deadline=position['timestamp'] + 300,  # 5 minutes max hold
+            position=position,
+            price_field='last'
+        )
+
+    def on_exit(self, pos_id, position, reason, price):
+        """Position book trigger: sell and drop the position"""
+        if price is None:
+            quote = market_data_hub.get_quote('simulator', position['symbol'], max_age=5.0)
+            if not quote or not quote['last']:
+                self.retry_exit(pos_id, position, 'no quote')
+                return
+            price = float(quote['last'])
         
-        # Remove closed positions
-        for pos_id in positions_to_remove:
-            del self.positions[pos_id]
+        # The sell runs on the core's I/O pool; the outcome comes back to the loop
+        self.core.submit(self, self.execute_sell_position, position, price, reason, key=('sell', pos_id),
+                         then=lambda sold: self.on_sold(pos_id, position, reason, sold))
+
+    def on_sold(self, pos_id, position, reason, sold):
+        """Sell outcome back on the engine loop: drop the position or retry the exit"""
+        if not sold:
+            self.retry_exit(pos_id, position, 'sell failed')
+            return
+        self.positions.pop(pos_id, None)
+        self.persistence.close_position(pos_id, reason)
+
+    def retry_exit(self, pos_id, position, error):
+        """Retry a failed exit after a doubling delay; give up after max_exit_attempts"""
+        attempts = position['exit_attempts'] = position.get('exit_attempts', 0) + 1
+        if attempts >= self.max_exit_attempts:
+            self.create_alert("Exit Abandoned",
+                              f"{position['symbol']}: {attempts} failed sells ({error}), position left open for manual review",
+                              "ERROR")
+            return
+        self.core.track(
+            self, pos_id, 'simulator', position['symbol'],
+            deadline=time.time() + self.exit_retry * 2 ** (attempts - 1),
+            position=position,
+            price_field='last'
+        )
 
     def execute_sell_position(self, position, current_price, reason):
-        """Execute sell order for a position"""
+        """Execute sell order for a position; returns True if it was sold"""
         try:
             symbol = position['symbol']
             quantity = position['quantity']
             
             # Execute sell on the target exchange
-            sell_client = self.kucoin_client if position['sell_exchange'] == 'KuCoin' else self.client
-            sell_order = sell_client.order_market_sell(symbol, quantity)
+            sell_order = self.venue.sell(position['sell_exchange'], symbol, quantity)
             
-            if sell_order and sell_order.get('status') == 'FILLED':
-                executed_price = float(sell_order['fills'][0]['price'])
+            if sell_order.success:
+                quantity = sell_order.filled_qty
+                executed_price = sell_order.avg_price
                 total_value = quantity * executed_price
                 
                 # Calculate profit/loss
@@ -268,89 +276,43 @@ class SimpleTradingEngine:
                 profit_loss = total_value - buy_total
                 
                 # Record sell trade
-                trade = Trade()
-                trade.symbol = symbol
-                trade.side = 'SELL'
-                trade.quantity = quantity
-                trade.price = executed_price
-                trade.total_value = total_value
-                trade.fee = float(sell_order['fills'][0]['commission'])
-                trade.strategy = 'arbitrage'
-                trade.profit_loss = profit_loss
-                trade.exchange = position['sell_exchange']
-                trade.order_id = sell_order['orderId']
-                
-                db.session.add(trade)
-                db.session.commit()
+                self.persistence.record_trade(
+                    symbol=symbol,
+                    side='SELL',
+                    quantity=quantity,
+                    price=executed_price,
+                    total_value=total_value,
+                    fee=sell_order.fee,
+                    strategy='arbitrage',
+                    profit_loss=profit_loss,
+                    exchange=position['sell_exchange'],
+                    order_id=sell_order.order_id
+                )
                 
                 logging.info(f"Position closed: {symbol} - P/L: ${profit_loss:.2f} - Reason: {reason}")
                 
                 # Log trade notification
                 logging.info(f"Position closed: {symbol} SELL - P/L: ${profit_loss:.2f} - Reason: {reason}")
+                return True
+            
+            logging.error(f"Sell of {symbol} failed: {sell_order.error or 'unknown error'}")
+            return False
                 
         except Exception as e:
             logging.error(f"Error executing sell: {e}")
+            return False
 
     def get_asset_balance(self, asset):
         """Get balance for a specific asset"""
         try:
-            balance = Balance.query.filter_by(asset=asset).first()
-            return balance.free_balance if balance else 0
+            return balance_ledger.free('Binance', asset)
         except:
             return 0
 
-    def update_daily_stats(self):
-        """Update daily trading statistics"""
-        try:
-            today = datetime.now().date()
-            
-            stats = DailyStats.query.filter_by(date=today).first()
-            if not stats:
-                yesterday = today - timedelta(days=1)
-                yesterday_stats = DailyStats.query.filter_by(date=yesterday).first()
-                starting_balance = yesterday_stats.ending_balance if yesterday_stats else 30.0
-                
-                stats = DailyStats()
-                stats.date = today
-                stats.starting_balance = starting_balance
-                stats.ending_balance = starting_balance
-                db.session.add(stats)
-            
-            # Update statistics from today's trades
-            today_trades = Trade.query.filter(
-                Trade.executed_at >= datetime.combine(today, datetime.min.time())
-            ).all()
-            
-            stats.total_trades = len(today_trades)
-            stats.successful_trades = len([t for t in today_trades if t.profit_loss and t.profit_loss > 0])
-            stats.total_profit = sum(t.profit_loss for t in today_trades if t.profit_loss)
-            stats.total_fees = sum(t.fee for t in today_trades)
-            
-            # Get current balance
-            current_balance = sum(b.usd_value for b in Balance.query.all())
-            stats.ending_balance = current_balance
-            
-            if stats.starting_balance > 0:
-                stats.roi_percentage = ((stats.ending_balance - stats.starting_balance) / stats.starting_balance) * 100
-            
-            db.session.commit()
-            
-        except Exception as e:
-            logging.error(f"Error updating daily stats: {e}")
-
     def create_alert(self, title, message, alert_type):
         """Create a system alert"""
         try:
-            alert = Alert()
-            alert.title = title
-            alert.message = message
-            alert.alert_type = alert_type
-            
-            db.session.add(alert)
-            db.session.commit()
-            
-            # Log alert
-            logging.info(f"Alert created: {title} - {message}")
+            self.persistence.alert(title, message, alert_type)
             
         except Exception as e:
             logging.error(f"Error creating alert: {e}")
@@ -358,4 +320,5 @@ class SimpleTradingEngine:
     def stop(self):
         """Stop the trading engine"""
         self.is_running = False
+        engine_core.unregister(self)
         logging.info("Simple Trading Engine stopped")
\ No newline at end of file
@@ -1,90 +1,78 @@
-import subprocess
-import json
 import logging
 import time
-import asyncio
 from datetime import datetime
-from app import db
-from models import Trade, Alert, DailyStats
+from async_exchange import run_exchange_command
+from opportunity_tracker import opportunity_tracker
+from engine_core import Strategy, Persistence, engine_core
 
-class StableTradingBot:
+class StableTradingBot(Strategy):
     """Bot de trading estable sin timeouts"""
     
+    name = 'stable_trading_bot'
+    scan_interval = 30.0
+    
     def __init__(self):
         self.exchanges = ['gate', 'mexc', 'okx', 'bitget']
         self.symbols = ['BTC/USDT', 'ETH/USDT', 'ADA/USDT']
         self.min_spread = 0.003  # 0.3% mínimo
         self.capital = 30.0
         self.is_running = False
+        self.persistence = Persistence(self.name)
         
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
     
+    def start(self):
+        """Escanear periódicamente en el núcleo compartido (run_single_scan sigue disponible)"""
+        self.is_running = True
+        engine_core.register(self)
+    
+    def stop(self):
+        self.is_running = False
+        engine_core.unregister(self)
+    
+    def markets(self):
+        return {exchange: self.symbols for exchange in self.exchanges}
+    
+    def wants(self, quote):
+        # Cada escaneo simula un trade: escanea por temporizador, no con cada cotización
+        return False
+    
+    def scan(self):
+        self.run_single_scan()
+    
     def get_price_data(self, exchange, symbol):
         """Obtener datos de precio de un exchange"""
-                result = subprocess.run(
-                ["node", "/home/ubuntu/binance_miner_analysis/BinanceMiner/get_price.js", exchange, symbol],
-                capture_output=True,
-                text=True,
-                timeout=8
-            )    
-            if result.returncode == 0:
-                return json.loads(result.stdout)
-            else:
-                return None
-                
-        except Exception as e:
-            self.logger.error(f"Error getting price data: {e}")
+        ticker = run_exchange_command('fetch_ticker', exchange, symbol, timeout=8)
+        if not ticker or not ticker.get('bid') or not ticker.get('ask'):
             return None
+        
+        return {
+            'exchange': exchange,
+            'symbol': symbol,
+            'bid': ticker['bid'],
+            'ask': ticker['ask'],
+            'last': ticker.get('last'),
+            'volume': ticker.get('baseVolume'),
+            'spread': (ticker['ask'] - ticker['bid']) / ticker['bid'] * 100
+        }
     
     def scan_arbitrage_opportunities(self):
         """Escanear oportunidades de arbitraje"""
-        opportunities = []
-        
-        for symbol in self.symbols:
-            prices = {}
-            
-            # Obtener precios de todos los exchanges
-            for exchange in self.exchanges:
-                price_data = self.get_price_data(exchange, symbol)
-                if price_data and not 'error' in price_data:
-                    prices[exchange] = price_data
-            
-            # Buscar oportunidades
-            for buy_ex in prices:
-                for sell_ex in prices:
-                    if buy_ex != sell_ex:
-                        buy_price = prices[buy_ex]['ask']
-                        sell_price = prices[sell_ex]['bid']
-                        spread = (sell_price - buy_price) / buy_price
-                        
-                        if spread > self.min_spread:
-                            opportunity = {
-                                'symbol': symbol,
-                                'buy_exchange': buy_ex,
-                                'sell_exchange': sell_ex,
-                                'buy_price': buy_price,
-                                'sell_price': sell_price,
-                                'spread_percentage': spread * 100,
-                                'potential_profit': self.capital * spread * 0.8,  # 80% del capital
-                                'timestamp': datetime.now()
-                            }
-                            opportunities.append(opportunity)
-        
-        # Ordenar por mayor spread
-        opportunities.sort(key=lambda x: x['spread_percentage'], reverse=True)
-        return opportunities[:3]  # Top 3 oportunidades
+        # Las cotizaciones llegan al tracker según se actualizan; aquí solo se leen las vivas
+        opportunity_tracker.track(self.exchanges, self.symbols)
+        opportunities = opportunity_tracker.top(
+            3, self.min_spread, exchanges=self.exchanges, symbols=self.symbols
+        )  # Top 3 oportunidades
+        for opportunity in opportunities:
+            opportunity['potential_profit'] = self.capital * opportunity['net_spread_percentage'] / 100 * 0.8  # 80% del capital
+            opportunity['timestamp'] = datetime.now()
+        return opportunities
     
     def create_alert_record(self, title, message, alert_type):
         """Crear registro de alerta"""
         try:
-            alert = Alert()
-            alert.title = title
-            alert.message = message
-            alert.alert_type = alert_type
-            
-            db.session.add(alert)
-            db.session.commit()
+            self.persistence.alert(title, message, alert_type)
             
         except Exception as e:
             self.logger.error(f"Error creating alert: {e}")
@@ -97,37 +85,34 @@ class StableTradingBot:
             quantity = trade_amount / opportunity['buy_price']
             
             # Registrar trade simulado
-            trade = Trade()
-            trade.symbol = opportunity['symbol']
-            trade.side = 'BUY'
-            trade.quantity = quantity
-            trade.price = opportunity['buy_price']
-            trade.total_value = trade_amount
-            trade.fee = trade_amount * 0.001
-            trade.strategy = 'arbitrage_simulation'
-            trade.exchange = opportunity['buy_exchange'].upper()
-            trade.order_id = f"SIM_{int(time.time())}"
-            
-            db.session.add(trade)
+            self.persistence.record_trade(
+                symbol=opportunity['symbol'],
+                side='BUY',
+                quantity=quantity,
+                price=opportunity['buy_price'],
+                total_value=trade_amount,
+                fee=trade_amount * 0.001,
+                strategy='arbitrage_simulation',
+                exchange=opportunity['buy_exchange'].upper(),
+                order_id=f"SIM_{int(time.time())}"
+            )
             
             # Simular venta inmediata
             sell_total = quantity * opportunity['sell_price']
             profit = sell_total - trade_amount - (sell_total * 0.001)
             
-            sell_trade = Trade()
-            sell_trade.symbol = opportunity['symbol']
-            sell_trade.side = 'SELL'
-            sell_trade.quantity = quantity
-            sell_trade.price = opportunity['sell_price']
-            sell_trade.total_value = sell_total
-            sell_trade.fee = sell_total * 0.001
-            sell_trade.profit_loss = profit
-            sell_trade.strategy = 'arbitrage_simulation'
-            sell_trade.exchange = opportunity['sell_exchange'].upper()
-            sell_trade.order_id = f"SIM_{int(time.time()) + 1}"
-            
-            db.session.add(sell_trade)
-            db.session.commit()
+            self.persistence.record_trade(
+                symbol=opportunity['symbol'],
+                side='SELL',
+                quantity=quantity,
+                price=opportunity['sell_price'],
+                total_value=sell_total,
+                fee=sell_total * 0.001,
+                profit_loss=profit,
+                strategy='arbitrage_simulation',
+                exchange=opportunity['sell_exchange'].upper(),
+                order_id=f"SIM_{int(time.time()) + 1}"
+            )
             
             self.logger.info(f"Simulated arbitrage: {opportunity['symbol']} - Profit: ${profit:.4f}")
             
@@ -143,39 +128,7 @@ class StableTradingBot:
     
     def update_daily_stats(self):
         """Actualizar estadísticas diarias"""
-        try:
-            today = datetime.now().date()
-            
-            # Obtener trades de hoy
-            today_trades = Trade.query.filter(
-                Trade.executed_at >= datetime.combine(today, datetime.min.time())
-            ).all()
-            
-            if today_trades:
-                total_profit = sum(t.profit_loss for t in today_trades if t.profit_loss)
-                total_trades = len(today_trades)
-                successful_trades = len([t for t in today_trades if t.profit_loss and t.profit_loss > 0])
-                
-                # Actualizar o crear estadísticas
-                stats = DailyStats.query.filter_by(date=today).first()
-                if not stats:
-                    stats = DailyStats()
-                    stats.date = today
-                    stats.starting_balance = 30.0
-                    db.session.add(stats)
-                
-                stats.total_trades = total_trades
-                stats.successful_trades = successful_trades
-                stats.total_profit = total_profit
-                stats.ending_balance = 30.0 + total_profit
-                
-                if stats.starting_balance > 0:
-                    stats.roi_percentage = (total_profit / stats.starting_balance) * 100
-                
-                db.session.commit()
-                
-        except Exception as e:
-            self.logger.error(f"Error updating daily stats: {e}")
+        self.persistence.update_daily_stats(from_balances=False)
     
     def run_single_scan(self):
         """Ejecutar un escaneo único"""
@@ -0,0 +1,449 @@
+"""
+Metadatos de símbolos por exchange
+Step size, tick size, mínimos y comisiones de cada par, descargados una vez
+(exchangeInfo de Binance, /api/v1/symbols de KuCoin, load_markets de ccxt) y
+persistidos en disco para que el arranque no vuelva a bajarlos. Expone el
+redondeo de cantidades y precios que usan todas las rutas de órdenes, en
+versión escalar y vectorizada (NumPy).
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+import numpy as np
+
+CACHE_PATH = os.environ.get(
+    'SYMBOL_METADATA_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'symbol_metadata.json')
+)
+
+# Comisión por defecto si el exchange no la publica (nivel base, taker)
+DEFAULT_FEE = 0.001
+
+# exchange.precisionMode de ccxt
+DECIMAL_PLACES = 2
+SIGNIFICANT_DIGITS = 3
+TICK_SIZE = 4
+
+
+def _decimals(step):
+    """Decimales que representa un step (0.001 -> 3)"""
+    if not step or step <= 0:
+        return 8
+    return max(0, int(round(-math.log10(step)))) if step < 1 else 0
+
+
+class SymbolRules:
+    """Reglas de trading de un par en un exchange"""
+
+    __slots__ = ('exchange', 'symbol', 'base', 'quote', 'step_size', 'tick_size', 'min_qty',
+                 'min_notional', 'quote_step', 'maker_fee', 'taker_fee')
+
+    def __init__(self, exchange, symbol, base, quote, step_size=0.0, tick_size=0.0, min_qty=0.0,
+                 min_notional=0.0, quote_step=0.0, maker_fee=DEFAULT_FEE, taker_fee=DEFAULT_FEE):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.base = base
+        self.quote = quote
+        self.step_size = step_size
+        self.tick_size = tick_size
+        self.min_qty = min_qty
+        self.min_notional = min_notional
+        self.quote_step = quote_step
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.__slots__ if field in data})
+
+    def quantize_quantity(self, quantity):
+        """Redondear hacia abajo al step size (nunca vender más de lo que hay)"""
+        if not self.step_size:
+            return float(quantity)
+        steps = math.floor(quantity / self.step_size + 1e-9)
+        return round(steps * self.step_size, _decimals(self.step_size))
+
+    def quantize_price(self, price, side='BUY'):
+        """Redondear al tick: compras hacia abajo, ventas hacia arriba"""
+        if not self.tick_size:
+            return float(price)
+        rounding = math.floor if side.upper() == 'BUY' else math.ceil
+        ticks = rounding(price / self.tick_size + (1e-9 if side.upper() == 'BUY' else -1e-9))
+        return round(ticks * self.tick_size, _decimals(self.tick_size))
+
+    def quantize_quote(self, amount):
+        """Redondear un importe en moneda quote (órdenes por coste)"""
+        if not self.quote_step:
+            return float(amount)
+        steps = math.floor(amount / self.quote_step + 1e-9)
+        return round(steps * self.quote_step, _decimals(self.quote_step))
+
+    def format_quantity(self, quantity):
+        """Cantidad redondeada como texto con los decimales exactos del step"""
+        return f"{self.quantize_quantity(quantity):.{_decimals(self.step_size)}f}"
+
+    def format_quote(self, amount):
+        return f"{self.quantize_quote(amount):.{_decimals(self.quote_step)}f}"
+
+    def check_order(self, quantity, price):
+        """(True, None) si la orden cumple mínimos; si no (False, motivo)"""
+        if quantity <= 0 or quantity < self.min_qty:
+            return False, f"cantidad {quantity} por debajo del mínimo {self.min_qty}"
+        if price and self.min_notional and quantity * price < self.min_notional:
+            return False, f"nocional {quantity * price:.4f} por debajo de {self.min_notional}"
+        return True, None
+
+
+def parse_binance_exchange_info(info, fees=None):
+    """exchangeInfo de Binance -> lista de SymbolRules"""
+    fees = fees or {}
+    rules = []
+    for market in (info or {}).get('symbols', []):
+        if market.get('status') not in (None, 'TRADING'):
+            continue
+        filters = {f['filterType']: f for f in market.get('filters', [])}
+        lot = filters.get('LOT_SIZE', {})
+        price_filter = filters.get('PRICE_FILTER', {})
+        notional = filters.get('NOTIONAL') or filters.get('MIN_NOTIONAL') or {}
+        maker, taker = fees.get(market['symbol'], (DEFAULT_FEE, DEFAULT_FEE))
+        rules.append(SymbolRules(
+            'binance', market['symbol'], market.get('baseAsset'), market.get('quoteAsset'),
+            step_size=float(lot.get('stepSize', 0)),
+            tick_size=float(price_filter.get('tickSize', 0)),
+            min_qty=float(lot.get('minQty', 0)),
+            min_notional=float(notional.get('minNotional', 0)),
+            quote_step=10.0 ** -int(market.get('quoteAssetPrecision', market.get('quotePrecision', 8))),
+            maker_fee=maker,
+            taker_fee=taker
+        ))
+    return rules
+
+
+def parse_kucoin_symbols(response):
+    """/api/v1/symbols de KuCoin -> lista de SymbolRules"""
+    rules = []
+    for market in (response or {}).get('data') or []:
+        if not market.get('enableTrading', True):
+            continue
+        rules.append(SymbolRules(
+            'kucoin', market['symbol'], market.get('baseCurrency'), market.get('quoteCurrency'),
+            step_size=float(market.get('baseIncrement') or 0),
+            tick_size=float(market.get('priceIncrement') or 0),
+            min_qty=float(market.get('baseMinSize') or 0),
+            min_notional=float(market.get('minFunds') or 0),
+            quote_step=float(market.get('quoteIncrement') or 0),
+            maker_fee=DEFAULT_FEE * float(market.get('feeCategory', 1) or 1),
+            taker_fee=DEFAULT_FEE * float(market.get('feeCategory', 1) or 1)
+        ))
+    return rules
+
+
+def parse_ccxt_markets(exchange, markets, precision_mode=None):
+    """markets de ccxt (load_markets) -> lista de SymbolRules
+
+    precision_mode es el exchange.precisionMode de ccxt: con TICK_SIZE la
+    precisión ya es el step (1 o 10 incluidos), con DECIMAL_PLACES es un
+    número de decimales. Sin él se deduce del valor (los enteros >= 1 se toman
+    como decimales).
+    """
+    def step(value):
+        if value is None:
+            return 0.0
+        value = float(value)
+        if precision_mode == TICK_SIZE:
+            return value
+        if precision_mode == DECIMAL_PLACES:
+            return 10.0 ** -int(value)
+        if precision_mode == SIGNIFICANT_DIGITS:
+            return 0.0  # sin step fijo: no se redondea
+        return value if value < 1 or value != int(value) else 10.0 ** -int(value)
+
+    rules = []
+    for symbol, market in (markets or {}).items():
+        if market.get('active') is False or not market.get('spot', True):
+            continue
+        precision = market.get('precision') or {}
+        limits = market.get('limits') or {}
+
+        rules.append(SymbolRules(
+            exchange, symbol, market.get('base'), market.get('quote'),
+            step_size=step(precision.get('amount')),
+            tick_size=step(precision.get('price')),
+            min_qty=float((limits.get('amount') or {}).get('min') or 0),
+            min_notional=float((limits.get('cost') or {}).get('min') or 0),
+            quote_step=step(precision.get('cost')) if precision.get('cost') is not None else 0.0,
+            maker_fee=float(market.get('maker') or DEFAULT_FEE),
+            taker_fee=float(market.get('taker') or DEFAULT_FEE)
+        ))
+    return rules
+
+
+class SymbolMetadataStore:
+    """Caché de reglas por (exchange, símbolo), en memoria y en disco"""
+
+    def __init__(self, path=CACHE_PATH, max_age=24 * 3600, retry_interval=30.0, max_retry_interval=900.0):
+        self.path = path
+        self.max_age = max_age
+        self.retry_interval = retry_interval          # primera espera tras una descarga fallida
+        self.max_retry_interval = max_retry_interval
+        self.rules = {}       # exchange -> {symbol: SymbolRules}
+        self.fetched_at = {}  # exchange -> timestamp de descarga
+        self.failures = {}    # exchange -> (no reintentar antes de, espera actual)
+        self.loading = {}     # exchange -> Event de la descarga en curso
+        self.loaders = {}
+        self.vectors = {}     # (exchange(s), símbolos) -> arrays precalculados
+        self.lock = threading.RLock()
+        self._read_disk()
+
+    def register_loader(self, exchange, loader):
+        """loader() -> lista de SymbolRules; se llama sólo si la caché no vale"""
+        self.loaders[exchange] = loader
+
+    def register_binance(self, client):
+        def load():
+            fees = None
+            if hasattr(client, 'get_trade_fees'):
+                response = client.get_trade_fees()
+                if isinstance(response, list):
+                    fees = {
+                        item['symbol']: (float(item['makerCommission']), float(item['takerCommission']))
+                        for item in response
+                    }
+            return parse_binance_exchange_info(client.get_exchange_info(), fees)
+        self.register_loader('binance', load)
+
+    def register_kucoin(self, client):
+        self.register_loader('kucoin', lambda: parse_kucoin_symbols(client.get_symbols()))
+
+    def _ccxt_loader(self, exchange):
+        from async_exchange import run_exchange_command
+        markets = run_exchange_command('load_markets', exchange, timeout=30)
+        precision_mode = run_exchange_command('precision_mode', exchange, timeout=30) if markets else None
+        return parse_ccxt_markets(exchange, markets, precision_mode)
+
+    def _read_disk(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Caché de metadatos ilegible ({self.path}): {e}")
+            return
+
+        self._install(data)
+
+    def _install(self, data):
+        """Reglas en el formato de la caché de disco: {exchange: {'fetched_at', 'symbols'}}"""
+        for exchange, entry in data.items():
+            self.rules[exchange] = self._index(
+                SymbolRules.from_dict(rule) for rule in entry.get('symbols', {}).values()
+            )
+            self.fetched_at[exchange] = entry.get('fetched_at', 0)
+            self._drop_vectors(exchange)
+
+    def _dump(self, exchanges=None):
+        return {
+            exchange: {
+                'fetched_at': self.fetched_at.get(exchange, 0),
+                'symbols': {rule.symbol: rule.to_dict() for rule in rules.values()}
+            }
+            for exchange, rules in self.rules.items() if exchanges is None or exchange in exchanges
+        }
+
+    def _write_disk(self):
+        data = self._dump()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar la caché de metadatos: {e}")
+
+    @staticmethod
+    def _index(rules):
+        """Indexar por símbolo nativo (BTCUSDT, BTC-USDT) y unificado ccxt (BTC/USDT)"""
+        index = {}
+        for rule in rules:
+            index[rule.symbol] = rule
+            if rule.base and rule.quote:
+                index.setdefault(f"{rule.base}/{rule.quote}", rule)
+        return index
+
+    def load(self, exchange, force=False):
+        """Reglas del exchange: memoria/disco si están vigentes, si no se descargan
+
+        La descarga (hasta 30 s) corre fuera del lock y una sola vez por
+        exchange: mientras tanto los demás llamantes siguen con las reglas
+        viejas, o esperan a la descarga si no hay ninguna. Tras un fallo no se
+        reintenta hasta que pasa retry_interval, que se duplica con cada fallo
+        seguido; mientras, se devuelven las reglas viejas (o ninguna).
+        """
+        with self.lock:
+            now = time.time()
+            if exchange in self.rules and now - self.fetched_at.get(exchange, 0) < self.max_age and not force:
+                return self.rules[exchange]
+            failure = self.failures.get(exchange)
+            if failure is not None and now < failure[0] and not force:
+                return self.rules.get(exchange, {})
+
+            in_flight = self.loading.get(exchange)
+            if in_flight is None:
+                in_flight = self.loading[exchange] = threading.Event()
+                loader = self.loaders.get(exchange) or (lambda: self._ccxt_loader(exchange))
+            elif exchange in self.rules:
+                return self.rules[exchange]  # otro hilo ya la descarga: mejor reglas viejas que esperar
+            else:
+                loader = None
+
+        if loader is None:
+            in_flight.wait()
+            return self.rules.get(exchange, {})
+
+        rules = None
+        try:
+            rules = loader()
+        except Exception as e:
+            logging.error(f"Error cargando metadatos de {exchange}: {e}")
+        finally:
+            with self.lock:
+                if rules:
+                    self.rules[exchange] = self._index(rules)
+                    self.fetched_at[exchange] = time.time()
+                    self.failures.pop(exchange, None)
+                    self._drop_vectors(exchange)
+                    self._write_disk()
+                    logging.info(f"Metadatos de {exchange}: {len(rules)} símbolos")
+                else:
+                    wait = self.retry_interval if failure is None else min(failure[1] * 2, self.max_retry_interval)
+                    self.failures[exchange] = (time.time() + wait, wait)
+                    logging.warning(f"Sin metadatos de {exchange}; siguiente intento en {wait:.0f}s")
+                del self.loading[exchange]
+                in_flight.set()
+        # Mejor reglas viejas que ninguna
+        return self.rules.get(exchange, {})
+
+    def get(self, exchange, symbol):
+        return self.load(exchange).get(symbol)
+
+    def export(self, exchanges):
+        """Reglas de estos exchanges (descargadas si hace falta) para pasarlas a otro proceso"""
+        for exchange in exchanges:
+            self.load(exchange)
+        with self.lock:
+            return self._dump(exchanges)
+
+    def adopt(self, data):
+        """Usar las reglas de otro proceso (ver export) sin descargarlas ni escribir la caché
+
+        Los workers de shard_supervisor las reciben del supervisor, que es el
+        único que las descarga y las guarda en disco.
+        """
+        with self.lock:
+            self._install(data)
+            for exchange in data:
+                self.loaders[exchange] = lambda: None  # vencidas: se siguen usando hasta que lleguen otras
+
+    def quantize_quantity(self, exchange, symbol, quantity):
+        rules = self.get(exchange, symbol)
+        return rules.quantize_quantity(quantity) if rules else float(quantity)
+
+    def quantize_price(self, exchange, symbol, price, side='BUY'):
+        rules = self.get(exchange, symbol)
+        return rules.quantize_price(price, side) if rules else float(price)
+
+    def quantize_quote(self, exchange, symbol, amount):
+        rules = self.get(exchange, symbol)
+        return rules.quantize_quote(amount) if rules else float(amount)
+
+    def taker_fee(self, exchange, symbol):
+        rules = self.get(exchange, symbol)
+        return rules.taker_fee if rules else DEFAULT_FEE
+
+    def prepare_order(self, exchange, symbol, quantity, price=None):
+        """Cantidad lista para enviar, o None si tras redondear no cumple los mínimos"""
+        rules = self.get(exchange, symbol)
+        if rules is None:
+            return float(quantity)
+
+        quantity = rules.quantize_quantity(quantity)
+        ok, reason = rules.check_order(quantity, price)
+        if not ok:
+            logging.warning(f"Orden {exchange} {symbol} descartada: {reason}")
+            return None
+        return quantity
+
+    # Versión vectorizada: una fila por (exchange, símbolo)
+
+    def _drop_vectors(self, exchange):
+        """Olvidar los arrays construidos con las reglas anteriores del exchange"""
+        for key in list(self.vectors):
+            if exchange == key[0] or (isinstance(key[0], tuple) and exchange in key[0]):
+                del self.vectors[key]
+
+    def _vectors(self, exchange, symbols):
+        """Arrays de reglas de los símbolos; exchange es un nombre o uno por símbolo"""
+        symbols = tuple(symbols)
+        exchange = exchange if isinstance(exchange, str) else tuple(exchange)
+        exchanges = (exchange,) * len(symbols) if isinstance(exchange, str) else exchange
+        # load() primero: si las reglas vencieron se descargan y los arrays viejos se descartan
+        books = {name: self.load(name) for name in set(exchanges)}
+        key = (exchange, symbols)
+        vectors = self.vectors.get(key)
+        if vectors is None:
+            rows = [books[name].get(symbol) for name, symbol in zip(exchanges, symbols)]
+            vectors = {
+                'step': np.array([r.step_size if r else 0.0 for r in rows]),
+                'tick': np.array([r.tick_size if r else 0.0 for r in rows]),
+                'min_qty': np.array([r.min_qty if r else 0.0 for r in rows]),
+                'min_notional': np.array([r.min_notional if r else 0.0 for r in rows]),
+                'taker_fee': np.array([r.taker_fee if r else DEFAULT_FEE for r in rows]),
+            }
+            with self.lock:
+                if len(self.vectors) >= 256:
+                    self.vectors.clear()
+                self.vectors[key] = vectors
+        return vectors
+
+    def quantize_quantities(self, exchange, symbols, quantities):
+        """Redondeo vectorizado de cantidades (step 0 = sin redondeo)"""
+        quantities = np.asarray(quantities, dtype=float)
+        step = self._vectors(exchange, symbols)['step']
+        safe_step = np.where(step > 0, step, 1.0)
+        floored = np.floor(quantities / safe_step + 1e-9) * safe_step
+        return np.where(step > 0, floored, quantities)
+
+    def quantize_prices(self, exchange, symbols, prices, side='BUY'):
+        """Redondeo vectorizado de precios al tick"""
+        prices = np.asarray(prices, dtype=float)
+        tick = self._vectors(exchange, symbols)['tick']
+        safe_tick = np.where(tick > 0, tick, 1.0)
+        if side.upper() == 'BUY':
+            rounded = np.floor(prices / safe_tick + 1e-9) * safe_tick
+        else:
+            rounded = np.ceil(prices / safe_tick - 1e-9) * safe_tick
+        return np.where(tick > 0, rounded, prices)
+
+    def tradable_mask(self, exchange, symbols, quantities, prices):
+        """Máscara de órdenes que cumplen mínimos tras redondear (NaN = no operable)"""
+        vectors = self._vectors(exchange, symbols)
+        quantities = self.quantize_quantities(exchange, symbols, quantities)
+        prices = np.asarray(prices, dtype=float)
+        with np.errstate(invalid='ignore'):
+            return (quantities > 0) & (quantities >= vectors['min_qty']) & \
+                (quantities * prices >= vectors['min_notional'])
+
+    def taker_fees(self, exchange, symbols):
+        return self._vectors(exchange, symbols)['taker_fee']
+
+
+# Instancia global compartida por todos los motores
+symbol_metadata = SymbolMetadataStore()
@@ -0,0 +1,405 @@
+"""
+Motor multiusuario sobre el feed compartido
+Cada usuario con trading activado es un inquilino con sus límites (plan de
+SaaSManager.PLAN_FEATURES y UserSettings) guardado en memoria e indexado por
+símbolo y por conjunto de exchanges. Una cotización nueva de un símbolo se
+evalúa una vez por grupo de usuarios que comparten exchanges, no una vez por
+usuario, y las órdenes resultantes se juntan por (símbolo, compra, venta):
+una sola orden por cuenta de exchange para todo el lote, repartida después a
+prorrata. No hay hilo ni sondeo por usuario: todo corre en el núcleo
+compartido de los motores.
+"""
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime
+from opportunity_tracker import opportunity_tracker
+from leg_executor import FILLED, HEDGED
+from engine_core import Strategy, Venue, Persistence, engine_core
+
+# Spread neto mínimo según el nivel de riesgo del usuario
+RISK_MIN_SPREAD = {'LOW': 0.005, 'MEDIUM': 0.003, 'HIGH': 0.002}
+MIN_ORDER_AMOUNT = 5.0   # por usuario, en USDT
+TRADES_PER_ARBITRAGE = 2  # compra + venta: cuentan así en check_plan_limits
+
+
+def parse_list(value):
+    """preferred_exchanges / preferred_symbols: lista JSON o texto separado por comas"""
+    if not value:
+        return []
+    try:
+        items = json.loads(value)
+    except ValueError:
+        items = value.split(',')
+    return [item.strip() for item in items if item and item.strip()]
+
+
+class Tenant:
+    """Usuario con trading activado y sus límites"""
+
+    __slots__ = ('user_id', 'plan', 'exchanges', 'symbols', 'max_trade_amount', 'min_spread',
+                 'max_trades_per_day', 'trades_today', 'balance', 'balance_id', 'reserved', 'executed')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.plan = 'FREE'
+        self.exchanges = frozenset()
+        self.symbols = ()
+        self.max_trade_amount = 0.0
+        self.min_spread = RISK_MIN_SPREAD['LOW']
+        self.max_trades_per_day = 0
+        self.trades_today = 0
+        self.balance = 0.0       # USDT libre según el motor (se vuelca a UserBalance)
+        self.balance_id = None
+        self.reserved = 0.0      # USDT comprometido en lotes aún sin ejecutar
+        self.executed = {}       # (símbolo, compra, venta) -> opened_at ya operado
+
+    def to_dict(self):
+        """Límites y saldo para otro proceso (ver shard_supervisor)"""
+        return {
+            'user_id': self.user_id,
+            'plan': self.plan,
+            'exchanges': sorted(self.exchanges),
+            'symbols': list(self.symbols),
+            'max_trade_amount': self.max_trade_amount,
+            'min_spread': self.min_spread,
+            'max_trades_per_day': self.max_trades_per_day,
+            'trades_today': self.trades_today,
+            'balance': self.balance
+        }
+
+    def order_amount(self):
+        """USDT a poner en la siguiente orden, o 0 si algún límite lo impide"""
+        if self.max_trades_per_day != -1 and \
+                self.trades_today + TRADES_PER_ARBITRAGE > self.max_trades_per_day:
+            return 0.0
+        amount = min(self.max_trade_amount, self.balance - self.reserved)
+        return amount if amount >= MIN_ORDER_AMOUNT else 0.0
+
+
+class TenantEngine(Strategy):
+    """Estrategia de arbitraje para todos los usuarios suscritos"""
+
+    name = 'tenant_engine'
+    per_pair = True  # cada cotización solo reevalúa a los usuarios de su símbolo
+
+    def __init__(self, refresh_interval=60.0, tracker=None):
+        self.refresh_interval = refresh_interval
+        self.tracker = tracker or opportunity_tracker
+        self.tenants = {}       # user_id -> Tenant
+        self.index = {}         # símbolo -> {frozenset(exchanges): (spread mínimo del grupo, [Tenant])}
+        self.exchanges = frozenset()
+        self.pending = {}       # (símbolo, compra, venta) -> [(Tenant, importe, oportunidad)]
+        self.dirty = set()      # usuarios con balance pendiente de volcar
+        self.day = datetime.now().date()
+        self.lock = threading.Lock()
+        self.is_running = False
+        # Cuentas de exchange reales (venue.adapters); sin cuenta se simula al precio de la oportunidad
+        self.venue = Venue(self.name)
+        self.persistence = Persistence(self.name)
+
+    def add_account(self, exchange, adapter):
+        """Operar los lotes de este exchange contra una cuenta real"""
+        self.venue.adapters[exchange] = adapter
+
+    # Ciclo de vida
+
+    def start(self):
+        self.is_running = True
+        self.load_tenants()
+        engine_core.register(self)
+
+    def stop(self):
+        self.is_running = False
+        engine_core.unregister(self)
+
+    def setup(self, core):
+        core.every(self, self.refresh_interval, self.load_tenants)
+        core.every(self, 5.0, self.persist_balances)
+
+    def teardown(self):
+        self.persist_balances()
+
+    def markets(self):
+        return {exchange: list(self.index) for exchange in self.exchanges}
+
+    def wants(self, quote):
+        return quote['symbol'] in self.index and quote['exchange'] in self.exchanges
+
+    # Inquilinos
+
+    def load_tenants(self):
+        """Releer usuarios, planes, balances y trades de hoy con una consulta por tabla"""
+        from app import db
+        from models import Subscription, UserBalance, UserSettings, UserTrade
+        from saas_manager import SaaSManager
+        try:
+            rows = db.session.query(UserSettings, Subscription.plan_type).join(
+                Subscription, Subscription.user_id == UserSettings.user_id
+            ).filter(UserSettings.trading_enabled.is_(True), Subscription.status == 'ACTIVE').all()
+            user_ids = [settings.user_id for settings, _ in rows]
+
+            balances = {}
+            if user_ids:
+                for balance in UserBalance.query.filter(UserBalance.user_id.in_(user_ids),
+                                                        UserBalance.asset == 'USDT').all():
+                    balances.setdefault(balance.user_id, balance)
+
+            today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+            counts = dict(db.session.query(UserTrade.user_id, db.func.count(UserTrade.id)).filter(
+                UserTrade.executed_at >= today_start
+            ).group_by(UserTrade.user_id).all())
+        except Exception as e:
+            logging.error(f"Error cargando usuarios del motor multiusuario: {e}")
+            return
+
+        tenants = {}
+        for settings, plan_type in rows:
+            features = SaaSManager.PLAN_FEATURES.get(plan_type)
+            if not features or 'arbitrage' not in features['strategies']:
+                continue
+            exchanges = frozenset(exchange for exchange in parse_list(settings.preferred_exchanges)
+                                  if exchange in features['exchanges_access'])
+            balance = balances.get(settings.user_id)
+            if len(exchanges) < 2 or balance is None:
+                continue  # el arbitraje necesita dos exchanges y saldo en USDT
+
+            tenant = self.tenants.get(settings.user_id) or Tenant(settings.user_id)
+            tenant.plan = plan_type
+            tenant.exchanges = exchanges
+            tenant.symbols = tuple(parse_list(settings.preferred_symbols))
+            tenant.max_trade_amount = settings.max_trade_amount or 0.0
+            tenant.min_spread = RISK_MIN_SPREAD.get(settings.risk_level, RISK_MIN_SPREAD['LOW'])
+            tenant.max_trades_per_day = features['max_trades_per_day']
+            # Los trades y balances del motor llegan a SQL con retraso: no retroceder
+            tenant.trades_today = max(tenant.trades_today, counts.get(settings.user_id, 0))
+            if tenant.user_id not in self.dirty and not tenant.reserved:
+                tenant.balance = balance.free_balance
+            tenant.balance_id = balance.id
+            tenants[tenant.user_id] = tenant
+
+        self._install(tenants)
+
+    def set_tenants(self, snapshots):
+        """Inquilinos recibidos de otro proceso (Tenant.to_dict); conserva reservas y oportunidades operadas"""
+        tenants = {}
+        for snapshot in snapshots:
+            tenant = self.tenants.get(snapshot['user_id']) or Tenant(snapshot['user_id'])
+            tenant.plan = snapshot['plan']
+            tenant.exchanges = frozenset(snapshot['exchanges'])
+            tenant.symbols = tuple(snapshot['symbols'])
+            tenant.max_trade_amount = snapshot['max_trade_amount']
+            tenant.min_spread = snapshot['min_spread']
+            tenant.max_trades_per_day = snapshot['max_trades_per_day']
+            tenant.trades_today = max(tenant.trades_today, snapshot['trades_today'])
+            tenant.balance = snapshot['balance']
+            tenants[tenant.user_id] = tenant
+        self._install(tenants)
+
+    def apply_fill(self, user_id, amount, balance, trades_today):
+        """Resultado de una orden ejecutada en otro proceso: liberar la reserva y fijar saldo y contador"""
+        tenant = self.tenants.get(user_id)
+        if tenant is None:
+            return
+        tenant.reserved = max(0.0, tenant.reserved - amount)
+        tenant.balance = balance
+        tenant.trades_today = max(tenant.trades_today, trades_today)
+
+    def _install(self, tenants):
+        """Indexar por símbolo y grupo de exchanges y sustituir los inquilinos"""
+        index = {}
+        for tenant in tenants.values():
+            for symbol in tenant.symbols:
+                groups = index.setdefault(symbol, {})
+                min_spread, members = groups.get(tenant.exchanges, (tenant.min_spread, []))
+                members.append(tenant)
+                groups[tenant.exchanges] = (min(min_spread, tenant.min_spread), members)
+
+        exchanges = frozenset().union(*(tenant.exchanges for tenant in tenants.values()))
+        with self.lock:
+            self.tenants, self.index, self.exchanges = tenants, index, exchanges
+        if index:
+            self.tracker.track(list(exchanges), list(index))
+        logging.info(f"Motor multiusuario: {len(tenants)} usuarios, {len(index)} símbolos, "
+                     f"{sum(len(groups) for groups in index.values())} grupos")
+
+    # Evaluación
+
+    def on_quote(self, quote):
+        self.evaluate(quote['symbol'])
+
+    def evaluate(self, symbol):
+        if self.collect(symbol):
+            # Detrás de las cotizaciones ya encoladas: un lote recoge todas las del ciclo
+            self.core.post_once(self, 'flush', self.flush)
+
+    def collect(self, symbol):
+        """Mejor oportunidad del símbolo por grupo de exchanges y orden para cada usuario que la admite
+
+        Las órdenes quedan en self.pending; devuelve si hay alguna.
+        """
+        groups = self.index.get(symbol)
+        if not groups:
+            return False
+        self._roll_day()
+
+        for exchanges, (min_spread, tenants) in groups.items():
+            best = self.tracker.top(1, min_spread, exchanges=exchanges, symbols=(symbol,))
+            if not best:
+                continue
+            opportunity = best[0]
+            key = (symbol, opportunity['buy_exchange'], opportunity['sell_exchange'])
+            net_spread = opportunity['net_spread_percentage'] / 100
+            for tenant in tenants:
+                if net_spread <= tenant.min_spread or tenant.executed.get(key) == opportunity['opened_at']:
+                    continue
+                amount = tenant.order_amount()
+                if not amount:
+                    continue
+                tenant.executed[key] = opportunity['opened_at']
+                tenant.reserved += amount
+                self.pending.setdefault(key, []).append((tenant, amount, opportunity))
+
+        return bool(self.pending)
+
+    def _roll_day(self):
+        today = datetime.now().date()
+        if today != self.day:
+            self.day = today
+            for tenant in self.tenants.values():
+                tenant.trades_today = 0
+
+    # Ejecución por lotes
+
+    def flush(self):
+        """Una orden por cuenta de exchange y lote; fills repartidos a prorrata -> [(Tenant, importe)]
+
+        Los lotes contra cuentas reales corren en el pool de E/S del núcleo y se
+        liquidan al volver al bucle (on_settled); aquí solo se devuelven los demás.
+        """
+        batches, self.pending = self.pending, {}
+        settled = []
+        for key, orders in batches.items():
+            symbol, buy_exchange, sell_exchange = key
+            opportunity = orders[-1][2]
+            quantity = sum(amount for _, amount, _ in orders) / opportunity['buy_price']
+            if self.core is not None and self._live(buy_exchange, sell_exchange):
+                self.core.submit(self, self._execute, symbol, buy_exchange, sell_exchange, quantity, opportunity,
+                                 then=lambda fill, key=key, orders=orders: self.on_settled(self._settle(key, orders, fill)))
+                continue
+            try:
+                fill = self._execute(symbol, buy_exchange, sell_exchange, quantity, opportunity)
+            except Exception as e:
+                logging.error(f"Error ejecutando lote {symbol} {buy_exchange}->{sell_exchange}: {e}")
+                fill = None
+            settled += self._settle(key, orders, fill)
+        return settled
+
+    def _settle(self, key, orders, fill):
+        """Liberar las reservas del lote y repartir el fill -> [(Tenant, importe)]"""
+        symbol, buy_exchange, sell_exchange = key
+        total = sum(amount for _, amount, _ in orders)
+        settled = []
+        for tenant, amount, _ in orders:
+            tenant.reserved -= amount
+            if fill is not None:
+                self._allocate(tenant, amount / total, symbol, buy_exchange, sell_exchange, fill)
+            settled.append((tenant, amount))
+        logging.info(f"Lote {symbol} {buy_exchange}->{sell_exchange}: {len(orders)} usuarios, ${total:.2f}"
+                     f"{'' if fill else ' sin ejecutar'}")
+        return settled
+
+    def on_settled(self, settled):
+        """Lotes contra cuentas reales liquidados de vuelta en el bucle"""
+
+    def _live(self, buy_exchange, sell_exchange):
+        return buy_exchange in self.venue.adapters and sell_exchange in self.venue.adapters
+
+    def _execute(self, symbol, buy_exchange, sell_exchange, quantity, opportunity):
+        """Ejecutar el lote -> (cantidad, precio compra, precio venta, comisiones, id, estrategia) o None"""
+        if self._live(buy_exchange, sell_exchange):
+            execution = self.venue.execute_pair(buy_exchange, sell_exchange, symbol, quantity,
+                                                opportunity['buy_price'], on_late=self._late_fill)
+            if execution.status not in (FILLED, HEDGED) or not execution.buy or not execution.sell:
+                logging.warning(f"Lote {symbol} terminó {execution.status}: {execution.error}")
+                return None
+            quantity = min(execution.buy.filled_qty, execution.sell.filled_qty)
+            return (quantity, execution.buy.avg_price, execution.sell.avg_price,
+                    execution.buy.fee + execution.sell.fee, execution.buy.order_id, 'arbitrage')
+
+        # Sin cuenta real: simulación al precio de la oportunidad con el coste de cada pata
+        buy_price, sell_price = opportunity['buy_price'], opportunity['sell_price']
+        fees = quantity * (buy_price * opportunity['buy_fee'] + sell_price * opportunity['sell_fee'])
+        return quantity, buy_price, sell_price, fees, f"SIM_{uuid.uuid4().hex[:12]}", 'arbitrage_simulation'
+
+    def _late_fill(self, execution, orders):
+        """Fill tardío de un lote ya liquidado como no ejecutado: queda en la cuenta, sin repartir"""
+        self.persistence.alert(
+            'Fill Tardío de Lote',
+            f"{execution.symbol} {execution.buy_exchange}->{execution.sell_exchange}: {len(orders)} órdenes "
+            f"tras leg_timeout ({execution.status}, residual {execution.residual})",
+            'WARNING'
+        )
+
+    def _allocate(self, tenant, share, symbol, buy_exchange, sell_exchange, fill):
+        quantity, buy_price, sell_price, fees, order_id, strategy = fill
+        quantity *= share
+        fees *= share
+        profit = quantity * (sell_price - buy_price) - fees
+        for side, exchange, price, profit_loss in (('BUY', buy_exchange, buy_price, 0.0),
+                                                   ('SELL', sell_exchange, sell_price, profit)):
+            self.persistence.record_row(
+                'UserTrade',
+                user_id=tenant.user_id,
+                symbol=symbol,
+                side=side,
+                quantity=quantity,
+                price=price,
+                total_value=quantity * price,
+                fee=fees / 2,
+                strategy=strategy,
+                profit_loss=profit_loss,
+                exchange=exchange.upper(),
+                order_id=order_id
+            )
+        tenant.balance += profit
+        tenant.trades_today += TRADES_PER_ARBITRAGE
+        self.dirty.add(tenant.user_id)
+
+    def persist_balances(self):
+        """Volcar en bloque los balances USDT que cambiaron"""
+        dirty, self.dirty = self.dirty, set()
+        mappings = []
+        for user_id in dirty:
+            tenant = self.tenants.get(user_id)
+            if tenant is None or tenant.balance_id is None:
+                continue
+            total = tenant.balance
+            mappings.append({'id': tenant.balance_id, 'free_balance': total, 'total_balance': total,
+                             'usd_value': total, 'updated_at': datetime.utcnow()})
+        if not mappings:
+            return
+        from app import db
+        from models import UserBalance
+        try:
+            db.session.bulk_update_mappings(UserBalance, mappings)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.dirty |= dirty
+            logging.error(f"Error guardando balances de usuarios: {e}")
+
+    def get_status(self):
+        return {
+            'running': self.is_running,
+            'tenants': len(self.tenants),
+            'symbols': len(self.index),
+            'groups': sum(len(groups) for groups in self.index.values()),
+            'exchanges': sorted(self.exchanges),
+            'pending_batches': len(self.pending)
+        }
+
+
+# Instancia global del motor
+tenant_engine = TenantEngine()
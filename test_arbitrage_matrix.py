@@ -0,0 +1,89 @@
+"""Tests de la matriz de arbitraje entre exchanges (spreads y top-K)"""
+import math
+import numpy as np
+import arbitrage_matrix
+from arbitrage_matrix import ArbitrageMatrix
+
+
+def make_matrix(fee=0.0, volume=None):
+    # BTC: comprar en A (ask 100) y vender en B (bid 103); ETH: comprar en B (ask 10) y vender en C (bid 10.5)
+    bid = [[99.0, 103.0, 100.0],
+           [9.9, 9.8, 10.5]]
+    ask = [[100.0, 104.0, 101.0],
+           [10.2, 10.0, 10.6]]
+    return ArbitrageMatrix(['BTC/USDT', 'ETH/USDT'], ['a', 'b', 'c'], bid, ask, volume=volume, fee=fee)
+
+
+def test_gross_spreads_buy_ask_against_sell_bid():
+    spreads = make_matrix().gross_spreads()
+    assert spreads.shape == (2, 3, 3)
+    assert math.isclose(spreads[0, 0, 1], (103.0 - 100.0) / 100.0)
+    assert math.isclose(spreads[1, 1, 2], (10.5 - 10.0) / 10.0)
+
+
+def test_net_spreads_charge_both_legs():
+    net = make_matrix(fee=0.001).net_spreads()
+    expected = (103.0 * 0.999 - 100.0 * 1.001) / (100.0 * 1.001)
+    assert math.isclose(net[0, 0, 1], expected)
+
+
+def test_top_is_sorted_and_skips_same_exchange():
+    top = make_matrix().top(k=10)
+    assert [(o['symbol'], o['buy_exchange'], o['sell_exchange']) for o in top[:2]] == [
+        ('ETH/USDT', 'b', 'c'), ('BTC/USDT', 'a', 'b')
+    ]
+    spreads = [o['spread_percentage'] for o in top]
+    assert spreads == sorted(spreads, reverse=True)
+    assert all(o['buy_exchange'] != o['sell_exchange'] for o in top)
+
+
+def test_top_respects_k_and_min_spread():
+    matrix = make_matrix()
+    assert len(matrix.top(k=1)) == 1
+    assert matrix.top(k=5, min_spread=0.04) == [matrix.top(k=1)[0]]
+    assert matrix.top(k=5, min_spread=1.0) == []
+    assert matrix.best(min_spread=1.0) is None
+
+
+def test_missing_quotes_are_ignored():
+    matrix = make_matrix()
+    matrix.bid[1, 2] = np.nan  # ETH sin bid en c: solo quedaba esa oportunidad de ETH
+    assert set(matrix.best_per_symbol()) == {'BTC/USDT'}
+
+
+def test_illiquid_exchanges_are_ignored():
+    matrix = make_matrix(volume=[[10.0, 0.0, 10.0], [10.0, 10.0, 10.0]])
+    best = matrix.best_per_symbol(min_volume=1.0)
+    assert set(best) == {'ETH/USDT'}  # BTC solo tenía spread vendiendo en b, sin volumen
+
+
+def test_best_per_symbol_picks_each_symbols_best_pair():
+    best = make_matrix().best_per_symbol()
+    assert (best['BTC/USDT']['buy_exchange'], best['BTC/USDT']['sell_exchange']) == ('a', 'b')
+    assert (best['ETH/USDT']['buy_exchange'], best['ETH/USDT']['sell_exchange']) == ('b', 'c')
+
+
+def test_from_prices_drops_exchanges_without_quotes():
+    matrix = ArbitrageMatrix.from_prices('BTC/USDT', {
+        'a': {'bid': 99.0, 'ask': 100.0},
+        'b': {'bid': 102.0, 'ask': 103.0},
+        'c': {'bid': None, 'ask': None},
+    }, fees=0.0)
+    assert matrix.exchanges == ['a', 'b']
+    assert matrix.best()['sell_exchange'] == 'b'
+
+
+def test_notional_drops_legs_below_exchange_minimums(monkeypatch):
+    class FakeMetadata:
+        def tradable_mask(self, exchange, symbols, quantities, prices):
+            # c no acepta órdenes de menos de 50 de nocional
+            return np.asarray(quantities) * np.asarray(prices) >= (50.0 if exchange == 'c' else 0.0)
+
+    monkeypatch.setattr(arbitrage_matrix, 'symbol_metadata', FakeMetadata())
+    prices = {
+        'a': {'bid': 99.0, 'ask': 100.0},
+        'b': {'bid': 101.0, 'ask': 102.0},
+        'c': {'bid': 103.0, 'ask': 104.0},
+    }
+    assert ArbitrageMatrix.from_prices('BTC/USDT', prices, fees=0.0).best()['sell_exchange'] == 'c'
+    assert ArbitrageMatrix.from_prices('BTC/USDT', prices, fees=0.0, notional=10.0).best()['sell_exchange'] == 'b'
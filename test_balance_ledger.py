@@ -0,0 +1,144 @@
+"""Tests del libro de balances: fotos, fills y volcado solo de las filas que cambian"""
+import sys
+import time
+import types
+import pytest
+import balance_ledger as balance_ledger_module
+from balance_ledger import BalanceLedger
+from market_types import AssetBalance, OrderResult
+
+PRICES = {'USDT': 1.0, 'BTC': 60000.0, 'ETH': 3000.0}
+
+
+class FakeValuation:
+    def value_all(self, amounts, exchange=None):
+        return {asset: amount * PRICES.get(asset, 0.0) for asset, amount in amounts.items()}
+
+
+class FakeSession:
+    def __init__(self):
+        self.updates, self.inserts, self.deletes, self.commits = [], [], [], 0
+        self.next_id = 100
+        self.fail = False
+
+    def bulk_update_mappings(self, model, mappings):
+        self.updates.append(mappings)
+
+    def bulk_insert_mappings(self, model, mappings, return_defaults=False):
+        for mapping in mappings:
+            mapping['id'] = self.next_id
+            self.next_id += 1
+        self.inserts.append(mappings)
+
+    def commit(self):
+        if self.fail:
+            raise RuntimeError('base de datos no disponible')
+        self.commits += 1
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """app y models falsos: persist() los importa al volcar"""
+    session = FakeSession()
+
+    class Column:
+        def in_(self, ids):
+            return ids
+
+    class Query:
+        def filter(self, ids):
+            return types.SimpleNamespace(delete=lambda synchronize_session=None: session.deletes.append(list(ids)))
+
+    class Balance:
+        id = Column()
+        query = Query()
+
+    class Context:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    app_module = types.ModuleType('app')
+    app_module.app = types.SimpleNamespace(app_context=Context)
+    app_module.db = types.SimpleNamespace(session=session)
+    models_module = types.ModuleType('models')
+    models_module.Balance = Balance
+    monkeypatch.setitem(sys.modules, 'app', app_module)
+    monkeypatch.setitem(sys.modules, 'models', models_module)
+    return session
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    monkeypatch.setattr(balance_ledger_module, 'usd_valuation', FakeValuation())
+    ledger = BalanceLedger()
+    # Ya cargado y alimentado por un motor, sin hilo de volcado
+    ledger.loaded_at = time.time()
+    ledger.is_running = ledger.live = True
+    return ledger
+
+
+def test_snapshot_values_and_marks_rows_dirty(ledger):
+    total = ledger.apply_snapshot('binance', {'USDT': AssetBalance('USDT', 100.0),
+                                              'BTC': AssetBalance('BTC', 0.01, 0.01),
+                                              'ETH': AssetBalance('ETH', 0.0)})
+    assert total == 100.0 + 0.02 * 60000.0
+    assert ledger.dirty == {('BINANCE', 'USDT'), ('BINANCE', 'BTC')}
+    assert [entry.asset for entry in ledger.snapshot('Binance')] == ['BTC', 'USDT']
+
+
+def test_fill_moves_base_and_quote(ledger):
+    ledger.apply_snapshot('binance', {'USDT': AssetBalance('USDT', 100.0)})
+    ledger.apply_fill(OrderResult('binance', 'BTC/USDT', 'BUY', True, filled_qty=0.001, avg_price=60000.0,
+                                  cost=60.0, fee=0.06))
+    assert ledger.free('binance', 'USDT') == pytest.approx(39.94)
+    assert ledger.free('binance', 'BTC') == 0.001
+
+
+def test_persist_inserts_then_updates_only_changed_rows(ledger, session):
+    ledger.apply_snapshot('binance', {'USDT': AssetBalance('USDT', 100.0), 'BTC': AssetBalance('BTC', 0.01)})
+    assert ledger.persist() == 2
+    assert sorted(mapping['asset'] for mapping in session.inserts[0]) == ['BTC', 'USDT']
+    assert ledger.dirty == set()
+
+    # Misma foto: nada que escribir
+    ledger.apply_snapshot('binance', {'USDT': AssetBalance('USDT', 100.0), 'BTC': AssetBalance('BTC', 0.01)})
+    assert ledger.persist() == 0
+
+    ledger.adjust('binance', {'USDT': -10.0})
+    assert ledger.persist() == 1
+    assert [(mapping['asset'], mapping['free_balance']) for mapping in session.updates[0]] == [('USDT', 90.0)]
+    assert session.updates[0][0]['id'] == ledger.ids[('BINANCE', 'USDT')]
+
+
+def test_small_revaluation_is_not_written(ledger, session):
+    ledger.apply_snapshot('binance', {'BTC': AssetBalance('BTC', 0.01)})
+    ledger.persist()
+    PRICES['BTC'] = 60000.0 * 1.0005  # por debajo de USD_TOLERANCE
+    try:
+        ledger.apply_snapshot('binance', {'BTC': AssetBalance('BTC', 0.01)})
+    finally:
+        PRICES['BTC'] = 60000.0
+    assert ledger.dirty == set()
+
+
+def test_vanished_asset_deletes_its_row(ledger, session):
+    ledger.apply_snapshot('binance', {'USDT': AssetBalance('USDT', 100.0), 'BTC': AssetBalance('BTC', 0.01)})
+    ledger.persist()
+    btc_id = ledger.ids[('BINANCE', 'BTC')]
+    ledger.apply_snapshot('binance', {'USDT': AssetBalance('USDT', 100.0)})
+    assert ledger.persist() == 1
+    assert session.deletes == [[btc_id]]
+    assert ('BINANCE', 'BTC') not in ledger.ids
+
+
+def test_failed_persist_keeps_rows_dirty(ledger, session):
+    ledger.apply_snapshot('binance', {'USDT': AssetBalance('USDT', 100.0)})
+    session.fail = True
+    assert ledger.persist() == 0
+    assert ledger.dirty == {('BINANCE', 'USDT')}
+    session.fail = False
+    assert ledger.persist() == 1
+    assert ledger.dirty == set()
@@ -0,0 +1,63 @@
+"""Tests del libro local de Binance: eventos viejos, evento puente y resincronización por hueco"""
+from binance_depth_stream import BinanceDepthStream
+
+
+def make_stream(last_update_id=100):
+    stream = BinanceDepthStream(client=None, symbols=['BTCUSDT'])
+    stream.requested = []
+    stream._request_snapshot = lambda symbol, delay=0: stream.requested.append((symbol, delay))
+    book = stream.books['BTCUSDT']
+    book.load_snapshot([['99', '1']], [['101', '1']], last_update_id)
+    return stream, book
+
+
+def event(first_id, last_id, bids=(), asks=()):
+    return {'s': 'BTCUSDT', 'U': first_id, 'u': last_id, 'b': list(bids), 'a': list(asks)}
+
+
+def test_event_already_in_the_snapshot_is_ignored():
+    stream, book = make_stream()
+    assert stream._apply_event(book, event(90, 100, bids=[['99', '5']]))
+    assert book.bids == {99.0: 1.0}
+    assert book.last_update_id == 100 and not book.synced
+
+
+def test_first_event_must_bridge_the_snapshot():
+    stream, book = make_stream()
+    assert stream._apply_event(book, event(95, 105, bids=[['99', '0'], ['98', '2']]))
+    assert book.synced and book.last_update_id == 105
+    assert book.bids == {98.0: 2.0}
+
+    # Ya sincronizado, el siguiente tiene que empezar justo tras el anterior
+    assert stream._apply_event(book, event(106, 110, asks=[['102', '3']]))
+    assert book.asks == {101.0: 1.0, 102.0: 3.0}
+    assert stream.requested == []
+
+
+def test_event_past_the_snapshot_forces_a_resync():
+    stream, book = make_stream()
+    late = event(102, 105)
+    assert not stream._apply_event(book, late)
+    assert book.last_update_id is None and book.bids == {}
+    assert stream.buffers['BTCUSDT'] == [late]
+    assert stream.requested == [('BTCUSDT', 0.5)]
+
+
+def test_gap_after_sync_forces_a_resync():
+    stream, book = make_stream()
+    assert stream._apply_event(book, event(100, 101))
+    gap = event(103, 104)
+    assert not stream._apply_event(book, gap)
+    assert not book.synced and book.last_update_id is None
+    assert stream.buffers['BTCUSDT'] == [gap]
+    assert stream.requested == [('BTCUSDT', 0.5)]
+
+
+def test_events_before_the_snapshot_are_buffered():
+    stream = BinanceDepthStream(client=None, symbols=['BTCUSDT'])
+    stream.requested = []
+    stream._request_snapshot = lambda symbol, delay=0: stream.requested.append((symbol, delay))
+    first = event(1, 2)
+    stream._on_event('BTCUSDT', first)
+    assert stream.buffers['BTCUSDT'] == [first]
+    assert stream.requested == [('BTCUSDT', 0)]
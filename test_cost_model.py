@@ -0,0 +1,72 @@
+"""Tests del modelo de costes: comisiones cacheadas y metadatos ausentes"""
+import math
+import cost_model as cost_model_module
+from cost_model import CostModel
+from symbol_metadata import DEFAULT_FEE
+
+
+class FakeRules:
+    taker_fee = 0.001
+    maker_fee = 0.0005
+
+
+class FakeMetadata:
+    def __init__(self, rules=None):
+        self.rules = rules
+        self.calls = 0
+
+    def get(self, exchange, symbol):
+        self.calls += 1
+        return self.rules
+
+
+class FakeHub:
+    def subscribe(self, callback, symbol=None, exchange=None):
+        return symbol, exchange, callback
+
+    def unsubscribe(self, token):
+        pass
+
+
+def make_model(monkeypatch, rules=None, **kwargs):
+    metadata = FakeMetadata(rules)
+    monkeypatch.setattr(cost_model_module, 'symbol_metadata', metadata)
+    return CostModel(hub=FakeHub(), **kwargs), metadata
+
+
+def test_leg_cost_uses_metadata_fees(monkeypatch):
+    model, _ = make_model(monkeypatch, FakeRules())
+    assert model.leg_cost('binance', 'BTC/USDT') == FakeRules.taker_fee
+    assert model.leg_cost('binance', 'BTC/USDT', maker=True) == FakeRules.maker_fee
+
+
+def test_aliases_share_the_cache(monkeypatch):
+    model, metadata = make_model(monkeypatch, FakeRules())
+    model.leg_cost('binance_spot', 'BTC/USDT')
+    model.leg_cost('binance', 'BTC/USDT')
+    assert metadata.calls == 1
+
+
+def test_refresh_keeps_known_fees_while_metadata_is_missing(monkeypatch):
+    model, metadata = make_model(monkeypatch, FakeRules())
+    model.leg_cost('binance', 'BTC/USDT')
+    metadata.rules = None
+    model.refresh()
+    assert model.leg_cost('binance', 'BTC/USDT') == FakeRules.taker_fee
+
+
+def test_fees_are_picked_up_once_metadata_appears(monkeypatch):
+    model, metadata = make_model(monkeypatch)
+    assert model.leg_cost('binance', 'BTC/USDT') == DEFAULT_FEE
+    metadata.rules = FakeRules()
+    model.refresh()
+    assert model.leg_cost('binance', 'BTC/USDT') == FakeRules.taker_fee
+
+
+def test_adverse_selection_grows_with_volatility(monkeypatch):
+    model, _ = make_model(monkeypatch, FakeRules(), default_latency=1.0, volatility_halflife=1e-9)
+    model.on_quote({'exchange': 'binance', 'symbol': 'BTC/USDT', 'bid': 100.0, 'ask': 100.0, 'received_at': 0.0})
+    model.on_quote({'exchange': 'binance', 'symbol': 'BTC/USDT', 'bid': 101.0, 'ask': 101.0, 'received_at': 1.0})
+    model.refresh()
+    expected = FakeRules.taker_fee + abs(math.log(101.0 / 100.0))
+    assert math.isclose(model.leg_cost('binance', 'BTC/USDT'), expected, rel_tol=1e-6)
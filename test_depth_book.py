@@ -0,0 +1,69 @@
+"""Tests numéricos del libro NumPy: niveles a medio consumir, libro agotado y tope de slippage"""
+import math
+import numpy as np
+from depth_book import DepthBook
+
+
+def make_book():
+    return DepthBook.from_levels(
+        bids=[['98', '2'], ['99', '1']],  # desordenados a propósito
+        asks=[['100', '1'], ['101', '2'], ['102', '1']]
+    )
+
+
+def test_levels_are_sorted():
+    book = make_book()
+    assert book.best_bid == 99.0 and book.best_ask == 100.0
+    assert book.mid == 99.5
+
+
+def test_base_for_quote_partially_consumes_a_level():
+    book = make_book()
+    assert book.base_for_quote(100.0) == 1.0
+    assert math.isclose(book.base_for_quote(150.0), 1.0 + 50.0 / 101.0)
+    assert math.isclose(book.base_for_quote(148.5, side='SELL'), 1.0 + 49.5 / 98.0)
+
+
+def test_quote_for_base_and_vwaps():
+    book = make_book()
+    assert book.quote_for_base(1.0) == 100.0
+    assert book.quote_for_base(2.5) == 100.0 + 1.5 * 101.0
+    quote, vwap = book.cost_to_buy(2.0)
+    assert quote == 201.0 and vwap == 100.5
+    quote, vwap = book.vwap_to_sell(2.0)
+    assert quote == 197.0 and vwap == 98.5
+    base, vwap = book.cost_to_buy_quote(201.0)
+    assert math.isclose(base, 2.0) and math.isclose(vwap, 100.5)
+
+
+def test_exhausted_book_is_nan():
+    book = make_book()
+    assert math.isnan(book.quote_for_base(4.5))
+    assert math.isnan(book.base_for_quote(405.0))
+    assert math.isnan(book.vwap_to_sell(3.5)[1])
+    assert book.quote_for_base(4.0) == 404.0  # justo el libro entero sí cabe
+
+
+def test_queries_accept_arrays():
+    book = make_book()
+    np.testing.assert_allclose(book.quote_for_base([0.5, 2.0, 10.0]), [50.0, 201.0, np.nan])
+
+
+def test_max_quote_stops_where_the_vwap_hits_the_cap():
+    book = make_book()
+    # 50 bps sobre 100: el VWAP llega a 100.5 tras tomar 1 unidad del segundo nivel
+    quote = book.max_quote_within_slippage(50)
+    assert math.isclose(quote, 201.0)
+    assert math.isclose(book.slippage_bps(quote), 50.0)
+
+    quote = book.max_quote_within_slippage(50, side='SELL')
+    assert math.isclose(book.slippage_bps(quote, side='SELL'), 50.0)
+    assert 99.0 < quote < 99.0 + 2 * 98.0
+
+
+def test_max_quote_is_capped_by_the_book():
+    book = make_book()
+    assert book.max_quote_within_slippage(0) == 100.0
+    assert book.max_quote_within_slippage(1000) == 404.0
+    assert DepthBook.from_levels([], []).max_quote_within_slippage(50) == 0.0
+    assert math.isnan(DepthBook.from_levels([], []).base_for_quote(10.0))
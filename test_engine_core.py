@@ -0,0 +1,182 @@
+"""Tests del núcleo de motores: registro, reparto de cotizaciones, salidas y aislamiento de errores"""
+import contextlib
+import sys
+import threading
+import types
+import pytest
+from engine_core import EngineCore, Strategy
+from engine_loop import PRIORITY_HOUSEKEEPING
+
+
+class FakeHub:
+    def __init__(self):
+        self.callbacks = []
+        self.watched = {}
+
+    def watch(self, exchange, symbols, credentials=None):
+        self.watched.setdefault(exchange, set()).update(symbols)
+
+    def subscribe(self, callback, symbol=None, exchange=None):
+        self.callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, token):
+        if token in self.callbacks:
+            self.callbacks.remove(token)
+
+    def start(self):
+        pass
+
+    def publish(self, exchange, symbol, bid, last=None):
+        quote = {'exchange': exchange, 'symbol': symbol, 'bid': bid, 'last': last or bid}
+        for callback in list(self.callbacks):
+            callback(quote)
+
+
+class RecordingStrategy(Strategy):
+    def __init__(self, name, exchange='binance', symbols=('BTC/USDT',), fail=False):
+        self.name = name
+        self.exchange = exchange
+        self.symbols = list(symbols)
+        self.fail = fail
+        self.quotes, self.exits, self.errors = [], [], []
+        self.torn_down = False
+
+    def markets(self):
+        return {self.exchange: self.symbols}
+
+    def on_quote(self, quote):
+        if self.fail:
+            raise RuntimeError('estrategia rota')
+        self.quotes.append((quote['exchange'], quote['symbol'], quote['bid']))
+
+    def on_exit(self, position_id, position, reason, price):
+        self.exits.append((position_id, reason, price))
+
+    def on_error(self, error):
+        self.errors.append(str(error))
+
+    def teardown(self):
+        self.torn_down = True
+
+
+@pytest.fixture
+def fake_app(monkeypatch):
+    """Los trabajos del pool de E/S corren dentro de app.app_context()"""
+    app = types.SimpleNamespace(app_context=contextlib.nullcontext)
+    monkeypatch.setitem(sys.modules, 'app', types.SimpleNamespace(app=app))
+
+
+def make_core():
+    core = EngineCore(hub=FakeHub())
+    core.is_running = True  # sin hilo propio: el bucle se atiende en el test
+    return core
+
+
+def drain(core):
+    core.loop.call_soon(core.loop.stop, priority=PRIORITY_HOUSEKEEPING + 1)
+    core.loop.run()
+
+
+def test_register_watches_markets_once():
+    core = make_core()
+    strategy = RecordingStrategy('a')
+    core.register(strategy)
+    core.register(strategy)
+    assert strategy.core is core
+    assert core.hub.watched == {'binance': {'BTC/USDT'}}
+    assert len(core.hub.callbacks) == 1
+
+
+def test_quotes_reach_only_interested_strategies():
+    core = make_core()
+    btc, eth = RecordingStrategy('btc'), RecordingStrategy('eth', symbols=('ETH/USDT',))
+    core.register(btc)
+    core.register(eth)
+    core.hub.publish('binance', 'BTC/USDT', 100.0)
+    core.hub.publish('binance', 'BTC/USDT', 101.0)
+    core.hub.publish('kucoin', 'ETH/USDT', 10.0)
+    drain(core)
+    assert btc.quotes == [('binance', 'BTC/USDT', 101.0)]  # fundidas mientras esperaban
+    assert eth.quotes == []
+
+
+def test_failing_strategy_does_not_stop_the_others():
+    core = make_core()
+    broken, healthy = RecordingStrategy('broken', fail=True), RecordingStrategy('healthy')
+    core.register(broken)
+    core.register(healthy)
+    core.hub.publish('binance', 'BTC/USDT', 100.0)
+    drain(core)
+    assert broken.errors == ['estrategia rota']
+    assert healthy.quotes == [('binance', 'BTC/USDT', 100.0)]
+
+
+def test_position_exits_go_to_their_strategy():
+    core = make_core()
+    first, second = RecordingStrategy('first'), RecordingStrategy('second')
+    core.register(first)
+    core.register(second)
+    core.track(first, 'p1', 'binance', 'BTC/USDT', stop_price=95.0)
+    core.track(second, 'p1', 'binance', 'BTC/USDT', target_price=105.0)
+    core.hub.publish('binance', 'BTC/USDT', 94.0)
+    drain(core)
+    assert first.exits == [('p1', 'STOP_LOSS', 94.0)]
+    assert second.exits == []
+
+
+def test_unregister_drops_positions_and_tears_down():
+    core = make_core()
+    strategy = RecordingStrategy('a')
+    core.register(strategy)
+    core.track(strategy, 'p1', 'binance', 'BTC/USDT', stop_price=95.0)
+    core.unregister(strategy)
+    assert strategy.torn_down
+    assert len(core.books['bid']) == 0
+    core.hub.publish('binance', 'BTC/USDT', 90.0)
+    drain(core)
+    assert strategy.exits == [] and strategy.quotes == []
+
+
+def test_blocking_work_runs_off_the_loop_and_reports_back(fake_app):
+    core = make_core()
+    strategy = RecordingStrategy('a')
+    core.register(strategy)
+    threads, results = [], []
+
+    def work(value):
+        threads.append(threading.current_thread().name)
+        return value * 2
+
+    core.submit(strategy, work, 21, then=lambda result: results.append((threading.current_thread().name, result)))
+    core.io.shutdown(wait=True)
+    drain(core)
+    assert threads[0].startswith('engine-io')
+    assert results == [(threading.current_thread().name, 42)]  # then() vuelve al hilo del bucle
+
+
+def test_failed_work_goes_to_on_error_and_then_gets_none(fake_app):
+    core = make_core()
+    strategy = RecordingStrategy('a')
+    core.register(strategy)
+    results = []
+
+    def broken():
+        raise RuntimeError('exchange caído')
+
+    core.submit(strategy, broken, then=results.append)
+    core.io.shutdown(wait=True)
+    drain(core)
+    assert strategy.errors == ['exchange caído']
+    assert results == [None]
+
+
+def test_same_key_is_not_submitted_twice_while_running(fake_app):
+    core = make_core()
+    strategy = RecordingStrategy('a')
+    release = threading.Event()
+    assert core.submit(strategy, release.wait, 5, key='balances')
+    assert not core.submit(strategy, release.wait, 5, key='balances')
+    release.set()
+    core.io.shutdown(wait=True)
+    assert core.busy == set()
@@ -0,0 +1,109 @@
+"""Tests del bucle de eventos: prioridades, coalescencia, temporizadores y parada"""
+import threading
+from engine_loop import PRIORITY_CONTROL, PRIORITY_EXIT, PRIORITY_HOUSEKEEPING, PRIORITY_MARKET, EngineLoop
+
+
+class FakeHub:
+    def __init__(self):
+        self.callbacks = []
+
+    def subscribe(self, callback, symbol=None, exchange=None):
+        self.callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, token):
+        self.callbacks.remove(token)
+
+    def publish(self, quote):
+        for callback in list(self.callbacks):
+            callback(quote)
+
+
+def make_loop():
+    return EngineLoop('test', hub=FakeHub())
+
+
+def run_until_idle(loop):
+    """Atender lo encolado en este hilo y parar al llegar a la tarea de menor prioridad"""
+    loop.call_soon(loop.stop, priority=PRIORITY_HOUSEKEEPING + 1)
+    loop.run()
+
+
+def test_events_run_by_priority_then_arrival():
+    loop, seen = make_loop(), []
+    loop.call_soon(seen.append, 'market-1')
+    loop.call_soon(seen.append, 'housekeeping', priority=PRIORITY_HOUSEKEEPING)
+    loop.call_soon(seen.append, 'exit', priority=PRIORITY_EXIT)
+    loop.call_soon(seen.append, 'market-2')
+    loop.call_soon(seen.append, 'control', priority=PRIORITY_CONTROL)
+    run_until_idle(loop)
+    assert seen == ['control', 'exit', 'market-1', 'market-2', 'housekeeping']
+
+
+def test_post_once_coalesces_pending_calls():
+    loop, seen = make_loop(), []
+    for _ in range(3):
+        loop.post_once('scan', lambda: seen.append('scan'))
+    run_until_idle(loop)
+    loop.post_once('scan', lambda: seen.append('scan'))
+    run_until_idle(loop)
+    assert seen == ['scan', 'scan']
+
+
+def test_quotes_fold_into_the_latest_per_pair():
+    loop, seen = make_loop(), []
+    loop.subscribe_quotes(lambda quote: seen.append((quote['symbol'], quote['bid'])))
+    for bid in (1.0, 2.0, 3.0):
+        loop.hub.publish({'exchange': 'a', 'symbol': 'BTC/USDT', 'bid': bid})
+    loop.hub.publish({'exchange': 'a', 'symbol': 'ETH/USDT', 'bid': 10.0})
+    run_until_idle(loop)
+    assert seen == [('BTC/USDT', 3.0), ('ETH/USDT', 10.0)]
+
+
+def test_quotes_filtered_by_accept():
+    loop, seen = make_loop(), []
+    loop.subscribe_quotes(seen.append, accept=lambda quote: quote['exchange'] == 'a')
+    loop.hub.publish({'exchange': 'b', 'symbol': 'BTC/USDT', 'bid': 1.0})
+    run_until_idle(loop)
+    assert seen == []
+
+
+def test_stop_keeps_queued_exits_and_drops_scans():
+    loop, seen = make_loop(), []
+    loop.call_soon(seen.append, 'scan', priority=PRIORITY_MARKET)
+    loop.call_soon(seen.append, 'exit', priority=PRIORITY_EXIT)
+    loop.stop()
+    loop.call_soon(seen.append, 'late exit', priority=PRIORITY_EXIT)
+    loop.run()
+    assert seen == ['exit']
+    # La salida encolada tras stop() sobrevive para el siguiente run()
+    run_until_idle(loop)
+    assert seen == ['exit', 'late exit']
+
+
+def test_timers_fire_and_errors_do_not_stop_the_loop():
+    loop, seen, errors = make_loop(), [], []
+    done = threading.Event()
+
+    def tick():
+        seen.append('tick')
+        if len(seen) == 3:
+            done.set()
+            raise RuntimeError('fallo en el manejador')
+
+    loop.on_error = lambda event, error: errors.append(str(error))
+    loop.every(0.01, tick)
+    loop.start()
+    assert done.wait(2)
+    loop.stop()
+    loop.thread.join(2)
+    assert len(seen) >= 3
+    assert errors == ['fallo en el manejador']
+
+
+def test_executor_posts_exits():
+    loop, seen = make_loop(), []
+    loop.call_soon(seen.append, 'scan')
+    loop.executor().submit(seen.append, 'exit')
+    run_until_idle(loop)
+    assert seen == ['exit', 'scan']
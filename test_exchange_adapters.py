@@ -0,0 +1,43 @@
+"""Tests de los adaptadores: órdenes de Binance con cantidades en texto según las reglas"""
+import exchange_adapters
+from exchange_adapters import BinanceAdapter
+from symbol_metadata import SymbolMetadataStore, SymbolRules
+
+
+class FakeClient:
+    """Guarda lo que recibe cada orden y responde con una ejecución completa"""
+
+    def __init__(self):
+        self.orders = []
+
+    def order_market_buy(self, symbol, quoteOrderQty):
+        self.orders.append(('BUY', symbol, quoteOrderQty))
+        return {'orderId': 1, 'status': 'FILLED', 'executedQty': '0.0001', 'cummulativeQuoteQty': '5.0'}
+
+    def order_market_sell(self, symbol, quantity):
+        self.orders.append(('SELL', symbol, quantity))
+        return {'orderId': 2, 'status': 'FILLED', 'executedQty': quantity, 'cummulativeQuoteQty': '2.5'}
+
+
+def make_adapter(monkeypatch, tmp_path):
+    store = SymbolMetadataStore(path=str(tmp_path / 'symbol_metadata.json'))
+    store.register_loader('binance', lambda: [
+        SymbolRules('binance', 'BTCUSDT', 'BTC', 'USDT', step_size=0.00001, tick_size=0.01, quote_step=0.01)
+    ])
+    store.load('binance')
+    monkeypatch.setattr(exchange_adapters, 'symbol_metadata', store)
+    client = FakeClient()
+    return BinanceAdapter(client), client
+
+
+def test_sell_quantity_is_sent_as_step_decimals(monkeypatch, tmp_path):
+    adapter, client = make_adapter(monkeypatch, tmp_path)
+    result = adapter.market_sell('BTC/USDT', 0.0000512)
+    assert client.orders == [('SELL', 'BTCUSDT', '0.00005')]  # str(0.00005) sería '5e-05'
+    assert result.success and result.filled_qty == 0.00005
+
+
+def test_buy_amount_is_sent_as_quote_decimals(monkeypatch, tmp_path):
+    adapter, client = make_adapter(monkeypatch, tmp_path)
+    adapter.market_buy('BTC/USDT', 5.129)
+    assert client.orders == [('BUY', 'BTCUSDT', '5.12')]
@@ -0,0 +1,62 @@
+"""Tests del libro local de KuCoin: secuencias por cambio, huecos y reinicio de secuencia"""
+from kucoin_level2_stream import KuCoinLevel2Stream
+
+
+def make_stream(sequence=100):
+    stream = KuCoinLevel2Stream(client=None, symbols=['BTC-USDT'])
+    stream.requested = []
+    stream._request_snapshot = lambda symbol, delay=0: stream.requested.append((symbol, delay))
+    book = stream.books['BTC-USDT']
+    book.load_snapshot([['99', '1', '90']], [['101', '1', '90']], sequence)
+    return stream, book
+
+
+def update(start, end, bids=(), asks=()):
+    return {'symbol': 'BTC-USDT', 'sequenceStart': start, 'sequenceEnd': end,
+            'changes': {'bids': list(bids), 'asks': list(asks)}}
+
+
+def test_stale_update_is_ignored():
+    stream, book = make_stream()
+    assert stream._apply_update(book, update(95, 100, bids=[['99', '5', '98']]))
+    assert book.bids == {99.0: 1.0} and not book.synced
+
+
+def test_bridging_update_skips_changes_already_in_the_snapshot():
+    stream, book = make_stream()
+    assert stream._apply_update(book, update(99, 102, bids=[['99', '5', '99'], ['98', '2', '101']],
+                                             asks=[['101', '0', '102']]))
+    assert book.synced and book.last_update_id == 102
+    assert book.bids == {99.0: 1.0, 98.0: 2.0}
+    assert book.asks == {}
+    assert stream.requested == []
+
+
+def test_gap_forces_a_resync():
+    stream, book = make_stream()
+    assert stream._apply_update(book, update(101, 101, bids=[['98', '1', '101']]))
+    gap = update(103, 104)
+    assert not stream._apply_update(book, gap)
+    assert book.last_update_id is None and not book.synced
+    assert stream.buffers['BTC-USDT'] == [gap]
+    assert stream.requested == [('BTC-USDT', 0.5)]
+
+
+def test_sequence_rollover_forces_a_resync():
+    stream, book = make_stream()
+    assert stream._apply_update(book, update(101, 101, bids=[['98', '1', '101']]))
+
+    # KuCoin reinicia la secuencia: sin resincronizar el libro quedaría congelado
+    rolled = update(1, 2, asks=[['100', '1', '2']])
+    assert not stream._apply_update(book, rolled)
+    assert book.last_update_id is None
+    assert stream.buffers['BTC-USDT'] == [rolled]
+    assert stream.requested == [('BTC-USDT', 0.5)]
+
+
+def test_duplicate_of_the_last_update_is_not_a_rollover():
+    stream, book = make_stream()
+    last = update(101, 101, bids=[['98', '1', '101']])
+    assert stream._apply_update(book, last)
+    assert stream._apply_update(book, last)
+    assert book.synced and stream.requested == []
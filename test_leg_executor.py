@@ -0,0 +1,162 @@
+"""Tests de la ejecución de dos patas: conciliación, cobertura y exposición"""
+import math
+import threading
+import time
+import numpy as np
+import leg_executor as leg_executor_module
+from leg_executor import EXPOSED, FAILED, FILLED, HEDGED, REJECTED, UNWOUND, TwoLegExecutor
+from market_types import OrderResult
+
+PRICE = 100.0
+
+
+class FakeMetadata:
+    """Sin mínimos ni redondeo: cualquier cantidad positiva es operable"""
+
+    def get(self, exchange, symbol):
+        return None
+
+    def quantize_quantity(self, exchange, symbol, quantity):
+        return quantity
+
+    def quantize_quote(self, exchange, symbol, amount):
+        return amount
+
+    def prepare_order(self, exchange, symbol, quantity, price=None):
+        return quantity if quantity > 0 else None
+
+    def tradable_mask(self, exchanges, symbols, quantities, prices):
+        return np.asarray(quantities, dtype=float) > 0
+
+
+class FakeAdapter:
+    """Responde a cada orden con la siguiente respuesta programada
+
+    Una respuesta es la cantidad ejecutada, None (orden rechazada) o un
+    threading.Event por el que la orden espera antes de ejecutarse entera.
+    """
+
+    def __init__(self, name, *responses):
+        self.name = name
+        self.responses = list(responses)
+        self.orders = []
+
+    def submit(self, side, symbol, amount):
+        self.orders.append((side, amount))
+        response = self.responses.pop(0) if self.responses else amount
+        if isinstance(response, threading.Event):
+            response.wait(5)
+            response = amount if side == 'SELL' else amount / PRICE
+        if response is None:
+            return OrderResult.failed(self.name, symbol, side, 'rechazada')
+        return OrderResult(self.name, symbol, side, True, filled_qty=response, avg_price=PRICE,
+                           cost=response * PRICE)
+
+
+class FakeJournal:
+    def submit(self, strategy, adapter, side, symbol, amount):
+        return adapter.submit(side, symbol, amount)
+
+
+def make_executor(monkeypatch, **kwargs):
+    monkeypatch.setattr(leg_executor_module, 'symbol_metadata', FakeMetadata())
+    monkeypatch.setattr(leg_executor_module, 'order_journal', FakeJournal())
+    return TwoLegExecutor(**kwargs)
+
+
+def test_both_legs_filled(monkeypatch):
+    executor = make_executor(monkeypatch)
+    execution = executor.execute(FakeAdapter('a', 1.0), FakeAdapter('b', 1.0), 'BTC/USDT', 1.0, PRICE)
+    assert execution.status == FILLED
+    assert execution.residual == 0.0
+
+
+def test_no_leg_filled_is_failed(monkeypatch):
+    executor = make_executor(monkeypatch)
+    execution = executor.execute(FakeAdapter('a', None), FakeAdapter('b', None), 'BTC/USDT', 1.0, PRICE)
+    assert execution.status == FAILED
+    assert execution.error == 'rechazada'
+
+
+def test_short_sell_is_hedged_on_the_sell_exchange(monkeypatch):
+    executor = make_executor(monkeypatch)
+    seller = FakeAdapter('b', 0.4, 0.6)
+    execution = executor.execute(FakeAdapter('a', 1.0), seller, 'BTC/USDT', 1.0, PRICE)
+    assert execution.status == HEDGED
+    side, amount = seller.orders[1]
+    assert side == 'SELL' and math.isclose(amount, 0.6)
+    assert len(execution.adjustments) == 1
+
+
+def test_failed_hedge_unwinds_on_the_buy_exchange(monkeypatch):
+    executor = make_executor(monkeypatch)
+    buyer = FakeAdapter('a', 1.0, 1.0)
+    execution = executor.execute(buyer, FakeAdapter('b', None, None), 'BTC/USDT', 1.0, PRICE)
+    assert execution.status == UNWOUND
+    assert buyer.orders[1] == ('SELL', 1.0)
+
+
+def test_hanging_hedge_is_reported_exposed_without_waiting(monkeypatch):
+    executor = make_executor(monkeypatch, leg_timeout=0.1)
+    release, delivered = threading.Event(), threading.Event()
+    late = []
+
+    def on_late(execution, orders):
+        late.append((execution.status, execution.residual, execution.late))
+        delivered.set()
+
+    buyer = FakeAdapter('a', 1.0)
+    seller = FakeAdapter('b', None, release)
+    started = time.time()
+    execution = executor.execute(buyer, seller, 'BTC/USDT', 1.0, PRICE, on_late=on_late)
+    assert execution.status == EXPOSED and execution.late
+    assert execution.residual == 1.0
+    assert time.time() - started < 2
+    assert len(buyer.orders) == 1  # sin unwind encima de una cobertura que puede ejecutarse aún
+
+    # La cobertura responde tarde: el motor recibe el estado que deja, la ejecución original no cambia
+    release.set()
+    assert delivered.wait(5)
+    assert late == [(HEDGED, 0.0, False)]
+    assert execution.status == EXPOSED
+
+
+def test_below_minimums_is_rejected(monkeypatch):
+    executor = make_executor(monkeypatch)
+    buyer, seller = FakeAdapter('a'), FakeAdapter('b')
+    execution = executor.execute(buyer, seller, 'BTC/USDT', 0.0, PRICE)
+    assert execution.status == REJECTED
+    assert buyer.orders == [] and seller.orders == []
+
+
+def test_minimums_of_the_sell_exchange_are_checked(monkeypatch):
+    executor = make_executor(monkeypatch)
+    monkeypatch.setattr(leg_executor_module.symbol_metadata, 'tradable_mask',
+                        lambda exchanges, symbols, quantities, prices: np.array([name != 'b' for name in exchanges]))
+    buyer, seller = FakeAdapter('a'), FakeAdapter('b')
+    execution = executor.execute(buyer, seller, 'BTC/USDT', 1.0, PRICE)
+    assert execution.status == REJECTED
+    assert buyer.orders == [] and seller.orders == []
+
+
+def test_hanging_leg_returns_exposed_and_reconciles_when_it_fills(monkeypatch):
+    executor = make_executor(monkeypatch, leg_timeout=0.1)
+    release, delivered = threading.Event(), threading.Event()
+    late = []
+
+    def on_late(execution, orders):
+        late.append((execution.status, execution.late, [(order.exchange, order.side) for order in orders]))
+        delivered.set()
+
+    started = time.time()
+    execution = executor.execute(FakeAdapter('a', 1.0), FakeAdapter('b', release), 'BTC/USDT', 1.0, PRICE,
+                                 on_late=on_late)
+    assert execution.status == EXPOSED and execution.residual == 1.0 and execution.late
+    assert time.time() - started < 1  # sin esperar a la pata colgada
+    assert executor.pending == [execution]
+
+    release.set()
+    assert delivered.wait(5)
+    assert late == [(FILLED, False, [('b', 'SELL')])]
+    assert execution.status == EXPOSED  # la ejecución del llamante no cambia
+    assert executor.pending == []
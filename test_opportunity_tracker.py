@@ -0,0 +1,127 @@
+"""Tests del tracker de oportunidades: apertura, ranking y cierre por cotización"""
+import time
+import pytest
+import opportunity_tracker as opportunity_tracker_module
+from opportunity_tracker import OpportunityTracker
+
+
+class FakeCostModel:
+    fee = 0.0
+
+    def leg_cost(self, exchange, symbol, maker=False):
+        return self.fee
+
+    def transfer_cost(self, symbol, buy_exchange, sell_exchange, price):
+        return 0.0
+
+    def start(self):
+        pass
+
+
+class FakeHub:
+    def __init__(self):
+        self.watched = {}
+
+    def watch(self, exchange, symbols, credentials=None):
+        self.watched[exchange] = (list(symbols), credentials)
+
+    def subscribe(self, callback, symbol=None, exchange=None):
+        return symbol, exchange, callback
+
+    def unsubscribe(self, token):
+        pass
+
+    def start(self):
+        pass
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(opportunity_tracker_module, 'cost_model', FakeCostModel())
+    tracker = OpportunityTracker(hub=FakeHub())
+    tracker.track(['a', 'b', 'c'], ['BTC/USDT', 'ETH/USDT'])
+    return tracker
+
+
+def quote(exchange, bid, ask, symbol='BTC/USDT', received_at=None, volume=10.0):
+    return {'exchange': exchange, 'symbol': symbol, 'bid': bid, 'ask': ask, 'volume': volume,
+            'received_at': received_at or time.time()}
+
+
+def test_track_passes_credentials_per_exchange(monkeypatch):
+    monkeypatch.setattr(opportunity_tracker_module, 'cost_model', FakeCostModel())
+    tracker = OpportunityTracker(hub=FakeHub())
+    tracker.track(['a', 'b'], ['BTC/USDT'], credentials={'a': {'apiKey': 'key'}})
+    assert tracker.hub.watched == {'a': (['BTC/USDT'], {'apiKey': 'key'}), 'b': (['BTC/USDT'], None)}
+
+
+def test_crossed_quotes_open_an_opportunity(tracker):
+    tracker.on_quote(quote('a', 99.0, 100.0))
+    tracker.on_quote(quote('b', 102.0, 103.0))
+    top = tracker.top()
+    assert len(top) == 1
+    assert (top[0]['buy_exchange'], top[0]['sell_exchange']) == ('a', 'b')
+    assert top[0]['net_spread_percentage'] == pytest.approx(2.0)
+
+
+def test_opportunities_are_ranked_by_net_spread(tracker):
+    tracker.on_quote(quote('a', 99.0, 100.0))
+    tracker.on_quote(quote('b', 101.0, 102.0))
+    tracker.on_quote(quote('c', 103.0, 104.0))
+    # a->c 3%, a->b 1%, b->c 1/102
+    assert [(item['buy_exchange'], item['sell_exchange']) for item in tracker.top()] == \
+        [('a', 'c'), ('a', 'b'), ('b', 'c')]
+    assert [item['sell_exchange'] for item in tracker.top(5, exchanges={'a', 'b'})] == ['b']
+
+
+def test_fees_can_close_the_edge(monkeypatch, tracker):
+    opportunity_tracker_module.cost_model.fee = 0.02
+    tracker.on_quote(quote('a', 99.0, 100.0))
+    tracker.on_quote(quote('b', 102.0, 103.0))
+    assert tracker.top() == []
+
+
+def test_converging_prices_close_and_keep_history(tracker):
+    tracker.on_quote(quote('a', 99.0, 100.0))
+    tracker.on_quote(quote('b', 102.0, 103.0))
+    opened_at = tracker.top()[0]['opened_at']
+    tracker.on_quote(quote('b', 99.5, 100.5))
+    assert tracker.top() == []
+    closed = tracker.history[-1]
+    assert closed.opened_at == opened_at and closed.closed_at is not None
+    assert tracker.lifetime_stats()['closed'] == 1
+
+
+def test_same_opportunity_keeps_its_opened_at(tracker):
+    tracker.on_quote(quote('a', 99.0, 100.0))
+    tracker.on_quote(quote('b', 102.0, 103.0))
+    opened_at = tracker.top()[0]['opened_at']
+    tracker.on_quote(quote('b', 103.0, 104.0))
+    top = tracker.top()
+    assert top[0]['opened_at'] == opened_at
+    assert top[0]['net_spread_percentage'] == pytest.approx(3.0)
+
+
+def test_stale_quotes_expire_opportunities(tracker):
+    old = time.time() - 60
+    tracker.on_quote(quote('a', 99.0, 100.0, received_at=old))
+    tracker.on_quote(quote('b', 102.0, 103.0, received_at=old))
+    assert tracker.top() == []
+
+
+def test_empty_book_closes_the_exchange(tracker):
+    tracker.on_quote(quote('a', 99.0, 100.0))
+    tracker.on_quote(quote('b', 102.0, 103.0))
+    tracker.on_quote(quote('b', None, None))
+    assert tracker.top() == []
+
+
+def test_best_per_symbol(tracker):
+    tracker.on_quote(quote('a', 99.0, 100.0))
+    tracker.on_quote(quote('b', 102.0, 103.0))
+    tracker.on_quote(quote('a', 10.0, 10.1, symbol='ETH/USDT'))
+    tracker.on_quote(quote('c', 10.5, 10.6, symbol='ETH/USDT'))
+    tracker.on_quote(quote('a', 1.0, 1.1, symbol='XRP/USDT'))  # no seguido
+    best = tracker.best_per_symbol()
+    assert set(best) == {'BTC/USDT', 'ETH/USDT'}
+    assert best['ETH/USDT']['sell_exchange'] == 'c'
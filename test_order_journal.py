@@ -0,0 +1,162 @@
+"""Tests del diario de órdenes: reproducción, truncado, compactación y fallos de escritura"""
+import json
+import os
+import pytest
+import order_journal as order_journal_module
+from order_journal import CHECKPOINT, OPEN, SNAPSHOT, OrderJournal
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'journal.log')
+
+
+def reopen(path, **kwargs):
+    journal = OrderJournal(path=path, **kwargs)
+    journal.open()
+    return journal
+
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_replay_restores_positions_and_pending_orders(path):
+    journal = reopen(path)
+    client_id = journal.intent('engine', 'binance', 'BTC/USDT', 'BUY', 100.0)
+    journal.open_position('engine', 'p1', {'symbol': 'BTC/USDT', 'quantity': 0.001})
+    journal.open_position('engine', 'p2', {'symbol': 'ETH/USDT', 'quantity': 0.1})
+    journal.close_position('engine', 'p2', reason='target', profit=1.5)
+    journal.close()
+
+    journal = reopen(path)
+    assert journal.recover('engine') == {'p1': {'symbol': 'BTC/USDT', 'quantity': 0.001}}
+    assert [order['client_id'] for order in journal.pending_orders('engine')] == [client_id]
+    assert journal.pending_orders('other') == []
+    journal.close()
+
+
+def test_acked_and_filled_orders_are_resolved(path):
+    class Result:
+        success, order_id, status, error = True, '42', 'closed', None
+        filled_qty, avg_price, cost, fee = 0.001, 60000.0, 60.0, 0.06
+
+    journal = reopen(path)
+    client_id = journal.intent('engine', 'binance', 'BTC/USDT', 'BUY', 60.0)
+    journal.order_result(client_id, Result())
+    journal.close()
+
+    assert reopen(path).pending_orders() == []
+
+
+def test_partial_last_line_is_truncated(path):
+    journal = reopen(path)
+    journal.open_position('engine', 'p1', {'symbol': 'BTC/USDT'})
+    journal.close()
+    valid_size = os.path.getsize(path)
+    with open(path, 'a') as f:
+        f.write('{"type":"open","seq":99,"engine":"engine","key":"p2"')  # caída a mitad de registro
+
+    journal = OrderJournal(path=path)
+    assert journal._replay() > 0
+    assert os.path.getsize(path) == valid_size
+    assert list(journal.positions['engine']) == ['p1']
+
+
+def test_open_compacts_to_current_state(path):
+    journal = reopen(path)
+    for index in range(20):
+        journal.open_position('engine', f'p{index}', {'index': index})
+        if index % 2:
+            journal.close_position('engine', f'p{index}')
+    journal.close()
+
+    journal = reopen(path)
+    records = read_records(path)
+    assert records[0]['type'] == SNAPSHOT
+    assert sorted(record['key'] for record in records if record['type'] == OPEN) == \
+        sorted(f'p{index}' for index in range(0, 20, 2))
+    assert len(journal.recover('engine')) == 10
+    journal.close()
+
+
+def test_compaction_by_size_keeps_state(path):
+    journal = reopen(path, compact_bytes=512)
+    for index in range(50):
+        journal.open_position('engine', 'p', {'index': index})
+    journal.flush()
+    assert os.path.getsize(path) < 1024
+    journal.close()
+
+    assert reopen(path).recover('engine') == {'p': {'index': 49}}
+
+
+def test_checkpoint_drops_persisted_trades(path):
+    journal = reopen(path)
+    journal.record_trade(symbol='BTC/USDT', side='BUY', order_id='1')
+    seq = journal.seq
+    journal.record_trade(symbol='BTC/USDT', side='SELL', order_id='2')
+    journal.append(CHECKPOINT, upto=seq)
+    journal.close()
+
+    journal = reopen(path)
+    assert [fields['order_id'] for _, fields in journal.trades.values()] == ['2']
+    assert journal.recovered_seq == journal.seq
+    journal.close()
+
+
+def test_failed_fsync_does_not_advance_synced_seq(path, monkeypatch):
+    journal = reopen(path, retry_interval=0.01)
+    real_fsync = os.fsync
+
+    def failing_fsync(fd):
+        raise OSError(5, 'Input/output error')
+
+    monkeypatch.setattr(order_journal_module.os, 'fsync', failing_fsync)
+    with pytest.raises(OSError):
+        journal.intent('engine', 'binance', 'BTC/USDT', 'BUY', 100.0)
+    assert journal.synced_seq < journal.seq
+    assert journal.flush() is False
+
+    monkeypatch.setattr(order_journal_module.os, 'fsync', real_fsync)
+    journal.open_position('engine', 'p1', {'symbol': 'BTC/USDT'})
+    assert journal.flush() is True
+    assert journal.synced_seq == journal.seq
+    journal.close()
+
+    # Los reintentos no dejan líneas duplicadas a medias: todo se reproduce
+    journal = reopen(path)
+    assert len(journal.pending_orders('engine')) == 1
+    assert list(journal.recover('engine')) == ['p1']
+    journal.close()
+
+
+def test_rejected_rows_are_set_aside(path, monkeypatch):
+    pytest.importorskip('sqlalchemy')
+
+    class FakeSession:
+        def __init__(self):
+            self.rows, self.pending = [], []
+
+        def add(self, row):
+            self.pending.append(row)
+
+        def commit(self):
+            if 'bad' in self.pending:
+                raise ValueError('NOT NULL constraint failed: trades.strategy')
+            self.rows += self.pending
+            self.pending = []
+
+        def rollback(self):
+            self.pending = []
+
+    class FakeDb:
+        session = FakeSession()
+
+    journal = OrderJournal(path=path)
+    monkeypatch.setattr(journal, '_row', lambda seq, model, fields: fields['row'])
+    batch = [(1, ('Trade', {'row': 'a'})), (2, ('Trade', {'row': 'bad'})), (3, ('Trade', {'row': 'c'}))]
+    assert journal._persist_rows(FakeDb, batch) == 3
+    assert FakeDb.session.rows == ['a', 'c']
+    assert [record['seq'] for record in read_records(journal.dead_letter_path)] == [2]
@@ -0,0 +1,123 @@
+"""Tests del libro de posiciones: escaleras de stop/objetivo y vencimientos"""
+from position_book import PROFIT_TARGET, STOP_LOSS, TIME_EXIT, PositionBook
+
+
+class FakeHub:
+    def __init__(self):
+        self.watched = []
+
+    def watch(self, exchange, symbols, credentials=None):
+        self.watched.append((exchange, tuple(symbols)))
+
+    def subscribe(self, callback, symbol=None, exchange=None):
+        return symbol, exchange, callback
+
+    def unsubscribe(self, token):
+        pass
+
+    def start(self):
+        pass
+
+
+class InlineExecutor:
+    def submit(self, function, *args):
+        function(*args)
+
+
+def make_book():
+    fired = []
+    book = PositionBook(lambda *args: fired.append(args), hub=FakeHub(), executor=InlineExecutor())
+    return book, fired
+
+
+def quote(price, exchange='binance', symbol='BTC/USDT'):
+    return {'exchange': exchange, 'symbol': symbol, 'bid': price}
+
+
+def test_add_watches_the_pair():
+    book, _ = make_book()
+    book.add('p1', 'binance', 'BTC/USDT', stop_price=95.0)
+    assert book.hub.watched == [('binance', ('BTC/USDT',))]
+    assert 'p1' in book and len(book) == 1
+
+
+def test_stops_fire_from_the_highest_crossed():
+    book, _ = make_book()
+    for position_id, stop in (('p1', 90.0), ('p2', 95.0), ('p3', 98.0)):
+        book.add(position_id, 'binance', 'BTC/USDT', stop_price=stop, position={'id': position_id})
+    assert book.check_price('binance', 'BTC/USDT', 99.0) == []
+    triggered = book.check_price('binance', 'BTC/USDT', 95.0)
+    assert sorted(position_id for position_id, _, _ in triggered) == ['p2', 'p3']
+    assert {reason for _, _, reason in triggered} == {STOP_LOSS}
+    assert list(book.entries) == ['p1']
+
+
+def test_targets_fire_at_or_below_price():
+    book, _ = make_book()
+    book.add('p1', 'binance', 'BTC/USDT', target_price=105.0)
+    book.add('p2', 'binance', 'BTC/USDT', target_price=110.0)
+    triggered = book.check_price('binance', 'BTC/USDT', 105.0)
+    assert [(position_id, reason) for position_id, _, reason in triggered] == [('p1', PROFIT_TARGET)]
+
+
+def test_trigger_removes_the_other_side_of_the_position():
+    book, _ = make_book()
+    book.add('p1', 'binance', 'BTC/USDT', stop_price=95.0, target_price=105.0)
+    assert len(book.check_price('binance', 'BTC/USDT', 94.0)) == 1
+    # El objetivo de una posición ya cerrada no vuelve a dispararse
+    assert book.check_price('binance', 'BTC/USDT', 200.0) == []
+
+
+def test_pairs_are_independent():
+    book, _ = make_book()
+    book.add('p1', 'binance', 'BTC/USDT', stop_price=95.0)
+    book.add('p2', 'kucoin', 'BTC/USDT', stop_price=95.0)
+    triggered = book.check_price('kucoin', 'BTC/USDT', 90.0)
+    assert [position_id for position_id, _, _ in triggered] == ['p2']
+    assert 'p1' in book
+
+
+def test_remove_drops_stop_and_target():
+    book, _ = make_book()
+    book.add('p1', 'binance', 'BTC/USDT', stop_price=95.0, target_price=105.0, position={'id': 'p1'})
+    assert book.remove('p1') == {'id': 'p1'}
+    assert book.remove('p1') is None
+    assert book.check_price('binance', 'BTC/USDT', 90.0) == []
+
+
+def test_readding_replaces_previous_levels():
+    book, _ = make_book()
+    book.add('p1', 'binance', 'BTC/USDT', stop_price=95.0)
+    book.add('p1', 'binance', 'BTC/USDT', stop_price=80.0)
+    assert book.check_price('binance', 'BTC/USDT', 90.0) == []
+    assert len(book.check_price('binance', 'BTC/USDT', 80.0)) == 1
+
+
+def test_deadlines_expire_in_order_with_last_price():
+    book, _ = make_book()
+    book.add('late', 'binance', 'BTC/USDT', deadline=200.0)
+    book.add('early', 'binance', 'BTC/USDT', deadline=100.0)
+    book.check_price('binance', 'BTC/USDT', 101.0)
+    assert book.check_deadlines(now=50.0) == []
+    assert book.check_deadlines(now=150.0) == [('early', None, 101.0)]
+    assert [position_id for position_id, _, _ in book.check_deadlines(now=300.0)] == ['late']
+
+
+def test_closed_or_rescheduled_deadlines_are_skipped():
+    book, _ = make_book()
+    book.add('closed', 'binance', 'BTC/USDT', deadline=100.0)
+    book.add('moved', 'binance', 'BTC/USDT', deadline=100.0)
+    book.remove('closed')
+    book.add('moved', 'binance', 'BTC/USDT', deadline=500.0)
+    assert book.check_deadlines(now=200.0) == []
+    assert [position_id for position_id, _, _ in book.check_deadlines(now=600.0)] == ['moved']
+
+
+def test_quotes_and_expiry_call_the_trigger():
+    book, fired = make_book()
+    book.add('p1', 'binance', 'BTC/USDT', stop_price=95.0, position={'id': 'p1'})
+    book.add('p2', 'binance', 'ETH/USDT', deadline=100.0, position={'id': 'p2'})
+    book.on_quote(quote(94.0))
+    book.on_quote(quote(None))
+    book.expire(now=150.0)
+    assert fired == [('p1', {'id': 'p1'}, STOP_LOSS, 94.0), ('p2', {'id': 'p2'}, TIME_EXIT, None)]
@@ -0,0 +1,67 @@
+"""Tests del limitador de peso: cuenta por ventana, prioridad de las órdenes y pausa por baneo"""
+import threading
+import time
+from rate_limiter import PRIORITY_MARKET_DATA, PRIORITY_ORDER, ExchangeRateLimiter
+
+
+def test_weight_is_counted_per_window():
+    limiter = ExchangeRateLimiter('test', weight_limit=10, window=60.0)
+    assert limiter.acquire(weight=3, priority=PRIORITY_ORDER)
+    assert limiter.acquire(weight=4, priority=PRIORITY_ORDER)
+    now = time.time()
+    assert limiter.used_weight(now) == 7
+    assert not limiter.acquire(weight=4, priority=PRIORITY_ORDER, timeout=0.05)
+    assert limiter.used_weight(now) == 7  # el intento fallido no gasta peso
+    assert limiter.used_weight(now + 61.0) == 0
+
+
+def test_server_header_raises_the_used_weight():
+    limiter = ExchangeRateLimiter('test', weight_limit=100, window=60.0, used_header='X-USED')
+    limiter.acquire(weight=5)
+    limiter.update_from_headers({'X-USED': '40'})
+    assert limiter.used_weight() == 40
+    limiter.update_from_headers({'X-USED': 'n/a'})
+    assert limiter.used_weight() == 40
+
+
+def test_market_data_cannot_spend_the_order_reserve():
+    limiter = ExchangeRateLimiter('test', weight_limit=10, window=60.0, market_data_share=0.5)
+    assert limiter.acquire(weight=5, priority=PRIORITY_MARKET_DATA)
+    assert not limiter.acquire(weight=1, priority=PRIORITY_MARKET_DATA, timeout=0.05)
+    assert limiter.acquire(weight=5, priority=PRIORITY_ORDER)
+
+
+def test_orders_go_first_under_contention():
+    limiter = ExchangeRateLimiter('test', weight_limit=2, window=0.3, market_data_share=0.5)
+    assert limiter.acquire(weight=2, priority=PRIORITY_ORDER)
+    served = []
+
+    def request(label, priority):
+        if limiter.acquire(weight=1, priority=priority, timeout=5.0):
+            served.append(label)
+
+    # Los datos de mercado llegan antes a la cola, pero la orden pasa primero al liberarse peso
+    market = threading.Thread(target=request, args=('market', PRIORITY_MARKET_DATA))
+    market.start()
+    time.sleep(0.05)
+    order = threading.Thread(target=request, args=('order', PRIORITY_ORDER))
+    order.start()
+    market.join(5)
+    order.join(5)
+    assert served == ['order', 'market']
+
+
+def test_ban_blocks_requests_until_it_ends():
+    limiter = ExchangeRateLimiter('test', weight_limit=10, window=0.2)
+    limiter.on_rate_limited(429, retry_after='0.3')
+    assert limiter.is_banned()
+
+    # Datos de mercado y órdenes que no pueden esperar al fin del baneo fallan sin encolarse
+    assert not limiter.acquire(priority=PRIORITY_MARKET_DATA)
+    assert not limiter.acquire(priority=PRIORITY_ORDER, timeout=0.1)
+    assert limiter.waiters == []
+
+    started = time.time()
+    assert limiter.acquire(priority=PRIORITY_ORDER, timeout=2.0)
+    assert time.time() - started >= 0.25
+    assert not limiter.is_banned()
@@ -0,0 +1,113 @@
+"""Tests del supervisor de shards sin arrancar procesos: reparto de usuarios y metadatos"""
+import pytest
+import shard_supervisor as shard_supervisor_module
+from shard_supervisor import FILLS, QUOTES, RULES, TENANTS, ShardSupervisor
+from tenant_engine import TenantEngine
+
+
+class FakeMetadata:
+    def __init__(self):
+        self.fetched_at = {'binance': 1.0, 'kucoin': 1.0}
+        self.loads = []
+
+    def load(self, exchange):
+        self.loads.append(exchange)
+
+    def export(self, exchanges):
+        return {exchange: {'fetched_at': self.fetched_at[exchange], 'symbols': {}}
+                for exchange in exchanges if exchange in self.fetched_at}
+
+
+class FakeTracker:
+    def track(self, exchanges, symbols, credentials=None):
+        pass
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    monkeypatch.setattr(shard_supervisor_module, 'symbol_metadata', FakeMetadata())
+    supervisor = ShardSupervisor(workers=2)
+    supervisor.tracker = FakeTracker()
+    for worker in supervisor.workers:
+        worker.sent = []
+        worker.send = lambda kind, payload, worker=worker: worker.sent.append((kind, payload)) or True
+    return supervisor
+
+
+def snapshot(user_id, exchanges=('binance', 'kucoin'), symbols=('BTC/USDT',)):
+    return {'user_id': user_id, 'plan': 'PRO', 'exchanges': list(exchanges), 'symbols': list(symbols),
+            'max_trade_amount': 50.0, 'min_spread': 0.002, 'max_trades_per_day': 10, 'trades_today': 0,
+            'balance': 100.0}
+
+
+def users_per_shard(supervisor, count=20):
+    shards = {}
+    for user_id in range(count):
+        shards.setdefault(supervisor.shard_of(user_id), []).append(user_id)
+    return shards
+
+
+def test_shard_of_is_stable_and_spreads_users(supervisor):
+    shards = users_per_shard(supervisor)
+    assert set(shards) == {0, 1}
+    assert all(supervisor.shard_of(user_id) == shard for shard, users in shards.items() for user_id in users)
+
+
+def test_rules_are_sent_once_before_tenants(supervisor):
+    user_id = users_per_shard(supervisor)[0][0]
+    supervisor.set_tenants([snapshot(user_id)])
+    worker = supervisor.workers[0]
+    assert [kind for kind, _ in worker.sent] == [RULES, TENANTS]
+    assert set(worker.sent[0][1]) == {'binance', 'kucoin'}
+    assert worker.symbols == {'BTC/USDT'}
+    # El otro shard no tiene usuarios: ni metadatos ni símbolos
+    assert [kind for kind, _ in supervisor.workers[1].sent] == [TENANTS]
+
+    worker.sent.clear()
+    supervisor.distribute()
+    assert [kind for kind, _ in worker.sent] == [TENANTS]
+
+
+def test_refreshed_rules_are_resent(supervisor):
+    user_id = users_per_shard(supervisor)[0][0]
+    supervisor.set_tenants([snapshot(user_id)])
+    worker = supervisor.workers[0]
+    worker.sent.clear()
+    shard_supervisor_module.symbol_metadata.fetched_at['kucoin'] = 2.0
+    supervisor.distribute()
+    assert [(kind, sorted(payload)) for kind, payload in worker.sent if kind == RULES] == [(RULES, ['kucoin'])]
+
+
+def test_restarted_worker_gets_rules_again(supervisor):
+    user_id = users_per_shard(supervisor)[0][0]
+    supervisor.set_tenants([snapshot(user_id)])
+    worker = supervisor.workers[0]
+    worker.sent.clear()
+    worker.rules = {}  # como tras start()
+    supervisor.distribute(worker.shard)
+    assert [kind for kind, _ in worker.sent] == [RULES, TENANTS]
+
+
+def test_quotes_are_forwarded_only_to_interested_shards(supervisor):
+    shards = users_per_shard(supervisor)
+    supervisor.set_tenants([snapshot(shards[0][0]), snapshot(shards[1][0], symbols=('ETH/USDT',))])
+    supervisor.core = type('Core', (), {'post_once': lambda self, strategy, key, function: None})()
+    supervisor.on_quote({'exchange': 'binance', 'symbol': 'ETH/USDT'})
+    for worker in supervisor.workers:
+        worker.sent.clear()
+    supervisor.forward()
+    assert supervisor.workers[0].sent == []
+    assert [kind for kind, _ in supervisor.workers[1].sent] == [QUOTES]
+
+
+def test_fills_go_back_to_the_owning_shard(supervisor, monkeypatch):
+    shards = users_per_shard(supervisor)
+    user_id = shards[1][0]
+    supervisor.set_tenants([snapshot(user_id)])
+    tenant = supervisor.tenants[user_id]
+    monkeypatch.setattr(TenantEngine, 'flush', lambda self: [(tenant, 50.0)])
+    for worker in supervisor.workers:
+        worker.sent.clear()
+    supervisor.flush()
+    assert supervisor.workers[0].sent == []
+    assert supervisor.workers[1].sent == [(FILLS, [(user_id, 50.0, 100.0, 0)])]
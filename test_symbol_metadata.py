@@ -0,0 +1,98 @@
+"""Tests del almacén de metadatos: redondeo vectorizado y mínimos por exchange"""
+import threading
+import numpy as np
+from symbol_metadata import SymbolMetadataStore, SymbolRules
+
+
+def make_store(tmp_path, **rules):
+    """Almacén con un loader por exchange; rules: exchange -> [SymbolRules]"""
+    store = SymbolMetadataStore(path=str(tmp_path / 'symbol_metadata.json'))
+    for exchange, items in rules.items():
+        store.register_loader(exchange, lambda items=items: list(items))
+    return store
+
+
+def btc(exchange, step=0.001, min_qty=0.001, min_notional=10.0):
+    return SymbolRules(exchange, 'BTCUSDT', 'BTC', 'USDT', step_size=step, tick_size=0.01,
+                       min_qty=min_qty, min_notional=min_notional, taker_fee=0.00075)
+
+
+def eth(exchange):
+    return SymbolRules(exchange, 'ETHUSDT', 'ETH', 'USDT', step_size=0.01, tick_size=0.1,
+                       min_qty=0.01, min_notional=5.0)
+
+
+def test_quantities_floor_to_each_symbols_step(tmp_path):
+    store = make_store(tmp_path, binance=[btc('binance'), eth('binance')])
+    quantities = store.quantize_quantities('binance', ['BTCUSDT', 'ETHUSDT', 'XRPUSDT'], [0.12345, 1.239, 7.5])
+    assert np.allclose(quantities, [0.123, 1.23, 7.5])  # sin reglas no se redondea
+
+
+def test_prices_round_down_for_buys_and_up_for_sells(tmp_path):
+    store = make_store(tmp_path, binance=[btc('binance'), eth('binance')])
+    symbols = ['BTCUSDT', 'ETHUSDT']
+    assert np.allclose(store.quantize_prices('binance', symbols, [100.129, 10.05]), [100.12, 10.0])
+    assert np.allclose(store.quantize_prices('binance', symbols, [100.121, 10.01], 'SELL'), [100.13, 10.1])
+
+
+def test_tradable_mask_checks_min_qty_and_notional(tmp_path):
+    store = make_store(tmp_path, binance=[btc('binance'), eth('binance')])
+    mask = store.tradable_mask('binance', ['BTCUSDT', 'BTCUSDT', 'ETHUSDT', 'ETHUSDT'],
+                               [0.2, 0.0009, 0.1, 0.1], [100.0, 20000.0, 40.0, np.nan])
+    assert mask.tolist() == [True, False, False, False]
+
+
+def test_one_exchange_per_row(tmp_path):
+    store = make_store(tmp_path, a=[btc('a', step=0.01)], b=[btc('b', step=0.001, min_notional=50.0)])
+    assert np.allclose(store.quantize_quantities(['a', 'b'], ['BTCUSDT'] * 2, [0.125, 0.125]), [0.12, 0.125])
+    assert store.tradable_mask(['a', 'b'], ['BTCUSDT'] * 2, [0.2, 0.2], [100.0, 100.0]).tolist() == [True, False]
+    assert np.allclose(store.taker_fees(['a', 'b'], ['BTCUSDT', 'XRPUSDT']), [0.00075, 0.001])
+
+
+def test_vectors_follow_reloaded_rules(tmp_path):
+    store = make_store(tmp_path, binance=[btc('binance', step=0.01)])
+    assert np.allclose(store.quantize_quantities('binance', ['BTCUSDT'], [0.125]), [0.12])
+    store.register_loader('binance', lambda: [btc('binance', step=0.001)])
+    store.load('binance', force=True)
+    assert np.allclose(store.quantize_quantities('binance', ['BTCUSDT'], [0.125]), [0.125])
+
+
+def test_failed_load_backs_off_and_doubles(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    calls = []
+    store.register_loader('kucoin', lambda: calls.append(1))
+    now = [1000.0]
+    monkeypatch.setattr('symbol_metadata.time.time', lambda: now[0])
+
+    assert store.get('kucoin', 'BTC-USDT') is None
+    assert store.get('kucoin', 'ETH-USDT') is None
+    assert len(calls) == 1  # sin descargar otra vez en cada get
+    now[0] += store.retry_interval
+    store.get('kucoin', 'BTC-USDT')
+    assert len(calls) == 2
+    assert store.failures['kucoin'][1] == 2 * store.retry_interval
+
+
+def test_download_runs_outside_the_lock_and_only_once(tmp_path):
+    store = make_store(tmp_path, binance=[btc('binance')])
+    release, started = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [eth('kucoin')]
+
+    store.register_loader('kucoin', slow_loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get('kucoin', 'ETHUSDT'))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    assert store.get('binance', 'BTCUSDT') is not None  # otro exchange no espera a la descarga
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert [rule.symbol for rule in results] == ['ETHUSDT'] * 3
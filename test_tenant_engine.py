@@ -0,0 +1,118 @@
+"""Tests del motor multiusuario: límites por usuario, grupos por exchanges y lotes a prorrata"""
+import pytest
+from tenant_engine import MIN_ORDER_AMOUNT, TRADES_PER_ARBITRAGE, Tenant, TenantEngine, parse_list
+
+OPPORTUNITY = {
+    'symbol': 'BTC/USDT', 'buy_exchange': 'binance', 'sell_exchange': 'kucoin',
+    'buy_price': 100.0, 'sell_price': 102.0, 'buy_fee': 0.0, 'sell_fee': 0.0,
+    'net_spread_percentage': 2.0, 'opened_at': 1000.0
+}
+
+
+class FakeTracker:
+    def __init__(self, opportunities=()):
+        self.opportunities = list(opportunities)
+        self.tracked = None
+
+    def track(self, exchanges, symbols, credentials=None):
+        self.tracked = (sorted(exchanges), sorted(symbols))
+
+    def top(self, k=5, min_spread=0.0, exchanges=None, symbols=None, min_volume=0.0):
+        return [opportunity for opportunity in self.opportunities
+                if opportunity['net_spread_percentage'] / 100 > min_spread
+                and opportunity['symbol'] in symbols
+                and {opportunity['buy_exchange'], opportunity['sell_exchange']} <= exchanges][:k]
+
+
+class FakePersistence:
+    def __init__(self):
+        self.rows = []
+
+    def record_row(self, model, **fields):
+        self.rows.append((model, fields))
+
+
+def snapshot(user_id, balance=100.0, max_trade_amount=50.0, min_spread=0.005, max_trades_per_day=10,
+             exchanges=('binance', 'kucoin'), symbols=('BTC/USDT',), trades_today=0):
+    return {'user_id': user_id, 'plan': 'PRO', 'exchanges': list(exchanges), 'symbols': list(symbols),
+            'max_trade_amount': max_trade_amount, 'min_spread': min_spread,
+            'max_trades_per_day': max_trades_per_day, 'trades_today': trades_today, 'balance': balance}
+
+
+def make_engine(*snapshots, opportunities=(OPPORTUNITY,)):
+    engine = TenantEngine(tracker=FakeTracker(opportunities))
+    engine.persistence = FakePersistence()
+    engine.set_tenants(list(snapshots))
+    return engine
+
+
+def test_parse_list_accepts_json_and_commas():
+    assert parse_list('["binance", " kucoin "]') == ['binance', 'kucoin']
+    assert parse_list('binance, kucoin,') == ['binance', 'kucoin']
+    assert parse_list(None) == []
+
+
+def test_order_amount_respects_limits():
+    tenant = Tenant(1)
+    tenant.balance, tenant.max_trade_amount, tenant.max_trades_per_day = 100.0, 30.0, 4
+    assert tenant.order_amount() == 30.0
+    tenant.reserved = 96.0
+    assert tenant.order_amount() == 0.0  # quedan 4 USDT < MIN_ORDER_AMOUNT
+    tenant.reserved = 100.0 - MIN_ORDER_AMOUNT
+    assert tenant.order_amount() == MIN_ORDER_AMOUNT
+    tenant.trades_today = 4 - TRADES_PER_ARBITRAGE + 1
+    assert tenant.order_amount() == 0.0
+    tenant.max_trades_per_day = -1  # ilimitado
+    assert tenant.order_amount() == MIN_ORDER_AMOUNT
+
+
+def test_tenants_are_grouped_by_exchange_set():
+    engine = make_engine(snapshot(1, min_spread=0.005), snapshot(2, min_spread=0.002),
+                         snapshot(3, exchanges=('binance', 'okx'), symbols=('BTC/USDT', 'ETH/USDT')))
+    groups = engine.index['BTC/USDT']
+    assert groups[frozenset({'binance', 'kucoin'})][0] == 0.002  # spread mínimo del grupo
+    assert len(groups) == 2
+    assert engine.tracker.tracked == (['binance', 'kucoin', 'okx'], ['BTC/USDT', 'ETH/USDT'])
+
+
+def test_collect_reserves_once_per_live_opportunity():
+    engine = make_engine(snapshot(1), snapshot(2, min_spread=0.03))
+    assert engine.collect('BTC/USDT')
+    orders = engine.pending[('BTC/USDT', 'binance', 'kucoin')]
+    assert [(tenant.user_id, amount) for tenant, amount, _ in orders] == [(1, 50.0)]  # 2% < 3% del usuario 2
+    assert engine.tenants[1].reserved == 50.0
+
+    engine.pending = {}
+    assert not engine.collect('BTC/USDT')  # misma oportunidad (mismo opened_at): no se repite
+
+
+def test_flush_allocates_one_batch_pro_rata():
+    engine = make_engine(snapshot(1, max_trade_amount=30.0), snapshot(2, max_trade_amount=10.0))
+    engine.collect('BTC/USDT')
+    settled = engine.flush()
+    assert sorted((tenant.user_id, amount) for tenant, amount in settled) == [(1, 30.0), (2, 10.0)]
+    tenant_1, tenant_2 = engine.tenants[1], engine.tenants[2]
+    # 0.4 BTC simulados a 100 -> 102: 0.8 USDT repartidos 3:1
+    assert tenant_1.balance == pytest.approx(100.0 + 0.6)
+    assert tenant_2.balance == pytest.approx(100.0 + 0.2)
+    assert tenant_1.reserved == tenant_2.reserved == 0.0
+    assert tenant_1.trades_today == TRADES_PER_ARBITRAGE
+    assert engine.dirty == {1, 2}
+    assert [(model, fields['user_id'], fields['side']) for model, fields in engine.persistence.rows] == \
+        [('UserTrade', 1, 'BUY'), ('UserTrade', 1, 'SELL'), ('UserTrade', 2, 'BUY'), ('UserTrade', 2, 'SELL')]
+
+
+def test_apply_fill_releases_the_reservation():
+    engine = make_engine(snapshot(1))
+    engine.collect('BTC/USDT')
+    engine.apply_fill(1, 50.0, 101.0, 2)
+    tenant = engine.tenants[1]
+    assert (tenant.reserved, tenant.balance, tenant.trades_today) == (0.0, 101.0, 2)
+
+
+def test_set_tenants_keeps_executed_opportunities():
+    engine = make_engine(snapshot(1))
+    engine.collect('BTC/USDT')
+    engine.flush()
+    engine.set_tenants([snapshot(1)])
+    assert not engine.collect('BTC/USDT')
@@ -0,0 +1,52 @@
+"""Tests del detector de ciclos (SPFA incremental) en el grafo de monedas"""
+import math
+from triangular_arbitrage import TriangularArbitrage
+
+
+def make_graph(fee=0.0, **kwargs):
+    graph = TriangularArbitrage(fee=fee, **kwargs)
+    graph.add_pair('BTCUSDT', 'BTC', 'USDT')
+    graph.add_pair('ETHUSDT', 'ETH', 'USDT')
+    graph.add_pair('ETHBTC', 'ETH', 'BTC')
+    return graph
+
+
+FAIR = {'BTCUSDT': (60000.0, 60000.0), 'ETHUSDT': (3000.0, 3000.0), 'ETHBTC': (0.05, 0.05)}
+
+
+def test_consistent_prices_have_no_cycle():
+    assert make_graph().update_quotes(FAIR) == []
+
+
+def test_mispriced_cross_is_detected():
+    # ETH barato en BTC: USDT -> BTC -> ETH -> USDT rinde 3000 / (0.04 * 60000) = 25%
+    opportunities = make_graph().update_quotes(dict(FAIR, ETHBTC=(0.04, 0.04)))
+    assert len(opportunities) == 1
+    cycle = opportunities[0]
+    assert math.isclose(cycle['profit_percentage'], 25.0, rel_tol=1e-9)
+    assert sorted(cycle['path'][:-1]) == ['BTC', 'ETH', 'USDT']
+    assert cycle['path'][0] == cycle['path'][-1]
+    assert {leg['symbol'] for leg in cycle['legs']} == {'BTCUSDT', 'ETHUSDT', 'ETHBTC'}
+
+
+def test_cycle_is_dropped_when_the_price_recovers():
+    graph = make_graph()
+    graph.update_quotes(dict(FAIR, ETHBTC=(0.04, 0.04)))
+    assert graph.update_quotes({'ETHBTC': (0.05, 0.05)}) == []
+    assert graph.cycles == {}
+
+
+def test_fees_are_charged_on_every_leg():
+    # 0.3% bruto: cubre tres comisiones del 0.1% (1.003 * 0.999^3 > 1) pero no tres del 0.2%
+    assert make_graph(fee=0.001).update_quotes(dict(FAIR, ETHBTC=(0.04985, 0.04985)))
+    assert make_graph(fee=0.002).update_quotes(dict(FAIR, ETHBTC=(0.04985, 0.04985))) == []
+
+
+def test_min_profit_threshold():
+    graph = make_graph(min_profit=0.5)
+    assert graph.update_quotes(dict(FAIR, ETHBTC=(0.04, 0.04))) == []
+
+
+def test_unknown_symbols_are_ignored():
+    graph = make_graph()
+    assert graph.update_quote('XRPUSDT', 0.5, 0.5) is False
@@ -0,0 +1,96 @@
+"""Tests de la valoración en USD: rutas del grafo de conversión y caché de tipos"""
+import math
+import threading
+import usd_valuation as usd_valuation_module
+from usd_valuation import MAX_HOPS, ConversionGraph, UsdValuation
+
+
+class FakeHub:
+    def __init__(self, quotes=None):
+        self.quotes = quotes or {}
+
+    def snapshot(self):
+        return dict(self.quotes)
+
+
+def test_stablecoins_are_one_dollar():
+    rates = ConversionGraph([]).rates
+    assert rates['USD'] == rates['USDT'] == rates['USDC'] == 1.0
+
+
+def test_direct_and_inverse_pairs():
+    rates = ConversionGraph([('BTC', 'USDT', 60000.0), ('USDC', 'EUR', 0.9)]).rates
+    assert rates['BTC'] == 60000.0
+    assert math.isclose(rates['EUR'], 1 / 0.9)
+
+
+def test_route_through_btc():
+    rates = ConversionGraph([('BTC', 'USDT', 60000.0), ('XMR', 'BTC', 0.0025)]).rates
+    assert math.isclose(rates['XMR'], 150.0)
+
+
+def test_direct_usdt_pair_beats_route_through_btc():
+    # Por BTC saldría 3300: la ruta con menos saltos manda
+    rates = ConversionGraph([('BTC', 'USDT', 60000.0), ('ETH', 'BTC', 0.055), ('ETH', 'USDT', 3000.0)]).rates
+    assert rates['ETH'] == 3000.0
+
+
+def test_routes_longer_than_max_hops_are_ignored():
+    # USD -> USDT ya es un salto: A1 está a dos, A{n} a n + 1
+    pairs = [('A1', 'USDT', 2.0)] + [(f'A{index + 1}', f'A{index}', 2.0) for index in range(1, MAX_HOPS + 1)]
+    rates = ConversionGraph(pairs).rates
+    assert rates[f'A{MAX_HOPS - 1}'] == 2.0 ** (MAX_HOPS - 1)
+    assert f'A{MAX_HOPS}' not in rates
+
+
+def test_invalid_pairs_are_skipped():
+    rates = ConversionGraph([('BTC', 'USDT', 0.0), ('ETH', 'USDT', None), (None, 'USDT', 1.0)]).rates
+    assert 'BTC' not in rates and 'ETH' not in rates
+
+
+def make_valuation(monkeypatch, pairs):
+    valuation = UsdValuation(hub=FakeHub())
+    calls = []
+
+    def ccxt_pairs(exchange):
+        calls.append(exchange)
+        return list(pairs)
+
+    monkeypatch.setattr(valuation, '_ccxt_pairs', ccxt_pairs)
+    monkeypatch.setattr(usd_valuation_module, '_canonical', lambda exchange: exchange)
+    return valuation, calls
+
+
+def test_rates_are_cached(monkeypatch):
+    valuation, calls = make_valuation(monkeypatch, [('BTC', 'USDT', 60000.0)])
+    assert valuation.rates('binance')['BTC'] == 60000.0
+    valuation.rates('binance')
+    assert calls == ['binance']
+    assert valuation.value_all({'BTC': 0.5, 'USDT': 10.0, 'DOGE': 100.0}, 'binance') == \
+        {'BTC': 30000.0, 'USDT': 10.0, 'DOGE': 0.0}
+
+
+def test_empty_snapshot_is_not_cached(monkeypatch):
+    valuation, calls = make_valuation(monkeypatch, [])
+    assert valuation.value('BTC', 1.0, 'binance') == 0.0
+    valuation.rates('binance')
+    assert calls == ['binance', 'binance']
+
+
+def test_fetch_does_not_hold_the_lock(monkeypatch):
+    valuation, _ = make_valuation(monkeypatch, [('BTC', 'USDT', 60000.0)])
+    held = []
+    original = valuation._ccxt_pairs
+
+    def ccxt_pairs(exchange):
+        acquired = valuation.lock.acquire(blocking=False)
+        held.append(not acquired)
+        if acquired:
+            valuation.lock.release()
+        return original(exchange)
+
+    monkeypatch.setattr(valuation, '_ccxt_pairs', ccxt_pairs)
+    thread = threading.Thread(target=valuation.rates, args=('binance',))
+    thread.start()
+    thread.join(5)
+    assert held == [False]
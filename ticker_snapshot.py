@@ -0,0 +1,123 @@
+"""
+Snapshot de tickers en bloque (Binance)
+Una sola petición a /api/v3/ticker/bookTicker y /api/v3/ticker/price por ciclo,
+compartida por el escáner, la valoración de balances y cualquier otro lector.
+"""
+import logging
+import threading
+import time
+
+
+class TickerSnapshot:
+    """Mejores bid/ask y último precio de todos los símbolos en un instante"""
+
+    def __init__(self, book_tickers=None, prices=None, fetched_at=None):
+        self.fetched_at = fetched_at or time.time()
+        self.books = {}
+        self.prices = {}
+
+        # Convertir a float una sola vez, al recibir los datos
+        for ticker in book_tickers or []:
+            try:
+                self.books[ticker['symbol']] = (
+                    float(ticker['bidPrice']),
+                    float(ticker['bidQty']),
+                    float(ticker['askPrice']),
+                    float(ticker['askQty'])
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        for ticker in prices or []:
+            try:
+                self.prices[ticker['symbol']] = float(ticker['price'])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def book(self, symbol):
+        """(bid, bid_qty, ask, ask_qty) o None"""
+        return self.books.get(symbol)
+
+    def price(self, symbol):
+        """Último precio; si no hay, el punto medio del book ticker"""
+        if symbol in self.prices:
+            return self.prices[symbol]
+
+        book = self.books.get(symbol)
+        if book and book[0] > 0 and book[2] > 0:
+            return (book[0] + book[2]) / 2
+        return None
+
+    def to_tickers(self, symbols):
+        """Tickers estilo ccxt (bid/ask/last) para publicar en el market data hub"""
+        tickers = {}
+        for symbol in symbols:
+            book = self.books.get(symbol)
+            if book is None:
+                continue
+            tickers[symbol] = {
+                'bid': book[0],
+                'ask': book[2],
+                'last': self.price(symbol),
+                'baseVolume': 0,
+                'timestamp': int(self.fetched_at * 1000)
+            }
+        return tickers
+
+    def symbols(self, quote_asset=None):
+        """Símbolos con book ticker válido, opcionalmente filtrados por moneda quote"""
+        return [
+            symbol for symbol, book in self.books.items()
+            if book[0] > 0 and book[2] > 0
+            and (quote_asset is None or symbol.endswith(quote_asset))
+        ]
+
+
+class TickerSnapshotCache:
+    """Comparte el snapshot entre todos los llamadores de un mismo ciclo"""
+
+    def __init__(self, client, max_age=1.0, include_prices=True):
+        self.client = client
+        self.max_age = max_age
+        self.include_prices = include_prices
+        self.snapshot = None
+        self.lock = threading.Lock()
+
+    def supported(self):
+        """El cliente expone los endpoints en bloque"""
+        return hasattr(self.client, 'get_book_tickers')
+
+    def get(self, max_age=None):
+        """Devolver el snapshot vigente o pedir uno nuevo (una petición por ciclo)"""
+        max_age = self.max_age if max_age is None else max_age
+
+        with self.lock:
+            if self.snapshot is not None and self.snapshot.age() < max_age:
+                return self.snapshot
+
+            try:
+                book_tickers = self.client.get_book_tickers()
+                prices = self.client.get_all_prices() if self.include_prices else None
+            except Exception as e:
+                logging.error(f"Error obteniendo snapshot de tickers: {e}")
+                book_tickers, prices = None, None
+
+            if book_tickers is None:
+                # Mantener el anterior antes que dejar a los lectores sin datos
+                return self.snapshot
+
+            self.snapshot = TickerSnapshot(book_tickers, prices)
+            return self.snapshot
+
+    def fetch_tickers(self, symbols):
+        """Fuente para MarketDataHub.register_source"""
+        snapshot = self.get()
+        return snapshot.to_tickers(symbols) if snapshot else {}
+
+    def invalidate(self):
+        """Forzar un snapshot nuevo en la siguiente lectura (inicio de ciclo)"""
+        with self.lock:
+            self.snapshot = None
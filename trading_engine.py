@@ -2,16 +2,28 @@ import asyncio
 import time
 import logging
 import os
-from datetime import datetime, timedelta
-from app import db, socketio
-from models import Trade, Balance, DailyStats, TradingConfig, Alert
+from app import socketio
+from models import TradingConfig
 from arbitrage_scanner import ArbitrageScanner
 from risk_manager import RiskManager
 from binance_client import BinanceClient
 from kucoin_client import KuCoinClient
+from ticker_snapshot import TickerSnapshotCache
+from market_data_hub import market_data_hub
+from symbol_metadata import symbol_metadata
+from cost_model import cost_model
+from engine_core import Strategy, Venue, Persistence, engine_core
+from balance_ledger import balance_ledger
+from usd_valuation import usd_valuation
+from exchange_adapters import BinanceAdapter
+from binance_depth_stream import BinanceDepthStream
+from kucoin_level2_stream import KuCoinLevel2Stream
 import threading
 
-class TradingEngine:
+class TradingEngine(Strategy):
+    name = 'trading_engine'
+    scan_interval = 5.0  # in case quotes stop arriving
+
     def __init__(self, telegram_bot=None):
         # Use hardcoded API keys for testing
         self.api_key = '2LMbgTKIlWhHBArycKAIyhEnCAM0OIA2rZGgkNYjaZXPag4BD5bAlnqzFWsARdV8'
@@ -23,6 +35,9 @@ class TradingEngine:
             raise ValueError("Missing Binance API credentials")
         
         self.client = BinanceClient(self.api_key, self.api_secret)
+        self.binance = BinanceAdapter(self.client)
+        self.venue = Venue(self.name, {'binance': self.binance})
+        self.persistence = Persistence(self.name)
         
         # Initialize KuCoin client
         self.kucoin_client = KuCoinClient(
@@ -30,7 +45,20 @@ class TradingEngine:
             '3e67acf6-a77d-462d-a19f-4a9f75057c4e',
             'AA290523'
         )
-        self.arbitrage_scanner = ArbitrageScanner(self.client)
+        symbol_metadata.register_binance(self.client)
+        symbol_metadata.register_kucoin(self.kucoin_client)
+        self.ticker_snapshots = TickerSnapshotCache(self.client, max_age=1.0)
+        market_data_hub.register_source('binance_spot', self.ticker_snapshots.fetch_tickers)
+        usd_valuation.register_snapshot('binance', self.ticker_snapshots)
+        self.arbitrage_scanner = ArbitrageScanner(self.client, self.ticker_snapshots)
+        self.depth_stream = BinanceDepthStream(self.client, self.arbitrage_scanner.target_symbols)
+        self.arbitrage_scanner.book_stream = self.depth_stream
+        
+        # KuCoin books for the same symbols (BTCUSDT -> BTC-USDT)
+        self.kucoin_symbols = {
+            symbol: symbol[:-4] + '-USDT' for symbol in self.arbitrage_scanner.target_symbols
+        }
+        self.kucoin_stream = KuCoinLevel2Stream(self.kucoin_client, list(self.kucoin_symbols.values()))
         self.risk_manager = RiskManager()
         
         # Trading parameters
@@ -39,9 +67,12 @@ class TradingEngine:
         self.stop_loss_percentage = 0.02  # 2% stop loss
         self.target_spread = 0.005  # 0.5% minimum spread
         self.reinvestment_rate = 0.8  # Reinvest 80% of profits
+        self.exit_retry = 5.0  # Seconds before retrying a failed sell, doubled on every attempt
+        self.max_exit_attempts = 5
         
         self.is_running = False
-        self.positions = {}
+        # Open positions survive restarts through the order journal
+        self.positions = self.persistence.recover()
         
         logging.info("Trading Engine initialized successfully")
 
@@ -49,52 +80,54 @@ class TradingEngine:
         """Start the trading engine"""
         self.is_running = True
         logging.info("Starting Trading Engine...")
+        self.client.prewarm()
+        self.kucoin_client.prewarm()
+        symbol_metadata.load('binance')  # desde disco si la caché está vigente
+        cost_model.start()
+        for order in self.venue.reconcile():
+            self.create_alert("Order Reconciliation",
+                              f"{order['side']} {order['symbol']} left no result before restart", "WARNING")
+        self.depth_stream.start()
+        self.kucoin_stream.start()
         
-        # Start main trading loop
-        while self.is_running:
-            try:
-                self.update_balances()
-                self.scan_opportunities()
-                self.manage_positions()
-                self.update_daily_stats()
-                
-                time.sleep(1)  # Short delay for high-frequency trading
-                
-            except Exception as e:
-                logging.error(f"Error in trading loop: {e}")
-                self.create_alert("Trading Error", f"Error in main loop: {str(e)}", "ERROR")
-                time.sleep(5)  # Wait longer on error
+        # Runs on the shared engine core: a scan on every fresh Binance quote, exits first
+        engine_core.register(self)
+
+    def markets(self):
+        return {'binance_spot': self.arbitrage_scanner.target_symbols}
+
+    def setup(self, core):
+        # Recovered positions that shrank below LOT_SIZE/notional can no longer be sold
+        symbols = list(self.positions)
+        if symbols:
+            positions = [self.positions[symbol] for symbol in symbols]
+            sellable = symbol_metadata.tradable_mask(
+                'binance', symbols, [p['quantity'] for p in positions], [p['buy_price'] for p in positions]
+            )
+            for symbol, position, ok in zip(symbols, positions, sellable):
+                if ok:
+                    self.track_position(symbol, position)
+                else:
+                    self.drop_dust(symbol, position)
+        # REST and SQL work runs on the core's I/O pool, never on the shared loop thread
+        core.every(self, 1.0, self.update_balances, blocking=True)
+        core.every(self, 60.0, self.persistence.update_daily_stats, blocking=True)
+
+    def scan(self):
+        self.scan_opportunities()
+
+    def on_error(self, error):
+        self.create_alert("Trading Error", f"Error in main loop: {str(error)}", "ERROR")
 
     def update_balances(self):
         """Update account balances"""
         try:
-            account_info = self.client.get_account()
-            total_usd_value = 0
+            balances = self.binance.get_balances()
+            if balances is None:
+                return
             
-            with db.session.begin():
-                # Clear existing balances
-                Balance.query.delete()
-                
-                for balance in account_info['balances']:
-                    free = float(balance['free'])
-                    locked = float(balance['locked'])
-                    total = free + locked
-                    
-                    if total > 0:
-                        # Get USD value
-                        usd_value = self.get_usd_value(balance['asset'], total)
-                        total_usd_value += usd_value
-                        
-                        # Save to database
-                        balance_record = Balance()
-                        balance_record.asset = balance['asset']
-                        balance_record.free_balance = free
-                        balance_record.locked_balance = locked
-                        balance_record.total_balance = total
-                        balance_record.usd_value = usd_value
-                        db.session.add(balance_record)
-                
-                db.session.commit()
+            # In-memory ledger valued from one bulk price snapshot; only changed rows hit the database
+            total_usd_value = balance_ledger.apply_snapshot('binance', balances)
             
             # Emit balance update via WebSocket
             socketio.emit('balance_update', {'total_usd': total_usd_value})
@@ -104,19 +137,9 @@ class TradingEngine:
 
     def get_usd_value(self, asset, amount):
         """Get USD value of an asset"""
-        if asset == 'USDT' or asset == 'BUSD':
-            return amount
-        
         try:
-            if asset == 'BTC':
-                ticker = self.client.get_symbol_ticker(symbol='BTCUSDT')
-            elif asset == 'ETH':
-                ticker = self.client.get_symbol_ticker(symbol='ETHUSDT')
-            else:
-                # Try to find a USDT pair
-                ticker = self.client.get_symbol_ticker(symbol=f'{asset}USDT')
-            
-            return amount * float(ticker['price'])
+            # Cross rates over the cycle's bulk snapshot instead of one request per asset
+            return usd_valuation.value(asset, amount, 'binance')
         except:
             return 0
 
@@ -125,15 +148,40 @@ class TradingEngine:
         try:
             opportunities = self.arbitrage_scanner.scan_all_pairs()
             
-            for opp in opportunities:
-                if opp['spread_percentage'] >= self.target_spread:
-                    # Check if we have enough balance
-                    if self.can_execute_trade(opp):
-                        self.execute_arbitrage(opp)
+            # Binance vs KuCoin from the two streamed books
+            for cross in self.arbitrage_scanner.scan_cross_exchange(self.kucoin_stream, self.kucoin_symbols):
+                logging.info(f"Cross-exchange spread {cross['symbol']}: buy {cross['buy_exchange']} "
+                             f"sell {cross['sell_exchange']} ({cross['spread_percentage']:.3%})")
+            
+            # Cycles across the whole Binance currency graph (reported, not yet executed)
+            for cycle in self.arbitrage_scanner.scan_triangular():
+                logging.info(f"Triangular cycle {' -> '.join(cycle['path'])}: "
+                             f"{cycle['profit_percentage']:.3f}%")
+            
+            # Fire on the edge left after fees and adverse selection, not the raw spread
+            candidates = [opp for opp in opportunities if opp['expected_edge'] >= self.target_spread]
+            if candidates:
+                # One vectorised pass drops the buys Binance would reject for LOT_SIZE or notional
+                trade_amount = self.trade_amount()
+                prices = [opp['buy_price'] for opp in candidates]
+                tradable = symbol_metadata.tradable_mask(
+                    'binance', [opp['symbol'] for opp in candidates],
+                    [trade_amount / price for price in prices], prices
+                )
+                candidates = [opp for opp, ok in zip(candidates, tradable) if ok]
+            
+            for opp in candidates:
+                # Check if we have enough balance
+                if self.can_execute_trade(opp):
+                    self.execute_arbitrage(opp)
                         
         except Exception as e:
             logging.error(f"Error scanning opportunities: {e}")
 
+    def trade_amount(self):
+        """USDT to spend on the next trade: 10% of the balance, between min and max"""
+        return min(self.max_trade_amount, max(self.min_trade_amount, self.get_asset_balance('USDT') * 0.1))
+
     def can_execute_trade(self, opportunity):
         """Check if we can execute a trade"""
         try:
@@ -141,7 +189,8 @@ class TradingEngine:
             usdt_balance = self.get_asset_balance('USDT')
             
             # Calculate trade amount (between min and max)
-            trade_amount = min(self.max_trade_amount, max(self.min_trade_amount, usdt_balance * 0.1))
+            trade_amount = self.trade_amount()
+            trade_amount = symbol_metadata.quantize_quote('binance', opportunity['symbol'], trade_amount)
             
             # Check if we have enough balance
             return usdt_balance >= trade_amount and trade_amount >= self.min_trade_amount
@@ -153,8 +202,7 @@ class TradingEngine:
     def get_asset_balance(self, asset):
         """Get balance for a specific asset"""
         try:
-            balance = Balance.query.filter_by(asset=asset).first()
-            return balance.free_balance if balance else 0
+            return balance_ledger.free('binance', asset)
         except:
             return 0
 
@@ -167,6 +215,14 @@ class TradingEngine:
             # Calculate trade amount
             trade_amount = min(self.max_trade_amount, max(self.min_trade_amount, usdt_balance * 0.1))
             
+            if trade_amount < self.min_trade_amount:
+                return
+            
+            # Never take more than the book absorbs within 20 bps of slippage
+            trade_amount = self.risk_manager.size_for_depth(
+                trade_amount, self.arbitrage_scanner.get_depth_book(symbol)
+            )
+            trade_amount = symbol_metadata.quantize_quote('binance', symbol, trade_amount)
             if trade_amount < self.min_trade_amount:
                 return
             
@@ -178,41 +234,48 @@ class TradingEngine:
             if not self.risk_manager.can_execute_trade(symbol, trade_amount):
                 return
             
-            # Execute buy order
-            buy_order = self.client.order_market_buy(
-                symbol=symbol,
-                quoteOrderQty=trade_amount
+            # The market order runs on the core's I/O pool; its fill comes back to the loop
+            self.core.submit(
+                self, self.venue.buy, 'binance', symbol, trade_amount, key=('buy', symbol),
+                then=lambda buy_order: self.on_buy(symbol, trade_amount, buy_price, buy_order)
             )
-            
-            if buy_order['status'] == 'FILLED':
-                # Record the trade
-                trade = Trade(
+                
+        except Exception as e:
+            logging.error(f"API error executing arbitrage: {e}")
+            self.create_alert("Trading Error", f"Failed to execute arbitrage: {str(e)}", "ERROR")
+        except Exception as e:
+            logging.error(f"Error executing arbitrage: {e}")
+
+    def on_buy(self, symbol, trade_amount, buy_price, buy_order):
+        """Buy result back on the engine loop: record it and track the new position"""
+        try:
+            if buy_order is not None and buy_order.success:
+                # Record the trade (written to SQL in batches by the journal)
+                self.persistence.record_trade(
                     symbol=symbol,
                     side='BUY',
-                    quantity=float(buy_order['executedQty']),
-                    price=float(buy_order['fills'][0]['price']),
+                    quantity=buy_order.filled_qty,
+                    price=buy_order.avg_price,
                     total_value=trade_amount,
-                    fee=sum(float(fill['commission']) for fill in buy_order['fills']),
+                    fee=buy_order.fee,
                     strategy='arbitrage',
-                    order_id=buy_order['orderId']
+                    order_id=buy_order.order_id
                 )
                 
-                with db.session.begin():
-                    db.session.add(trade)
-                    db.session.commit()
-                
                 # Store position for potential sell
                 self.positions[symbol] = {
-                    'quantity': float(buy_order['executedQty']),
-                    'buy_price': float(buy_order['fills'][0]['price']),
+                    'quantity': buy_order.filled_qty,
+                    'buy_price': buy_order.avg_price,
                     'timestamp': time.time()
                 }
+                self.persistence.open_position(symbol, self.positions[symbol])
+                self.track_position(symbol, self.positions[symbol])
                 
                 logging.info(f"Executed arbitrage buy: {symbol} - {trade_amount} USDT")
                 
-                # Send notification
+                # Send notification (off the loop: it is an HTTP call)
                 if self.telegram_bot:
-                    self.telegram_bot.send_message(f"🟢 Arbitrage Buy Executed\nSymbol: {symbol}\nAmount: ${trade_amount:.2f}\nPrice: {buy_price:.6f}")
+                    self.core.submit(self, self.telegram_bot.send_message, f"🟢 Arbitrage Buy Executed\nSymbol: {symbol}\nAmount: ${trade_amount:.2f}\nPrice: {buy_price:.6f}")
                 
                 # Emit trade update
                 socketio.emit('trade_executed', {
@@ -223,65 +286,83 @@ class TradingEngine:
                 })
                 
         except Exception as e:
-            logging.error(f"API error executing arbitrage: {e}")
-            self.create_alert("Trading Error", f"Failed to execute arbitrage: {str(e)}", "ERROR")
-        except Exception as e:
-            logging.error(f"Error executing arbitrage: {e}")
+            logging.error(f"Error recording arbitrage buy: {e}")
+
+    def track_position(self, symbol, position):
+        """Register stop, profit target and time exit of a position with the engine core"""
+        buy_price = position['buy_price']
+        self.core.track(
+            self, symbol, 'binance_spot', symbol,
+            stop_price=buy_price * (1 - self.stop_loss_percentage),
+            target_price=buy_price * 1.008,  # 0.8% minimum profit
+            deadline=position['timestamp'] + 300,  # hold for max 5 minutes
+            position=position,
+            price_field='last'
+        )
 
-    def manage_positions(self):
-        """Manage open positions and execute sells when profitable"""
-        current_time = time.time()
-        positions_to_remove = []
+    def on_exit(self, symbol, position, reason, price):
+        """Position book trigger: sell and drop the position"""
+        if price is None:
+            quote = market_data_hub.get_quote('binance_spot', symbol, max_age=1.0)
+            if not quote or not quote['last']:
+                self.retry_exit(symbol, position, 'no quote')
+                return
+            price = float(quote['last'])
         
-        for symbol, position in self.positions.items():
-            try:
-                # Get current price
-                ticker = self.client.get_symbol_ticker(symbol=symbol)
-                current_price = float(ticker['price'])
-                
-                buy_price = position['buy_price']
-                quantity = position['quantity']
-                
-                # Calculate profit percentage
-                profit_pct = (current_price - buy_price) / buy_price
-                
-                # Check stop loss
-                if profit_pct <= -self.stop_loss_percentage:
-                    self.execute_sell(symbol, position, current_price, "STOP_LOSS")
-                    positions_to_remove.append(symbol)
-                    continue
-                
-                # Check for profit target (0.8% minimum profit)
-                if profit_pct >= 0.008:
-                    self.execute_sell(symbol, position, current_price, "PROFIT_TARGET")
-                    positions_to_remove.append(symbol)
-                    continue
-                
-                # Time-based exit (hold for max 5 minutes)
-                if current_time - position['timestamp'] > 300:  # 5 minutes
-                    self.execute_sell(symbol, position, current_price, "TIME_EXIT")
-                    positions_to_remove.append(symbol)
-                    
-            except Exception as e:
-                logging.error(f"Error managing position {symbol}: {e}")
+        # Round down to LOT_SIZE so the close is not rejected; below the minimums it cannot be sold at all
+        quantity = symbol_metadata.prepare_order('binance', symbol, position['quantity'], price)
+        if quantity is None:
+            self.drop_dust(symbol, position)
+            return
         
-        # Remove closed positions
-        for symbol in positions_to_remove:
-            del self.positions[symbol]
+        # The sell runs on the core's I/O pool; the outcome comes back to the loop
+        self.core.submit(self, self.execute_sell, symbol, position, quantity, reason, key=('sell', symbol),
+                         then=lambda sold: self.on_sold(symbol, position, reason, sold))
+
+    def on_sold(self, symbol, position, reason, sold):
+        """Sell outcome back on the engine loop: drop the position or retry the exit"""
+        if not sold:
+            self.retry_exit(symbol, position, 'sell failed')
+            return
+        self.positions.pop(symbol, None)
+        self.persistence.close_position(symbol, reason)
 
-    def execute_sell(self, symbol, position, current_price, reason):
-        """Execute a sell order"""
+    def retry_exit(self, symbol, position, error):
+        """Retry a failed exit after a doubling delay; give up after max_exit_attempts
+
+        While it waits only the retry deadline is watched, so a price past the
+        stop does not fire the same failing sell on every tick.
+        """
+        attempts = position['exit_attempts'] = position.get('exit_attempts', 0) + 1
+        if attempts >= self.max_exit_attempts:
+            self.create_alert("Exit Abandoned",
+                              f"{symbol}: {attempts} failed sells ({error}), position left open for manual review",
+                              "ERROR")
+            return
+        self.core.track(
+            self, symbol, 'binance_spot', symbol,
+            deadline=time.time() + self.exit_retry * 2 ** (attempts - 1),
+            position=position,
+            price_field='last'
+        )
+
+    def drop_dust(self, symbol, position):
+        """A position below the exchange minimums cannot be sold: alert and stop tracking it"""
+        self.create_alert("Unsellable Position",
+                          f"{position['quantity']} {symbol} is below Binance minimums, left in the account",
+                          "WARNING")
+        self.positions.pop(symbol, None)
+        self.persistence.close_position(symbol, 'dust')
+
+    def execute_sell(self, symbol, position, quantity, reason):
+        """Execute a sell order; returns True if the position was sold"""
         try:
-            quantity = position['quantity']
-            
             # Execute market sell
-            sell_order = self.client.order_market_sell(
-                symbol=symbol,
-                quantity=quantity
-            )
+            sell_order = self.venue.sell('binance', symbol, quantity)
             
-            if sell_order['status'] == 'FILLED':
-                executed_price = float(sell_order['fills'][0]['price'])
+            if sell_order.success:
+                quantity = sell_order.filled_qty
+                executed_price = sell_order.avg_price
                 total_value = quantity * executed_price
                 
                 # Calculate profit/loss
@@ -289,22 +370,18 @@ class TradingEngine:
                 profit_loss = total_value - buy_total
                 
                 # Record the trade
-                trade = Trade(
+                self.persistence.record_trade(
                     symbol=symbol,
                     side='SELL',
                     quantity=quantity,
                     price=executed_price,
                     total_value=total_value,
-                    fee=sum(float(fill['commission']) for fill in sell_order['fills']),
+                    fee=sell_order.fee,
                     strategy='arbitrage',
                     profit_loss=profit_loss,
-                    order_id=sell_order['orderId']
+                    order_id=sell_order.order_id
                 )
                 
-                with db.session.begin():
-                    db.session.add(trade)
-                    db.session.commit()
-                
                 logging.info(f"Executed sell: {symbol} - P/L: ${profit_loss:.2f} - Reason: {reason}")
                 
                 # Send notification
@@ -319,65 +396,19 @@ class TradingEngine:
                     'profit': profit_loss,
                     'reason': reason
                 })
-                
-        except Exception as e:
-            logging.error(f"Error executing sell for {symbol}: {e}")
-
-    def update_daily_stats(self):
-        """Update daily trading statistics"""
-        try:
-            today = datetime.now().date()
+                return True
             
-            # Get or create today's stats
-            stats = DailyStats.query.filter_by(date=today).first()
-            if not stats:
-                # Get starting balance (end of yesterday or initial balance)
-                yesterday = today - timedelta(days=1)
-                yesterday_stats = DailyStats.query.filter_by(date=yesterday).first()
-                starting_balance = yesterday_stats.ending_balance if yesterday_stats else 30.0  # Initial $30
+            logging.error(f"Sell of {symbol} failed: {sell_order.error or 'unknown error'}")
+            return False
                 
-                stats = DailyStats(
-                    date=today,
-                    starting_balance=starting_balance,
-                    ending_balance=starting_balance
-                )
-                db.session.add(stats)
-            
-            # Update statistics
-            today_trades = Trade.query.filter(
-                Trade.executed_at >= datetime.combine(today, datetime.min.time())
-            ).all()
-            
-            stats.total_trades = len(today_trades)
-            stats.successful_trades = len([t for t in today_trades if t.profit_loss > 0])
-            stats.total_profit = sum(t.profit_loss for t in today_trades)
-            stats.total_fees = sum(t.fee for t in today_trades)
-            
-            # Get current total balance
-            current_balance = sum(b.usd_value for b in Balance.query.all())
-            stats.ending_balance = current_balance
-            
-            # Calculate ROI
-            if stats.starting_balance > 0:
-                stats.roi_percentage = ((stats.ending_balance - stats.starting_balance) / stats.starting_balance) * 100
-            
-            db.session.commit()
-            
         except Exception as e:
-            logging.error(f"Error updating daily stats: {e}")
+            logging.error(f"Error executing sell for {symbol}: {e}")
+            return False
 
     def create_alert(self, title, message, alert_type):
         """Create a system alert"""
         try:
-            alert = Alert(
-                title=title,
-                message=message,
-                alert_type=alert_type
-            )
-            
-            with db.session.begin():
-                db.session.add(alert)
-                db.session.commit()
+            self.persistence.alert(title, message, alert_type)
             
             # Emit alert via WebSocket
             socketio.emit('new_alert', {
@@ -392,4 +423,9 @@ class TradingEngine:
     def stop(self):
         """Stop the trading engine"""
         self.is_running = False
+        engine_core.unregister(self)
+        self.depth_stream.stop()
+        self.kucoin_stream.stop()
+        self.client.close()
+        self.kucoin_client.close()
         logging.info("Trading Engine stopped")
@@ -0,0 +1,350 @@
+"""
+Arbitraje triangular/cíclico dentro de un mismo exchange
+Grafo de monedas construido con los book tickers de todos los pares: cada par
+BASE/QUOTE aporta dos aristas, vender base al bid y comprar base al ask, con
+peso -log(precio x (1 - comisión)). Un ciclo de peso negativo es una secuencia
+de conversiones que termina con más de la moneda inicial.
+Las distancias se mantienen entre actualizaciones (SPFA incremental): solo se
+vuelven a relajar las aristas tocadas por cotizaciones que cambiaron y, cuando
+una arista empeora, solo el subárbol de caminos que dependía de ella.
+"""
+import logging
+import math
+import time
+from collections import deque
+from symbol_metadata import DEFAULT_FEE
+
+EPSILON = 1e-12
+
+
+class Edge:
+    """Conversión from_asset -> to_asset operando symbol en el lado side"""
+
+    __slots__ = ('source', 'target', 'symbol', 'side', 'price', 'rate', 'weight')
+
+    def __init__(self, source, target, symbol, side):
+        self.source = source
+        self.target = target
+        self.symbol = symbol
+        self.side = side  # BUY: quote -> base al ask, SELL: base -> quote al bid
+        self.price = 0.0
+        self.rate = 0.0
+        self.weight = math.inf  # sin cotización: arista inactiva
+
+
+class ArbitrageCycle:
+    """Ciclo rentable; legs en orden de ejecución"""
+
+    __slots__ = ('legs', 'profit', 'detected_at')
+
+    def __init__(self, legs, detected_at=None):
+        self.legs = legs
+        self.profit = 0.0
+        self.detected_at = detected_at or time.time()
+        self.refresh()
+
+    @property
+    def key(self):
+        """Identidad independiente del punto de partida del ciclo"""
+        symbols = [(leg.symbol, leg.side) for leg in self.legs]
+        start = symbols.index(min(symbols))
+        return tuple(symbols[start:] + symbols[:start])
+
+    @property
+    def assets(self):
+        return [leg.source for leg in self.legs]
+
+    def refresh(self):
+        """Recalcular la rentabilidad con los precios actuales de las aristas"""
+        weight = sum(leg.weight for leg in self.legs)
+        self.profit = math.exp(-weight) - 1 if weight < math.inf else -1.0
+        return self.profit
+
+    def to_dict(self):
+        return {
+            'path': self.assets + [self.legs[0].source],
+            'legs': [
+                {'symbol': leg.symbol, 'side': leg.side, 'price': leg.price, 'from': leg.source, 'to': leg.target}
+                for leg in self.legs
+            ],
+            'profit_percentage': self.profit * 100,
+            'detected_at': self.detected_at
+        }
+
+
+class TriangularArbitrage:
+    """Grafo de monedas con detección incremental de ciclos negativos"""
+
+    def __init__(self, fee=DEFAULT_FEE, min_profit=0.0, max_hops=4, max_relaxations=200000):
+        self.fee = fee
+        self.min_profit = min_profit
+        self.max_hops = max_hops  # ciclos más largos no se ejecutan a tiempo: no se registran
+        self.max_relaxations = max_relaxations
+
+        self.nodes = {}           # activo -> índice
+        self.assets = []
+        self.out_edges = []       # índice -> [Edge]
+        self.in_edges = []
+        self.pair_edges = {}      # símbolo -> (arista SELL, arista BUY)
+        self.edges_between = {}   # (origen, destino) -> [Edge]
+        self.fees = {}
+
+        # Árbol de caminos mínimos desde un origen virtual unido a todos los nodos con peso 0
+        self.dist = []
+        self.pred = []            # Edge por la que se llegó, o None
+        self.hops = []
+        self.children = []
+        self.queue = deque()
+        self.queued = []
+
+        self.cycles = {}          # key -> ArbitrageCycle
+        self.cycles_by_symbol = {}
+
+    # Construcción del grafo
+
+    def _node(self, asset):
+        index = self.nodes.get(asset)
+        if index is None:
+            index = len(self.assets)
+            self.nodes[asset] = index
+            self.assets.append(asset)
+            self.out_edges.append([])
+            self.in_edges.append([])
+            self.dist.append(0.0)
+            self.pred.append(None)
+            self.hops.append(0)
+            self.children.append(set())
+            self.queued.append(False)
+        return index
+
+    def add_pair(self, symbol, base, quote, fee=None):
+        """Registrar un par; sus aristas quedan inactivas hasta la primera cotización"""
+        if symbol in self.pair_edges:
+            return
+        base_index, quote_index = self._node(base), self._node(quote)
+        sell = Edge(base_index, quote_index, symbol, 'SELL')
+        buy = Edge(quote_index, base_index, symbol, 'BUY')
+        for edge in (sell, buy):
+            self.out_edges[edge.source].append(edge)
+            self.in_edges[edge.target].append(edge)
+            self.edges_between.setdefault((edge.source, edge.target), []).append(edge)
+        self.pair_edges[symbol] = (sell, buy)
+        self.fees[symbol] = self.fee if fee is None else fee
+
+    def add_pairs_from_rules(self, rules):
+        """Desde las reglas de symbol_metadata ({símbolo nativo: SymbolRules})"""
+        for symbol, rule in rules.items():
+            if rule.base and rule.quote and symbol == rule.symbol:
+                self.add_pair(symbol, rule.base, rule.quote, rule.taker_fee)
+
+    # Actualización de cotizaciones
+
+    def _set_edge(self, edge, price, rate, changed_up, changed_down):
+        weight = -math.log(rate) if rate > 0 else math.inf
+        edge.price = price
+        edge.rate = rate
+        if abs(weight - edge.weight) <= EPSILON:
+            return
+        if weight > edge.weight:
+            changed_up.append(edge)
+        else:
+            changed_down.append(edge)
+        edge.weight = weight
+
+    def update_quote(self, symbol, bid, ask, changed_up=None, changed_down=None):
+        """Actualizar las dos aristas de un par; devuelve True si algún peso cambió"""
+        edges = self.pair_edges.get(symbol)
+        if edges is None:
+            return False
+        sell, buy = edges
+        fee = self.fees[symbol]
+        up = [] if changed_up is None else changed_up
+        down = [] if changed_down is None else changed_down
+        before = len(up) + len(down)
+
+        self._set_edge(sell, bid, bid * (1 - fee) if bid > 0 else 0.0, up, down)
+        self._set_edge(buy, ask, (1 - fee) / ask if ask > 0 else 0.0, up, down)
+
+        if changed_up is None:
+            self._process(up, down)
+        return len(up) + len(down) > before
+
+    def update_quotes(self, books):
+        """Aplicar un lote {símbolo: (bid, ask)} y relajar una sola vez; devuelve ciclos rentables"""
+        changed_up, changed_down = [], []
+        for symbol, (bid, ask) in books.items():
+            self.update_quote(symbol, bid, ask, changed_up, changed_down)
+        if changed_up or changed_down:
+            self._process(changed_up, changed_down)
+        return self.opportunities()
+
+    def update_from_snapshot(self, snapshot):
+        """Desde un ticker_snapshot.TickerSnapshot (bid, bid_qty, ask, ask_qty)"""
+        return self.update_quotes({
+            symbol: (book[0], book[2])
+            for symbol, book in snapshot.books.items()
+            if symbol in self.pair_edges
+        })
+
+    # SPFA incremental
+
+    def _push(self, node):
+        if not self.queued[node]:
+            self.queued[node] = True
+            self.queue.append(node)
+
+    def _set_pred(self, node, edge):
+        old = self.pred[node]
+        if old is not None:
+            self.children[old.source].discard(node)
+        self.pred[node] = edge
+        if edge is not None:
+            self.children[edge.source].add(node)
+
+    def _invalidate(self, root):
+        """Descolgar el subárbol que pasaba por una arista que empeoró"""
+        # Con un ciclo negativo largo a medio recorrer el árbol puede tener bucles
+        stack = [root]
+        subtree = []
+        seen = {root}
+        while stack:
+            node = stack.pop()
+            subtree.append(node)
+            for child in self.children[node]:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+
+        for node in subtree:
+            self._set_pred(node, None)
+            self.dist[node] = 0.0
+            self.hops[node] = 0
+        for node in subtree:
+            self._push(node)
+            for edge in self.in_edges[node]:
+                self._push(edge.source)
+
+    def _process(self, changed_up, changed_down):
+        for edge in changed_up:
+            if self.pred[edge.target] is edge:
+                self._invalidate(edge.target)
+        for edge in changed_down:
+            self._push(edge.source)
+            self._scan_triangles(edge)
+
+        self._refresh_cycles(changed_up + changed_down)
+        self._relax()
+
+    def _scan_triangles(self, edge):
+        """Triángulos que pasan por una arista que mejoró (el SPFA puede taparlos con otro ciclo)"""
+        if edge.weight == math.inf:
+            return
+        for second in self.out_edges[edge.target]:
+            if second.target == edge.source or second.weight == math.inf:
+                continue
+            for third in self.edges_between.get((second.target, edge.source), ()):
+                if edge.weight + second.weight + third.weight < -EPSILON:
+                    self._record(ArbitrageCycle([edge, second, third]))
+
+    def _cycle_length(self, edge):
+        """Legs del ciclo si edge.target es antecesor de edge.source en el árbol, si no 0"""
+        # hops de los descendientes puede quedar desfasado: subir hasta la raíz
+        node = edge.source
+        for length in range(1, len(self.assets) + 1):
+            if node == edge.target:
+                return length
+            parent = self.pred[node]
+            if parent is None:
+                return 0
+            node = parent.source
+        return 0
+
+    def _cycle_from(self, edge):
+        legs = [edge]
+        node = edge.source
+        while node != edge.target:
+            parent = self.pred[node]
+            legs.append(parent)
+            node = parent.source
+        legs.reverse()
+        return ArbitrageCycle(legs)
+
+    def _relax(self):
+        relaxations = 0
+        node_count = len(self.assets)
+        while self.queue:
+            node = self.queue.popleft()
+            self.queued[node] = False
+            base = self.dist[node]
+
+            for edge in self.out_edges[node]:
+                candidate = base + edge.weight
+                if candidate >= self.dist[edge.target] - EPSILON:
+                    continue
+
+                length = self._cycle_length(edge)
+                if length:
+                    # Ciclo negativo: registrarlo si es ejecutable y no dar la vuelta
+                    if length <= self.max_hops:
+                        self._record(self._cycle_from(edge))
+                    continue
+                if self.hops[node] + 1 >= node_count:
+                    continue  # ciclo negativo largo: no ejecutable, cortar
+
+                self.dist[edge.target] = candidate
+                self.hops[edge.target] = self.hops[node] + 1
+                self._set_pred(edge.target, edge)
+                self._push(edge.target)
+
+                relaxations += 1
+                if relaxations >= self.max_relaxations:
+                    logging.warning("Grafo triangular: límite de relajaciones alcanzado")
+                    self.queue.clear()
+                    self.queued = [False] * node_count
+                    return
+
+    # Ciclos encontrados
+
+    def _record(self, cycle):
+        if cycle.profit <= self.min_profit:
+            return
+        key = cycle.key
+        if key in self.cycles:
+            self.cycles[key].refresh()
+            return
+        self.cycles[key] = cycle
+        for leg in cycle.legs:
+            self.cycles_by_symbol.setdefault(leg.symbol, set()).add(key)
+        logging.info(f"Ciclo de arbitraje {' -> '.join(self.assets[a] for a in cycle.assets)}: "
+                     f"{cycle.profit:.4%}")
+
+    def _drop(self, key):
+        cycle = self.cycles.pop(key, None)
+        if cycle is None:
+            return
+        for leg in cycle.legs:
+            keys = self.cycles_by_symbol.get(leg.symbol)
+            if keys:
+                keys.discard(key)
+
+    def _refresh_cycles(self, edges):
+        """Revaluar solo los ciclos que usan algún par con precio nuevo"""
+        touched = set()
+        for edge in edges:
+            touched.update(self.cycles_by_symbol.get(edge.symbol, ()))
+        for key in touched:
+            cycle = self.cycles.get(key)
+            if cycle is not None and cycle.refresh() <= self.min_profit:
+                self._drop(key)
+
+    def opportunities(self, limit=10):
+        """Ciclos vivos ordenados por rentabilidad, con nombres de activos"""
+        ranked = sorted(self.cycles.values(), key=lambda cycle: cycle.profit, reverse=True)[:limit]
+        result = []
+        for cycle in ranked:
+            data = cycle.to_dict()
+            data['path'] = [self.assets[node] for node in data['path']]
+            for leg in data['legs']:
+                leg['from'], leg['to'] = self.assets[leg['from']], self.assets[leg['to']]
+            result.append(data)
+        return result
@@ -0,0 +1,206 @@
+"""
+Valoración en USD de todos los activos
+Los motores valoraban cada activo con una petición de ticker a su par USDT
+(30 activos = 30 peticiones seguidas) y daban 0 a todo lo que no tuviera par
+directo. Aquí se piden todos los precios de un exchange en una sola foto en
+bloque (snapshot de tickers, fetch_tickers sin símbolos o las cotizaciones del
+market data hub) y se construye un grafo de conversión entre activos: cada
+activo se valora por la ruta más corta hasta USD (activo -> BTC -> USDT, con
+las stablecoins equivalentes a 1 USD). El grafo se guarda en caché y una
+cartera entera se valora en una sola pasada vectorizada.
+"""
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+from async_exchange import run_exchange_command
+from cost_model import EXCHANGE_ALIASES, cost_model
+from market_data_hub import market_data_hub
+
+STABLE_ASSETS = ('USDT', 'USD', 'USDC', 'BUSD', 'FDUSD', 'TUSD', 'DAI')
+MAX_HOPS = 3  # USD -> USDT -> BTC -> activo
+
+
+def _canonical(exchange):
+    if exchange is None:
+        return None
+    exchange = exchange.lower()
+    return EXCHANGE_ALIASES.get(exchange, exchange)
+
+
+def _quote_price(ticker):
+    """Último precio o, si no hay, punto medio bid/ask"""
+    last = ticker.get('last')
+    if last:
+        return last
+    bid, ask = ticker.get('bid'), ticker.get('ask')
+    if bid and ask:
+        return (bid + ask) / 2
+    return None
+
+
+class ConversionGraph:
+    """Tipos de cambio entre activos a partir de pares (base, quote, precio)"""
+
+    def __init__(self, pairs):
+        self.edges = {}  # activo -> {vecino: unidades de vecino por unidad de activo}
+        for base, quote, price in pairs:
+            if not base or not quote or not price or price <= 0:
+                continue
+            self.edges.setdefault(base, {})[quote] = price
+            self.edges.setdefault(quote, {})[base] = 1.0 / price
+        for asset in STABLE_ASSETS:
+            self.edges.setdefault(asset, {})['USD'] = 1.0
+            self.edges.setdefault('USD', {})[asset] = 1.0
+        self.rates = self._solve()
+        self.created_at = time.time()
+
+    def _solve(self):
+        """Recorrido en anchura desde USD: cada activo por la ruta con menos saltos
+
+        Las stablecoins quedan a un salto y se exploran primero, así que un
+        activo con par directo a USDT nunca se valora a través de BTC.
+        """
+        rates = {'USD': 1.0}
+        hops = {'USD': 0}
+        queue = deque(['USD'])
+        while queue:
+            asset = queue.popleft()
+            if hops[asset] >= MAX_HOPS:
+                continue
+            for neighbour in self.edges.get(asset, ()):
+                if neighbour in rates:
+                    continue
+                rates[neighbour] = self.edges[neighbour][asset] * rates[asset]
+                hops[neighbour] = hops[asset] + 1
+                queue.append(neighbour)
+        return rates
+
+
+class UsdValuation:
+    def __init__(self, hub=None, max_age=30.0):
+        self.hub = hub or market_data_hub
+        self.max_age = max_age
+        self.snapshots = {}  # exchange -> TickerSnapshotCache (pares nativos tipo BTCUSDT)
+        self.rates_cache = {}  # exchange (None: todos) -> (creado, {activo: USD})
+        self.lock = threading.Lock()
+
+    def register_snapshot(self, exchange, cache):
+        """Usar el snapshot en bloque de un motor como foto de precios del exchange"""
+        with self.lock:
+            self.snapshots[_canonical(exchange)] = cache
+            self.rates_cache.pop(_canonical(exchange), None)
+
+    # Fotos de precios
+
+    def _snapshot_pairs(self, exchange, cache):
+        snapshot = cache.get(max_age=self.max_age)
+        if snapshot is None:
+            return []
+        pairs = []
+        for symbol in set(snapshot.prices) | set(snapshot.books):
+            base, quote = cost_model.assets(exchange, symbol)
+            pairs.append((base, quote, snapshot.price(symbol)))
+        return pairs
+
+    def _ccxt_pairs(self, exchange):
+        """Todos los tickers del exchange en una petición (fetch_tickers sin símbolos)"""
+        tickers = run_exchange_command('fetch_tickers', exchange, params={}, timeout=10)
+        if not tickers:
+            return []
+        pairs = []
+        for symbol, ticker in tickers.items():
+            if '/' not in symbol:
+                continue
+            base, quote = symbol.split('/', 1)
+            pairs.append((base, quote.split(':')[0], _quote_price(ticker)))
+        return pairs
+
+    def _hub_pairs(self, exchange=None):
+        pairs = []
+        for (quote_exchange, symbol), quote in self.hub.snapshot().items():
+            if exchange is not None and _canonical(quote_exchange) != exchange:
+                continue
+            base, quote_asset = cost_model.assets(quote_exchange, symbol)
+            pairs.append((base, quote_asset, _quote_price(quote)))
+        return pairs
+
+    def _pairs(self, exchange):
+        """Una sola foto en bloque: la del exchange o, sin exchange, todo lo que ya hay en memoria"""
+        if exchange is None:
+            pairs = self._hub_pairs()
+            with self.lock:
+                snapshots = list(self.snapshots.items())
+            for name, cache in snapshots:
+                pairs += self._snapshot_pairs(name, cache)
+            return pairs
+        cache = self.snapshots.get(exchange)
+        if cache is not None:
+            return self._snapshot_pairs(exchange, cache) + self._hub_pairs(exchange)
+        try:
+            return self._ccxt_pairs(exchange) + self._hub_pairs(exchange)
+        except Exception as e:
+            logging.error(f"Error obteniendo precios de {exchange}: {e}")
+            return self._hub_pairs(exchange)
+
+    # Valoración
+
+    def rates(self, exchange=None):
+        """{activo: USD por unidad}; los precios del exchange mandan y el resto sale de los demás"""
+        exchange = _canonical(exchange)
+        cached = self._cached(exchange)
+        if cached is not None:
+            return cached
+
+        # Las fotos (fetch_tickers puede tardar segundos) se piden sin el lock tomado
+        pairs = self._pairs(exchange)
+        rates = ConversionGraph(pairs).rates
+        if exchange is not None:
+            fallback = self._cached(None)
+            if fallback is None:
+                fallback = self._store(None, self._pairs(None))
+            rates = dict(fallback, **rates)
+        return self._store(exchange, pairs, rates)
+
+    def _cached(self, exchange):
+        with self.lock:
+            cached = self.rates_cache.get(exchange)
+        if cached is not None and time.time() - cached[0] < self.max_age:
+            return cached[1]
+        return None
+
+    def _store(self, exchange, pairs, rates=None):
+        """Guardar en caché; una foto sin pares (exchange caído) no se guarda"""
+        if rates is None:
+            rates = ConversionGraph(pairs).rates
+        if pairs:
+            with self.lock:
+                self.rates_cache[exchange] = (time.time(), rates)
+        return rates
+
+    def value(self, asset, amount, exchange=None):
+        if asset in STABLE_ASSETS:
+            return amount
+        return amount * self.rates(exchange).get(asset, 0.0)
+
+    def value_all(self, amounts, exchange=None):
+        """{activo: cantidad} -> {activo: USD} con una foto y una sola pasada"""
+        if not amounts:
+            return {}
+        rates = self.rates(exchange)
+        assets = list(amounts)
+        quantities = np.fromiter((amounts[asset] for asset in assets), dtype=float, count=len(assets))
+        prices = np.fromiter((rates.get(asset, 0.0) for asset in assets), dtype=float, count=len(assets))
+        return dict(zip(assets, (quantities * prices).tolist()))
+
+    def invalidate(self, exchange=None):
+        with self.lock:
+            if exchange is None:
+                self.rates_cache.clear()
+            else:
+                self.rates_cache.pop(_canonical(exchange), None)
+
+
+# Instancia global compartida por todos los motores
+usd_valuation = UsdValuation()
@@ -1,6 +1,7 @@
 from flask_socketio import emit, disconnect
 from app import socketio, db
-from models import Trade, Balance, Alert
+from models import Trade, Alert
+from balance_ledger import balance_ledger
 import logging
 from datetime import datetime
 
@@ -19,7 +20,7 @@ def on_disconnect():
 def handle_get_balance():
     """Send current balance to client"""
     try:
-        balances = Balance.query.all()
+        balances = balance_ledger.snapshot()
         total_usd = sum(b.usd_value for b in balances)
         
         balance_data = []
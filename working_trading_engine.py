@@ -1,19 +1,23 @@
-import subprocess
-import json
 import logging
 import time
 import threading
-from datetime import datetime, timedelta
-from app import db
-from models import Trade, Balance, DailyStats, Alert
+from async_exchange import run_exchange_command
+from opportunity_tracker import opportunity_tracker
+from engine_core import Strategy, Persistence, engine_core
+from market_data_hub import market_data_hub
 
-class WorkingTradingEngine:
+class WorkingTradingEngine(Strategy):
     """Motor de trading funcionando con exchanges disponibles"""
     
+    name = 'working_trading_engine'
+    scan_interval = 15.0
+    
     def __init__(self, telegram_bot=None):
         self.telegram_bot = telegram_bot
         self.is_running = False
         self.positions = {}
+        self.executed = {}  # (símbolo, compra, venta) -> opened_at de la oportunidad ya simulada
+        self.persistence = Persistence(self.name)
         
         # Configuración optimizada para capital de $30
         self.min_trade_amount = 5.0
@@ -30,84 +34,38 @@ class WorkingTradingEngine:
     
     def run_ccxt_command(self, command, exchange, symbol=None, amount=None):
         """Ejecutar comando CCXT con exchanges disponibles"""
-        try:
-            script = f"""
-const ccxt = require('ccxt');
-
-async function execute() {{
-    try {{
-        const exchange = new ccxt.{exchange}({{
-            sandbox: false,
-            enableRateLimit: true,
-        }});
+        params = {}
+        if command == 'fetch_order_book':
+            params['limit'] = 10
+        if amount is not None:
+            params['amount'] = amount
         
-        let result;
-        switch ('{command}') {{
-            case 'fetch_ticker':
-                result = await exchange.fetchTicker('{symbol or "BTC/USDT"}');
-                break;
-            case 'fetch_order_book':
-                result = await exchange.fetchOrderBook('{symbol or "BTC/USDT"}', 10);
-                break;
-            case 'fetch_markets':
-                result = await exchange.loadMarkets();
-                break;
-            case 'test_connection':
-                result = await exchange.fetchTicker('BTC/USDT');
-                result = {{ success: true, price: result.last }};
-                break;
-            default:
-                throw new Error('Unknown command: {command}');
-        }}
-        
-        console.log(JSON.stringify(result));
-    }} catch (error) {{
-        console.error(JSON.stringify({{error: error.message}}));
-    }}
-}}
-
-execute();
-"""
-            
-            with open('/tmp/ccxt_script.js', 'w') as f:
-                f.write(script)
-            
-            result = subprocess.run(
-                ['node', '/tmp/ccxt_script.js'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                return json.loads(result.stdout)
-            else:
-                logging.error(f"CCXT error: {result.stderr}")
-                return None
-                
-        except Exception as e:
-            logging.error(f"Error running CCXT command: {e}")
-            return None
+        return run_exchange_command(command, exchange, symbol or 'BTC/USDT', params=params, timeout=10)
     
     def start(self):
         """Iniciar motor de trading"""
         self.is_running = True
         logging.info("Starting Working Trading Engine...")
         
+        # Posiciones abiertas antes del reinicio
+        self.positions = self.persistence.recover()
+        
         # Verificar conexiones iniciales
         self.test_connections()
         
-        while self.is_running:
-            try:
-                self.scan_arbitrage_opportunities()
-                self.manage_positions()
-                self.update_trading_stats()
-                
-                time.sleep(15)  # Revisar cada 15 segundos
-                
-            except Exception as e:
-                logging.error(f"Error in trading loop: {e}")
-                time.sleep(30)
+        # En el núcleo compartido: escaneo con cada cotización de nuestros exchanges
+        engine_core.register(self)
+    
+    def markets(self):
+        return {exchange: self.target_symbols for exchange in self.exchanges}
+    
+    def setup(self, core):
+        for pos_id, position in self.positions.items():
+            self.track_position(pos_id, position)
+        core.every(self, 15.0, self.update_trading_stats)
+    
+    def scan(self):
+        self.scan_arbitrage_opportunities()
     
     def test_connections(self):
         """Probar conexiones a exchanges"""
@@ -123,62 +81,31 @@ execute();
     def scan_arbitrage_opportunities(self):
         """Escanear oportunidades de arbitraje"""
         try:
-            for symbol in self.target_symbols:
-                prices = {}
-                
-                # Obtener precios de exchanges disponibles
-                for exchange in self.exchanges:
-                    ticker = self.run_ccxt_command('fetch_ticker', exchange, symbol)
-                    if ticker and 'bid' in ticker and 'ask' in ticker:
-                        prices[exchange] = {
-                            'bid': ticker['bid'],
-                            'ask': ticker['ask'],
-                            'last': ticker['last'],
-                            'volume': ticker.get('baseVolume', 0)
-                        }
-                
-                # Analizar oportunidades
-                if len(prices) >= 2:
-                    self.analyze_arbitrage_opportunity(symbol, prices)
+            # Oportunidades vivas, reevaluadas por el tracker con cada cotización
+            opportunity_tracker.track(self.exchanges, self.target_symbols)
+            self.analyze_arbitrage_opportunity()
                     
         except Exception as e:
             logging.error(f"Error scanning opportunities: {e}")
     
-    def analyze_arbitrage_opportunity(self, symbol, prices):
-        """Analizar y ejecutar oportunidad de arbitraje"""
-        best_opportunity = None
-        max_spread = 0
-        
-        exchanges = list(prices.keys())
-        for i in range(len(exchanges)):
-            for j in range(len(exchanges)):
-                if i != j:
-                    buy_exchange = exchanges[i]
-                    sell_exchange = exchanges[j]
-                    
-                    buy_price = prices[buy_exchange]['ask']
-                    sell_price = prices[sell_exchange]['bid']
-                    spread = (sell_price - buy_price) / buy_price
-                    
-                    # Verificar volumen suficiente
-                    min_volume = 100  # Volumen mínimo requerido
-                    if (spread > self.target_spread and 
-                        spread > max_spread and
-                        prices[buy_exchange]['volume'] > min_volume and
-                        prices[sell_exchange]['volume'] > min_volume):
-                        
-                        max_spread = spread
-                        best_opportunity = {
-                            'symbol': symbol,
-                            'buy_exchange': buy_exchange,
-                            'sell_exchange': sell_exchange,
-                            'buy_price': buy_price,
-                            'sell_price': sell_price,
-                            'spread_percentage': spread * 100,
-                            'potential_profit': self.min_trade_amount * spread
-                        }
+    def analyze_arbitrage_opportunity(self):
+        """Analizar y ejecutar la mejor oportunidad de arbitraje de cada símbolo"""
+        # Verificar volumen suficiente en ambas patas
+        min_volume = 100  # Volumen mínimo requerido
+        best = opportunity_tracker.best_per_symbol(
+            self.target_spread, exchanges=self.exchanges, symbols=self.target_symbols, min_volume=min_volume
+        )
         
-        if best_opportunity:
+        for symbol, candidate in best.items():
+            # El escaneo corre con cada cotización: una sola simulación por oportunidad viva
+            key = (symbol, candidate['buy_exchange'], candidate['sell_exchange'])
+            if self.executed.get(key) == candidate['opened_at']:
+                continue
+            self.executed[key] = candidate['opened_at']
+            best_opportunity = dict(
+                candidate,
+                potential_profit=self.min_trade_amount * candidate['net_spread_percentage'] / 100
+            )
             logging.info(f"Arbitrage opportunity found: {symbol} - {best_opportunity['spread_percentage']:.3f}% spread")
             self.simulate_arbitrage_execution(best_opportunity)
     
@@ -192,19 +119,19 @@ execute();
             buy_price = opportunity['buy_price']
             quantity = trade_amount / buy_price
             
-            # Registrar trade simulado de compra
-            buy_trade = Trade()
-            buy_trade.symbol = symbol
-            buy_trade.side = 'BUY'
-            buy_trade.quantity = quantity
-            buy_trade.price = buy_price
-            buy_trade.total_value = trade_amount
-            buy_trade.fee = trade_amount * 0.001  # 0.1% fee
-            buy_trade.strategy = 'arbitrage_simulation'
-            buy_trade.exchange = opportunity['buy_exchange'].upper()
-            buy_trade.order_id = f"SIM_{int(time.time())}"
-            
-            db.session.add(buy_trade)
+            # Registrar trade simulado de compra (se vuelca a la base de datos por lotes)
+            order_id = f"SIM_{int(time.time())}"
+            self.persistence.record_trade(
+                symbol=symbol,
+                side='BUY',
+                quantity=quantity,
+                price=buy_price,
+                total_value=trade_amount,
+                fee=trade_amount * 0.001,  # 0.1% fee
+                strategy='arbitrage_simulation',
+                exchange=opportunity['buy_exchange'].upper(),
+                order_id=order_id
+            )
             
             # Crear posición para venta
             position_id = f"{symbol}_{int(time.time())}"
@@ -216,10 +143,10 @@ execute();
                 'sell_exchange': opportunity['sell_exchange'],
                 'target_sell_price': opportunity['sell_price'],
                 'timestamp': time.time(),
-                'trade_id': buy_trade.order_id
+                'trade_id': order_id
             }
-            
-            db.session.commit()
+            self.persistence.open_position(position_id, self.positions[position_id])
+            self.track_position(position_id, self.positions[position_id])
             
             logging.info(f"Simulated arbitrage buy: {symbol} - ${trade_amount} at ${buy_price}")
             
@@ -233,45 +160,29 @@ execute();
         except Exception as e:
             logging.error(f"Error simulating arbitrage: {e}")
     
-    def manage_positions(self):
-        """Gestionar posiciones abiertas"""
-        positions_to_close = []
-        current_time = time.time()
-        
-        for pos_id, position in self.positions.items():
-            try:
-                # Obtener precio actual en exchange de venta
-                ticker = self.run_ccxt_command('fetch_ticker', position['sell_exchange'], position['symbol'])
-                
-                if ticker and 'bid' in ticker:
-                    current_sell_price = ticker['bid']
-                    buy_price = position['buy_price']
-                    profit_pct = (current_sell_price - buy_price) / buy_price
-                    
-                    should_close = False
-                    reason = ""
-                    
-                    # Criterios para cerrar posición
-                    if profit_pct >= self.take_profit_percentage:
-                        should_close = True
-                        reason = "PROFIT_TARGET"
-                    elif profit_pct <= -self.stop_loss_percentage:
-                        should_close = True
-                        reason = "STOP_LOSS"
-                    elif current_time - position['timestamp'] > 900:  # 15 minutos máximo
-                        should_close = True
-                        reason = "TIME_EXIT"
-                    
-                    if should_close:
-                        self.close_position_simulation(position, current_sell_price, reason)
-                        positions_to_close.append(pos_id)
-                        
-            except Exception as e:
-                logging.error(f"Error managing position {pos_id}: {e}")
+    def track_position(self, pos_id, position):
+        """Registrar take profit, stop loss y tiempo máximo en el núcleo"""
+        buy_price = position['buy_price']
+        self.core.track(
+            self, pos_id, position['sell_exchange'], position['symbol'],
+            stop_price=buy_price * (1 - self.stop_loss_percentage),
+            target_price=buy_price * (1 + self.take_profit_percentage),
+            deadline=position['timestamp'] + 900,  # 15 minutos máximo
+            position=position
+        )
+    
+    def on_exit(self, pos_id, position, reason, price):
+        """Disparo del libro de posiciones: cerrar al bid del exchange de venta"""
+        if price is None:
+            quote = market_data_hub.get_quote(position['sell_exchange'], position['symbol'])
+            if not quote or not quote['bid']:
+                self.track_position(pos_id, position)  # reintentar en el siguiente ciclo
+                return
+            price = quote['bid']
         
-        # Remover posiciones cerradas
-        for pos_id in positions_to_close:
-            del self.positions[pos_id]
+        self.close_position_simulation(position, price, reason)
+        self.positions.pop(pos_id, None)
+        self.persistence.close_position(pos_id, reason)
     
     def close_position_simulation(self, position, sell_price, reason):
         """Simular cierre de posición"""
@@ -282,20 +193,18 @@ execute();
             profit_loss = sell_total - buy_total - (sell_total * 0.001)  # Menos fees
             
             # Registrar trade de venta simulado
-            sell_trade = Trade()
-            sell_trade.symbol = position['symbol']
-            sell_trade.side = 'SELL'
-            sell_trade.quantity = quantity
-            sell_trade.price = sell_price
-            sell_trade.total_value = sell_total
-            sell_trade.fee = sell_total * 0.001
-            sell_trade.profit_loss = profit_loss
-            sell_trade.strategy = 'arbitrage_simulation'
-            sell_trade.exchange = position['sell_exchange'].upper()
-            sell_trade.order_id = f"SIM_{int(time.time())}"
-            
-            db.session.add(sell_trade)
-            db.session.commit()
+            self.persistence.record_trade(
+                symbol=position['symbol'],
+                side='SELL',
+                quantity=quantity,
+                price=sell_price,
+                total_value=sell_total,
+                fee=sell_total * 0.001,
+                profit_loss=profit_loss,
+                strategy='arbitrage_simulation',
+                exchange=position['sell_exchange'].upper(),
+                order_id=f"SIM_{int(time.time())}"
+            )
             
             profit_pct = (profit_loss / (quantity * position['buy_price'])) * 100
             
@@ -314,52 +223,12 @@ execute();
     
     def update_trading_stats(self):
         """Actualizar estadísticas de trading"""
-        try:
-            today = datetime.now().date()
-            
-            # Obtener estadísticas del día
-            today_trades = Trade.query.filter(
-                Trade.executed_at >= datetime.combine(today, datetime.min.time())
-            ).all()
-            
-            if today_trades:
-                total_profit = sum(t.profit_loss for t in today_trades if t.profit_loss)
-                total_trades = len(today_trades)
-                successful_trades = len([t for t in today_trades if t.profit_loss and t.profit_loss > 0])
-                
-                # Actualizar estadísticas diarias
-                stats = DailyStats.query.filter_by(date=today).first()
-                if not stats:
-                    stats = DailyStats()
-                    stats.date = today
-                    stats.starting_balance = 30.0
-                    db.session.add(stats)
-                
-                stats.total_trades = total_trades
-                stats.successful_trades = successful_trades
-                stats.total_profit = total_profit
-                stats.ending_balance = 30.0 + total_profit
-                
-                if stats.starting_balance > 0:
-                    stats.roi_percentage = (total_profit / stats.starting_balance) * 100
-                
-                db.session.commit()
-                
-        except Exception as e:
-            logging.error(f"Error updating stats: {e}")
+        self.persistence.update_daily_stats(from_balances=False)
     
     def create_alert(self, title, message, alert_type):
         """Crear alerta del sistema"""
         try:
-            alert = Alert()
-            alert.title = title
-            alert.message = message
-            alert.alert_type = alert_type
-            
-            db.session.add(alert)
-            db.session.commit()
-            
-            logging.info(f"Alert: {title}")
+            self.persistence.alert(title, message, alert_type)
             
         except Exception as e:
             logging.error(f"Error creating alert: {e}")
@@ -376,4 +245,5 @@ execute();
     def stop(self):
         """Detener motor de trading"""
         self.is_running = False
+        engine_core.unregister(self)
         logging.info("Working Trading Engine stopped")
\ No newline at end of file